@@ -1,7 +1,35 @@
-from flask import Blueprint, jsonify, request
-from werkzeug.security import check_password_hash, generate_password_hash
-from datetime import date
-from models import db, Usuario, Mascota, Vacuna, Diagnostico, Receta, Prevencion
+import io
+import os
+
+from flask import Blueprint, Response, current_app, g, jsonify, request, send_file, stream_with_context
+from sqlalchemy import and_, insert, select
+from sqlalchemy.exc import IntegrityError
+from datetime import date, datetime, timedelta
+
+import borrado
+import busqueda
+import cache
+import calendario
+import condicional
+import estadisticas
+import exportacion
+import imagenes
+import microchips
+import replicas
+import seguridad
+import serializacion
+import sincronizacion
+import tokens
+from models import db, Usuario, Mascota, Vacuna, Diagnostico, Receta, Prevencion, Eliminacion, Importacion
+from media import (
+    MediaInvalida,
+    es_hash_valido,
+    guardar_foto_base64,
+    migrar_foto_usuario,
+    mimetype_de_archivo,
+    ruta_media,
+)
+from paginacion import ParametroInvalido, paginar
 
 api = Blueprint('api', __name__)
 
@@ -13,11 +41,185 @@ def ping():
     return jsonify({"success": True, "message": "API funcionando"}), 200
 
 
+@api.errorhandler(ParametroInvalido)
+def parametro_invalido(error):
+    return jsonify({"success": False, "message": str(error)}), 400
+
+
+@api.errorhandler(seguridad.DemasiadosIntentos)
+def demasiados_intentos(error):
+    respuesta = jsonify({"success": False, "message": str(error)})
+    respuesta.headers["Retry-After"] = str(error.reintentar_en)
+    return respuesta, 429
+
+
+@api.errorhandler(seguridad.HashingSaturado)
+def hashing_saturado(error):
+    respuesta = jsonify({"success": False, "message": str(error)})
+    respuesta.headers["Retry-After"] = "1"
+    return respuesta, 503
+
+
+@api.errorhandler(microchips.MicrochipRegistrado)
+def microchip_registrado(error):
+    return jsonify({"success": False, "message": str(error)}), 409
+
+
+@api.errorhandler(tokens.TokenInvalido)
+def token_invalido(error):
+    return jsonify({"success": False, "message": str(error)}), 401
+
+
+@api.errorhandler(tokens.AccesoDenegado)
+def acceso_denegado(error):
+    return jsonify({"success": False, "message": "No tienes permiso sobre este recurso"}), 403
+
+
+# ============================================================
+# AUTENTICACIÓN POR TOKEN
+# ============================================================
+# Con "Authorization: Bearer <token>" la identidad sale del token (sin
+# consultar la base) y cada recurso se filtra por dueño en la misma
+# consulta que lo busca. Sin token solo se responde si API_MODO_HEREDADO
+# está activo (identidad por el user_id que manda el cliente, obsoleto:
+# cada uso queda en el log); los endpoints de la clínica
+# (_requiere_scope) exigen token siempre.
+ENDPOINTS_PUBLICOS = {
+    'api.ping',
+    'api.api_login',
+    'api.api_register',
+    'api.refrescar_token',
+    'api.obtener_media',
+}
+
+
+@api.before_request
+def autenticar():
+    g.user_id = None
+    g.scopes = ()
+
+    cabecera = request.headers.get('Authorization', '')
+    if cabecera.startswith('Bearer '):
+        try:
+            payload = tokens.verificar_token(cabecera[7:].strip())
+        except tokens.TokenInvalido as e:
+            return jsonify({"success": False, "message": str(e)}), 401
+        g.user_id = payload["sub"]
+        g.scopes = tuple(payload["scp"])
+    elif request.endpoint not in ENDPOINTS_PUBLICOS:
+        if not current_app.config.get('API_MODO_HEREDADO'):
+            return jsonify({"success": False, "message": "Falta el token de acceso"}), 401
+        current_app.logger.warning("Modo heredado por user_id (obsoleto): %s %s sin token",
+                                   request.method, request.path)
+
+
+def _alcance(modelo):
+    """(filtros, uniones) que restringen `modelo` a lo del usuario del token."""
+    if g.user_id is None:
+        return [], []
+    if modelo is Mascota:
+        return [Mascota.user_id == g.user_id], []
+    return [Mascota.user_id == g.user_id], [Mascota]
+
+
+def _propio(modelo, id):
+    """Busca por id y dueño en una sola consulta (join indexado para el historial)."""
+    filtros, uniones = _alcance(modelo)
+    consulta = modelo.query
+    for union in uniones:
+        consulta = consulta.join(union)
+    return consulta.filter(modelo.id == id, *filtros).first()
+
+
+def _user_id_efectivo(valor):
+    """Con token manda el token; el user_id del cliente solo vale en modo heredado."""
+    if g.user_id is None:
+        return valor
+    if valor not in (None, "") and str(valor) != str(g.user_id):
+        raise tokens.AccesoDenegado()
+    return g.user_id
+
+
+def _verificar_usuario(user_id):
+    if g.user_id is not None and g.user_id != user_id:
+        raise tokens.AccesoDenegado()
+
+
+def _version_de_mascota(mascota_id, *modelos):
+    """Agregados para GET condicional de lo que cuelga de una mascota.
+
+    Incluye la propia mascota (su count dice si existe y es del usuario
+    del token) y las lápidas de su dueño en esas tablas.
+    """
+    duenio = select(Mascota.user_id).where(Mascota.id == mascota_id).scalar_subquery()
+    propia = [duenio == g.user_id] if g.user_id is not None else []
+    partes = [(Mascota, and_(Mascota.id == mascota_id, *propia))]
+    partes += [(m, and_(m.mascota_id == mascota_id, *propia)) for m in modelos]
+    tablas = [Mascota.__tablename__] + [m.__tablename__ for m in modelos]
+    return condicional.version(partes, and_(Eliminacion.user_id == duenio, Eliminacion.tabla.in_(tablas)))
+
+
+def _requiere_scope(scope):
+    """Exige token con `scope`, también en el modo heredado sin token."""
+    if g.user_id is None:
+        raise tokens.TokenInvalido("Falta el token de acceso")
+    if scope not in g.scopes:
+        raise tokens.AccesoDenegado()
+
+
+@api.route('/token/refresh', methods=['POST'])
+def refrescar_token():
+    data = request.get_json() or {}
+    try:
+        payload = tokens.verificar_token(data.get("refresh_token"), tokens.REFRESCO)
+    except tokens.TokenInvalido as e:
+        return jsonify({"success": False, "message": str(e)}), 401
+
+    usuario = db.session.get(Usuario, payload["sub"])
+    if not usuario:
+        return jsonify({"success": False, "message": "Usuario no encontrado"}), 401
+
+    return jsonify({
+        "success": True,
+        **tokens.emitir_tokens(usuario.id, tokens.scopes_de(usuario), refresco_vence=payload["exp"])
+    }), 200
+
+
+# ============================================================
+# MEDIA (FOTOS)
+# ============================================================
+@api.route('/media/<hash_media>', methods=['GET'])
+def obtener_media(hash_media):
+    if not es_hash_valido(hash_media):
+        return jsonify({"success": False, "message": "Media no encontrada"}), 404
+
+    ruta = ruta_media(hash_media)
+    if not os.path.exists(ruta):
+        return jsonify({"success": False, "message": "Media no encontrada"}), 404
+
+    # El contenido nunca cambia para un hash: ETag fuerte = hash, caché inmutable.
+    # conditional=True responde If-None-Match (304) y Range (206).
+    respuesta = send_file(
+        ruta,
+        mimetype=mimetype_de_archivo(ruta),
+        conditional=True,
+        etag=hash_media,
+        max_age=31536000,
+    )
+    respuesta.cache_control.immutable = True
+    return respuesta
+
+
 # ============================================================
 # OBTENER USUARIO
 # ============================================================
+# Solo lectura (se cachea y puede ir a una réplica): una foto base64
+# heredada no tiene URL hasta que la pasa al almacén `flask migrar-fotos`
+# o la próxima escritura del usuario.
 @api.route('/usuario/<int:id>', methods=['GET'])
+@cache.cacheado(lambda id: [f"u:{id}"])
 def obtener_usuario(id):
+    _verificar_usuario(id)
     usuario = Usuario.query.get(id)
 
     if not usuario:
@@ -30,7 +232,7 @@ def obtener_usuario(id):
             "nombre": usuario.nombre,
             "apellido": usuario.apellido,
             "email": usuario.email,
-            "foto": usuario.foto if hasattr(usuario, "foto") else ""
+            "foto_url": usuario.foto_url()
         }
     }), 200
 
@@ -40,6 +242,7 @@ def obtener_usuario(id):
 # ============================================================
 @api.route('/usuario/<int:id>', methods=['PUT'])
 def actualizar_usuario(id):
+    _verificar_usuario(id)
     usuario = Usuario.query.get(id)
 
     if not usuario:
@@ -52,9 +255,16 @@ def actualizar_usuario(id):
     usuario.email = data.get("email", usuario.email)
 
     if "foto" in data:
-        usuario.foto = data.get("foto")
+        try:
+            usuario.foto_hash = guardar_foto_base64(data["foto"]) if data["foto"] else None
+        except MediaInvalida as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+        usuario.foto = None
+    elif usuario.foto and not usuario.foto_hash:
+        migrar_foto_usuario(usuario)
 
     db.session.commit()
+    cache.invalidar(f"u:{id}")
 
     return jsonify({"success": True, "message": "Usuario actualizado"}), 200
 
@@ -64,6 +274,7 @@ def actualizar_usuario(id):
 # ============================================================
 @api.route('/usuario/<int:user_id>/foto', methods=['PUT'])
 def actualizar_foto_usuario(user_id):
+    _verificar_usuario(user_id)
     usuario = Usuario.query.get(user_id)
 
     if not usuario:
@@ -75,10 +286,20 @@ def actualizar_foto_usuario(user_id):
     if not foto_base64:
         return jsonify({"success": False, "message": "No se envió ninguna foto"}), 400
 
-    usuario.foto = foto_base64
+    try:
+        usuario.foto_hash = guardar_foto_base64(foto_base64)
+    except MediaInvalida as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    usuario.foto = None
     db.session.commit()
+    cache.invalidar(f"u:{user_id}")
 
-    return jsonify({"success": True, "message": "Foto actualizada"}), 200
+    return jsonify({
+        "success": True,
+        "message": "Foto actualizada",
+        "foto_url": usuario.foto_url()
+    }), 200
 
 
 # ============================================================
@@ -92,12 +313,27 @@ def api_login():
 
     if not email or not password:
         return jsonify({"success": False, "message": "Email y contraseña son obligatorios"}), 400
+    if not isinstance(email, str) or not isinstance(password, str):
+        return jsonify({"success": False, "message": "Email y contraseña deben ser texto"}), 400
+
+    seguridad.admitir_intento(email, request.remote_addr)
 
     user = Usuario.query.filter_by(email=email).first()
 
-    if not user or not check_password_hash(user.password, password):
+    if not user or not seguridad.verificar_password(user.password, password):
+        seguridad.registrar_fallo(email)
         return jsonify({"success": False, "message": "Credenciales incorrectas"}), 401
 
+    seguridad.registrar_exito(email)
+
+    # Rehash transparente si cambió el método/costo configurado
+    if seguridad.necesita_rehash(user.password):
+        try:
+            user.password = seguridad.generar_hash(password)
+            db.session.commit()
+        except seguridad.HashingSaturado:
+            pass
+
     return jsonify({
         "success": True,
         "message": "Login exitoso",
@@ -105,10 +341,26 @@ def api_login():
         "nombre": user.nombre,
         "apellido": user.apellido,
         "email": user.email,
-        "foto": user.foto if hasattr(user, "foto") else ""
+        "foto_url": user.foto_url(),
+        **tokens.emitir_tokens(user.id, tokens.scopes_de(user))
     }), 200
 
 
+@api.route('/metricas/hashing', methods=['GET'])
+def metricas_hashing():
+    return jsonify({"success": True, "hashing": seguridad.metricas()}), 200
+
+
+@api.route('/metricas/cache', methods=['GET'])
+def metricas_cache():
+    return jsonify({"success": True, "cache": cache.metricas()}), 200
+
+
+@api.route('/metricas/replicas', methods=['GET'])
+def metricas_replicas():
+    return jsonify({"success": True, "replicas": replicas.estado()}), 200
+
+
 # ============================================================
 # REGISTER
 # ============================================================
@@ -124,6 +376,8 @@ def api_register():
     if not nombre or not email or not password:
         return jsonify({"success": False, "message": "Nombre, email y contraseña son obligatorios"}), 400
 
+    seguridad.admitir_intento(None, request.remote_addr)
+
     if Usuario.query.filter_by(email=email).first():
         return jsonify({"success": False, "message": "El correo ya está registrado"}), 400
 
@@ -131,8 +385,7 @@ def api_register():
         nombre=nombre,
         apellido=apellido,
         email=email,
-        password=generate_password_hash(password),
-        foto=""
+        password=seguridad.generar_hash(password)
     )
 
     db.session.add(nuevo)
@@ -145,25 +398,49 @@ def api_register():
         "nombre": nuevo.nombre,
         "apellido": nuevo.apellido,
         "email": nuevo.email,
-        "foto": nuevo.foto
+        "foto_url": nuevo.foto_url(),
+        **tokens.emitir_tokens(nuevo.id, tokens.scopes_de(nuevo))
     }), 201
 
 
 # ============================================================
 # MASCOTAS
 # ============================================================
+def _espacios_mascotas():
+    user_id = request.args.get('user_id') or g.user_id
+    return [f"u:{_user_id_efectivo(user_id)}"] if user_id else None
+
+
+def _version_mascotas():
+    user_id = request.args.get('user_id') or g.user_id
+    if not user_id:
+        return None
+    user_id = _user_id_efectivo(user_id)
+    return condicional.version(
+        [(Mascota, Mascota.user_id == user_id)],
+        and_(Eliminacion.user_id == user_id, Eliminacion.tabla == Mascota.__tablename__),
+    )
+
+
 @api.route('/mascotas', methods=['GET'])
+@condicional.condicional(_version_mascotas)
+@cache.cacheado(_espacios_mascotas)
 def obtener_mascotas():
-    user_id = request.args.get('user_id')
+    user_id = _user_id_efectivo(request.args.get('user_id'))
 
     if not user_id:
         return jsonify({"success": False, "message": "Falta user_id"}), 400
 
-    mascotas = Mascota.query.filter_by(user_id=user_id).all()
+    mascotas, next_cursor = paginar(
+        Mascota,
+        [Mascota.user_id == user_id],
+        {"id": Mascota.id, "nombre": Mascota.nombre},
+    )
 
     return jsonify({
         "success": True,
-        "mascotas": [m.to_dict() for m in mascotas]
+        "mascotas": mascotas,
+        "next_cursor": next_cursor
     }), 200
 
 
@@ -174,80 +451,218 @@ def agregar_mascota():
     if not data.get("nombre") or not data.get("especie") or not data.get("raza"):
         return jsonify({"success": False, "message": "Faltan datos obligatorios"}), 400
 
-    user_id = data.get("user_id")
+    user_id = _user_id_efectivo(data.get("user_id"))
     if not user_id:
         return jsonify({"success": False, "message": "Falta user_id"}), 400
 
+    # Antes de la primera consulta: ahí empieza la transacción (BEGIN IMMEDIATE)
+    try:
+        variantes = imagenes.variantes_api(data.get("foto"))
+    except MediaInvalida as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    microchip = microchips.asignable(data.get("microchip"))
+
     nueva = Mascota(
         nombre=data.get("nombre"),
         especie=data.get("especie"),
         raza=data.get("raza"),
         fecha_nacimiento=None,
         peso=data.get("peso") or 0.0,
-        microchip=data.get("microchip"),
+        microchip=microchip,
         castrado=data.get("castrado", False),
-        foto=data.get("foto") or "",
+        foto="",
         user_id=user_id
     )
+    imagenes.asignar_variantes(nueva, variantes)
 
     db.session.add(nueva)
-    db.session.commit()
+    microchips.confirmar(microchip)
+    cache.invalidar(f"u:{user_id}")
+    microchips.olvidar_negativo(microchip)
 
     return jsonify({"success": True, "message": "Mascota agregada", "id": nueva.id}), 201
 
 
 @api.route('/mascotas/<int:id>', methods=['PUT'])
 def editar_mascota(id):
-    mascota = Mascota.query.get(id)
+    data = request.get_json() or {}
+
+    # Antes de la primera consulta: ahí empieza la transacción (BEGIN IMMEDIATE)
+    if "foto" in data:
+        try:
+            variantes = imagenes.variantes_api(data["foto"])
+        except MediaInvalida as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+    mascota = _propio(Mascota, id)
 
     if not mascota:
         return jsonify({"success": False, "message": "Mascota no encontrada"}), 404
 
-    data = request.get_json() or {}
+    especie_anterior = mascota.especie
 
     mascota.nombre = data.get("nombre", mascota.nombre)
     mascota.especie = data.get("especie", mascota.especie)
     mascota.raza = data.get("raza", mascota.raza)
     mascota.peso = data.get("peso", mascota.peso)
-    mascota.microchip = data.get("microchip", mascota.microchip)
+    if "microchip" in data:
+        mascota.microchip = microchips.asignable(data["microchip"], mascota.id)
     mascota.castrado = data.get("castrado", mascota.castrado)
-    mascota.foto = data.get("foto", mascota.foto)
 
-    db.session.commit()
+    if "foto" in data:
+        imagenes.asignar_variantes(mascota, variantes)
+        mascota.foto = ""
+
+    # Los intervalos de refuerzo dependen de la especie
+    if mascota.especie != especie_anterior:
+        calendario.recalcular_mascota(mascota.id)
+
+    user_id, microchip = mascota.user_id, mascota.microchip
+    microchips.confirmar(microchip, id)
+    cache.invalidar(f"u:{user_id}", f"m:{id}")
+    microchips.olvidar_negativo(microchip)
 
     return jsonify({"success": True, "message": "Mascota actualizada"}), 200
 
 
 @api.route('/mascotas/<int:id>', methods=['DELETE'])
 def eliminar_mascota(id):
-    mascota = Mascota.query.get(id)
+    mascota = _propio(Mascota, id)
 
     if not mascota:
         return jsonify({"success": False, "message": "Mascota no encontrada"}), 404
 
-    db.session.delete(mascota)
-    db.session.commit()
+    borrado.eliminar_mascota(mascota)
+    cache.invalidar(f"u:{mascota.user_id}", f"m:{id}")
 
     return jsonify({"success": True, "message": "Mascota eliminada"}), 200
 
 
+# ============================================================
+# MICROCHIP (REFUGIOS Y CLÍNICAS)
+# ============================================================
+@api.route('/microchip/<codigo>', methods=['GET'])
+def buscar_microchip(codigo):
+    _requiere_scope('clinica')
+
+    microchip = microchips.normalizar(codigo)
+    if microchip is None:
+        raise microchips.MicrochipInvalido("Microchip no válido")
+
+    ficha = microchips.buscar(microchip)
+    if ficha is None:
+        return jsonify({"success": False, "message": "Microchip no registrado", "microchip": microchip}), 404
+
+    return jsonify({"success": True, "microchip": microchip, **ficha}), 200
+
+
+@api.route('/microchip:batch', methods=['POST'])
+def buscar_microchips_lote():
+    _requiere_scope('clinica')
+
+    data = request.get_json(silent=True)
+    codigos = data.get("codigos") if isinstance(data, dict) else data
+    if not isinstance(codigos, list) or not codigos:
+        return jsonify({"success": False, "message": "Se espera una lista 'codigos' no vacía"}), 400
+    if len(codigos) > MAX_LOTE:
+        return jsonify({"success": False, "message": f"Máximo {MAX_LOTE} códigos por lote"}), 413
+
+    normalizados = []
+    for codigo in codigos:
+        try:
+            normalizados.append(microchips.normalizar(codigo) if isinstance(codigo, (str, int)) else None)
+        except microchips.MicrochipInvalido:
+            normalizados.append(None)
+
+    fichas = microchips.buscar_lote({m for m in normalizados if m})
+    resultados = []
+    for codigo, microchip in zip(codigos, normalizados):
+        if microchip is None:
+            resultados.append({"codigo": codigo, "success": False, "message": "Microchip no válido"})
+        elif microchip in fichas:
+            resultados.append({"codigo": codigo, "success": True, "microchip": microchip, **fichas[microchip]})
+        else:
+            resultados.append({"codigo": codigo, "success": False, "microchip": microchip,
+                               "message": "Microchip no registrado"})
+
+    return jsonify({
+        "success": True,
+        "encontrados": sum(1 for r in resultados if r["success"]),
+        "resultados": resultados
+    }), 200
+
+
+# ============================================================
+# HISTORIAL COMPLETO (UNA SOLA LLAMADA POR PANTALLA)
+# ============================================================
+CATEGORIAS_HISTORIAL = {
+    "vacunas": (Vacuna, Vacuna.fecha_aplicacion),
+    "diagnosticos": (Diagnostico, Diagnostico.fecha),
+    "recetas": (Receta, Receta.fecha),
+    "prevenciones": (Prevencion, Prevencion.fecha),
+}
+
+
+def _version_historial(id):
+    filas = _version_de_mascota(id, Vacuna, Diagnostico, Receta, Prevencion)
+    # Mascota inexistente o ajena: la vista responde 404 sin validadores
+    return filas if filas[0][0] else None
+
+
+@api.route('/mascotas/<int:id>/historial', methods=['GET'])
+@condicional.condicional(_version_historial)
+@cache.cacheado(lambda id: [f"m:{id}"])
+def obtener_historial(id):
+    incluir = list(CATEGORIAS_HISTORIAL)
+    if request.args.get('incluir'):
+        incluir = [c.strip() for c in request.args['incluir'].split(',') if c.strip()]
+        invalidas = [c for c in incluir if c not in CATEGORIAS_HISTORIAL]
+        if invalidas:
+            return jsonify({"success": False, "message": f"Categoría no válida: {', '.join(invalidas)}"}), 400
+
+    desde = None
+    if request.args.get('desde'):
+        try:
+            desde = date.fromisoformat(request.args['desde'])
+        except ValueError:
+            return jsonify({"success": False, "message": "Fecha 'desde' no válida"}), 400
+
+    # 1 consulta para la mascota + 1 por categoría incluida, solo columnas (sin objetos del ORM)
+    mascota = serializacion.uno(db.session, Mascota, Mascota.id == id, *_alcance(Mascota)[0])
+    if not mascota:
+        return jsonify({"success": False, "message": "Mascota no encontrada"}), 404
+
+    respuesta = {"success": True, "mascota": mascota}
+    for categoria in incluir:
+        modelo, columna_fecha = CATEGORIAS_HISTORIAL[categoria]
+        filtros = [modelo.mascota_id == id]
+        if desde:
+            filtros.append(columna_fecha >= desde)
+        respuesta[categoria] = serializacion.listar(db.session, modelo, *filtros, orden=[modelo.id])
+
+    return jsonify(respuesta), 200
+
+
 # ============================================================
 # VACUNAS
 # ============================================================
 @api.route('/mascotas/<int:mascota_id>/vacunas', methods=['GET'])
+@condicional.condicional(lambda mascota_id: _version_de_mascota(mascota_id, Vacuna))
+@cache.cacheado(lambda mascota_id: [f"m:{mascota_id}"])
 def obtener_vacunas(mascota_id):
-    vacunas = Vacuna.query.filter_by(mascota_id=mascota_id).all()
+    filtros, uniones = _alcance(Vacuna)
+    vacunas, next_cursor = paginar(
+        Vacuna,
+        [Vacuna.mascota_id == mascota_id] + filtros,
+        {"id": Vacuna.id, "fecha": Vacuna.fecha_aplicacion},
+        uniones=uniones,
+    )
 
     return jsonify({
         "success": True,
-        "vacunas": [
-            {
-                "id": v.id,
-                "nombre": v.nombre,
-                "fecha_aplicacion": v.fecha_aplicacion.isoformat()
-            }
-            for v in vacunas
-        ]
+        "vacunas": vacunas,
+        "next_cursor": next_cursor
     }), 200
 
 
@@ -258,6 +673,9 @@ def agregar_vacuna():
     if not data.get("nombre") or not data.get("fecha_aplicacion") or not data.get("mascota_id"):
         return jsonify({"success": False, "message": "Faltan datos"}), 400
 
+    if g.user_id is not None and not _propio(Mascota, data.get("mascota_id")):
+        return jsonify({"success": False, "message": "Mascota no encontrada"}), 404
+
     nueva = Vacuna(
         nombre=data.get("nombre"),
         fecha_aplicacion=date.fromisoformat(data.get("fecha_aplicacion")),
@@ -265,56 +683,512 @@ def agregar_vacuna():
     )
 
     db.session.add(nueva)
+    calendario.recalcular_mascota(nueva.mascota_id, [nueva.nombre])
     db.session.commit()
+    cache.invalidar(f"m:{nueva.mascota_id}")
 
     return jsonify({"success": True, "message": "Vacuna agregada", "id": nueva.id}), 201
 
 
 @api.route('/vacunas/<int:id>', methods=['PUT'])
 def actualizar_vacuna(id):
-    vacuna = Vacuna.query.get(id)
+    vacuna = _propio(Vacuna, id)
     if not vacuna:
         return jsonify({"success": False, "message": "Vacuna no encontrada"}), 404
 
     data = request.get_json() or {}
+    nombre_anterior = vacuna.nombre
 
     vacuna.nombre = data.get("nombre", vacuna.nombre)
     vacuna.fecha_aplicacion = date.fromisoformat(data.get("fecha_aplicacion")) if data.get("fecha_aplicacion") else vacuna.fecha_aplicacion
 
+    calendario.recalcular_mascota(vacuna.mascota_id, [nombre_anterior, vacuna.nombre])
     db.session.commit()
+    cache.invalidar(f"m:{vacuna.mascota_id}")
 
     return jsonify({"success": True, "message": "Vacuna actualizada"}), 200
 
 
 @api.route('/vacunas/<int:id>', methods=['DELETE'])
 def eliminar_vacuna(id):
-    vacuna = Vacuna.query.get(id)
+    vacuna = _propio(Vacuna, id)
     if not vacuna:
         return jsonify({"success": False, "message": "Vacuna no encontrada"}), 404
 
     db.session.delete(vacuna)
+    calendario.recalcular_mascota(vacuna.mascota_id, [vacuna.nombre])
     db.session.commit()
+    cache.invalidar(f"m:{vacuna.mascota_id}")
     return jsonify({"success": True, "message": "Vacuna eliminada"}), 200
 
 
+# ============================================================
+# ALTAS EN LOTE (MIGRACIÓN DE FICHAS / SINCRONIZACIÓN OFFLINE)
+# ============================================================
+MAX_LOTE = 500
+
+# categoría -> (modelo, campos obligatorios, campo fecha, campos opcionales)
+ESQUEMAS_LOTE = {
+    "vacunas": (Vacuna, ("nombre",), "fecha_aplicacion", ()),
+    "diagnosticos": (Diagnostico, ("titulo",), "fecha", ("descripcion",)),
+    "recetas": (Receta, ("medicamento", "dosis"), "fecha", ("instrucciones",)),
+    "prevenciones": (Prevencion, ("tipo",), "fecha", ("descripcion",)),
+}
+
+
+def _validar_item_lote(modelo, item, obligatorios, campo_fecha, opcionales):
+    if not isinstance(item, dict):
+        return None, "El elemento debe ser un objeto"
+
+    fila = {}
+    for campo in obligatorios:
+        valor = item.get(campo)
+        if not isinstance(valor, str) or not valor.strip():
+            return None, f"Falta '{campo}'"
+        fila[campo] = valor
+
+    try:
+        fila[campo_fecha] = date.fromisoformat(item.get(campo_fecha) or "")
+    except (TypeError, ValueError):
+        return None, f"Fecha '{campo_fecha}' no válida"
+
+    for campo in opcionales:
+        fila[campo] = item.get(campo)
+
+    # Lo que PostgreSQL rechazaría al insertar se rechaza aquí, con su índice
+    for campo, valor in fila.items():
+        largo = getattr(modelo.__table__.c[campo].type, "length", None)
+        if largo and isinstance(valor, str) and len(valor) > largo:
+            return None, f"'{campo}' supera los {largo} caracteres"
+
+    return fila, None
+
+
+def _insertar_lote(modelo, filas):
+    """INSERT masivo; si alguna fila viola una restricción, de a una con savepoints.
+
+    Devuelve los ids en el orden de `filas`, con None en las que fallaron.
+    """
+    try:
+        with db.session.begin_nested():
+            return db.session.execute(
+                insert(modelo).returning(modelo.id, sort_by_parameter_order=True), filas,
+            ).scalars().all()
+    except IntegrityError:
+        pass
+
+    ids = []
+    for fila in filas:
+        try:
+            with db.session.begin_nested():
+                ids.append(db.session.execute(insert(modelo).returning(modelo.id), fila).scalar_one())
+        except IntegrityError:
+            ids.append(None)
+    return ids
+
+
+@api.route('/mascotas/<int:mascota_id>/<any(vacunas, diagnosticos, recetas, prevenciones):categoria>:batch',
+           methods=['POST'])
+def agregar_lote(mascota_id, categoria):
+    data = request.get_json(silent=True)
+    items = data.get("items") if isinstance(data, dict) else data
+    atomico = isinstance(data, dict) and bool(data.get("atomico"))
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"success": False, "message": "Se espera una lista 'items' no vacía"}), 400
+    if len(items) > MAX_LOTE:
+        return jsonify({"success": False, "message": f"Máximo {MAX_LOTE} elementos por lote"}), 413
+
+    if not _propio(Mascota, mascota_id):
+        return jsonify({"success": False, "message": "Mascota no encontrada"}), 404
+
+    modelo, obligatorios, campo_fecha, opcionales = ESQUEMAS_LOTE[categoria]
+
+    resultados = [None] * len(items)
+    validas, indices = [], []
+    for i, item in enumerate(items):
+        fila, error = _validar_item_lote(modelo, item, obligatorios, campo_fecha, opcionales)
+        if error:
+            resultados[i] = {"indice": i, "success": False, "message": error}
+        else:
+            fila["mascota_id"] = mascota_id
+            validas.append(fila)
+            indices.append(i)
+
+    errores = len(items) - len(validas)
+    rechazadas = 0
+    if validas and not (atomico and errores):
+        # El INSERT masivo no pasa por los eventos del ORM: la revisión se asigna aquí
+        rev = sincronizacion.siguiente_revision(db.session.connection())
+        ahora = datetime.utcnow()
+        for fila in validas:
+            fila["rev"] = rev
+            fila["actualizado_en"] = ahora
+
+        # Un solo INSERT ... VALUES por bloques (executemany) y un solo commit
+        ids = _insertar_lote(modelo, validas)
+        for i, id_ in zip(indices, ids):
+            if id_ is None:
+                resultados[i] = {"indice": i, "success": False, "message": "Rechazado por la base de datos"}
+        rechazadas = ids.count(None)
+        insertadas = [(i, fila, id_) for i, fila, id_ in zip(indices, validas, ids) if id_ is not None]
+
+        if atomico and rechazadas:
+            db.session.rollback()
+        elif insertadas:
+            ids = [id_ for _, _, id_ in insertadas]
+            busqueda.indexar(db.session.connection(), modelo, ids)
+            estadisticas.sumar(db.session.connection(), modelo, ids)
+
+            if modelo is Vacuna:
+                calendario.recalcular_mascota(mascota_id, {f["nombre"] for _, f, _ in insertadas})
+            elif modelo is Prevencion:
+                calendario.recalcular_prevenciones(mascota_id, {f["tipo"] for _, f, _ in insertadas})
+
+            db.session.commit()
+            cache.invalidar(f"m:{mascota_id}")
+
+            for i, _, id_ in insertadas:
+                resultados[i] = {"indice": i, "success": True, "id": id_}
+
+    for i in indices:
+        if resultados[i] is None:
+            resultados[i] = {"indice": i, "success": False, "message": "No insertado: el lote tiene errores"}
+
+    insertados = len(items) - sum(1 for r in resultados if not r["success"])
+    if insertados == len(items):
+        status = 201
+    elif insertados:
+        status = 207
+    elif rechazadas:
+        status = 409
+    else:
+        status = 400
+
+    return jsonify({
+        "success": insertados == len(items),
+        "insertados": insertados,
+        "errores": len(items) - insertados,
+        "resultados": resultados
+    }), status
+
+
+# ============================================================
+# SINCRONIZACIÓN INCREMENTAL
+# ============================================================
+# Mientras hay_mas, repetir con desde_rev=<rev> y cursor=<cursor> de la
+# respuesta (el cursor solo viene cuando una revisión se parte).
+@api.route('/sync', methods=['GET'])
+def sincronizar():
+    user_id = _user_id_efectivo(request.args.get('user_id', type=int))
+    if not user_id:
+        return jsonify({"success": False, "message": "Falta user_id"}), 400
+
+    desde_rev = request.args.get('desde_rev', 0, type=int)
+    cambios, hasta_rev, hay_mas, cursor = sincronizacion.cambios_desde(
+        user_id, desde_rev, cursor=request.args.get('cursor')
+    )
+
+    return jsonify({
+        "success": True,
+        "rev": hasta_rev,
+        "hay_mas": hay_mas,
+        "cursor": cursor,
+        "cambios": cambios
+    }), 200
+
+
+# ============================================================
+# EXPORTACIÓN / IMPORTACIÓN (NDJSON, CSV)
+# ============================================================
+# Las respuestas y las subidas van en streaming (ver exportacion.py).
+# La exportación e importación de toda la clínica exige scope "clinica".
+def _respuesta_exportacion(user_id, nombre):
+    formato = exportacion.formato_valido(request.args.get('formato', 'ndjson'))
+    return Response(
+        stream_with_context(exportacion.exportar(formato, user_id)),
+        mimetype=exportacion.FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'},
+    )
+
+
+@api.route('/usuarios/<int:user_id>/export', methods=['GET'])
+def exportar_usuario(user_id):
+    _verificar_usuario(user_id)
+    if not db.session.get(Usuario, user_id):
+        return jsonify({"success": False, "message": "Usuario no encontrado"}), 404
+    return _respuesta_exportacion(user_id, f"vacunapet-usuario-{user_id}")
+
+
+@api.route('/export', methods=['GET'])
+def exportar_clinica():
+    _requiere_scope('clinica')
+    return _respuesta_exportacion(None, "vacunapet-clinica")
+
+
+def _importar(user_id):
+    """Crea la importación (o reanuda ?importacion=<id>) y consume el cuerpo."""
+    importacion_id = request.args.get('importacion', type=int)
+    if importacion_id:
+        importacion = db.session.get(Importacion, importacion_id)
+        if not importacion or importacion.user_id != user_id:
+            return jsonify({"success": False, "message": "Importación no encontrada"}), 404
+    else:
+        importacion = exportacion.crear_importacion(request.args.get('formato', 'ndjson'), user_id)
+
+    texto = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    estado, errores = exportacion.importar(texto, importacion)
+
+    return jsonify({
+        "success": estado["errores"] == 0,
+        "importacion": estado["id"],
+        "estado": estado["estado"],
+        "registros": estado["registros"],
+        "insertados": estado["insertados"],
+        "errores": estado["errores"],
+        "detalle_errores": errores
+    }), 200
+
+
+@api.route('/usuarios/<int:user_id>/import', methods=['POST'])
+def importar_usuario(user_id):
+    _verificar_usuario(user_id)
+    if not db.session.get(Usuario, user_id):
+        return jsonify({"success": False, "message": "Usuario no encontrado"}), 404
+    return _importar(user_id)
+
+
+@api.route('/import', methods=['POST'])
+def importar_clinica():
+    _requiere_scope('clinica')
+    return _importar(None)
+
+
+@api.route('/importaciones/<int:id>', methods=['GET'])
+def obtener_importacion(id):
+    importacion = db.session.get(Importacion, id)
+    if importacion and importacion.user_id is None:
+        _requiere_scope('clinica')
+    elif importacion:
+        _verificar_usuario(importacion.user_id)
+    if not importacion:
+        return jsonify({"success": False, "message": "Importación no encontrada"}), 404
+
+    return jsonify({
+        "success": True,
+        "importacion": importacion.id,
+        "estado": importacion.estado,
+        "registros": importacion.registros,
+        "insertados": importacion.insertados,
+        "errores": importacion.errores,
+        "ultimo_error": importacion.ultimo_error,
+        "actualizado_en": importacion.actualizado_en
+    }), 200
+
+
+# ============================================================
+# BÚSQUEDA DE TEXTO COMPLETO
+# ============================================================
+# ?q=dermatitis&en=diagnosticos&limite=20&cursor=<next_cursor>
+# Con token de clínica busca en todos los dueños (o en ?user_id=); si no,
+# solo en lo del usuario. Orden por relevancia, así que el cursor es un
+# desplazamiento acotado a busqueda.MAX_OFFSET.
+TABLAS_BUSQUEDA = {"mascotas": "mascota", "diagnosticos": "diagnostico", "recetas": "receta"}
+
+
+@api.route('/buscar', methods=['GET'])
+def buscar():
+    palabras = busqueda.terminos(request.args.get('q'))
+    if not palabras:
+        return jsonify({"success": False, "message": "Falta 'q'"}), 400
+
+    if g.user_id is not None and 'clinica' in g.scopes:
+        user_id = request.args.get('user_id', type=int)
+    else:
+        user_id = _user_id_efectivo(request.args.get('user_id', type=int))
+        if not user_id:
+            return jsonify({"success": False, "message": "Falta user_id"}), 400
+
+    en = request.args.get('en')
+    if en and en not in TABLAS_BUSQUEDA:
+        raise ParametroInvalido(f"'en' debe ser uno de: {', '.join(TABLAS_BUSQUEDA)}")
+
+    limite = max(1, min(request.args.get('limite', 20, type=int), 100))
+    cursor = request.args.get('cursor', '0')
+    if not cursor.isdigit() or int(cursor) > busqueda.MAX_OFFSET:
+        raise ParametroInvalido("Cursor no válido")
+    offset = int(cursor)
+
+    resultados = busqueda.buscar(db.session, palabras, user_id, TABLAS_BUSQUEDA.get(en), limite + 1, offset)
+    next_cursor = None
+    if len(resultados) > limite and offset + limite <= busqueda.MAX_OFFSET:
+        next_cursor = str(offset + limite)
+
+    return jsonify({
+        "success": True,
+        "resultados": resultados[:limite],
+        "next_cursor": next_cursor
+    }), 200
+
+
+# ============================================================
+# VACUNAS PENDIENTES (PRÓXIMAS DOSIS)
+# ============================================================
+def _fecha_param(nombre, por_defecto):
+    valor = request.args.get(nombre)
+    if not valor:
+        return por_defecto
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise ParametroInvalido(f"Fecha '{nombre}' no válida")
+
+
+@api.route('/usuarios/<int:user_id>/pendientes', methods=['GET'])
+def obtener_pendientes_usuario(user_id):
+    _verificar_usuario(user_id)
+
+    try:
+        dias = int(request.args.get('dias', 30))
+    except ValueError:
+        raise ParametroInvalido("'dias' debe ser un número")
+
+    hoy = date.today()
+    hasta = hoy + timedelta(days=max(dias, 0))
+
+    # Incluye las ya vencidas: todo lo que tenga próxima dosis hasta `hasta`
+    pendientes, next_cursor = paginar(
+        Vacuna,
+        [Mascota.user_id == user_id, Vacuna.proxima_dosis.isnot(None), Vacuna.proxima_dosis <= hasta],
+        {"fecha": Vacuna.proxima_dosis},
+        extra={"mascota_id": Vacuna.mascota_id, "mascota": Mascota.nombre},
+        uniones=[Mascota],
+        orden_por_defecto="fecha",
+    )
+    for p in pendientes:
+        if "proxima_dosis" in p:
+            p["vencida"] = p["proxima_dosis"] < hoy
+
+    return jsonify({
+        "success": True,
+        "pendientes": pendientes,
+        "next_cursor": next_cursor
+    }), 200
+
+
+@api.route('/pendientes', methods=['GET'])
+def obtener_pendientes_clinica():
+    _requiere_scope('clinica')
+
+    hoy = date.today()
+    desde = _fecha_param('desde', hoy)
+    hasta = _fecha_param('hasta', hoy + timedelta(days=7))
+
+    pendientes, next_cursor = paginar(
+        Vacuna,
+        [Vacuna.proxima_dosis >= desde, Vacuna.proxima_dosis <= hasta],
+        {"fecha": Vacuna.proxima_dosis},
+        extra={"mascota_id": Vacuna.mascota_id, "mascota": Mascota.nombre, "user_id": Mascota.user_id},
+        uniones=[Mascota],
+        orden_por_defecto="fecha",
+    )
+
+    return jsonify({
+        "success": True,
+        "desde": desde,
+        "hasta": hasta,
+        "pendientes": pendientes,
+        "next_cursor": next_cursor
+    }), 200
+
+
+# ============================================================
+# ESTADÍSTICAS DE LA CLÍNICA
+# ============================================================
+# Leen solo la tabla de agregados (ver estadisticas.py): el costo no
+# depende del tamaño del historial. Rango con ?desde=&hasta= (por defecto
+# el último año), ?agrupar=mes|trimestre|anio y filtros ?especie=&raza=.
+def _rango_estadisticas():
+    hoy = date.today()
+    desde = _fecha_param('desde', hoy.replace(year=hoy.year - 1, day=1))
+    hasta = _fecha_param('hasta', hoy)
+    agrupar = request.args.get('agrupar', 'mes')
+    if agrupar not in estadisticas.AGRUPACIONES:
+        raise ParametroInvalido(f"'agrupar' debe ser uno de: {', '.join(estadisticas.AGRUPACIONES)}")
+    return desde, hasta, agrupar
+
+
+@api.route('/estadisticas/vacunacion', methods=['GET'])
+def estadisticas_vacunacion():
+    _requiere_scope('clinica')
+    desde, hasta, agrupar = _rango_estadisticas()
+    especie, raza = request.args.get('especie'), request.args.get('raza')
+
+    return jsonify({
+        "success": True,
+        "desde": desde,
+        "hasta": hasta,
+        "cobertura": estadisticas.cobertura(especie, raza, por_raza=request.args.get('por') != 'especie'),
+        "aplicaciones": estadisticas.serie("vacunas", desde, hasta, agrupar, especie, raza,
+                                           request.args.get('vacuna'))
+    }), 200
+
+
+@api.route('/estadisticas/prevenciones-vencidas', methods=['GET'])
+def estadisticas_prevenciones_vencidas():
+    _requiere_scope('clinica')
+    desde, hasta, agrupar = _rango_estadisticas()
+
+    return jsonify({
+        "success": True,
+        "desde": desde,
+        "hasta": hasta,
+        "vencidas": estadisticas.prevenciones_vencidas(
+            desde, hasta, agrupar, request.args.get('especie'), request.args.get('raza'),
+        )
+    }), 200
+
+
+@api.route('/estadisticas/medicamentos', methods=['GET'])
+def estadisticas_medicamentos():
+    _requiere_scope('clinica')
+    desde, hasta, agrupar = _rango_estadisticas()
+    especie, raza = request.args.get('especie'), request.args.get('raza')
+    limite = max(1, min(request.args.get('limite', 10, type=int), 100))
+
+    mas_recetados = estadisticas.ranking("recetas", desde, hasta, limite, especie, raza)
+    por_periodo = estadisticas.series("recetas", [m["clave"] for m in mas_recetados], desde, hasta, agrupar,
+                                      especie, raza)
+    return jsonify({
+        "success": True,
+        "desde": desde,
+        "hasta": hasta,
+        "medicamentos": [
+            {"medicamento": m["clave"], "recetas": m["total"], "por_periodo": por_periodo[m["clave"]]}
+            for m in mas_recetados
+        ]
+    }), 200
+
+
 # ============================================================
 # DIAGNÓSTICOS
 # ============================================================
 @api.route('/mascotas/<int:mascota_id>/diagnosticos', methods=['GET'])
+@condicional.condicional(lambda mascota_id: _version_de_mascota(mascota_id, Diagnostico))
+@cache.cacheado(lambda mascota_id: [f"m:{mascota_id}"])
 def obtener_diagnosticos(mascota_id):
-    diagnosticos = Diagnostico.query.filter_by(mascota_id=mascota_id).all()
+    filtros, uniones = _alcance(Diagnostico)
+    diagnosticos, next_cursor = paginar(
+        Diagnostico,
+        [Diagnostico.mascota_id == mascota_id] + filtros,
+        {"id": Diagnostico.id, "fecha": Diagnostico.fecha},
+        uniones=uniones,
+    )
 
     return jsonify({
         "success": True,
-        "diagnosticos": [
-            {
-                "id": d.id,
-                "titulo": d.titulo,
-                "fecha": d.fecha.isoformat(),
-                "descripcion": d.descripcion
-            }
-            for d in diagnosticos
-        ]
+        "diagnosticos": diagnosticos,
+        "next_cursor": next_cursor
     }), 200
 
 
@@ -325,6 +1199,9 @@ def agregar_diagnostico():
     if not data.get("titulo") or not data.get("fecha") or not data.get("mascota_id"):
         return jsonify({"success": False, "message": "Faltan datos"}), 400
 
+    if g.user_id is not None and not _propio(Mascota, data.get("mascota_id")):
+        return jsonify({"success": False, "message": "Mascota no encontrada"}), 404
+
     nuevo = Diagnostico(
         titulo=data.get("titulo"),
         fecha=date.fromisoformat(data.get("fecha")),
@@ -334,13 +1211,14 @@ def agregar_diagnostico():
 
     db.session.add(nuevo)
     db.session.commit()
+    cache.invalidar(f"m:{nuevo.mascota_id}")
 
     return jsonify({"success": True, "message": "Diagnóstico agregado", "id": nuevo.id}), 201
 
 
 @api.route('/diagnosticos/<int:id>', methods=['PUT'])
 def actualizar_diagnostico(id):
-    diag = Diagnostico.query.get(id)
+    diag = _propio(Diagnostico, id)
     if not diag:
         return jsonify({"success": False, "message": "Diagnóstico no encontrado"}), 404
 
@@ -351,18 +1229,20 @@ def actualizar_diagnostico(id):
     diag.descripcion = data.get("descripcion", diag.descripcion)
 
     db.session.commit()
+    cache.invalidar(f"m:{diag.mascota_id}")
 
     return jsonify({"success": True, "message": "Diagnóstico actualizado"}), 200
 
 
 @api.route('/diagnosticos/<int:id>', methods=['DELETE'])
 def eliminar_diagnostico(id):
-    diag = Diagnostico.query.get(id)
+    diag = _propio(Diagnostico, id)
     if not diag:
         return jsonify({"success": False, "message": "Diagnóstico no encontrado"}), 404
 
     db.session.delete(diag)
     db.session.commit()
+    cache.invalidar(f"m:{diag.mascota_id}")
     return jsonify({"success": True, "message": "Diagnóstico eliminado"}), 200
 
 
@@ -370,21 +1250,21 @@ def eliminar_diagnostico(id):
 # RECETAS
 # ============================================================
 @api.route('/mascotas/<int:mascota_id>/recetas', methods=['GET'])
+@condicional.condicional(lambda mascota_id: _version_de_mascota(mascota_id, Receta))
+@cache.cacheado(lambda mascota_id: [f"m:{mascota_id}"])
 def obtener_recetas(mascota_id):
-    recetas = Receta.query.filter_by(mascota_id=mascota_id).all()
+    filtros, uniones = _alcance(Receta)
+    recetas, next_cursor = paginar(
+        Receta,
+        [Receta.mascota_id == mascota_id] + filtros,
+        {"id": Receta.id, "fecha": Receta.fecha},
+        uniones=uniones,
+    )
 
     return jsonify({
         "success": True,
-        "recetas": [
-            {
-                "id": r.id,
-                "medicamento": r.medicamento,
-                "dosis": r.dosis,
-                "fecha": r.fecha.isoformat(),
-                "instrucciones": r.instrucciones
-            }
-            for r in recetas
-        ]
+        "recetas": recetas,
+        "next_cursor": next_cursor
     }), 200
 
 
@@ -395,6 +1275,9 @@ def agregar_receta():
     if not data.get("medicamento") or not data.get("dosis") or not data.get("fecha") or not data.get("mascota_id"):
         return jsonify({"success": False, "message": "Faltan datos"}), 400
 
+    if g.user_id is not None and not _propio(Mascota, data.get("mascota_id")):
+        return jsonify({"success": False, "message": "Mascota no encontrada"}), 404
+
     nueva = Receta(
         medicamento=data.get("medicamento"),
         dosis=data.get("dosis"),
@@ -405,13 +1288,14 @@ def agregar_receta():
 
     db.session.add(nueva)
     db.session.commit()
+    cache.invalidar(f"m:{nueva.mascota_id}")
 
     return jsonify({"success": True, "message": "Receta agregada", "id": nueva.id}), 201
 
 
 @api.route('/recetas/<int:id>', methods=['PUT'])
 def actualizar_receta(id):
-    receta = Receta.query.get(id)
+    receta = _propio(Receta, id)
     if not receta:
         return jsonify({"success": False, "message": "Receta no encontrada"}), 404
 
@@ -423,18 +1307,20 @@ def actualizar_receta(id):
     receta.instrucciones = data.get("instrucciones", receta.instrucciones)
 
     db.session.commit()
+    cache.invalidar(f"m:{receta.mascota_id}")
 
     return jsonify({"success": True, "message": "Receta actualizada"}), 200
 
 
 @api.route('/recetas/<int:id>', methods=['DELETE'])
 def eliminar_receta(id):
-    receta = Receta.query.get(id)
+    receta = _propio(Receta, id)
     if not receta:
         return jsonify({"success": False, "message": "Receta no encontrada"}), 404
 
     db.session.delete(receta)
     db.session.commit()
+    cache.invalidar(f"m:{receta.mascota_id}")
     return jsonify({"success": True, "message": "Receta eliminada"}), 200
 
 
@@ -442,20 +1328,21 @@ def eliminar_receta(id):
 # PREVENCIONES
 # ============================================================
 @api.route('/mascotas/<int:mascota_id>/prevenciones', methods=['GET'])
+@condicional.condicional(lambda mascota_id: _version_de_mascota(mascota_id, Prevencion))
+@cache.cacheado(lambda mascota_id: [f"m:{mascota_id}"])
 def obtener_prevenciones(mascota_id):
-    prevenciones = Prevencion.query.filter_by(mascota_id=mascota_id).all()
+    filtros, uniones = _alcance(Prevencion)
+    prevenciones, next_cursor = paginar(
+        Prevencion,
+        [Prevencion.mascota_id == mascota_id] + filtros,
+        {"id": Prevencion.id, "fecha": Prevencion.fecha},
+        uniones=uniones,
+    )
 
     return jsonify({
         "success": True,
-        "prevenciones": [
-            {
-                "id": p.id,
-                "tipo": p.tipo,
-                "fecha": p.fecha.isoformat(),
-                "descripcion": p.descripcion
-            }
-            for p in prevenciones
-        ]
+        "prevenciones": prevenciones,
+        "next_cursor": next_cursor
     }), 200
 
 
@@ -466,6 +1353,9 @@ def agregar_prevencion():
     if not data.get("tipo") or not data.get("fecha") or not data.get("mascota_id"):
         return jsonify({"success": False, "message": "Faltan datos"}), 400
 
+    if g.user_id is not None and not _propio(Mascota, data.get("mascota_id")):
+        return jsonify({"success": False, "message": "Mascota no encontrada"}), 404
+
     nueva = Prevencion(
         tipo=data.get("tipo"),
         fecha=date.fromisoformat(data.get("fecha")),
@@ -474,34 +1364,41 @@ def agregar_prevencion():
     )
 
     db.session.add(nueva)
+    calendario.recalcular_prevenciones(nueva.mascota_id, [nueva.tipo])
     db.session.commit()
+    cache.invalidar(f"m:{nueva.mascota_id}")
 
     return jsonify({"success": True, "message": "Prevención agregada", "id": nueva.id}), 201
 
 
 @api.route('/prevenciones/<int:id>', methods=['PUT'])
 def actualizar_prevencion(id):
-    prev = Prevencion.query.get(id)
+    prev = _propio(Prevencion, id)
     if not prev:
         return jsonify({"success": False, "message": "Prevención no encontrada"}), 404
 
     data = request.get_json() or {}
 
+    tipo_anterior = prev.tipo
     prev.tipo = data.get("tipo", prev.tipo)
     prev.fecha = date.fromisoformat(data.get("fecha")) if data.get("fecha") else prev.fecha
     prev.descripcion = data.get("descripcion", prev.descripcion)
+    calendario.recalcular_prevenciones(prev.mascota_id, [tipo_anterior, prev.tipo])
 
     db.session.commit()
+    cache.invalidar(f"m:{prev.mascota_id}")
 
     return jsonify({"success": True, "message": "Prevención actualizada"}), 200
 
 
 @api.route('/prevenciones/<int:id>', methods=['DELETE'])
 def eliminar_prevencion(id):
-    prev = Prevencion.query.get(id)
+    prev = _propio(Prevencion, id)
     if not prev:
         return jsonify({"success": False, "message": "Prevención no encontrada"}), 404
 
     db.session.delete(prev)
+    calendario.recalcular_prevenciones(prev.mascota_id, [prev.tipo])
     db.session.commit()
+    cache.invalidar(f"m:{prev.mascota_id}")
     return jsonify({"success": True, "message": "Prevención eliminada"}), 200
@@ -1,6 +1,7 @@
 import os
 from datetime import datetime
 
+import click
 from flask import (
     Flask,
     render_template,
@@ -17,27 +18,78 @@ from flask_login import (
     login_required,
     current_user,
 )
-from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
 
 from models import db, Usuario, Mascota, Vacuna, Diagnostico, Receta, Prevencion
 from api import api  # Blueprint con la API REST
+from media import MediaInvalida
+import basedatos
+import borrado
+import cache
+import compresion
+import imagenes
+import instrumentacion
+import lecturas
+import microchips
+import replicas
+import seguridad
+import serializacion
+import tokens
 
 # ------------------ CONFIGURACIÓN DE LA APP ------------------
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = 'clave_secreta'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///vacunapet.db'
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'clave_secreta')
+basedatos.configurar(app)  # DATABASE_URL, pragmas de SQLite / pool de PostgreSQL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['HASH_WORKERS'] = int(os.environ.get('HASH_WORKERS', 2))
+app.config['HASH_MAX_EN_COLA'] = int(os.environ.get('HASH_MAX_EN_COLA', 8))
+# Tokens de la API: el modo heredado por user_id (sin token, obsoleto) solo con esto en 1
+app.config['API_MODO_HEREDADO'] = os.environ.get('API_MODO_HEREDADO', '0') == '1'
+app.config['CLINICA_EMAILS'] = [e for e in os.environ.get('CLINICA_EMAILS', '').split(',') if e]
+# Clave de los tokens; sin ella (ni un SECRET_KEY propio) la API no emite tokens
+app.config['TOKEN_SECRET'] = os.environ.get('TOKEN_SECRET')
+tokens.validar_configuracion(app)
+# Caché de lecturas de la API: "memoria", "sqlite" (compartida entre workers) o "ninguno"
+app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'memoria')
+app.config['CACHE_TTL'] = int(os.environ.get('CACHE_TTL', 300))
+# Instrumentación: /metrics protegido si se define METRICAS_TOKEN; perfilador apagado con 0
+app.config['METRICAS_TOKEN'] = os.environ.get('METRICAS_TOKEN')
+app.config['PERFILADOR_UMBRAL_MS'] = int(os.environ.get('PERFILADOR_UMBRAL_MS', 0))
+# Recordatorios (worker aparte, ver recordatorios.py): destinos "log", "smtp", "webhook"
+app.config['RECORDATORIOS_DESTINOS'] = [d for d in os.environ.get('RECORDATORIOS_DESTINOS', 'log').split(',') if d]
+app.config['RECORDATORIOS_ANTICIPACION_DIAS'] = int(os.environ.get('RECORDATORIOS_ANTICIPACION_DIAS', 7))
+app.config['RECORDATORIOS_SMTP_HOST'] = os.environ.get('RECORDATORIOS_SMTP_HOST', 'localhost')
+app.config['RECORDATORIOS_SMTP_PORT'] = int(os.environ.get('RECORDATORIOS_SMTP_PORT', 1025))
+app.config['RECORDATORIOS_WEBHOOK_URL'] = os.environ.get('RECORDATORIOS_WEBHOOK_URL')
+# Respuestas JSON: "auto" usa orjson si está instalado; compresión gzip/br/zstd desde este tamaño
+app.config['JSON_BACKEND'] = os.environ.get('JSON_BACKEND', 'auto')
+app.config['COMPRESION'] = os.environ.get('COMPRESION', '1') == '1'
+app.config['COMPRESION_MIN_BYTES'] = int(os.environ.get('COMPRESION_MIN_BYTES', 1024))
+# Borrado de mascotas: 1 = solo se marcan y el purgador (`flask --app app purgar-mascotas`) las borra
+app.config['MASCOTAS_BORRADO_DIFERIDO'] = os.environ.get('MASCOTAS_BORRADO_DIFERIDO', '0') == '1'
+# Modo ASGI (uvicorn asgi:app, ver asgi.py): hilos para la app y umbrales de memoria en bytes
+app.config['ASGI_HILOS'] = int(os.environ.get('ASGI_HILOS', 16))
+app.config['ASGI_CUERPO_EN_MEMORIA'] = int(os.environ.get('ASGI_CUERPO_EN_MEMORIA', 1024 * 1024))
+app.config['ASGI_RESPUESTA_EN_MEMORIA'] = int(os.environ.get('ASGI_RESPUESTA_EN_MEMORIA', 4 * 1024 * 1024))
 app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
+app.config['MEDIA_FOLDER'] = os.environ.get('MEDIA_FOLDER', os.path.join(os.getcwd(), 'media'))
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['MEDIA_FOLDER'], exist_ok=True)
 
 db.init_app(app)
-
-# 🔥 CREAR TABLAS SIEMPRE (Render + local)
+serializacion.instalar(app)
 with app.app_context():
-    db.create_all()
+    basedatos.preparar_motor(app, db.engine)
+    replicas.instalar(app, db)  # DATABASE_REPLICA_URLS: lecturas a réplicas
+    for motor in replicas.motores():
+        basedatos.preparar_motor(app, motor, replica=True)
+    instrumentacion.instalar(app, db.engine, *replicas.motores())
+# Después de la instrumentación: su after_request corre antes y cuenta en Server-Timing
+compresion.instalar(app)
+
+# El esquema se crea/actualiza con `flask --app app migrar` (ver migraciones.py),
+# no al importar la app: varios workers de gunicorn no deben correr DDL a la vez.
 
 # ------------------ LOGIN MANAGER ------------------
 
@@ -83,13 +135,17 @@ def register():
             flash('El correo ya está registrado.')
             return redirect(url_for('register'))
 
-        password_hash = generate_password_hash(password_plain)
+        try:
+            seguridad.admitir_intento(None, request.remote_addr)
+            password_hash = seguridad.generar_hash(password_plain)
+        except (seguridad.DemasiadosIntentos, seguridad.HashingSaturado) as e:
+            flash(str(e))
+            return redirect(url_for('register'))
         nuevo = Usuario(
             nombre=nombre,
             apellido=apellido,
             email=email,
-            password=password_hash,
-            foto=""
+            password=password_hash
         )
         db.session.add(nuevo)
         db.session.commit()
@@ -107,12 +163,26 @@ def login():
         email = request.form['email']
         password_plain = request.form['password']
 
-        usuario = Usuario.query.filter_by(email=email).first()
-
-        if usuario and check_password_hash(usuario.password, password_plain):
+        try:
+            seguridad.admitir_intento(email, request.remote_addr)
+            usuario = Usuario.query.filter_by(email=email).first()
+            valido = usuario and seguridad.verificar_password(usuario.password, password_plain)
+        except (seguridad.DemasiadosIntentos, seguridad.HashingSaturado) as e:
+            flash(str(e))
+            return redirect(url_for('login'))
+
+        if valido:
+            seguridad.registrar_exito(email)
+            if seguridad.necesita_rehash(usuario.password):
+                try:
+                    usuario.password = seguridad.generar_hash(password_plain)
+                    db.session.commit()
+                except seguridad.HashingSaturado:
+                    pass
             login_user(usuario)
             return redirect(url_for('dashboard'))
 
+        seguridad.registrar_fallo(email)
         flash('Credenciales incorrectas.')
         return redirect(url_for('login'))
 
@@ -131,7 +201,8 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    mascotas = Mascota.query.filter_by(user_id=current_user.id).all()
+    # Conteos y últimos registros en la misma consulta (ver lecturas.py)
+    mascotas = lecturas.tarjetas_mascotas(current_user.id)
     return render_template('dashboard.html', mascotas=mascotas)
 
 # ------------------ AGREGAR MASCOTA WEB ------------------
@@ -156,14 +227,12 @@ def add_pet():
                 return redirect(url_for("add_pet"))
 
         peso = request.form.get("peso")
-        microchip = request.form.get("microchip")
         castrado = request.form.get("castrado") == "True"
-
-        foto = request.files.get("foto")
-        filename = None
-        if foto and foto.filename != '':
-            filename = secure_filename(foto.filename)
-            foto.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        try:
+            microchip = microchips.asignable(request.form.get("microchip"))
+        except (microchips.MicrochipInvalido, microchips.MicrochipRegistrado) as e:
+            flash(str(e))
+            return redirect(url_for("add_pet"))
 
         nueva = Mascota(
             nombre=nombre,
@@ -173,17 +242,133 @@ def add_pet():
             peso=peso,
             microchip=microchip,
             castrado=castrado,
-            foto=filename,
             user_id=current_user.id
         )
 
+        # Variantes WebP (miniatura/mediana/original) generadas una sola vez
+        foto = request.files.get("foto")
+        if foto and foto.filename != '':
+            try:
+                imagenes.asignar_foto_archivo(nueva, foto)
+            except MediaInvalida as e:
+                flash(str(e))
+                return redirect(url_for("add_pet"))
+
         db.session.add(nueva)
-        db.session.commit()
+        try:
+            microchips.confirmar(microchip)
+        except microchips.MicrochipRegistrado as e:
+            flash(str(e))
+            return redirect(url_for("add_pet"))
+        cache.invalidar(f"u:{current_user.id}")
+        microchips.olvidar_negativo(microchip)
         flash("Mascota registrada correctamente.")
         return redirect(url_for("dashboard"))
 
     return render_template("add_pet_form.html")
 
+# ------------------ COMANDOS CLI ------------------
+
+@app.cli.command('migrar')
+@click.option('--hasta', type=int, default=None, help='Aplicar solo hasta esta versión.')
+@click.option('--estado', is_flag=True, help='Mostrar la versión actual y las pendientes.')
+def migrar_command(hasta, estado):
+    """Aplica las migraciones de esquema pendientes."""
+    import migraciones
+
+    if estado:
+        print(f"Versión actual: {migraciones.version_actual(db.engine)}")
+        for version, descripcion, _ in migraciones.pendientes(db.engine):
+            print(f"  pendiente {version:03d} {descripcion}")
+        return
+
+    aplicadas = migraciones.aplicar(db.engine, hasta=hasta)
+    if not aplicadas:
+        print("El esquema ya está al día.")
+
+@app.cli.command('migrar-fotos')
+def migrar_fotos_command():
+    """Mueve las fotos base64 de usuario al almacén de media."""
+    from media import migrar_fotos_usuarios
+
+    total = migrar_fotos_usuarios()
+    print(f"Fotos migradas: {total}")
+
+@app.cli.command('procesar-fotos-mascotas')
+def procesar_fotos_mascotas_command():
+    """Genera las variantes WebP de las fotos de mascota heredadas."""
+    procesadas, sin_archivo = imagenes.procesar_fotos_heredadas()
+    print(f"Fotos procesadas: {procesadas} (sin archivo: {sin_archivo})")
+
+@app.cli.command('exportar')
+@click.option('--user-id', type=int, default=None, help='Solo este usuario (por defecto, toda la clínica).')
+@click.option('--formato', type=click.Choice(['ndjson', 'csv']), default='ndjson')
+@click.option('--salida', type=click.File('w', encoding='utf-8'), default='-', help='Archivo destino (por defecto stdout).')
+def exportar_command(user_id, formato, salida):
+    """Exporta mascotas e historial en streaming."""
+    import exportacion
+
+    for bloque in exportacion.exportar(formato, user_id):
+        salida.write(bloque)
+
+@app.cli.command('importar')
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', type=int, default=None, help='Dueño de todo lo importado (por defecto, el user_id de cada mascota).')
+@click.option('--formato', type=click.Choice(['ndjson', 'csv']), default=None, help='Por defecto, según la extensión.')
+@click.option('--reanudar', type=int, default=None, help='Id de una importación cortada.')
+@click.option('--lote', type=int, default=1000, help='Registros por transacción.')
+def importar_command(archivo, user_id, formato, reanudar, lote):
+    """Importa un archivo exportado; si se corta, se reanuda con --reanudar."""
+    import exportacion
+    from models import Importacion
+
+    if reanudar:
+        importacion = db.session.get(Importacion, reanudar)
+        if not importacion:
+            raise click.ClickException(f"No existe la importación {reanudar}")
+    else:
+        formato = formato or ('csv' if archivo.lower().endswith('.csv') else 'ndjson')
+        importacion = exportacion.crear_importacion(formato, user_id)
+        print(f"Importación {importacion.id} (reanudar con --reanudar {importacion.id})")
+
+    def progreso(estado):
+        print(f"  {estado['registros']} registros, {estado['insertados']} insertados, {estado['errores']} errores")
+
+    with open(archivo, encoding='utf-8', newline='') as texto:
+        estado, errores = exportacion.importar(texto, importacion, lote=lote, progreso=progreso)
+    for error in errores:
+        print(f"  registro {error['registro']}: {error['message']}")
+    print(f"Importación {estado['id']} {estado['estado']}: {estado['insertados']} insertados, {estado['errores']} errores")
+
+@app.cli.command('recordatorios')
+@click.option('--una-vez', is_flag=True, help='Planificar y entregar una sola vez y salir.')
+@click.option('--intervalo', type=int, default=30, help='Segundos entre rondas de entrega.')
+@click.option('--planificar-cada', type=int, default=3600, help='Segundos entre planificaciones.')
+def recordatorios_command(una_vez, intervalo, planificar_cada):
+    """Worker de recordatorios de vacunas y prevenciones."""
+    import recordatorios
+
+    recordatorios.ejecutar_worker(intervalo=intervalo, planificar_cada=planificar_cada, una_vez=una_vez)
+
+
+@app.cli.command('purgar-mascotas')
+@click.option('--una-vez', is_flag=True, help='Purgar lo pendiente y salir.')
+@click.option('--intervalo', type=int, default=60, help='Segundos entre rondas.')
+@click.option('--lote', type=int, default=1000, help='Filas de historial por transacción.')
+def purgar_mascotas_command(una_vez, intervalo, lote):
+    """Borra el historial y las fotos de las mascotas eliminadas en modo diferido."""
+    borrado.ejecutar_purgador(intervalo=intervalo, lote=lote, una_vez=una_vez)
+
+
+@app.cli.command('reconstruir-estadisticas')
+def reconstruir_estadisticas_command():
+    """Rehace desde cero los agregados de /api/estadisticas."""
+    import estadisticas
+
+    with db.engine.begin() as conn:
+        estadisticas.reconstruir(conn)
+    print("Estadísticas reconstruidas")
+
 # ------------------ EJECUCIÓN LOCAL ------------------
 
 if __name__ == '__main__':
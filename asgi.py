@@ -0,0 +1,216 @@
+import asyncio
+import json
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as aplicacion
+from models import db
+
+# ============================================================
+# MODO ASGI (CLIENTES LENTOS)
+# ============================================================
+#   uvicorn asgi:app --workers <núcleos> --host 0.0.0.0 --port 8000
+#
+# Con gunicorn sync un worker queda tomado mientras el cliente sube el
+# cuerpo o descarga la respuesta: un móvil con mala señal lo bloquea
+# durante segundos sin gastar CPU. Aquí toda la E/S con el cliente la
+# hace el bucle de eventos y la app Flask de siempre (API y web, sin
+# cambios) corre en un pool de ASGI_HILOS hilos solo cuando hay trabajo:
+#   1. el cuerpo se recibe en el bucle: en memoria hasta
+#      ASGI_CUERPO_EN_MEMORIA bytes y en un archivo temporal a partir de
+#      ahí (fotos, importaciones). Si supera MAX_CONTENT_LENGTH se
+#      responde 413 sin ocupar un hilo.
+#   2. la vista corre en un hilo con el cuerpo ya completo.
+#   3. las respuestas de hasta ASGI_RESPUESTA_EN_MEMORIA bytes se arman
+#      enteras en el hilo, que queda libre antes de enviarlas. Las de
+#      streaming (exportación) pasan bloque a bloque por una cola
+#      acotada: el hilo espera si el cliente no da abasto.
+#
+# El acceso a la base sigue siendo síncrono, dentro del hilo: las
+# consultas de la API son cortas y los hooks de la Session (revisiones,
+# índice de búsqueda, caché) son los mismos en los dos modos.
+
+_FIN = object()
+
+
+class _Demasiado(Exception):
+    pass
+
+
+class _Desconectado(Exception):
+    pass
+
+
+def _environ(scope, cuerpo, largo):
+    """Entorno WSGI (PEP 3333) de una petición HTTP ASGI ya recibida."""
+    servidor = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": servidor[0],
+        "SERVER_PORT": str(servidor[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "CONTENT_LENGTH": str(largo),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": cuerpo,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+    for nombre, valor in scope["headers"]:
+        nombre = nombre.decode("latin-1").upper().replace("-", "_")
+        valor = valor.decode("latin-1")
+        if nombre == "CONTENT_LENGTH":
+            continue
+        clave = nombre if nombre == "CONTENT_TYPE" else "HTTP_" + nombre
+        environ[clave] = f"{environ[clave]},{valor}" if clave in environ else valor
+    return environ
+
+
+class PuenteASGI:
+    """Sirve una app WSGI por ASGI sin dejar hilos esperando al cliente."""
+
+    def __init__(self, wsgi, hilos=16, cuerpo_en_memoria=1024 * 1024,
+                 respuesta_en_memoria=4 * 1024 * 1024, max_cuerpo=None):
+        self.wsgi = wsgi
+        self.hilos = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="asgi")
+        self.cuerpo_en_memoria = cuerpo_en_memoria
+        self.respuesta_en_memoria = respuesta_en_memoria
+        self.max_cuerpo = max_cuerpo
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._ciclo_de_vida(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+        else:
+            raise NotImplementedError(f"Tipo de conexión no soportado: {scope['type']}")
+
+    async def _ciclo_de_vida(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif mensaje["type"] == "lifespan.shutdown":
+                self.hilos.shutdown(wait=True)
+                with aplicacion.app_context():
+                    db.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # ------------------ PETICIÓN ------------------
+
+    async def _recibir(self, scope, receive):
+        declarado = next((v for k, v in scope["headers"] if k == b"content-length"), None)
+        if self.max_cuerpo and declarado and declarado.isdigit() and int(declarado) > self.max_cuerpo:
+            raise _Demasiado()
+
+        cuerpo = tempfile.SpooledTemporaryFile(max_size=self.cuerpo_en_memoria)
+        largo = 0
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "http.disconnect":
+                cuerpo.close()
+                raise _Desconectado()
+            datos = mensaje.get("body", b"")
+            largo += len(datos)
+            if self.max_cuerpo and largo > self.max_cuerpo:
+                cuerpo.close()
+                raise _Demasiado()
+            cuerpo.write(datos)
+            if not mensaje.get("more_body", False):
+                break
+        cuerpo.seek(0)
+        return cuerpo, largo
+
+    async def _http(self, scope, receive, send):
+        try:
+            cuerpo, largo = await self._recibir(scope, receive)
+        except _Desconectado:
+            return
+        except _Demasiado:
+            datos = json.dumps({"success": False, "message": "Cuerpo demasiado grande"}).encode()
+            await send({"type": "http.response.start", "status": 413, "headers": [
+                (b"content-type", b"application/json"), (b"content-length", str(len(datos)).encode()),
+                (b"connection", b"close"),
+            ]})
+            await send({"type": "http.response.body", "body": datos})
+            return
+
+        bucle = asyncio.get_running_loop()
+        cola = asyncio.Queue(maxsize=8)
+        cancelado = threading.Event()
+
+        def poner(elemento):
+            asyncio.run_coroutine_threadsafe(cola.put(elemento), bucle).result()
+
+        trabajo = bucle.run_in_executor(
+            self.hilos, self._en_hilo, _environ(scope, cuerpo, largo), poner, cancelado,
+        )
+        terminado = False
+        try:
+            inicio = await cola.get()
+            terminado = inicio is _FIN
+            if not terminado:
+                estado, cabeceras = inicio
+                await send({"type": "http.response.start", "status": estado, "headers": cabeceras})
+                while not (terminado := (datos := await cola.get()) is _FIN):
+                    await send({"type": "http.response.body", "body": datos, "more_body": True})
+                await send({"type": "http.response.body", "body": b""})
+        except BaseException:
+            # Cliente desconectado o error al enviar: se libera al hilo
+            cancelado.set()
+            while not terminado:
+                terminado = await cola.get() is _FIN
+            raise
+        finally:
+            cuerpo.close()
+        # Si el hilo falló antes de las cabeceras, la excepción llega al servidor (500)
+        await trabajo
+
+    # ------------------ HILO DE LA APP ------------------
+
+    def _en_hilo(self, environ, poner, cancelado):
+        try:
+            respuesta = {}
+
+            def start_response(estado, cabeceras, exc_info=None):
+                respuesta["estado"], respuesta["cabeceras"] = estado, cabeceras
+                return lambda datos: None  # write() heredado: Flask no lo usa
+
+            iterable = self.wsgi(environ, start_response)
+            try:
+                cabeceras = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in respuesta["cabeceras"]]
+                largo = next((int(v) for k, v in cabeceras if k == b"content-length"), None)
+                poner((int(respuesta["estado"].split(" ", 1)[0]), cabeceras))
+                if largo is not None and largo <= self.respuesta_en_memoria:
+                    poner(b"".join(iterable))
+                else:
+                    for datos in iterable:
+                        if cancelado.is_set():
+                            break
+                        if datos:
+                            poner(datos)
+            finally:
+                cerrar = getattr(iterable, "close", None)
+                if cerrar:
+                    cerrar()
+        finally:
+            poner(_FIN)
+
+
+app = PuenteASGI(
+    aplicacion,
+    hilos=aplicacion.config['ASGI_HILOS'],
+    cuerpo_en_memoria=aplicacion.config['ASGI_CUERPO_EN_MEMORIA'],
+    respuesta_en_memoria=aplicacion.config['ASGI_RESPUESTA_EN_MEMORIA'],
+    max_cuerpo=aplicacion.config.get('MAX_CONTENT_LENGTH'),
+)
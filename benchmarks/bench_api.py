@@ -0,0 +1,379 @@
+"""Prueba de carga de la API con tráfico tipo app Flutter.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_api --objetivo cliente --peticiones 2000
+    python -m benchmarks.bench_api --objetivo gunicorn --workers 4 --concurrencia 8
+    python -m benchmarks.bench_api --salida hoy.json --comparar ayer.json
+
+Crea una base SQLite temporal con usuarios, mascotas y varios años de
+historial, y reproduce una mezcla de operaciones (login, listar
+mascotas, abrir el perfil, agregar vacuna, sincronizar...) contra:
+  - cliente:  el test client de Flask en este proceso (cuenta consultas SQL)
+  - gunicorn: un gunicorn local real, por HTTP y con varios hilos
+
+Por operación informa peticiones/s, latencia p50/p95/p99, errores y
+consultas por petición (solo "cliente"). --salida guarda el resultado
+en JSON y --comparar muestra la diferencia con una ejecución anterior.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from werkzeug.security import generate_password_hash
+
+CLAVE = "clave-bench-123"
+
+# operación -> peso relativo
+MEZCLAS = {
+    "flutter": {
+        "login": 2,
+        "listar_mascotas": 25,
+        "abrir_perfil": 30,
+        "listar_vacunas": 15,
+        "agregar_vacuna": 8,
+        "pendientes": 5,
+        "sync": 15,
+    },
+    "lectura": {
+        "listar_mascotas": 40,
+        "abrir_perfil": 40,
+        "listar_vacunas": 20,
+    },
+    "escritura": {
+        "agregar_vacuna": 70,
+        "abrir_perfil": 30,
+    },
+}
+
+# Registros de historial por mascota y año
+POR_ANIO = {"vacuna": 2, "diagnostico": 3, "receta": 3, "prevencion": 4}
+
+
+# ============================================================
+# DATOS SINTÉTICOS
+# ============================================================
+def sembrar(url, usuarios, mascotas_por_usuario, anios):
+    import calendario
+    import migraciones
+    from models import Usuario, Mascota, Vacuna, Diagnostico, Receta, Prevencion
+
+    rnd = random.Random(42)
+    hoy = date.today()
+    ahora = datetime.utcnow()
+    engine = create_engine(url)
+    migraciones.aplicar(engine, log=lambda _: None)
+
+    # Un solo hash para todos: sembrar no debe tardar lo que tarda el scrypt
+    password = generate_password_hash(CLAVE, os.environ.get('HASH_METODO', 'scrypt'))
+    filas_usuarios = [
+        {"id": u, "nombre": f"u{u}", "apellido": "bench", "email": f"u{u}@bench.local", "password": password}
+        for u in range(1, usuarios + 1)
+    ]
+    filas_mascotas = []
+    historial = {"vacuna": [], "diagnostico": [], "receta": [], "prevencion": []}
+    for u in range(1, usuarios + 1):
+        for _ in range(mascotas_por_usuario):
+            m = len(filas_mascotas) + 1
+            nacimiento = hoy - timedelta(days=365 * anios + rnd.randrange(365))
+            filas_mascotas.append({
+                "id": m, "nombre": f"m{m}", "especie": rnd.choice(["perro", "gato"]), "raza": "mestiza",
+                "fecha_nacimiento": nacimiento, "peso": 10.0, "castrado": False, "foto": "",
+                "user_id": u, "rev": 1, "actualizado_en": ahora,
+            })
+            for tabla, por_anio in POR_ANIO.items():
+                for _ in range(por_anio * anios):
+                    historial[tabla].append((m, nacimiento + timedelta(days=rnd.randrange(365 * anios))))
+
+    columnas = {
+        "vacuna": lambda f: {"nombre": rnd.choice(["Rabia", "Parvovirus", "Moquillo"]), "fecha_aplicacion": f},
+        "diagnostico": lambda f: {"titulo": "Control", "fecha": f, "descripcion": "Sin novedades"},
+        "receta": lambda f: {"medicamento": "Amoxicilina", "dosis": "250 mg", "fecha": f},
+        "prevencion": lambda f: {"tipo": "Antiparasitario", "fecha": f},
+    }
+    modelos = {"vacuna": Vacuna, "diagnostico": Diagnostico, "receta": Receta, "prevencion": Prevencion}
+
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), filas_usuarios)
+        conn.execute(insert(Mascota.__table__), filas_mascotas)
+        for tabla, filas in historial.items():
+            datos = [dict(columnas[tabla](f), mascota_id=m, rev=1, actualizado_en=ahora) for m, f in filas]
+            for i in range(0, len(datos), 20000):
+                conn.execute(insert(modelos[tabla].__table__), datos[i:i + 20000])
+        calendario.recalcular_todo(conn)
+    engine.dispose()
+
+    mascotas = {}
+    for fila in filas_mascotas:
+        mascotas.setdefault(fila["user_id"], []).append(fila["id"])
+    return mascotas, sum(len(f) for f in historial.values())
+
+
+# ============================================================
+# OPERACIONES
+# ============================================================
+def _auth(usuario):
+    return {"Authorization": "Bearer " + usuario["token"]}
+
+
+def operacion(nombre, usuario, rnd):
+    """(método, ruta, cuerpo, cabeceras) de una operación para ese usuario."""
+    mascota_id = rnd.choice(usuario["mascotas"])
+    if nombre == "login":
+        return "POST", "/api/login", {"email": usuario["email"], "password": CLAVE}, {}
+    if nombre == "listar_mascotas":
+        return "GET", "/api/mascotas", None, _auth(usuario)
+    if nombre == "abrir_perfil":
+        return "GET", f"/api/mascotas/{mascota_id}/historial", None, _auth(usuario)
+    if nombre == "listar_vacunas":
+        return "GET", f"/api/mascotas/{mascota_id}/vacunas?orden=-fecha", None, _auth(usuario)
+    if nombre == "agregar_vacuna":
+        cuerpo = {"mascota_id": mascota_id, "nombre": "Rabia", "fecha_aplicacion": date.today().isoformat()}
+        return "POST", "/api/vacunas", cuerpo, _auth(usuario)
+    if nombre == "pendientes":
+        return "GET", f"/api/usuarios/{usuario['id']}/pendientes?dias=60", None, _auth(usuario)
+    if nombre == "sync":
+        return "GET", f"/api/sync?desde_rev={rnd.randint(0, 3)}", None, _auth(usuario)
+    raise ValueError(nombre)
+
+
+# ============================================================
+# OBJETIVOS
+# ============================================================
+class ClienteFlask:
+    """Test client en este proceso; cuenta las consultas SQL de cada petición."""
+
+    concurrencia = 1
+
+    def __init__(self):
+        from sqlalchemy import event
+        from app import app
+        from models import db
+
+        self.cliente = app.test_client()
+        self.consultas = 0
+
+        def contar(*_):
+            self.consultas += 1
+
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", contar)
+
+    def __call__(self, metodo, ruta, cuerpo, cabeceras):
+        self.consultas = 0
+        t0 = time.perf_counter()
+        respuesta = self.cliente.open(ruta, method=metodo, json=cuerpo, headers=cabeceras)
+        segundos = time.perf_counter() - t0
+        return respuesta.status_code, segundos, self.consultas, respuesta.get_json(silent=True)
+
+    def cerrar(self):
+        pass
+
+
+class Gunicorn:
+    """Lanza `gunicorn app:app` en un puerto libre y le habla por HTTP."""
+
+    def __init__(self, workers, concurrencia):
+        self.concurrencia = concurrencia
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.puerto = s.getsockname()[1]
+        raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.proceso = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{self.puerto}",
+             "--log-level", "warning", "app:app"],
+            cwd=raiz, env=os.environ.copy(),
+        )
+        limite = time.monotonic() + 30
+        while time.monotonic() < limite:
+            try:
+                if self("GET", "/ping", None, {})[0] == 200:
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.cerrar()
+        raise RuntimeError("gunicorn no arrancó")
+
+    def __call__(self, metodo, ruta, cuerpo, cabeceras):
+        conexion = http.client.HTTPConnection("127.0.0.1", self.puerto, timeout=30)
+        datos = json.dumps(cuerpo).encode() if cuerpo is not None else None
+        if datos is not None:
+            cabeceras = dict(cabeceras, **{"Content-Type": "application/json"})
+        t0 = time.perf_counter()
+        conexion.request(metodo, ruta, body=datos, headers=cabeceras)
+        respuesta = conexion.getresponse()
+        contenido = respuesta.read()
+        segundos = time.perf_counter() - t0
+        conexion.close()
+        try:
+            cuerpo_json = json.loads(contenido) if contenido else None
+        except ValueError:
+            cuerpo_json = None
+        return respuesta.status, segundos, None, cuerpo_json
+
+    def cerrar(self):
+        self.proceso.terminate()
+        self.proceso.wait(timeout=30)
+
+
+# ============================================================
+# EJECUCIÓN Y RESULTADOS
+# ============================================================
+def preparar_usuarios(objetivo, mascotas, activos, rnd):
+    """Login (no medido) de los usuarios que van a generar tráfico."""
+    usuarios = []
+    for user_id in rnd.sample(sorted(mascotas), min(activos, len(mascotas))):
+        usuario = {"id": user_id, "email": f"u{user_id}@bench.local", "mascotas": mascotas[user_id]}
+        estado, _, _, cuerpo = objetivo("POST", "/api/login", {"email": usuario["email"], "password": CLAVE}, {})
+        if estado != 200:
+            raise RuntimeError(f"Login de preparación falló ({estado}): {cuerpo}")
+        usuario["token"] = cuerpo["access_token"]
+        usuarios.append(usuario)
+    return usuarios
+
+
+def ejecutar(objetivo, usuarios, mezcla, peticiones, semilla=7):
+    nombres = list(mezcla)
+    pesos = [mezcla[n] for n in nombres]
+    medidas = {n: [] for n in nombres}
+    lock = threading.Lock()
+    restantes = [peticiones]
+
+    def hilo(indice):
+        rnd = random.Random(semilla + indice)
+        while True:
+            with lock:
+                if restantes[0] <= 0:
+                    return
+                restantes[0] -= 1
+            nombre = rnd.choices(nombres, pesos)[0]
+            estado, segundos, consultas, _ = objetivo(*operacion(nombre, rnd.choice(usuarios), rnd))
+            with lock:
+                medidas[nombre].append((estado, segundos, consultas))
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(objetivo.concurrencia) as pool:
+        list(pool.map(hilo, range(objetivo.concurrencia)))
+    return medidas, time.perf_counter() - t0
+
+
+def _percentil(ordenados, p):
+    if len(ordenados) == 1:
+        return ordenados[0]
+    return statistics.quantiles(ordenados, n=100, method="inclusive")[p - 1]
+
+
+def resumir(medidas, segundos):
+    operaciones = {}
+    for nombre, filas in medidas.items():
+        if not filas:
+            continue
+        latencias = sorted(s * 1000 for _, s, _ in filas)
+        consultas = [c for _, _, c in filas if c is not None]
+        operaciones[nombre] = {
+            "peticiones": len(filas),
+            "req_s": round(len(filas) / segundos, 1),
+            "p50_ms": round(_percentil(latencias, 50), 2),
+            "p95_ms": round(_percentil(latencias, 95), 2),
+            "p99_ms": round(_percentil(latencias, 99), 2),
+            "errores": sum(1 for e, _, _ in filas if e >= 400),
+            "consultas_por_peticion": round(statistics.mean(consultas), 2) if consultas else None,
+        }
+    total = sum(len(f) for f in medidas.values())
+    return {"peticiones": total, "segundos": round(segundos, 2), "req_s": round(total / segundos, 1),
+            "operaciones": operaciones}
+
+
+def imprimir(nombre_objetivo, resumen, anterior=None):
+    print(f"\n[{nombre_objetivo}] {resumen['peticiones']} peticiones en {resumen['segundos']}s "
+          f"-> {resumen['req_s']} req/s")
+    print(f"  {'operación':18s} {'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} "
+          f"{'errores':>8s} {'SQL/pet':>8s}")
+    for nombre, r in resumen["operaciones"].items():
+        consultas = "-" if r["consultas_por_peticion"] is None else f"{r['consultas_por_peticion']:.1f}"
+        linea = (f"  {nombre:18s} {r['req_s']:8.1f} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['p99_ms']:8.2f} "
+                 f"{r['errores']:8d} {consultas:>8s}")
+        previo = (anterior or {}).get("operaciones", {}).get(nombre)
+        if previo and previo["p95_ms"]:
+            linea += f"   p95 {100 * (r['p95_ms'] / previo['p95_ms'] - 1):+.0f}%"
+        print(linea)
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--objetivo", choices=["cliente", "gunicorn", "ambos"], default="cliente")
+    parser.add_argument("--mezcla", choices=sorted(MEZCLAS), default="flutter")
+    parser.add_argument("--peticiones", type=int, default=2000)
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--mascotas-por-usuario", type=int, default=2)
+    parser.add_argument("--anios", type=int, default=8, help="años de historial por mascota")
+    parser.add_argument("--usuarios-activos", type=int, default=20, help="usuarios que generan tráfico")
+    parser.add_argument("--workers", type=int, default=2, help="workers de gunicorn")
+    parser.add_argument("--concurrencia", type=int, default=4, help="hilos cliente contra gunicorn")
+    parser.add_argument("--salida", help="archivo JSON con los resultados")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior")
+    args = parser.parse_args()
+
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)["resultados"]
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        os.environ['DATABASE_URL'] = "sqlite:///" + os.path.join(carpeta, "bench.db")
+        os.environ['MEDIA_FOLDER'] = os.path.join(carpeta, "media")
+        os.environ.setdefault('SECRET_KEY', 'bench')
+        # Todo el tráfico sale de 127.0.0.1: sin esto el limitador por IP corta los logins
+        os.environ.setdefault('AUTH_MAX_POR_IP', '1000000')
+
+        t0 = time.perf_counter()
+        mascotas, filas = sembrar(os.environ['DATABASE_URL'], args.usuarios, args.mascotas_por_usuario, args.anios)
+        print(f"Datos: {args.usuarios} usuarios, {sum(len(m) for m in mascotas.values())} mascotas, "
+              f"{filas} registros de historial ({time.perf_counter() - t0:.1f}s)")
+        print(f"Mezcla '{args.mezcla}': {MEZCLAS[args.mezcla]}")
+
+        objetivos = ["cliente", "gunicorn"] if args.objetivo == "ambos" else [args.objetivo]
+        resultados = {}
+        for nombre in objetivos:
+            objetivo = ClienteFlask() if nombre == "cliente" else Gunicorn(args.workers, args.concurrencia)
+            try:
+                rnd = random.Random(3)
+                usuarios = preparar_usuarios(objetivo, mascotas, args.usuarios_activos, rnd)
+                medidas, segundos = ejecutar(objetivo, usuarios, MEZCLAS[args.mezcla], args.peticiones)
+            finally:
+                objetivo.cerrar()
+            resultados[nombre] = resumir(medidas, segundos)
+            imprimir(nombre, resultados[nombre], (anterior or {}).get(nombre))
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({
+                "fecha": datetime.now().isoformat(timespec="seconds"),
+                "commit": _commit(),
+                "parametros": vars(args),
+                "resultados": resultados,
+            }, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
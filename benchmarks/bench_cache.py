@@ -0,0 +1,96 @@
+"""Peticiones por segundo de la API con y sin la caché de lecturas.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_cache --filas 100000 --peticiones 5000
+
+Crea una base SQLite temporal, la llena con datos sintéticos y lanza
+una mezcla de lecturas (mascotas, historial, vacunas) con un porcentaje
+de escrituras que invalidan la caché. La misma secuencia se repite con
+CACHE_BACKEND=ninguno, memoria y sqlite.
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.bench_indices import sembrar
+
+
+def _peticiones(n, n_usuarios, n_mascotas, escrituras, semilla=11):
+    """Secuencia fija de (método, url, json) con mascotas "calientes" (distribución sesgada)."""
+    rnd = random.Random(semilla)
+    calientes = max(1, n_mascotas // 50)
+    secuencia = []
+    for _ in range(n):
+        mascota_id = rnd.randint(1, calientes) if rnd.random() < 0.8 else rnd.randint(1, n_mascotas)
+        if rnd.random() < escrituras:
+            secuencia.append(("POST", "/api/vacunas",
+                              {"mascota_id": mascota_id, "nombre": "rabia", "fecha_aplicacion": "2024-01-01"}))
+            continue
+        tipo = rnd.random()
+        if tipo < 0.4:
+            secuencia.append(("GET", f"/api/mascotas/{mascota_id}/historial", None))
+        elif tipo < 0.8:
+            secuencia.append(("GET", f"/api/mascotas/{mascota_id}/vacunas", None))
+        else:
+            secuencia.append(("GET", f"/api/mascotas?user_id={rnd.randint(1, n_usuarios)}", None))
+    return secuencia
+
+
+def medir(app, backend, secuencia):
+    import cache
+
+    app.config['CACHE_BACKEND'] = backend
+    app.extensions.pop("vacunapet_cache", None)
+    cliente = app.test_client()
+
+    t0 = time.perf_counter()
+    for metodo, url, cuerpo in secuencia:
+        respuesta = cliente.open(url, method=metodo, json=cuerpo)
+        assert respuesta.status_code < 400, (url, respuesta.status_code)
+    segundos = time.perf_counter() - t0
+
+    with app.app_context():
+        estado = cache.metricas()
+    return len(secuencia) / segundos, estado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=100_000, help="filas de historial en total")
+    parser.add_argument("--peticiones", type=int, default=5000)
+    parser.add_argument("--escrituras", type=float, default=0.05, help="fracción de peticiones que escriben")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        # La app lee la configuración al importarse
+        os.environ['DATABASE_URL'] = "sqlite:///" + os.path.join(carpeta, "bench.db")
+        os.environ.setdefault('MEDIA_FOLDER', os.path.join(carpeta, "media"))
+        # Usuarios sintéticos sin token: modo heredado, sin su aviso por petición
+        os.environ['API_MODO_HEREDADO'] = "1"
+        from app import app
+        app.logger.setLevel(logging.ERROR)
+        from models import db
+        import migraciones
+
+        app.config['CACHE_SQLITE_RUTA'] = os.path.join(carpeta, "cache.db")
+        with app.app_context():
+            migraciones.aplicar(db.engine, log=lambda _: None)
+            n_usuarios, n_mascotas = sembrar(db.engine, args.filas)
+        print(f"Datos: {args.filas} filas de historial, {n_mascotas} mascotas, {n_usuarios} usuarios")
+        print(f"Mezcla: {args.peticiones} peticiones, {args.escrituras:.0%} escrituras\n")
+
+        secuencia = _peticiones(args.peticiones, n_usuarios, n_mascotas, args.escrituras)
+        for backend in ("ninguno", "memoria", "sqlite"):
+            por_segundo, estado = medir(app, backend, secuencia)
+            linea = f"{backend:8s} {por_segundo:9.1f} req/s"
+            if "hits" in estado:
+                consultas = estado["hits"] + estado["misses"]
+                linea += f"  aciertos {estado['hits'] / max(consultas, 1):6.1%}  entradas {estado['entradas']}"
+            print(linea)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Conexiones lentas que aguanta un núcleo: gunicorn sync contra ASGI.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_clientes_lentos --lentos 10,100,400 --lentitud 2
+
+Lanza un solo proceso de cada servidor (un núcleo): `gunicorn app:app`
+con un worker sync y `uvicorn asgi:app`. Contra cada uno mantiene
+conectados N clientes lentos (un móvil con mala señal: envían el cuerpo
+de un POST /api/mascotas en trozos durante `--lentitud` segundos y
+vuelven a empezar), escalonados para que siempre haya N a medio enviar.
+A la vez, --rapidos clientes normales piden GET /api/ping en bucle y se
+mide su ritmo y latencia: mientras el servidor atienda a los lentos sin
+bloquearse, los rápidos no lo notan. La capacidad es el mayor N con
+p95 de los rápidos por debajo de --umbral-ms.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+TIMEOUT = 30
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVIDORES = {
+    "gunicorn sync": lambda puerto: [
+        sys.executable, "-m", "gunicorn", "-w", "1", "-b", f"127.0.0.1:{puerto}",
+        "--backlog", "2048", "--timeout", "300", "--log-level", "warning", "app:app",
+    ],
+    "uvicorn asgi": lambda puerto: [
+        sys.executable, "-m", "uvicorn", "--workers", "1", "--host", "127.0.0.1", "--port", str(puerto),
+        "--backlog", "2048", "--log-level", "warning", "asgi:app",
+    ],
+}
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _peticion(puerto, metodo, ruta, cuerpo=b"", trozos=1, lentitud=0.0):
+    lector, escritor = await asyncio.open_connection("127.0.0.1", puerto)
+    cabecera = (
+        f"{metodo} {ruta} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(cuerpo)}\r\n\r\n"
+    ).encode()
+    escritor.write(cabecera)
+    tamano = max(1, -(-len(cuerpo) // trozos))
+    for inicio in range(0, len(cuerpo), tamano):
+        if lentitud:
+            await asyncio.sleep(lentitud / trozos)
+        escritor.write(cuerpo[inicio:inicio + tamano])
+        await escritor.drain()
+    respuesta = await lector.read()
+    escritor.close()
+    return int(respuesta.split(b" ", 2)[1])
+
+
+async def _carga(puerto, lentos, lentitud, rapidos, duracion):
+    # El cuerpo no trae dueño a propósito: la API lo lee entero y responde 400 sin escribir
+    cuerpo = json.dumps({"nombre": "Firulais", "especie": "perro", "notas": "x" * 512}).encode()
+    fin = time.monotonic() + duracion
+    latencias, errores = [], 0
+
+    async def lento(desfase):
+        await asyncio.sleep(desfase)
+        while time.monotonic() < fin:
+            try:
+                await asyncio.wait_for(
+                    _peticion(puerto, "POST", "/api/mascotas", cuerpo, trozos=10, lentitud=lentitud), TIMEOUT)
+            except (OSError, asyncio.TimeoutError):
+                pass
+
+    async def rapido():
+        nonlocal errores
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            try:
+                await asyncio.wait_for(_peticion(puerto, "GET", "/api/ping"), TIMEOUT)
+                latencias.append(time.perf_counter() - inicio)
+            except (OSError, asyncio.TimeoutError):
+                errores += 1
+
+    await asyncio.gather(*[lento(i * lentitud / lentos) for i in range(lentos)],
+                         *[rapido() for _ in range(rapidos)])
+    return latencias, errores
+
+
+def medir(nombre, lentos, lentitud, rapidos, duracion):
+    puerto = _puerto_libre()
+    proceso = subprocess.Popen(SERVIDORES[nombre](puerto), cwd=RAIZ, env=os.environ.copy())
+    try:
+        limite = time.monotonic() + 30
+        while True:
+            try:
+                asyncio.run(_peticion(puerto, "GET", "/api/ping"))
+                break
+            except OSError:
+                if time.monotonic() > limite:
+                    raise RuntimeError(f"{nombre} no arrancó")
+                time.sleep(0.2)
+        return asyncio.run(_carga(puerto, lentos, lentitud, rapidos, duracion))
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lentos", default="10,100,400", help="clientes lentos conectados a la vez")
+    parser.add_argument("--lentitud", type=float, default=2.0, help="segundos que tarda cada lento en enviar")
+    parser.add_argument("--rapidos", type=int, default=4, help="clientes normales midiendo")
+    parser.add_argument("--duracion", type=float, default=10.0, help="segundos por medición")
+    parser.add_argument("--umbral-ms", type=float, default=100.0)
+    parser.add_argument("--servidores", default=",".join(SERVIDORES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        os.environ['DATABASE_URL'] = "sqlite:///" + os.path.join(carpeta, "bench.db")
+        os.environ.setdefault('MEDIA_FOLDER', os.path.join(carpeta, "media"))
+        os.environ['HASH_WORKERS'] = "0"
+        subprocess.run([sys.executable, "-m", "flask", "--app", "app", "migrar"], cwd=RAIZ, check=True,
+                       stdout=subprocess.DEVNULL)
+
+        print(f"Lentos: {args.lentitud:g} s por petición; {args.rapidos} clientes rápidos; 1 proceso\n")
+        print(f"{'servidor':14s} {'lentos':>7s} {'rápidas/s':>10s} {'p50 ms':>8s} {'p95 ms':>8s} {'errores':>8s}")
+        for nombre in args.servidores.split(","):
+            capacidad = 0
+            for lentos in [int(n) for n in args.lentos.split(",")]:
+                latencias, errores = medir(nombre, lentos, args.lentitud, args.rapidos, args.duracion)
+                latencias.sort()
+                p50 = latencias[len(latencias) // 2] * 1000 if latencias else float("inf")
+                p95 = latencias[int(len(latencias) * 0.95)] * 1000 if latencias else float("inf")
+                if p95 < args.umbral_ms and not errores:
+                    capacidad = max(capacidad, lentos)
+                print(f"{nombre:14s} {lentos:7d} {len(latencias) / args.duracion:10.1f} {p50:8.1f} {p95:8.1f} {errores:8d}")
+            print(f"{nombre:14s} capacidad: {capacidad} lentos con p95 < {args.umbral_ms:g} ms\n")
+
+
+if __name__ == "__main__":
+    main()
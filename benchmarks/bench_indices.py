@@ -0,0 +1,135 @@
+"""Planes de consulta y tiempos antes/después de los índices de la migración 3.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_indices --filas 1000000
+
+Crea una base SQLite temporal con el esquema previo a los índices,
+la llena con datos sintéticos, mide las consultas calientes de la API,
+aplica las migraciones restantes y vuelve a medir.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, insert, text
+
+import migraciones
+from models import Usuario, Mascota, Vacuna, Diagnostico, Receta, Prevencion
+
+CONSULTAS = {
+    "mascotas de un usuario": (
+        "SELECT id, nombre FROM mascota WHERE user_id = :user_id ORDER BY id LIMIT 100",
+        "user_id",
+    ),
+    "vacunas de una mascota por fecha": (
+        "SELECT id, nombre, fecha_aplicacion FROM vacuna WHERE mascota_id = :mascota_id "
+        "ORDER BY fecha_aplicacion, id LIMIT 100",
+        "mascota_id",
+    ),
+    "diagnósticos de una mascota": (
+        "SELECT id, titulo, fecha FROM diagnostico WHERE mascota_id = :mascota_id ORDER BY fecha, id LIMIT 100",
+        "mascota_id",
+    ),
+    "recetas de una mascota": (
+        "SELECT id, medicamento, fecha FROM receta WHERE mascota_id = :mascota_id ORDER BY fecha, id LIMIT 100",
+        "mascota_id",
+    ),
+    "prevenciones de una mascota": (
+        "SELECT id, tipo, fecha FROM prevencion WHERE mascota_id = :mascota_id ORDER BY fecha, id LIMIT 100",
+        "mascota_id",
+    ),
+}
+
+
+def _en_lotes(filas, tamano=20000):
+    for i in range(0, len(filas), tamano):
+        yield filas[i:i + tamano]
+
+
+def sembrar(engine, filas):
+    rnd = random.Random(42)
+    n_mascotas = max(1, filas // 20)
+    n_usuarios = max(1, n_mascotas // 4)
+    por_tabla = filas // 4
+    inicio = date(2000, 1, 1)
+
+    def fecha():
+        return inicio + timedelta(days=rnd.randrange(9000))
+
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__), [
+            {"id": i, "nombre": f"u{i}", "apellido": "x", "email": f"u{i}@bench", "password": "x"}
+            for i in range(1, n_usuarios + 1)
+        ])
+        mascotas = [
+            {"id": i, "nombre": f"m{i}", "especie": "perro", "user_id": rnd.randint(1, n_usuarios)}
+            for i in range(1, n_mascotas + 1)
+        ]
+        for lote in _en_lotes(mascotas):
+            conn.execute(insert(Mascota.__table__), lote)
+
+        tablas = [
+            (Vacuna, lambda: {"nombre": "rabia", "fecha_aplicacion": fecha()}),
+            (Diagnostico, lambda: {"titulo": "control", "fecha": fecha()}),
+            (Receta, lambda: {"medicamento": "amoxicilina", "dosis": "1", "fecha": fecha()}),
+            (Prevencion, lambda: {"tipo": "antiparasitario", "fecha": fecha()}),
+        ]
+        for modelo, fila in tablas:
+            datos = [dict(fila(), mascota_id=rnd.randint(1, n_mascotas)) for _ in range(por_tabla)]
+            for lote in _en_lotes(datos):
+                conn.execute(insert(modelo.__table__), lote)
+
+    return n_usuarios, n_mascotas
+
+
+def medir(engine, n_usuarios, n_mascotas, repeticiones):
+    rnd = random.Random(7)
+    resultado = {}
+    with engine.connect() as conn:
+        for nombre, (sql, parametro) in CONSULTAS.items():
+            tope = n_usuarios if parametro == "user_id" else n_mascotas
+            plan = conn.execute(text("EXPLAIN QUERY PLAN " + sql), {parametro: 1}).all()
+            tiempos = []
+            for _ in range(repeticiones):
+                t0 = time.perf_counter()
+                conn.execute(text(sql), {parametro: rnd.randint(1, tope)}).all()
+                tiempos.append((time.perf_counter() - t0) * 1000)
+            resultado[nombre] = (" | ".join(p[-1] for p in plan), statistics.median(tiempos))
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=1_000_000, help="filas de historial en total")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        engine = create_engine("sqlite:///" + os.path.join(carpeta, "bench.db"))
+        migraciones.aplicar(engine, hasta=2, log=lambda _: None)
+
+        t0 = time.perf_counter()
+        n_usuarios, n_mascotas = sembrar(engine, args.filas)
+        print(f"Datos: {args.filas} filas de historial, {n_mascotas} mascotas, "
+              f"{n_usuarios} usuarios ({time.perf_counter() - t0:.1f}s)\n")
+
+        antes = medir(engine, n_usuarios, n_mascotas, args.repeticiones)
+        migraciones.aplicar(engine, log=lambda _: None)
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        despues = medir(engine, n_usuarios, n_mascotas, args.repeticiones)
+
+        for nombre in CONSULTAS:
+            plan_a, ms_a = antes[nombre]
+            plan_d, ms_d = despues[nombre]
+            print(nombre)
+            print(f"  antes:   {ms_a:9.3f} ms  {plan_a}")
+            print(f"  después: {ms_d:9.3f} ms  {plan_d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Reparto de lecturas entre primaria y réplicas SQLite, y leer lo propio.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_replicas --replicas 2 --peticiones 2000
+
+Crea una primaria SQLite con --usuarios dueños y sus mascotas, la copia
+a --replicas archivos (la "replicación" es una copia con la API de
+backup de SQLite, abiertos en solo lectura) y lanza --hilos clientes que
+piden GET /api/mascotas e /historial mientras otro cliente escribe. Cuenta
+las consultas que atendió cada base: con réplicas sanas la primaria solo
+ve las escrituras y las lecturas de quien acaba de escribir. Verifica
+también que quien escribe lee su propia escritura aunque las réplicas
+no la tengan y que, si se borra una réplica, las lecturas pasan a las
+demás (o a la primaria) sin errores.
+"""
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+
+def copiar(origen, destino):
+    fuente, copia = sqlite3.connect(origen), sqlite3.connect(destino)
+    fuente.backup(copia)
+    copia.close()
+    fuente.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--usuarios", type=int, default=50)
+    parser.add_argument("--peticiones", type=int, default=2000, help="lecturas en total")
+    parser.add_argument("--hilos", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        primaria = os.path.join(carpeta, "primaria.db")
+        rutas = [os.path.join(carpeta, f"replica{i}.db") for i in range(args.replicas)]
+        # La app lee la configuración al importarse
+        os.environ['DATABASE_URL'] = "sqlite:///" + primaria
+        os.environ['DATABASE_REPLICA_URLS'] = ",".join(f"sqlite:///file:{r}?mode=ro&uri=true" for r in rutas)
+        os.environ.setdefault('MEDIA_FOLDER', os.path.join(carpeta, "media"))
+        os.environ['CACHE_BACKEND'] = "ninguno"
+        os.environ['HASH_WORKERS'] = "0"
+        os.environ['REPLICA_VERIFICAR_CADA_S'] = "1"
+        # Usuarios sintéticos sin token: modo heredado, sin su aviso por petición
+        os.environ['API_MODO_HEREDADO'] = "1"
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from sqlalchemy import event
+        from app import app
+        from models import db
+        import migraciones
+        import replicas
+        app.logger.setLevel(logging.ERROR)
+
+        with app.app_context():
+            migraciones.aplicar(db.engine, log=lambda _: None)
+            motores = {"primaria": db.engine}
+            motores.update({f"replica{i}": m for i, m in enumerate(replicas.motores())})
+
+        cliente = app.test_client()
+        mascotas = []
+        for u in range(args.usuarios):
+            user_id = cliente.post('/api/register', json={
+                "nombre": f"u{u}", "apellido": "x", "email": f"u{u}@bench", "password": "clave-de-bench"
+            }).json["user_id"]
+            for n in range(3):
+                mascotas.append((user_id, cliente.post('/api/mascotas', json={
+                    "nombre": f"m{n}", "especie": "perro", "raza": "mestizo", "user_id": user_id
+                }).json["id"]))
+        for ruta in rutas:
+            copiar(primaria, ruta)
+
+        consultas = Counter()
+        for nombre, motor in motores.items():
+            event.listen(motor, "before_cursor_execute",
+                         lambda *a, nombre=nombre: consultas.update([nombre]))
+
+        errores = Counter()
+
+        def lector(cantidad):
+            propio = app.test_client()
+            rnd = random.Random()
+            for _ in range(cantidad):
+                user_id, mascota_id = rnd.choice(mascotas)
+                for url in (f'/api/mascotas?user_id={user_id}', f'/api/mascotas/{mascota_id}/historial'):
+                    estado = propio.get(url).status_code
+                    if estado != 200:
+                        errores[estado] += 1
+
+        escritor = app.test_client()
+        user_id, mascota_id = mascotas[0]
+
+        inicio = time.perf_counter()
+        hilos = [threading.Thread(target=lector, args=(args.peticiones // 2 // args.hilos,)) for _ in range(args.hilos)]
+        for hilo in hilos:
+            hilo.start()
+
+        # Leer lo propio: la réplica no tiene esta vacuna, pero quien la escribió la ve
+        escritor.post('/api/vacunas', json={"mascota_id": mascota_id, "nombre": "rabia", "fecha_aplicacion": "2025-01-01"})
+        propias = len(escritor.get(f'/api/mascotas/{mascota_id}/historial').json["vacunas"])
+        ajenas = len(app.test_client().get(f'/api/mascotas/{mascota_id}/historial').json["vacunas"])
+
+        if rutas:
+            os.remove(rutas[0])  # réplica caída a mitad de la carga
+        for hilo in hilos:
+            hilo.join()
+        segundos = time.perf_counter() - inicio
+
+        print(f"{args.peticiones} lecturas en {segundos:.1f} s con {args.hilos} hilos y {args.replicas} réplicas\n")
+        print(f"{'base':10s} {'consultas':>10s}")
+        for nombre in motores:
+            print(f"{nombre:10s} {consultas[nombre]:10d}")
+        print(f"\nQuien escribió ve su vacuna: {'sí' if propias == 1 else 'NO'}"
+              f" (un cliente sin escritura reciente ve {ajenas}, la réplica aún no la tiene)")
+        with app.app_context():
+            for replica in replicas.estado():
+                print(f"{replica['replica']}: {'sana' if replica['sana'] else 'fuera: ' + replica['motivo']}")
+        print(f"Respuestas con error: {sum(errores.values())} {dict(errores) if errores else ''}")
+
+
+if __name__ == "__main__":
+    main()
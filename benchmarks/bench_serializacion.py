@@ -0,0 +1,137 @@
+"""CPU por respuesta y bytes enviados del historial, por backend JSON y compresión.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_serializacion --filas 10000 --repeticiones 20
+
+Crea una base SQLite temporal con una mascota cuyo historial tiene
+`--filas` registros (repartidos entre vacunas, diagnósticos, recetas y
+prevenciones) y pide GET /api/mascotas/<id>/historial sin caché con cada
+backend JSON (stdlib, orjson) y cada Accept-Encoding disponible. Como
+referencia mide también el camino anterior: objetos del ORM con
+selectinload, dicts a mano con isoformat() y json.dumps de la stdlib.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+
+
+def sembrar(engine, filas):
+    from models import Usuario, Mascota, Vacuna, Diagnostico, Receta, Prevencion
+
+    rnd = random.Random(42)
+    inicio = date(2010, 1, 1)
+
+    def fecha():
+        return inicio + timedelta(days=rnd.randrange(5000))
+
+    por_tabla = filas // 4
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario.__table__),
+                     {"id": 1, "nombre": "u1", "apellido": "x", "email": "u1@bench", "password": "x"})
+        conn.execute(insert(Mascota.__table__),
+                     {"id": 1, "nombre": "Firulais", "especie": "perro", "raza": "mestizo", "user_id": 1})
+        conn.execute(insert(Vacuna.__table__), [
+            {"mascota_id": 1, "nombre": rnd.choice(["rabia", "moquillo", "parvovirus"]),
+             "fecha_aplicacion": fecha(), "proxima_dosis": fecha()} for _ in range(por_tabla)
+        ])
+        conn.execute(insert(Diagnostico.__table__), [
+            {"mascota_id": 1, "titulo": "control", "fecha": fecha(),
+             "descripcion": "sin hallazgos relevantes, peso estable"} for _ in range(por_tabla)
+        ])
+        conn.execute(insert(Receta.__table__), [
+            {"mascota_id": 1, "medicamento": "amoxicilina", "dosis": "250 mg cada 12 h", "fecha": fecha(),
+             "instrucciones": "con comida, 7 días"} for _ in range(por_tabla)
+        ])
+        conn.execute(insert(Prevencion.__table__), [
+            {"mascota_id": 1, "tipo": "antiparasitario", "fecha": fecha(), "descripcion": "pipeta",
+             "proxima_fecha": fecha()} for _ in range(filas - 3 * por_tabla)
+        ])
+
+
+def _antes(mascota_id):
+    """El historial como se armaba antes: ORM + dicts a mano + json de la stdlib."""
+    from sqlalchemy.orm import selectinload
+    from models import Mascota
+
+    categorias = ("vacunas", "diagnosticos", "recetas", "prevenciones")
+    mascota = (
+        Mascota.query
+        .options(*[selectinload(getattr(Mascota, c)) for c in categorias])
+        .execution_options(populate_existing=True)
+        .filter(Mascota.id == mascota_id)
+        .first()
+    )
+
+    def a_dict(objeto):
+        return {
+            c: (v.isoformat() if isinstance(v, date) else v)
+            for c in type(objeto).campos_api
+            for v in (getattr(objeto, c),)
+        }
+
+    respuesta = {"success": True, "mascota": a_dict(mascota)}
+    for categoria in categorias:
+        respuesta[categoria] = [a_dict(r) for r in getattr(mascota, categoria)]
+    return json.dumps(respuesta, sort_keys=True, separators=(",", ":")).encode()
+
+
+def medir(funcion, repeticiones):
+    funcion()  # calentar (sentencias compiladas, páginas de SQLite)
+    t0 = time.process_time()
+    for _ in range(repeticiones):
+        datos = funcion()
+    return (time.process_time() - t0) * 1000 / repeticiones, len(datos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=10_000, help="registros del historial")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        # La app lee la configuración al importarse
+        os.environ['DATABASE_URL'] = "sqlite:///" + os.path.join(carpeta, "bench.db")
+        os.environ.setdefault('MEDIA_FOLDER', os.path.join(carpeta, "media"))
+        os.environ['CACHE_BACKEND'] = "ninguno"
+        from app import app
+        from models import db
+        import compresion
+        import migraciones
+        import serializacion
+
+        with app.app_context():
+            migraciones.aplicar(db.engine, log=lambda _: None)
+            sembrar(db.engine, args.filas)
+        print(f"Historial de {args.filas} registros, {args.repeticiones} repeticiones\n")
+        print(f"{'camino':32s} {'CPU ms/resp':>12s} {'bytes':>10s}")
+
+        with app.test_request_context():
+            cpu, tamano = medir(lambda: _antes(1), args.repeticiones)
+        print(f"{'antes (ORM + to_dict + json)':32s} {cpu:12.1f} {tamano:10d}")
+
+        cliente = app.test_client()
+        backends = ["stdlib"] + (["orjson"] if serializacion.orjson is not None else [])
+        for backend in backends:
+            app.json = serializacion.ProveedorJSON(app, backend)
+            for codificacion in [None] + compresion.disponibles():
+                cabeceras = {"Accept-Encoding": codificacion} if codificacion else {}
+
+                def pedir():
+                    respuesta = cliente.get("/api/mascotas/1/historial", headers=cabeceras)
+                    assert respuesta.status_code == 200
+                    assert respuesta.headers.get("Content-Encoding") == codificacion
+                    return respuesta.data
+
+                cpu, tamano = medir(pedir, args.repeticiones)
+                print(f"{backend + ' ' + (codificacion or 'sin comprimir'):32s} {cpu:12.1f} {tamano:10d}")
+
+
+if __name__ == "__main__":
+    main()
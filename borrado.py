@@ -0,0 +1,178 @@
+import os
+import signal
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, event, exists, or_, select
+from sqlalchemy.orm import Session, with_loader_criteria
+
+import busqueda
+import sincronizacion
+from media import ruta_media
+from models import db, Usuario, Mascota, Vacuna, Diagnostico, Receta, Prevencion
+
+# ============================================================
+# BORRADO DE MASCOTAS
+# ============================================================
+# El historial se borra en la base, no en el ORM: las FK de vacuna,
+# diagnostico, receta y prevencion son ON DELETE CASCADE en PostgreSQL y
+# un trigger AFTER DELETE hace lo mismo en SQLite (ahí las FK no se
+# aplican sin PRAGMA foreign_keys); los crea la migración 11. Las
+# relaciones de Mascota son passive_deletes: borrar una mascota no carga
+# su historial.
+#
+# Dos modos (MASCOTAS_BORRADO_DIFERIDO):
+#   inmediato (por defecto): un DELETE de la mascota; la cascada, las
+#     lápidas del historial y la limpieza del índice de búsqueda son
+#     sentencias sobre conjuntos, no una por fila.
+#   diferido: la petición solo marca la mascota (eliminada_en), le quita
+#     el microchip y deja su lápida: O(1). Desde ese momento no aparece
+#     en ninguna consulta del ORM (ver _ocultar_eliminadas). El purgador
+#     (`flask --app app purgar-mascotas`) borra después su historial en
+#     tramos de `lote` filas, cada uno en su transacción, y al final la
+#     mascota y sus fotos.
+#
+# Las fotos (variantes en el almacén de media y archivo heredado en
+# uploads/) se borran solo si ninguna otra fila las usa.
+
+HISTORIAL = (Vacuna, Diagnostico, Receta, Prevencion)
+
+
+# ------------------ OCULTAR LAS ELIMINADAS ------------------
+
+@event.listens_for(Session, "do_orm_execute")
+def _ocultar_eliminadas(estado):
+    """Toda consulta del ORM excluye las mascotas marcadas, también en los JOIN.
+
+    execution_options(incluir_eliminadas=True) las deja ver (el purgador).
+    """
+    if (estado.is_select and not estado.is_column_load and not estado.is_relationship_load
+            and not estado.execution_options.get("incluir_eliminadas", False)):
+        estado.statement = estado.statement.options(
+            with_loader_criteria(Mascota, lambda cls: cls.eliminada_en.is_(None), include_aliases=True)
+        )
+
+
+# ------------------ ELIMINAR ------------------
+
+def _fotos(mascota):
+    return (mascota.foto, mascota.foto_miniatura, mascota.foto_mediana, mascota.foto_original)
+
+
+def eliminar_mascota(mascota):
+    """Borra (o marca, en modo diferido) la mascota y confirma la transacción."""
+    if current_app.config.get("MASCOTAS_BORRADO_DIFERIDO", False):
+        mascota.eliminada_en = datetime.utcnow()
+        mascota.microchip = None
+        db.session.commit()
+        return
+
+    fotos = _fotos(mascota)
+    db.session.delete(mascota)
+    db.session.commit()
+    borrar_fotos_sin_uso(*fotos)
+
+
+def borrar_fotos_sin_uso(foto, *hashes):
+    """Quita del disco las fotos que ya no usa ninguna mascota ni usuario."""
+    for hash_media in {h for h in hashes if h}:
+        en_uso = db.session.execute(select(
+            exists().where(or_(Mascota.foto_miniatura == hash_media, Mascota.foto_mediana == hash_media,
+                               Mascota.foto_original == hash_media))
+            | exists().where(Usuario.foto_hash == hash_media)
+        ).execution_options(incluir_eliminadas=True)).scalar()
+        if not en_uso:
+            _quitar_archivo(ruta_media(hash_media))
+
+    # Heredado: nombre de archivo en uploads/ (no base64 ni vacío)
+    if foto and len(foto) <= 200 and os.path.basename(foto) == foto:
+        en_uso = db.session.execute(
+            select(exists().where(Mascota.foto == foto)).execution_options(incluir_eliminadas=True)
+        ).scalar()
+        if not en_uso:
+            _quitar_archivo(os.path.join(current_app.config['UPLOAD_FOLDER'], foto))
+
+
+def _quitar_archivo(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        current_app.logger.warning("No se pudo borrar %s: %s", ruta, e)
+
+
+# ------------------ PURGADOR (MODO DIFERIDO) ------------------
+
+def _siguiente_marcada():
+    return db.session.execute(
+        select(Mascota.id, Mascota.user_id, Mascota.foto, Mascota.foto_miniatura, Mascota.foto_mediana,
+               Mascota.foto_original)
+        .where(Mascota.eliminada_en.isnot(None)).order_by(Mascota.eliminada_en).limit(1)
+        .execution_options(incluir_eliminadas=True)
+    ).first()
+
+
+def _borrar_tramo(mascota, modelo, lote):
+    """Borra hasta `lote` filas de `modelo` de la mascota. Devuelve cuántas."""
+    conn = db.session.connection()
+    ids = conn.execute(
+        select(modelo.id).where(modelo.mascota_id == mascota.id).order_by(modelo.id).limit(lote)
+    ).scalars().all()
+    if ids:
+        rev = sincronizacion.siguiente_revision(conn)
+        sincronizacion.lapidas_historial(conn, mascota.id, mascota.user_id, rev, datetime.utcnow(), {modelo: ids})
+        conn.execute(delete(modelo).where(modelo.id.in_(ids)))
+        busqueda.indexar(conn, modelo, ids)  # ya no existen: los quita del índice
+    db.session.commit()
+    return len(ids)
+
+
+def purgar(lote=1000, maximo=None):
+    """Borra lo pendiente de las mascotas marcadas. Devuelve (mascotas, filas) borradas.
+
+    Cada tramo es una transacción corta, así las peticiones que escriben
+    no esperan al purgador más que un tramo. `maximo` corta tras esa
+    cantidad de filas (la siguiente llamada sigue donde quedó).
+    """
+    mascotas = filas = 0
+    while maximo is None or filas < maximo:
+        mascota = _siguiente_marcada()
+        if mascota is None:
+            break
+
+        borradas = 0
+        for modelo in HISTORIAL:
+            borradas = _borrar_tramo(mascota, modelo, lote)
+            if borradas:
+                break
+        filas += borradas
+        if borradas:
+            continue
+
+        # Sin historial: queda la mascota (su lápida ya se dejó al marcarla)
+        fotos = _fotos(mascota)
+        conn = db.session.connection()
+        conn.execute(delete(Mascota).where(Mascota.id == mascota.id))
+        busqueda.indexar(conn, Mascota, [mascota.id])
+        db.session.commit()
+        borrar_fotos_sin_uso(*fotos)
+        mascotas += 1
+    return mascotas, filas
+
+
+def ejecutar_purgador(intervalo=60, lote=1000, una_vez=False, log=print):
+    """Bucle del purgador: cada `intervalo` segundos purga todo lo marcado."""
+    detener = []
+    signal.signal(signal.SIGTERM, lambda *_: detener.append(True))
+
+    while not detener:
+        mascotas, filas = purgar(lote)
+        if mascotas or filas:
+            log(f"Purgadas {mascotas} mascotas y {filas} registros de historial")
+        if una_vez:
+            break
+        fin = time.monotonic() + intervalo
+        while not detener and time.monotonic() < fin:
+            time.sleep(min(1, intervalo))
@@ -0,0 +1,171 @@
+import itertools
+import re
+
+from sqlalchemy import String, cast, column, delete, event, func, insert, literal, select, table, text
+from sqlalchemy.orm import Session
+
+from calendario import normalizar
+from models import Mascota, Diagnostico, Receta
+
+# ============================================================
+# BÚSQUEDA DE TEXTO COMPLETO (MASCOTAS, DIAGNÓSTICOS, RECETAS)
+# ============================================================
+# Un índice invertido con un documento por registro (título + cuerpo):
+#   mascota:     nombre | especie raza microchip
+#   diagnostico: titulo | descripcion
+#   receta:      medicamento | dosis instrucciones
+#
+# SQLite: tabla virtual FTS5 con tokenizer unicode61 (sin tildes) e
+# índices de prefijo de 2 y 3 letras. El dueño se indexa como un token
+# más ("u<user_id>") en su propia columna, así "lo de este usuario" es
+# parte del MATCH y no un filtro posterior sobre todos los resultados.
+# PostgreSQL: tabla con tsvector generado (unaccent + 'simple') e índice
+# GIN, más un índice por user_id.
+#
+# El índice se mantiene en la misma transacción que los datos: tras cada
+# flush del ORM (ver _indexar_cambios) y, en las altas masivas con Core,
+# llamando a indexar() explícitamente. Las mascotas marcadas como
+# eliminadas (borrado.py) no se indexan y su historial no se devuelve.
+
+# modelo -> (tabla, código). La clave del documento es id * 4 + código.
+INDEXADOS = {
+    Mascota: ("mascota", 1),
+    Diagnostico: ("diagnostico", 2),
+    Receta: ("receta", 3),
+}
+
+MAX_TERMINOS = 8
+MAX_OFFSET = 1000
+MARCAS = ("«", "»")
+
+_SQLITE = table("busqueda", column("rowid"), column("duenio"), column("titulo"), column("cuerpo"),
+                column("tabla"), column("registro_id"), column("mascota_id"))
+_POSTGRES = table("busqueda", column("clave"), column("user_id"), column("titulo"), column("cuerpo"),
+                  column("tabla"), column("registro_id"), column("mascota_id"))
+
+
+def _unir(*columnas):
+    texto = func.coalesce(columnas[0], "")
+    for col in columnas[1:]:
+        texto = texto + " " + func.coalesce(col, "")
+    return texto
+
+
+def _documentos(modelo, ids, dialecto):
+    """SELECT con las filas del índice para `ids` (todas si ids es None)."""
+    nombre, codigo = INDEXADOS[modelo]
+    if modelo is Mascota:
+        titulo, cuerpo = Mascota.nombre, _unir(Mascota.especie, Mascota.raza, Mascota.microchip)
+    elif modelo is Diagnostico:
+        titulo, cuerpo = Diagnostico.titulo, _unir(Diagnostico.descripcion)
+    else:
+        titulo, cuerpo = Receta.medicamento, _unir(Receta.dosis, Receta.instrucciones)
+
+    duenio = literal("u").concat(cast(Mascota.user_id, String)) if dialecto == "sqlite" else Mascota.user_id
+    mascota_id = Mascota.id if modelo is Mascota else modelo.mascota_id
+    consulta = select(
+        modelo.id * 4 + codigo, duenio, titulo, cuerpo, literal(nombre), modelo.id, mascota_id,
+    )
+    if modelo is not Mascota:
+        consulta = consulta.join(Mascota, Mascota.id == modelo.mascota_id)
+    consulta = consulta.where(Mascota.eliminada_en.is_(None))
+    if ids is not None:
+        consulta = consulta.where(modelo.id.in_(ids))
+    return consulta
+
+
+def _tabla(dialecto):
+    return _SQLITE if dialecto == "sqlite" else _POSTGRES
+
+
+def indexar(conn, modelo, ids):
+    """Reindexa (o quita, si ya no existen) esos registros. No hace nada con otros modelos."""
+    if modelo not in INDEXADOS or not ids:
+        return
+    dialecto = conn.dialect.name
+    destino = _tabla(dialecto)
+    clave = destino.c.rowid if dialecto == "sqlite" else destino.c.clave
+    codigo = INDEXADOS[modelo][1]
+
+    ids = sorted(ids)
+    for inicio in range(0, len(ids), 500):
+        tramo = ids[inicio:inicio + 500]
+        conn.execute(delete(destino).where(clave.in_([i * 4 + codigo for i in tramo])))
+        conn.execute(insert(destino).from_select(list(destino.c), _documentos(modelo, tramo, dialecto)))
+
+
+def quitar_historial(conn, mascota_id, user_id):
+    """Quita los documentos del historial de una mascota ya borrada (la cascada
+    de la base no deja saber qué ids tenía). Recorre solo los de su dueño."""
+    if conn.dialect.name == "sqlite":
+        conn.execute(text(
+            "DELETE FROM busqueda WHERE rowid IN "
+            "(SELECT rowid FROM busqueda WHERE busqueda MATCH :duenio AND mascota_id = :mascota_id)"
+        ), {"duenio": f'duenio : "u{int(user_id)}"', "mascota_id": mascota_id})
+    else:
+        conn.execute(text("DELETE FROM busqueda WHERE user_id = :user_id AND mascota_id = :mascota_id"),
+                     {"user_id": user_id, "mascota_id": mascota_id})
+
+
+@event.listens_for(Session, "after_flush")
+def _indexar_cambios(session, flush_context):
+    cambiados = {}
+    for objeto in itertools.chain(session.new, session.dirty, session.deleted):
+        if type(objeto) in INDEXADOS:
+            cambiados.setdefault(type(objeto), set()).add(objeto.id)
+    if cambiados:
+        conn = session.connection()
+        for modelo, ids in cambiados.items():
+            indexar(conn, modelo, ids)
+        for objeto in session.deleted:
+            if isinstance(objeto, Mascota):
+                quitar_historial(conn, objeto.id, objeto.user_id)
+
+
+# ------------------ CONSULTA ------------------
+
+def terminos(q):
+    """Palabras de la consulta, sin tildes ni mayúsculas; cada una se busca como prefijo."""
+    return re.findall(r"\w+", normalizar(q or ""))[:MAX_TERMINOS]
+
+
+def buscar(session, palabras, user_id=None, tabla=None, limite=20, offset=0):
+    """Resultados ordenados por relevancia: lista de dicts con tabla, id,
+    mascota_id, mascota, titulo y fragmento (coincidencias entre «»)."""
+    parametros = {"limite": limite, "offset": offset, "tabla": tabla}
+    filtro_tabla = "AND busqueda.tabla = :tabla" if tabla else ""
+
+    if session.get_bind().dialect.name == "sqlite":
+        # Cada palabra entre comillas: el texto del usuario nunca es sintaxis FTS5
+        consulta = "{titulo cuerpo} : (" + " AND ".join(f'"{p}"*' for p in palabras) + ")"
+        if user_id is not None:
+            consulta = f'duenio : "u{int(user_id)}" AND ' + consulta
+        parametros.update(consulta=consulta, ini=MARCAS[0], fin=MARCAS[1])
+        sql = f"""
+            SELECT busqueda.tabla, busqueda.registro_id AS id, busqueda.mascota_id, mascota.nombre AS mascota,
+                   highlight(busqueda, 1, :ini, :fin) AS titulo,
+                   snippet(busqueda, 2, :ini, :fin, '…', 16) AS fragmento
+            FROM busqueda JOIN mascota ON mascota.id = busqueda.mascota_id
+            WHERE busqueda MATCH :consulta AND mascota.eliminada_en IS NULL {filtro_tabla}
+            ORDER BY bm25(busqueda, 0.0, 10.0, 1.0)
+            LIMIT :limite OFFSET :offset
+        """
+    else:
+        parametros.update(
+            consulta=" & ".join(f"{p}:*" for p in palabras),
+            user_id=user_id,
+            opciones=f"StartSel={MARCAS[0]}, StopSel={MARCAS[1]}, MaxWords=20, MinWords=5",
+        )
+        filtro_usuario = "AND busqueda.user_id = :user_id" if user_id is not None else ""
+        sql = f"""
+            SELECT busqueda.tabla, busqueda.registro_id AS id, busqueda.mascota_id, mascota.nombre AS mascota,
+                   ts_headline('simple', busqueda.titulo, q, :opciones) AS titulo,
+                   ts_headline('simple', coalesce(busqueda.cuerpo, ''), q, :opciones) AS fragmento
+            FROM busqueda JOIN mascota ON mascota.id = busqueda.mascota_id,
+                 to_tsquery('simple', :consulta) AS q
+            WHERE busqueda.documento @@ q AND mascota.eliminada_en IS NULL {filtro_usuario} {filtro_tabla}
+            ORDER BY ts_rank(busqueda.documento, q) DESC, busqueda.clave
+            LIMIT :limite OFFSET :offset
+        """
+
+    return [dict(fila._mapping) for fila in session.execute(text(sql), parametros)]
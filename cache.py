@@ -0,0 +1,271 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, request
+
+import replicas
+
+# ============================================================
+# CACHÉ DE RESPUESTAS (LECTURA) CON INVALIDACIÓN POR ESPACIO
+# ============================================================
+# Cada respuesta cacheada depende de uno o más "espacios" (u:<user_id>,
+# m:<mascota_id>). Cada espacio tiene una generación; la clave de la
+# respuesta incluye las generaciones vigentes. Invalidar = darle al
+# espacio una generación nueva: las entradas viejas quedan inalcanzables
+# y salen solas por LRU/TTL.
+#
+# Las generaciones nuevas son marcas de tiempo, no contadores: si una
+# generación se desaloja de la caché, la que se crea después nunca
+# coincide con una anterior.
+#
+# Configuración (app.config):
+#   CACHE_BACKEND      "memoria" (por proceso), "sqlite" (archivo compartido
+#                      entre workers de gunicorn) o "ninguno"
+#   CACHE_TTL          segundos de vida de cada respuesta
+#   CACHE_MAX_BYTES    tamaño máximo total
+#   CACHE_MAX_ENTRADAS entradas máximas (solo "memoria")
+#   CACHE_SQLITE_RUTA  archivo del backend "sqlite"
+#
+# Con "memoria" y varios workers, un worker no ve las invalidaciones de
+# otro: sirve hasta CACHE_TTL segundos de datos viejos. Para varios
+# workers usar "sqlite".
+
+
+class CacheMemoria:
+    """LRU en memoria con TTL y desalojo por cantidad y por bytes."""
+
+    def __init__(self, max_entradas=10000, max_bytes=32 * 1024 * 1024):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._datos = OrderedDict()  # clave -> (valor, expira)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.metricas = {"hits": 0, "misses": 0, "desalojos": 0, "expirados": 0}
+
+    def obtener(self, clave, contar=True):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and entrada[1] < time.monotonic():
+                self._quitar(clave)
+                self.metricas["expirados"] += 1
+                entrada = None
+            if entrada is None:
+                if contar:
+                    self.metricas["misses"] += 1
+                return None
+            self._datos.move_to_end(clave)
+            if contar:
+                self.metricas["hits"] += 1
+            return entrada[0]
+
+    def guardar(self, clave, valor, ttl):
+        tamano = len(valor)
+        if tamano > self.max_bytes:
+            return
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            self._datos[clave] = (valor, time.monotonic() + ttl)
+            self._bytes += tamano
+            while len(self._datos) > self.max_entradas or self._bytes > self.max_bytes:
+                self._quitar(next(iter(self._datos)))
+                self.metricas["desalojos"] += 1
+
+    def _quitar(self, clave):
+        valor, _ = self._datos.pop(clave)
+        self._bytes -= len(valor)
+
+    def estado(self):
+        with self._lock:
+            return dict(self.metricas, entradas=len(self._datos), bytes=self._bytes)
+
+
+class CacheSqlite:
+    """Caché en un archivo SQLite local, compartida por todos los workers de la máquina."""
+
+    def __init__(self, ruta, max_bytes=64 * 1024 * 1024):
+        self.ruta = ruta
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.metricas = {"hits": 0, "misses": 0, "desalojos": 0, "expirados": 0}
+        with self._conexion() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "clave TEXT PRIMARY KEY, valor BLOB NOT NULL, expira REAL NOT NULL, "
+                "tamano INTEGER NOT NULL, usado REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_usado ON cache (usado)")
+
+    def _conexion(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.ruta, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _contar(self, metrica):
+        with self._lock:
+            self.metricas[metrica] += 1
+
+    def obtener(self, clave, contar=True):
+        conn = self._conexion()
+        fila = conn.execute("SELECT valor, expira FROM cache WHERE clave = ?", (clave,)).fetchone()
+        if fila is not None and fila[1] < time.time():
+            self._contar("expirados")
+            fila = None
+        if contar:
+            self._contar("misses" if fila is None else "hits")
+        return fila[0] if fila else None
+
+    def guardar(self, clave, valor, ttl):
+        if len(valor) > self.max_bytes:
+            return
+        conn = self._conexion()
+        ahora = time.time()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (clave, valor, expira, tamano, usado) VALUES (?, ?, ?, ?, ?)",
+                (clave, valor, ahora + ttl, len(valor), ahora),
+            )
+            total = conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM cache").fetchone()[0]
+            if total > self.max_bytes:
+                conn.execute("DELETE FROM cache WHERE expira < ?", (ahora,))
+                # Desaloja lo más antiguo hasta quedar en el 90% del máximo
+                borradas = conn.execute(
+                    "DELETE FROM cache WHERE clave IN ("
+                    " SELECT clave FROM (SELECT clave, SUM(tamano) OVER (ORDER BY usado DESC) AS acumulado"
+                    " FROM cache) WHERE acumulado > ?)",
+                    (int(self.max_bytes * 0.9),),
+                ).rowcount
+                with self._lock:
+                    self.metricas["desalojos"] += borradas
+        except sqlite3.OperationalError:
+            # Caché ocupada por otro worker: no cachear es siempre correcto
+            pass
+
+    def estado(self):
+        conn = self._conexion()
+        entradas, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM cache").fetchone()
+        with self._lock:
+            return dict(self.metricas, entradas=entradas, bytes=total)
+
+
+# ------------------ INSTANCIA POR APP ------------------
+
+def _backend():
+    backend = current_app.extensions.get("vacunapet_cache")
+    if backend is None:
+        tipo = current_app.config.get("CACHE_BACKEND", "memoria")
+        if tipo == "sqlite":
+            ruta = current_app.config.get("CACHE_SQLITE_RUTA") or os.path.join(current_app.instance_path, "cache.db")
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            backend = CacheSqlite(ruta, current_app.config.get("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+        elif tipo == "memoria":
+            backend = CacheMemoria(
+                current_app.config.get("CACHE_MAX_ENTRADAS", 10000),
+                current_app.config.get("CACHE_MAX_BYTES", 32 * 1024 * 1024),
+            )
+        else:
+            backend = False
+        current_app.extensions["vacunapet_cache"] = backend
+    return backend
+
+
+def _generacion(backend, espacio, renovar=False):
+    clave = "gen:" + espacio
+    valor = None if renovar else backend.obtener(clave, contar=False)
+    if valor is None:
+        valor = str(time.time_ns()).encode()
+        # Las generaciones viven más que las respuestas que dependen de ellas
+        backend.guardar(clave, valor, current_app.config.get("CACHE_TTL", 300) * 2)
+    return valor.decode()
+
+
+def invalidar(*espacios):
+    """Llamar después del commit de cada escritura."""
+    backend = _backend()
+    if not backend:
+        return
+    for espacio in espacios:
+        _generacion(backend, espacio, renovar=True)
+
+
+def leer(espacio, clave):
+    """Valor guardado con guardar() mientras `espacio` no se haya invalidado, o None."""
+    backend = _backend()
+    if not backend:
+        return None
+    return backend.obtener(f"v:{clave}:{_generacion(backend, espacio)}")
+
+
+def guardar(espacio, clave, valor, ttl=None):
+    backend = _backend()
+    if backend:
+        ttl = ttl or current_app.config.get("CACHE_TTL", 300)
+        backend.guardar(f"v:{clave}:{_generacion(backend, espacio)}", valor, ttl)
+
+
+def marcar(clave, ttl):
+    """Marca que caduca sola a los `ttl` segundos (ver replicas.py)."""
+    backend = _backend()
+    if backend:
+        backend.guardar(f"marca:{clave}", b"1", ttl)
+
+
+def marcado(clave):
+    backend = _backend()
+    return bool(backend) and backend.obtener(f"marca:{clave}", contar=False) is not None
+
+
+def metricas():
+    backend = _backend()
+    if not backend:
+        return {"backend": "ninguno"}
+    return dict(backend.estado(), backend=current_app.config.get("CACHE_BACKEND", "memoria"))
+
+
+def cacheado(espacios):
+    """Cachea la respuesta JSON 200 de la vista.
+
+    `espacios(**kwargs_de_la_vista)` devuelve los espacios de los que
+    depende la respuesta, o None para no cachear esa petición.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(**kwargs):
+            backend = _backend()
+            lista = espacios(**kwargs) if backend else None
+            if not lista:
+                return vista(**kwargs)
+
+            generaciones = {e: _generacion(backend, e) for e in sorted(lista)}
+            partes = [request.endpoint, str(g.get("user_id")), request.query_string.decode()]
+            partes += [f"{e}={gen}" for e, gen in generaciones.items()]
+            clave = "r:" + hashlib.sha1("|".join(partes).encode()).hexdigest()
+
+            cuerpo = backend.obtener(clave)
+            if cuerpo is not None:
+                respuesta = current_app.response_class(cuerpo, status=200, mimetype="application/json")
+                respuesta.headers["X-Cache"] = "HIT"
+                return respuesta
+
+            # Recién invalidado: una réplica puede no tener aún la escritura y quedaría cacheada
+            ventana = current_app.config.get("REPLICA_VENTANA_PRIMARIA_S", 0) * 1e9
+            if any(time.time_ns() - int(gen) < ventana for gen in generaciones.values()):
+                replicas.usar_primaria()
+
+            respuesta = current_app.make_response(vista(**kwargs))
+            if respuesta.status_code == 200 and respuesta.mimetype == "application/json":
+                backend.guardar(clave, respuesta.get_data(), current_app.config.get("CACHE_TTL", 300))
+                respuesta.headers["X-Cache"] = "MISS"
+            return respuesta
+        return envoltura
+    return decorador
@@ -0,0 +1,265 @@
+import unicodedata
+from datetime import timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, bindparam, or_, select, update
+
+from models import db, Mascota, Vacuna, Prevencion
+
+# ============================================================
+# CALENDARIO DE VACUNACIÓN (PRÓXIMA DOSIS)
+# ============================================================
+# Solo la aplicación más reciente de cada vacuna de una mascota tiene
+# `proxima_dosis`; las anteriores quedan en NULL. Así "qué vence en los
+# próximos N días" es un rango sobre un índice parcial pequeño, sin
+# recorrer todo el historial.
+#
+# Los intervalos se configuran con app.config['INTERVALOS_REFUERZO']
+# (mismo formato que INTERVALOS_REFUERZO de abajo; se combina con él) y
+# app.config['INTERVALO_REFUERZO_POR_DEFECTO'] (días, o None para no
+# programar refuerzo de vacunas desconocidas).
+#
+# Las prevenciones siguen la misma regla con `proxima_fecha` (la más
+# reciente de cada tipo), con INTERVALOS_PREVENCION.
+
+# especie -> vacuna -> días hasta el refuerzo. "*" aplica a cualquier especie.
+INTERVALOS_REFUERZO = {
+    "*": {
+        "rabia": 365,
+        "antirrabica": 365,
+    },
+    "perro": {
+        "moquillo": 365,
+        "parvovirus": 365,
+        "hepatitis": 365,
+        "leptospirosis": 365,
+        "sextuple": 365,
+        "octuple": 365,
+        "polivalente": 365,
+        "tos de las perreras": 365,
+        "bordetella": 365,
+    },
+    "gato": {
+        "triple felina": 365,
+        "leucemia felina": 365,
+        "panleucopenia": 365,
+        "rinotraqueitis": 365,
+        "calicivirus": 365,
+    },
+}
+
+INTERVALO_POR_DEFECTO = 365
+
+# Prevenciones (antiparasitarios...): tipo -> días hasta la siguiente
+# aplicación. Los tipos que no estén aquí ni en
+# app.config['INTERVALOS_PREVENCION'] no se programan.
+INTERVALOS_PREVENCION = {
+    "antiparasitario": 90,
+    "antiparasitario interno": 90,
+    "desparasitacion": 90,
+    "desparasitante": 90,
+    "antiparasitario externo": 30,
+    "antipulgas": 30,
+    "pipeta": 30,
+    "pipeta antipulgas": 30,
+    "collar antiparasitario": 240,
+}
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes y con espacios simples: "Antirrábica " -> "antirrabica"."""
+    if not texto:
+        return ""
+    sin_tildes = ''.join(
+        c for c in unicodedata.normalize('NFKD', texto)
+        if not unicodedata.combining(c)
+    )
+    return ' '.join(sin_tildes.lower().split())
+
+
+def _configuracion():
+    intervalos = {especie: dict(vacunas) for especie, vacunas in INTERVALOS_REFUERZO.items()}
+    por_defecto = INTERVALO_POR_DEFECTO
+
+    if has_app_context():
+        for especie, vacunas in current_app.config.get('INTERVALOS_REFUERZO', {}).items():
+            destino = intervalos.setdefault(normalizar(especie) or "*", {})
+            destino.update({normalizar(v): dias for v, dias in vacunas.items()})
+        por_defecto = current_app.config.get('INTERVALO_REFUERZO_POR_DEFECTO', por_defecto)
+
+    return intervalos, por_defecto
+
+
+def intervalo_dias(especie, nombre_vacuna, configuracion=None):
+    intervalos, por_defecto = configuracion or _configuracion()
+    especie = normalizar(especie)
+    vacuna = normalizar(nombre_vacuna)
+
+    for clave in (especie, "*"):
+        if vacuna in intervalos.get(clave, {}):
+            return intervalos[clave][vacuna]
+    return por_defecto
+
+
+def calcular_proxima_dosis(especie, nombre_vacuna, fecha_aplicacion, configuracion=None):
+    dias = intervalo_dias(especie, nombre_vacuna, configuracion)
+    if not dias:
+        return None
+    return fecha_aplicacion + timedelta(days=dias)
+
+
+def _intervalos_prevencion():
+    intervalos = dict(INTERVALOS_PREVENCION)
+    if has_app_context():
+        intervalos.update({
+            normalizar(tipo): dias
+            for tipo, dias in current_app.config.get('INTERVALOS_PREVENCION', {}).items()
+        })
+    return intervalos
+
+
+def calcular_proxima_prevencion(tipo, fecha, intervalos=None):
+    dias = (intervalos or _intervalos_prevencion()).get(normalizar(tipo))
+    if not dias:
+        return None
+    return fecha + timedelta(days=dias)
+
+
+def _asignar(grupos, calcular):
+    """grupos: {nombre_normalizado: [(id, nombre, fecha), ...]} -> {id: proxima}
+
+    `calcular(nombre, fecha)` da la próxima fecha de la aplicación más reciente.
+    """
+    cambios = {}
+    for filas in grupos.values():
+        ultima = max(filas, key=lambda f: (f[2], f[0]))
+        for id_, nombre, fecha in filas:
+            cambios[id_] = calcular(nombre, fecha) if id_ == ultima[0] else None
+    return cambios
+
+
+def _calculador_vacunas(especie, configuracion):
+    return lambda nombre, fecha: calcular_proxima_dosis(especie, nombre, fecha, configuracion)
+
+
+def _calculador_prevenciones(intervalos):
+    return lambda tipo, fecha: calcular_proxima_prevencion(tipo, fecha, intervalos)
+
+
+# ------------------ MANTENIMIENTO INCREMENTAL ------------------
+
+def recalcular_mascota(mascota_id, nombres=None):
+    """Recalcula `proxima_dosis` de una mascota dentro de la sesión actual.
+
+    Llamar después de agregar/editar/borrar vacunas y antes del commit.
+    `nombres` limita el recálculo a esas vacunas (se normalizan).
+    """
+    mascota = db.session.get(Mascota, mascota_id)
+    if not mascota:
+        return
+
+    filtro = {normalizar(n) for n in nombres} if nombres is not None else None
+    grupos = {}
+    vacunas = {}
+    for vacuna in Vacuna.query.filter_by(mascota_id=mascota_id):
+        clave = normalizar(vacuna.nombre)
+        if filtro is not None and clave not in filtro:
+            continue
+        grupos.setdefault(clave, []).append((vacuna.id, vacuna.nombre, vacuna.fecha_aplicacion))
+        vacunas[vacuna.id] = vacuna
+
+    for id_, proxima in _asignar(grupos, _calculador_vacunas(mascota.especie, _configuracion())).items():
+        if vacunas[id_].proxima_dosis != proxima:
+            vacunas[id_].proxima_dosis = proxima
+
+
+def recalcular_prevenciones(mascota_id, tipos=None):
+    """Como recalcular_mascota, para `proxima_fecha` de las prevenciones."""
+    filtro = {normalizar(t) for t in tipos} if tipos is not None else None
+    grupos = {}
+    prevenciones = {}
+    for prevencion in Prevencion.query.filter_by(mascota_id=mascota_id):
+        clave = normalizar(prevencion.tipo)
+        if filtro is not None and clave not in filtro:
+            continue
+        grupos.setdefault(clave, []).append((prevencion.id, prevencion.tipo, prevencion.fecha))
+        prevenciones[prevencion.id] = prevencion
+
+    for id_, proxima in _asignar(grupos, _calculador_prevenciones(_intervalos_prevencion())).items():
+        if prevenciones[id_].proxima_fecha != proxima:
+            prevenciones[id_].proxima_fecha = proxima
+
+
+def recalcular_todo(conn, lote=5000, mascotas=None, rev=None):
+    """Recalcula todas las mascotas por lotes (para migraciones y reparaciones).
+
+    Recorre las vacunas en orden (mascota_id, id) con keyset, así que la
+    memoria queda acotada por `lote` más el historial de una mascota.
+    `mascotas` limita el recorrido a esos ids (un bloque de una
+    importación); con `rev` las filas recalculadas llevan esa revisión
+    para que la sincronización las reenvíe.
+    """
+    configuracion = _configuracion()
+    return _recalcular_tabla(
+        conn, Vacuna.__table__, "nombre", "fecha_aplicacion", "proxima_dosis",
+        lambda especie: _calculador_vacunas(especie, configuracion), lote, mascotas, rev,
+    )
+
+
+def recalcular_todo_prevenciones(conn, lote=5000, mascotas=None, rev=None):
+    calcular = _calculador_prevenciones(_intervalos_prevencion())
+    return _recalcular_tabla(
+        conn, Prevencion.__table__, "tipo", "fecha", "proxima_fecha", lambda especie: calcular,
+        lote, mascotas, rev,
+    )
+
+
+def _recalcular_tabla(conn, tabla, col_nombre, col_fecha, col_destino, calculador, lote,
+                      mascotas=None, rev=None):
+    """`calculador(especie)` devuelve la función calcular(nombre, fecha) de esa mascota."""
+    valores = {col_destino: bindparam('b_proxima')}
+    if rev is not None:
+        valores["rev"] = rev
+    sentencia = update(tabla).where(tabla.c.id == bindparam('b_id')).values(valores)
+
+    total = 0
+    abiertas = {}  # mascota_id -> (especie, grupos) aún incompletas
+    ultimo_mascota, ultimo_id = -1, 0
+    filtros = [tabla.c.mascota_id.in_(mascotas)] if mascotas is not None else []
+
+    def volcar(mascota_ids):
+        cambios = []
+        for mascota_id in mascota_ids:
+            especie, grupos = abiertas.pop(mascota_id)
+            cambios.extend(
+                {"b_id": id_, "b_proxima": proxima}
+                for id_, proxima in _asignar(grupos, calculador(especie)).items()
+            )
+        if cambios:
+            conn.execute(sentencia, cambios)
+        return len(cambios)
+
+    while True:
+        filas = conn.execute(
+            select(tabla.c.id, tabla.c[col_nombre], tabla.c[col_fecha], tabla.c.mascota_id, Mascota.especie)
+            .join(Mascota, Mascota.id == tabla.c.mascota_id)
+            .where(or_(
+                tabla.c.mascota_id > ultimo_mascota,
+                and_(tabla.c.mascota_id == ultimo_mascota, tabla.c.id > ultimo_id),
+            ), *filtros)
+            .order_by(tabla.c.mascota_id, tabla.c.id)
+            .limit(lote)
+        ).all()
+        if not filas:
+            break
+
+        for id_, nombre, fecha, mascota_id, especie in filas:
+            _, grupos = abiertas.setdefault(mascota_id, (especie, {}))
+            grupos.setdefault(normalizar(nombre), []).append((id_, nombre, fecha))
+
+        ultimo_mascota, ultimo_id = filas[-1].mascota_id, filas[-1].id
+        # Las mascotas anteriores a la última leída ya están completas
+        total += volcar([m for m in abiertas if m < ultimo_mascota])
+
+    total += volcar(list(abiertas))
+    return total
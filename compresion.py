@@ -0,0 +1,145 @@
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # opcional, ver requirements-opcional.txt
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # opcional, ver requirements-opcional.txt
+    zstandard = None
+
+# ============================================================
+# COMPRESIÓN DE RESPUESTAS (Accept-Encoding)
+# ============================================================
+# Se elige la codificación según Accept-Encoding (respetando los q=) y,
+# a igual preferencia del cliente, zstd > br > gzip. zstd y br solo si
+# sus módulos están instalados; gzip siempre.
+#
+# Solo se comprimen tipos de texto (JSON, NDJSON, CSV, HTML...) de al
+# menos COMPRESION_MIN_BYTES. Las respuestas en streaming (exportación)
+# se comprimen bloque a bloque, con un flush por bloque para que el
+# cliente reciba datos a medida que se generan. Los archivos servidos
+# con send_file (media WebP, estáticos) no se tocan.
+#
+# Configuración (app.config):
+#   COMPRESION            False = apagado (p. ej. si ya comprime el proxy)
+#   COMPRESION_MIN_BYTES  umbral para respuestas normales (1024)
+
+COMPRIMIBLES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "image/svg+xml",
+    "text/csv",
+    "text/css",
+    "text/html",
+    "text/javascript",
+    "text/plain",
+}
+
+# Niveles pensados para comprimir en cada respuesta, no para archivar
+NIVEL_GZIP = 6
+NIVEL_BROTLI = 4
+NIVEL_ZSTD = 3
+
+
+def disponibles():
+    """Codificaciones soportadas, de mayor a menor preferencia."""
+    codificaciones = []
+    if zstandard is not None:
+        codificaciones.append("zstd")
+    if brotli is not None:
+        codificaciones.append("br")
+    codificaciones.append("gzip")
+    return codificaciones
+
+
+def comprimir(datos, codificacion):
+    if codificacion == "zstd":
+        return zstandard.ZstdCompressor(level=NIVEL_ZSTD).compress(datos)
+    if codificacion == "br":
+        return brotli.compress(datos, quality=NIVEL_BROTLI)
+    return gzip.compress(datos, compresslevel=NIVEL_GZIP, mtime=0)
+
+
+class _Compresor:
+    """Interfaz común para comprimir por bloques: bloque() y fin()."""
+
+    def __init__(self, codificacion):
+        self.codificacion = codificacion
+        if codificacion == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=NIVEL_ZSTD).compressobj()
+        elif codificacion == "br":
+            self._obj = brotli.Compressor(quality=NIVEL_BROTLI)
+        else:
+            self._obj = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)  # 31: cabecera gzip
+
+    def bloque(self, datos):
+        if self.codificacion == "zstd":
+            return self._obj.compress(datos) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.codificacion == "br":
+            return self._obj.process(datos) + self._obj.flush()
+        return self._obj.compress(datos) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def fin(self):
+        if self.codificacion == "zstd":
+            return self._obj.flush()
+        if self.codificacion == "br":
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+def _en_streaming(iterable, codificacion):
+    compresor = _Compresor(codificacion)
+    try:
+        for datos in iterable:
+            if isinstance(datos, str):
+                datos = datos.encode()
+            if datos:
+                yield compresor.bloque(datos)
+        yield compresor.fin()
+    finally:
+        cerrar = getattr(iterable, "close", None)
+        if cerrar:
+            cerrar()
+
+
+def elegir(accept_encoding):
+    """Codificación a usar para esa cabecera Accept-Encoding, o None."""
+    return accept_encoding.best_match(disponibles())
+
+
+def instalar(app):
+    @app.after_request
+    def _comprimir(respuesta):
+        if not app.config.get("COMPRESION", True):
+            return respuesta
+        if (respuesta.status_code < 200 or respuesta.status_code in (204, 304)
+                or request.method == "HEAD"
+                or respuesta.direct_passthrough
+                or "Content-Encoding" in respuesta.headers
+                or respuesta.mimetype not in COMPRIMIBLES
+                or "no-transform" in respuesta.headers.get("Cache-Control", "")):
+            return respuesta
+
+        # Varía con Accept-Encoding aunque esta vez no se comprima
+        respuesta.vary.add("Accept-Encoding")
+        codificacion = elegir(request.accept_encodings)
+        if codificacion is None:
+            return respuesta
+
+        if respuesta.is_streamed:
+            respuesta.response = _en_streaming(respuesta.response, codificacion)
+            respuesta.headers.pop("Content-Length", None)
+        else:
+            datos = respuesta.get_data()
+            if len(datos) < app.config.get("COMPRESION_MIN_BYTES", 1024):
+                return respuesta
+            respuesta.set_data(comprimir(datos, codificacion))
+        respuesta.headers["Content-Encoding"] = codificacion
+        return respuesta
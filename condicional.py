@@ -0,0 +1,96 @@
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, g, request
+from sqlalchemy import func, literal, select, union_all
+
+from models import db, Eliminacion
+
+# ============================================================
+# GET CONDICIONAL (ETag / Last-Modified / 304)
+# ============================================================
+# El validador de una colección sale de una sola consulta de agregados
+# (count, max(rev), max(actualizado_en)) sobre las tablas de las que
+# depende la respuesta, más las lápidas de `eliminacion`. Se calcula
+# ANTES de ejecutar la vista: si el cliente ya tiene esa versión se
+# responde 304 sin cargar filas ni serializar nada.
+#
+# `rev` es global y creciente (ver sincronizacion.py), así que cualquier
+# alta o edición sube max(rev) y cualquier borrado deja una lápida.
+#
+# Last-Modified tiene resolución de segundos (HTTP): dos cambios en el
+# mismo segundo pueden pasar desapercibidos con If-Modified-Since. El
+# ETag no tiene ese problema y, si llegan ambos, manda If-None-Match.
+
+
+def version(partes, eliminados=None):
+    """Ejecuta los agregados y devuelve [(count, max_rev, max_fecha), ...].
+
+    `partes` es una lista de (modelo, condición). `eliminados` es la
+    condición sobre Eliminacion cuyas lápidas afectan a la respuesta.
+    """
+    consultas = [
+        select(func.count(), func.max(modelo.rev), func.max(modelo.actualizado_en))
+        .select_from(modelo).where(condicion)
+        for modelo, condicion in partes
+    ]
+    if eliminados is not None:
+        consultas.append(
+            select(literal(0), func.max(Eliminacion.rev), func.max(Eliminacion.eliminado_en))
+            .where(eliminados)
+        )
+    consulta = consultas[0] if len(consultas) == 1 else union_all(*consultas)
+    return [tuple(fila) for fila in db.session.execute(consulta)]
+
+
+def _validadores(filas):
+    datos = "|".join([repr(filas), request.query_string.decode(), str(g.get("user_id"))])
+    etag = hashlib.sha1(datos.encode()).hexdigest()[:20]
+
+    fechas = [fila[2] for fila in filas if fila[2] is not None]
+    ultima = max(fechas).replace(microsecond=0, tzinfo=timezone.utc) if fechas else None
+    return etag, ultima
+
+
+def _no_modificado(etag, ultima):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if ultima is not None and request.if_modified_since is not None:
+        return ultima <= request.if_modified_since
+    return False
+
+
+def _marcar(respuesta, etag, ultima):
+    respuesta.set_etag(etag, weak=True)
+    if ultima is not None:
+        respuesta.last_modified = ultima
+    # Datos por usuario: el cliente puede guardarlos pero debe revalidar
+    respuesta.cache_control.private = True
+    respuesta.cache_control.no_cache = True
+    return respuesta
+
+
+def condicional(calcular_version):
+    """Añade ETag/Last-Modified a la vista y responde 304 si no cambió.
+
+    `calcular_version(**kwargs_de_la_vista)` devuelve el resultado de
+    `version(...)`, o None para atender la petición sin validadores.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(**kwargs):
+            filas = calcular_version(**kwargs)
+            if filas is None:
+                return vista(**kwargs)
+
+            etag, ultima = _validadores(filas)
+            if _no_modificado(etag, ultima):
+                return _marcar(current_app.response_class(status=304), etag, ultima)
+
+            respuesta = current_app.make_response(vista(**kwargs))
+            if respuesta.status_code == 200:
+                _marcar(respuesta, etag, ultima)
+            return respuesta
+        return envoltura
+    return decorador
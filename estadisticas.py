@@ -0,0 +1,339 @@
+from datetime import date
+
+from sqlalchemy import delete, event, exists, func, inspect, literal, select, true
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import db, Estadistica, Mascota, Vacuna, Receta, Prevencion
+
+# ============================================================
+# ESTADÍSTICAS DE LA CLÍNICA (TABLA DE AGREGADOS)
+# ============================================================
+# Los tableros no recorren el historial: leen la tabla `estadistica`,
+# con un contador por (métrica, mes, especie, raza, clave):
+#   mascotas      mascotas vivas                      (sin mes ni clave)
+#   vacunadas     mascotas vivas con alguna vacuna    (sin mes ni clave)
+#   vacunas       aplicaciones por mes de aplicación  (clave: vacuna)
+#   recetas       recetas por mes                     (clave: medicamento)
+#   vencimientos  prevenciones por mes de proxima_fecha (clave: tipo)
+# Especie, raza y clave van normalizadas (minúsculas, sin espacios a
+# los lados). Su tamaño depende de cuántas combinaciones hay, no de
+# cuántos registros: una consulta del tablero lee unas decenas de filas.
+#
+# Se mantiene en la misma transacción que los datos, sumando y restando
+# aportes con INSERT ... SELECT ... GROUP BY ... ON CONFLICT DO UPDATE:
+#   - ORM: antes del flush se resta lo que aportaban las filas que
+#     cambian o se borran (la base aún tiene sus valores viejos) y
+#     después se suma lo que aportan las nuevas y las cambiadas. Si
+#     cambia la especie o raza de una mascota, o se marca como
+#     eliminada, se mueve su aporte entero.
+#   - Altas masivas con Core: llamar a sumar() con los ids insertados,
+#     como busqueda.indexar().
+# Las mascotas marcadas como eliminadas (borrado.py) no aportan: su
+# aporte se resta al marcarlas y el purgador ya no lo toca.
+#
+# `flask --app app reconstruir-estadisticas` la rehace desde cero con
+# una agregación por tabla (reparaciones, cambios de métricas).
+
+# modelo -> (métrica, columna de fecha, columna de clave)
+FUENTES = {
+    Mascota: ("mascotas", None, None),
+    Vacuna: ("vacunas", "fecha_aplicacion", "nombre"),
+    Receta: ("recetas", "fecha", "medicamento"),
+    Prevencion: ("vencimientos", "proxima_fecha", "tipo"),
+}
+
+# Columnas que, si cambian, cambian el aporte de la fila
+CAMPOS = {
+    Mascota: ("especie", "raza", "eliminada_en"),
+    Vacuna: ("nombre", "fecha_aplicacion", "mascota_id"),
+    Receta: ("medicamento", "fecha", "mascota_id"),
+    Prevencion: ("tipo", "proxima_fecha", "mascota_id"),
+}
+
+AGRUPACIONES = {
+    "mes": lambda periodo: periodo,
+    "trimestre": lambda periodo: f"{periodo[:4]}-T{(int(periodo[5:7]) - 1) // 3 + 1}",
+    "anio": lambda periodo: periodo[:4],
+}
+
+_COLUMNAS = ["metrica", "periodo", "especie", "raza", "clave", "valor"]
+_CLAVE = ["metrica", "periodo", "especie", "raza", "clave"]
+_TRAMO = 500
+
+
+def normalizar(columna):
+    return func.lower(func.trim(func.coalesce(columna, "")))
+
+
+def periodo(fecha):
+    return f"{fecha.year:04d}-{fecha.month:02d}"
+
+
+def _periodo_sql(columna, dialecto):
+    if dialecto == "sqlite":
+        return func.strftime("%Y-%m", columna)
+    return func.to_char(columna, "YYYY-MM")
+
+
+# ------------------ APORTES ------------------
+
+def _aportes(modelo, filtro, signo, dialecto):
+    """SELECT con lo que aportan a su métrica las filas de `modelo` que cumplen `filtro`."""
+    metrica, fecha, clave = FUENTES[modelo]
+    especie, raza = normalizar(Mascota.especie), normalizar(Mascota.raza)
+    grupos = [especie, raza]
+    columna_periodo = columna_clave = literal("")
+    if fecha:
+        columna_periodo = _periodo_sql(getattr(modelo, fecha), dialecto)
+        grupos.append(columna_periodo)
+    if clave:
+        columna_clave = normalizar(getattr(modelo, clave))
+        grupos.append(columna_clave)
+
+    consulta = select(literal(metrica), columna_periodo, especie, raza, columna_clave, func.count() * signo)
+    if modelo is not Mascota:
+        consulta = consulta.select_from(modelo).join(Mascota, Mascota.id == modelo.mascota_id)
+    consulta = consulta.where(Mascota.eliminada_en.is_(None), filtro)
+    if fecha:
+        consulta = consulta.where(getattr(modelo, fecha).isnot(None))
+    return consulta.group_by(*grupos)
+
+
+def _vacunadas(filtro, signo):
+    especie, raza = normalizar(Mascota.especie), normalizar(Mascota.raza)
+    return (
+        select(literal("vacunadas"), literal(""), especie, raza, literal(""), func.count() * signo)
+        .where(Mascota.eliminada_en.is_(None), filtro, exists().where(Vacuna.mascota_id == Mascota.id))
+        .group_by(especie, raza)
+    )
+
+
+def _aplicar(conn, consulta):
+    insertar = sqlite.insert if conn.dialect.name == "sqlite" else postgresql.insert
+    sentencia = insertar(Estadistica).from_select(_COLUMNAS, consulta)
+    conn.execute(sentencia.on_conflict_do_update(
+        index_elements=_CLAVE, set_={"valor": Estadistica.valor + sentencia.excluded.valor},
+    ))
+
+
+def _tramos(ids):
+    ids = sorted(ids)
+    for inicio in range(0, len(ids), _TRAMO):
+        yield ids[inicio:inicio + _TRAMO]
+
+
+def sumar(conn, modelo, ids, signo=1):
+    """Suma (signo=-1: resta) el aporte de esas filas de `modelo`.
+
+    Llamar después de insertarlas o antes de borrarlas. Para Mascota
+    cuenta solo la mascota, no su historial (ver sumar_mascotas).
+    """
+    if modelo not in FUENTES or not ids:
+        return
+    dialecto = conn.dialect.name
+    for tramo in _tramos(ids):
+        _aplicar(conn, _aportes(modelo, modelo.id.in_(tramo), signo, dialecto))
+
+    if modelo is Vacuna:
+        # Una mascota pasa a estar vacunada (o deja de estarlo) si todas sus vacunas están en `ids`
+        propias = {}
+        for tramo in _tramos(ids):
+            for mascota_id, cantidad in conn.execute(
+                select(Vacuna.mascota_id, func.count()).where(Vacuna.id.in_(tramo)).group_by(Vacuna.mascota_id)
+            ):
+                propias[mascota_id] = propias.get(mascota_id, 0) + cantidad
+        cambian = []
+        for tramo in _tramos(propias):
+            cambian += [
+                mascota_id for mascota_id, cantidad in conn.execute(
+                    select(Vacuna.mascota_id, func.count()).where(Vacuna.mascota_id.in_(tramo))
+                    .group_by(Vacuna.mascota_id)
+                ) if cantidad == propias[mascota_id]
+            ]
+        for tramo in _tramos(cambian):
+            _aplicar(conn, _vacunadas(Mascota.id.in_(tramo), signo))
+
+
+def sumar_mascotas(conn, ids=None, signo=1, desde=None):
+    """Suma (o resta) el aporte entero de esas mascotas: ellas y su historial.
+
+    `desde` en lugar de `ids`: todas las mascotas con id mayor o igual.
+    """
+    filtros = [Mascota.id >= desde] if desde is not None else [Mascota.id.in_(t) for t in _tramos(ids or ())]
+    dialecto = conn.dialect.name
+    for filtro in filtros:
+        for modelo in FUENTES:
+            _aplicar(conn, _aportes(modelo, filtro, signo, dialecto))
+        _aplicar(conn, _vacunadas(filtro, signo))
+
+
+def reconstruir(conn):
+    """Rehace la tabla entera: una agregación por métrica."""
+    conn.execute(delete(Estadistica))
+    dialecto = conn.dialect.name
+    for modelo in FUENTES:
+        _aplicar(conn, _aportes(modelo, true(), 1, dialecto))
+    _aplicar(conn, _vacunadas(true(), 1))
+
+
+# ------------------ MANTENIMIENTO CON EL ORM ------------------
+
+def _cambio_relevante(objeto):
+    estado = inspect(objeto)
+    return any(estado.attrs[campo].history.has_changes() for campo in CAMPOS[type(objeto)])
+
+
+def _afectados(nuevos, cambiados, borrados):
+    """-> (ids de mascotas cuyo aporte entero cambia, {modelo: ids de filas sueltas})"""
+    filas = [o for o in cambiados if type(o) in CAMPOS and _cambio_relevante(o)]
+    filas += [o for o in borrados if type(o) in CAMPOS]
+    mascotas = {o.id for o in filas if isinstance(o, Mascota)}
+    filas = [o for o in filas if not isinstance(o, Mascota)] + [o for o in nuevos if type(o) in CAMPOS]
+
+    sueltas = {}
+    for objeto in filas:
+        # El historial de una mascota que se mueve entera ya va en su aporte
+        if getattr(objeto, "mascota_id", None) not in mascotas:
+            sueltas.setdefault(type(objeto), set()).add(objeto.id)
+    return mascotas, sueltas
+
+
+def _mover(session, mascotas, sueltas, signo):
+    if not mascotas and not sueltas:
+        return
+    conn = session.connection()
+    if mascotas:
+        sumar_mascotas(conn, mascotas, signo)
+    for modelo, ids in sueltas.items():
+        sumar(conn, modelo, ids, signo)
+
+
+@event.listens_for(Session, "before_flush")
+def _restar_anteriores(session, flush_context, instances):
+    _mover(session, *_afectados((), session.dirty, session.deleted), -1)
+
+
+@event.listens_for(Session, "after_flush")
+def _sumar_nuevos(session, flush_context):
+    _mover(session, *_afectados(session.new, session.dirty, ()), 1)
+
+
+# ------------------ CONSULTAS DEL TABLERO ------------------
+
+def _filtros(metrica, especie=None, raza=None, clave=None, desde=None, hasta=None):
+    filtros = [Estadistica.metrica == metrica]
+    if especie:
+        filtros.append(Estadistica.especie == especie.strip().lower())
+    if raza:
+        filtros.append(Estadistica.raza == raza.strip().lower())
+    if clave:
+        filtros.append(Estadistica.clave == clave.strip().lower())
+    if desde:
+        filtros.append(Estadistica.periodo >= periodo(desde))
+    if hasta:
+        filtros.append(Estadistica.periodo <= periodo(hasta))
+    return filtros
+
+
+def _agrupar(filas, agrupar):
+    """[(periodo, total)] por mes -> [{"periodo", "total"}] por `agrupar`."""
+    a_grupo = AGRUPACIONES[agrupar]
+    totales = {}
+    for periodo_mes, total in filas:
+        grupo = a_grupo(periodo_mes)
+        totales[grupo] = totales.get(grupo, 0) + total
+    return [{"periodo": p, "total": t} for p, t in sorted(totales.items()) if t]
+
+
+def serie(metrica, desde, hasta, agrupar="mes", especie=None, raza=None, clave=None):
+    filas = db.session.execute(
+        select(Estadistica.periodo, func.sum(Estadistica.valor))
+        .where(*_filtros(metrica, especie, raza, clave, desde, hasta))
+        .group_by(Estadistica.periodo)
+    ).all()
+    return _agrupar(filas, agrupar)
+
+
+def series(metrica, claves, desde, hasta, agrupar="mes", especie=None, raza=None):
+    """{clave: serie} de varias claves en una sola consulta (mismo formato que serie)."""
+    if not claves:
+        return {}
+    filas = db.session.execute(
+        select(Estadistica.clave, Estadistica.periodo, func.sum(Estadistica.valor))
+        .where(*_filtros(metrica, especie, raza, None, desde, hasta), Estadistica.clave.in_(claves))
+        .group_by(Estadistica.clave, Estadistica.periodo)
+    ).all()
+    por_clave = {clave: [] for clave in claves}
+    for clave, periodo_mes, total in filas:
+        por_clave[clave].append((periodo_mes, total))
+    return {clave: _agrupar(filas_clave, agrupar) for clave, filas_clave in por_clave.items()}
+
+
+def cobertura(especie=None, raza=None, por_raza=True):
+    """Mascotas, vacunadas y cobertura (0..1) por especie (y raza)."""
+    grupos = [Estadistica.especie] + ([Estadistica.raza] if por_raza else [])
+    filas = db.session.execute(
+        select(*grupos, Estadistica.metrica, func.sum(Estadistica.valor))
+        .where(Estadistica.metrica.in_(("mascotas", "vacunadas")), *_filtros("mascotas", especie, raza)[1:])
+        .group_by(*grupos, Estadistica.metrica)
+    ).all()
+
+    resultado = {}
+    for *grupo, metrica, total in filas:
+        resultado.setdefault(tuple(grupo), {"mascotas": 0, "vacunadas": 0})[metrica] = total
+    salida = []
+    for grupo, totales in resultado.items():
+        if not totales["mascotas"]:
+            continue
+        fila = {"especie": grupo[0]}
+        if por_raza:
+            fila["raza"] = grupo[1]
+        fila.update(totales, cobertura=round(totales["vacunadas"] / totales["mascotas"], 4))
+        salida.append(fila)
+    return sorted(salida, key=lambda f: (-f["mascotas"], f["especie"], f.get("raza", "")))
+
+
+def ranking(metrica, desde, hasta, limite=10, especie=None, raza=None):
+    """Las claves más frecuentes de la métrica en el rango: [{"clave", "total"}]."""
+    total = func.sum(Estadistica.valor)
+    filas = db.session.execute(
+        select(Estadistica.clave, total)
+        .where(*_filtros(metrica, especie, raza, None, desde, hasta))
+        .group_by(Estadistica.clave)
+        .having(total > 0)
+        .order_by(total.desc(), Estadistica.clave)
+        .limit(limite)
+    ).all()
+    return [{"clave": clave, "total": t} for clave, t in filas]
+
+
+def prevenciones_vencidas(desde, hasta, agrupar="mes", especie=None, raza=None, hoy=None):
+    """Prevenciones cuya próxima fecha ya pasó sin una nueva, por mes de vencimiento.
+
+    Los meses cerrados salen de los agregados. El mes en curso se cuenta
+    en vivo hasta ayer con el índice de proxima_fecha: su agregado
+    incluye también lo que aún no venció.
+    """
+    hoy = hoy or date.today()
+    inicio_mes = hoy.replace(day=1)
+    filas = db.session.execute(
+        select(Estadistica.periodo, func.sum(Estadistica.valor))
+        .where(*_filtros("vencimientos", especie, raza, None, desde, hasta),
+               Estadistica.periodo < periodo(hoy))
+        .group_by(Estadistica.periodo)
+    ).all()
+
+    if desde <= hoy and hasta >= inicio_mes:
+        consulta = (
+            select(func.count()).select_from(Prevencion).join(Mascota, Mascota.id == Prevencion.mascota_id)
+            .where(Prevencion.proxima_fecha >= max(desde, inicio_mes), Prevencion.proxima_fecha < hoy,
+                   Prevencion.proxima_fecha <= hasta)
+        )
+        if especie:
+            consulta = consulta.where(normalizar(Mascota.especie) == especie.strip().lower())
+        if raza:
+            consulta = consulta.where(normalizar(Mascota.raza) == raza.strip().lower())
+        filas.append((periodo(hoy), db.session.execute(consulta).scalar()))
+
+    return _agrupar(filas, agrupar)
@@ -0,0 +1,397 @@
+import csv
+import io
+import itertools
+import json
+from datetime import date, datetime
+
+from sqlalchemy import Boolean, Date, Float, Integer, insert, select, update
+
+import busqueda
+import cache
+import calendario
+import estadisticas
+import microchips
+import replicas
+import sincronizacion
+from models import db, Usuario, Mascota, Vacuna, Diagnostico, Receta, Prevencion, Importacion, ImportacionMascota
+from paginacion import ParametroInvalido
+from serializacion import valor_json
+
+# ============================================================
+# EXPORTACIÓN E IMPORTACIÓN EN STREAMING (NDJSON / CSV)
+# ============================================================
+# Un registro por línea (NDJSON) o por fila (CSV con la unión de las
+# columnas). La columna "tabla" dice qué es cada registro. Primero van todas las mascotas y luego
+# el historial tabla por tabla, así cada registro llega después de su
+# mascota. `id` y `mascota_id` son los del origen: al importar se crean
+# ids nuevos y se traduce mascota_id.
+#
+# Exportar: cursor en streaming (yield_per) en una conexión propia,
+# entregado en bloques de ~64 KB. La memoria no depende del tamaño de la
+# cuenta.
+#
+# Importar: la entrada se lee de forma incremental y cada `lote`
+# registros se confirman en una transacción junto con el progreso (tabla
+# importacion) y la traducción de ids de mascota (importacion_mascota).
+# Si se corta, se reanuda con la misma importación: se saltan los
+# registros ya confirmados. proxima_dosis / proxima_fecha se exportan
+# pero no se importan: cada bloque las recalcula para las mascotas que
+# tocó, en su misma transacción, así que el progreso guardado incluye
+# el recálculo y al reanudar no queda nada pendiente. Las fotos no viajan.
+
+FORMATOS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# tabla -> (modelo, campos exportados además de id y user_id/mascota_id)
+TABLAS = {
+    "mascota": (Mascota, ("nombre", "especie", "raza", "fecha_nacimiento", "peso", "microchip", "castrado")),
+    "vacuna": (Vacuna, ("nombre", "fecha_aplicacion", "proxima_dosis")),
+    "diagnostico": (Diagnostico, ("titulo", "fecha", "descripcion")),
+    "receta": (Receta, ("medicamento", "dosis", "fecha", "instrucciones")),
+    "prevencion": (Prevencion, ("tipo", "fecha", "descripcion", "proxima_fecha")),
+}
+
+CALCULADOS = {"proxima_dosis", "proxima_fecha"}
+
+COLUMNAS_CSV = ["tabla", "id", "user_id", "mascota_id"]
+for _, _campos in TABLAS.values():
+    COLUMNAS_CSV += [c for c in _campos if c not in COLUMNAS_CSV]
+
+TAMANIO_BLOQUE = 64 * 1024
+MAX_ERRORES_INFORME = 100
+
+
+def formato_valido(formato):
+    if formato not in FORMATOS:
+        raise ParametroInvalido(f"Formato no soportado: usa {', '.join(FORMATOS)}")
+    return formato
+
+
+# ------------------ EXPORTACIÓN ------------------
+
+def _consulta(modelo, campos, user_id):
+    columnas = [modelo.id] + [getattr(modelo, c) for c in campos]
+    # Sin las mascotas marcadas como eliminadas (ver borrado.py)
+    if modelo is Mascota:
+        consulta = select(Mascota.user_id, *columnas).where(Mascota.eliminada_en.is_(None)).order_by(Mascota.id)
+        return consulta.where(Mascota.user_id == user_id) if user_id is not None else consulta
+
+    consulta = (
+        select(modelo.mascota_id, *columnas)
+        .join(Mascota, Mascota.id == modelo.mascota_id)
+        .where(Mascota.eliminada_en.is_(None))
+        .order_by(modelo.mascota_id, modelo.id)
+    )
+    return consulta.where(Mascota.user_id == user_id) if user_id is not None else consulta
+
+
+def registros(user_id=None, lote=1000):
+    """Genera (tabla, fila) de todo lo exportable del usuario, o de todos con None."""
+    with replicas.motor_de_lectura(db.engine).connect() as conn:
+        conn = conn.execution_options(stream_results=True, yield_per=lote)
+        for tabla, (modelo, campos) in TABLAS.items():
+            for fila in conn.execute(_consulta(modelo, campos, user_id)):
+                yield tabla, fila._asdict()
+
+
+def _en_bloques(trozos):
+    pendiente, tamanio = [], 0
+    for trozo in trozos:
+        pendiente.append(trozo)
+        tamanio += len(trozo)
+        if tamanio >= TAMANIO_BLOQUE:
+            yield "".join(pendiente)
+            pendiente, tamanio = [], 0
+    if pendiente:
+        yield "".join(pendiente)
+
+
+def _lineas_ndjson(user_id):
+    for tabla, fila in registros(user_id):
+        fila = {clave: valor_json(valor) for clave, valor in fila.items()}
+        yield json.dumps({"tabla": tabla, **fila}, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def _lineas_csv(user_id):
+    salida = io.StringIO()
+    escritor = csv.DictWriter(salida, COLUMNAS_CSV, lineterminator="\n")
+    escritor.writeheader()
+    for tabla, fila in registros(user_id):
+        escritor.writerow({"tabla": tabla, **{clave: valor_json(valor) for clave, valor in fila.items()}})
+        yield salida.getvalue()
+        salida.seek(0)
+        salida.truncate()
+    yield salida.getvalue()
+
+
+def exportar(formato, user_id=None):
+    """Generador de texto con la exportación completa."""
+    lineas = _lineas_ndjson if formato_valido(formato) == "ndjson" else _lineas_csv
+    return _en_bloques(lineas(user_id))
+
+
+# ------------------ LECTURA ------------------
+
+def _leer_ndjson(texto):
+    for linea in texto:
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield json.loads(linea)
+        except ValueError:
+            yield None
+
+
+def _leer_csv(texto):
+    for fila in csv.DictReader(texto):
+        yield {clave: valor for clave, valor in fila.items() if valor not in ("", None)}
+
+
+LECTORES = {"ndjson": _leer_ndjson, "csv": _leer_csv}
+
+
+def _convertir(columna, valor):
+    if valor is None or valor == "":
+        return None
+    tipo = columna.type
+    if isinstance(tipo, Date):
+        return date.fromisoformat(valor)
+    if isinstance(tipo, Boolean):
+        if isinstance(valor, bool):
+            return valor
+        texto = str(valor).strip().lower()
+        if texto in ("true", "1"):
+            return True
+        if texto in ("false", "0"):
+            return False
+        raise ValueError(valor)
+    if isinstance(tipo, Float):
+        return float(valor)
+    if isinstance(tipo, Integer):
+        return int(valor)
+    return str(valor)
+
+
+def _validar(registro, user_id):
+    """(tabla, fila, origen) o lanza ValueError con el motivo."""
+    if not isinstance(registro, dict):
+        raise ValueError("Registro no válido")
+    tabla = registro.get("tabla")
+    if tabla not in TABLAS:
+        raise ValueError(f"Tabla desconocida: {tabla!r}")
+    modelo, campos = TABLAS[tabla]
+
+    fila = {}
+    for campo in campos:
+        if campo in CALCULADOS:
+            continue
+        columna = modelo.__table__.c[campo]
+        try:
+            fila[campo] = _convertir(columna, registro.get(campo))
+        except (TypeError, ValueError):
+            raise ValueError(f"'{campo}' no válido")
+        if fila[campo] is None and not columna.nullable:
+            raise ValueError(f"Falta '{campo}'")
+
+    if modelo is Mascota:
+        try:
+            fila["microchip"] = microchips.normalizar(fila["microchip"])
+        except microchips.MicrochipInvalido:
+            raise ValueError("'microchip' no válido")
+
+    try:
+        origen = int(registro["id"]) if registro.get("id") not in (None, "") else None
+        if modelo is Mascota:
+            fila["user_id"] = user_id if user_id is not None else int(registro["user_id"])
+        else:
+            fila["mascota_id"] = int(registro["mascota_id"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Falta 'user_id'" if modelo is Mascota else "Falta 'mascota_id'")
+    return tabla, fila, origen
+
+
+# ------------------ IMPORTACIÓN ------------------
+
+def crear_importacion(formato, user_id=None):
+    importacion = Importacion(user_id=user_id, formato=formato_valido(formato))
+    db.session.add(importacion)
+    db.session.commit()
+    return importacion
+
+
+def _confirmar_bloque(estado, bloque, errores):
+    """Valida e inserta un bloque en una transacción, con el progreso incluido."""
+    importacion_id, user_id = estado["id"], estado["user_id"]
+    numero = estado["registros"]
+    fallidos = []
+
+    def fallo(n, motivo):
+        fallidos.append(n)
+        estado["ultimo_error"] = f"Registro {n}: {motivo}"
+        if len(errores) < MAX_ERRORES_INFORME:
+            errores.append({"registro": n, "message": motivo})
+
+    mascotas, hijos = [], {}
+    for registro in bloque:
+        numero += 1
+        try:
+            tabla, fila, origen = _validar(registro, user_id)
+        except ValueError as e:
+            fallo(numero, str(e))
+            continue
+        if tabla == "mascota":
+            mascotas.append((numero, fila, origen))
+        else:
+            hijos.setdefault(tabla, []).append((numero, fila))
+
+    # Dueños inexistentes (importación de clínica) y mascotas repetidas
+    if user_id is None and mascotas:
+        existentes = set(db.session.execute(
+            select(Usuario.id).where(Usuario.id.in_({f["user_id"] for _, f, _ in mascotas}))
+        ).scalars())
+        for n, fila, _ in mascotas:
+            if fila["user_id"] not in existentes:
+                fallo(n, f"Usuario {fila['user_id']} no existe")
+        mascotas = [m for m in mascotas if m[1]["user_id"] in existentes]
+
+    # Microchips ya registrados o repetidos dentro del bloque (índice único)
+    chips = {f["microchip"] for _, f, _ in mascotas if f["microchip"]}
+    usados = set(db.session.execute(
+        select(Mascota.microchip).where(Mascota.microchip.in_(chips))
+    ).scalars()) if chips else set()
+    sin_repetir = []
+    for n, fila, origen in mascotas:
+        if fila["microchip"] and fila["microchip"] in usados:
+            fallo(n, f"Microchip {fila['microchip']} ya registrado")
+            continue
+        usados.add(fila["microchip"])
+        sin_repetir.append((n, fila, origen))
+    mascotas = sin_repetir
+
+    origenes = {o for _, _, o in mascotas if o is not None}
+    vistas = set(db.session.execute(
+        select(ImportacionMascota.origen_id)
+        .where(ImportacionMascota.importacion_id == importacion_id, ImportacionMascota.origen_id.in_(origenes))
+    ).scalars()) if origenes else set()
+    unicas = []
+    for n, fila, origen in mascotas:
+        if origen is not None and origen in vistas:
+            fallo(n, f"Mascota {origen} repetida")
+            continue
+        vistas.add(origen)
+        unicas.append((n, fila, origen))
+    mascotas = unicas
+
+    rev = sincronizacion.siguiente_revision(db.session.connection())
+    ahora = datetime.utcnow()
+
+    traduccion, tocadas = {}, set()
+    if mascotas:
+        filas = [dict(fila, rev=rev, actualizado_en=ahora) for _, fila, _ in mascotas]
+        ids = db.session.execute(
+            insert(Mascota).returning(Mascota.id, sort_by_parameter_order=True), filas,
+        ).scalars().all()
+        busqueda.indexar(db.session.connection(), Mascota, ids)
+        estadisticas.sumar(db.session.connection(), Mascota, ids)
+        tocadas.update(ids)
+        traduccion = {origen: id_ for (_, _, origen), id_ in zip(mascotas, ids) if origen is not None}
+        if traduccion:
+            db.session.execute(insert(ImportacionMascota), [
+                {"importacion_id": importacion_id, "origen_id": o, "mascota_id": m} for o, m in traduccion.items()
+            ])
+
+    faltan = {f["mascota_id"] for filas in hijos.values() for _, f in filas} - set(traduccion)
+    if faltan:
+        traduccion.update(db.session.execute(
+            select(ImportacionMascota.origen_id, ImportacionMascota.mascota_id)
+            .where(ImportacionMascota.importacion_id == importacion_id, ImportacionMascota.origen_id.in_(faltan))
+        ).all())
+
+    insertados = len(mascotas)
+    for tabla, filas in hijos.items():
+        validas = []
+        for n, fila in filas:
+            if fila["mascota_id"] not in traduccion:
+                fallo(n, f"Mascota {fila['mascota_id']} no importada")
+                continue
+            validas.append(dict(fila, mascota_id=traduccion[fila["mascota_id"]], rev=rev, actualizado_en=ahora))
+        if validas:
+            modelo = TABLAS[tabla][0]
+            ids = db.session.execute(insert(modelo).returning(modelo.id), validas).scalars().all()
+            busqueda.indexar(db.session.connection(), modelo, ids)
+            estadisticas.sumar(db.session.connection(), modelo, ids)
+            tocadas.update(v["mascota_id"] for v in validas)
+            insertados += len(validas)
+
+    if tocadas:
+        # Las próximas fechas cambian con un UPDATE de Core: el aporte a las estadísticas se rehace
+        conn = db.session.connection()
+        estadisticas.sumar_mascotas(conn, tocadas, signo=-1)
+        calendario.recalcular_todo(conn, mascotas=tocadas, rev=rev)
+        calendario.recalcular_todo_prevenciones(conn, mascotas=tocadas, rev=rev)
+        estadisticas.sumar_mascotas(conn, tocadas)
+
+    estado["registros"] = numero
+    estado["insertados"] += insertados
+    estado["errores"] += len(fallidos)
+    db.session.execute(
+        update(Importacion).where(Importacion.id == importacion_id).values(
+            registros=estado["registros"], insertados=estado["insertados"], errores=estado["errores"],
+            ultimo_error=estado["ultimo_error"], actualizado_en=ahora,
+        )
+    )
+    db.session.commit()
+    # Espacios de caché que el bloque deja viejos: dueños, fichas y chips antes sin mascota
+    return (
+        [f"u:{u}" for u in {f["user_id"] for _, f, _ in mascotas}]
+        + [f"m:{m}" for m in tocadas]
+        + [f"chip:{f['microchip']}" for _, f, _ in mascotas if f["microchip"]]
+    )
+
+
+def _terminar(estado):
+    db.session.execute(
+        update(Importacion).where(Importacion.id == estado["id"])
+        .values(estado="completa", actualizado_en=datetime.utcnow())
+    )
+    db.session.commit()
+    estado["estado"] = "completa"
+
+
+def importar(texto, importacion, lote=1000, progreso=None):
+    """Importa `texto` (archivo de texto) continuando `importacion`.
+
+    Devuelve (estado, errores): el progreso final y hasta
+    MAX_ERRORES_INFORME errores de los registros leídos en esta llamada.
+    `progreso(estado)` se llama después de cada bloque confirmado.
+    """
+    if importacion.estado != "en_curso":
+        raise ParametroInvalido("La importación ya terminó")
+
+    estado = {
+        clave: getattr(importacion, clave)
+        for clave in ("id", "user_id", "formato", "estado", "registros", "insertados",
+                      "errores", "ultimo_error")
+    }
+    # Sin transacción abierta mientras se lee la entrada: en SQLite
+    # retendría el lock de escritura durante la subida
+    db.session.commit()
+
+    entrada = LECTORES[estado["formato"]](texto)
+    for _ in itertools.islice(entrada, estado["registros"]):
+        pass
+
+    errores = []
+    while True:
+        bloque = list(itertools.islice(entrada, lote))
+        if not bloque:
+            break
+        cache.invalidar(*_confirmar_bloque(estado, bloque, errores))
+        if progreso:
+            progreso(estado)
+
+    _terminar(estado)
+    return estado, errores
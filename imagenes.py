@@ -0,0 +1,143 @@
+import io
+import os
+
+from flask import current_app
+from PIL import Image, ImageOps, UnidentifiedImageError
+from werkzeug.utils import secure_filename
+
+from media import MediaInvalida, decodificar_base64, guardar_media
+
+# ============================================================
+# PIPELINE DE FOTOS DE MASCOTAS
+# ============================================================
+# Al subir una foto se generan una sola vez tres variantes WebP
+# (lado mayor acotado), sin EXIF y con la orientación ya aplicada.
+# Cada variante va al almacén de media y la mascota guarda los hashes.
+
+# variante -> (lado máximo en px, calidad WebP)
+VARIANTES = {
+    "miniatura": (400, 75),
+    "mediana": (800, 80),
+    "original": (1600, 85),
+}
+
+# Evita "bombas de descompresión" (imágenes diminutas que ocupan GB en memoria).
+# Se comprueba a mano con el tamaño de la cabecera: Pillow solo lanza
+# DecompressionBombError por encima del doble de Image.MAX_IMAGE_PIXELS,
+# que es global del proceso y no se toca.
+MAX_PIXELES = 40_000_000
+
+
+def _abrir(datos):
+    try:
+        imagen = Image.open(io.BytesIO(datos))
+        ancho, alto = imagen.size
+        if ancho * alto > MAX_PIXELES:
+            raise MediaInvalida("La foto supera la resolución máxima permitida")
+        imagen.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise MediaInvalida("La foto no es una imagen válida")
+
+    # Aplica la rotación del EXIF antes de descartarlo
+    imagen = ImageOps.exif_transpose(imagen)
+    if imagen.mode not in ("RGB", "RGBA"):
+        transparente = imagen.mode in ("LA", "PA") or "transparency" in imagen.info
+        imagen = imagen.convert("RGBA" if transparente else "RGB")
+    return imagen
+
+
+def _codificar(imagen, lado, calidad):
+    copia = imagen.copy()
+    copia.thumbnail((lado, lado), Image.LANCZOS)
+    salida = io.BytesIO()
+    # Sin exif=...: Pillow no copia metadatos al re-codificar
+    copia.save(salida, format="WEBP", quality=calidad, method=4)
+    return salida.getvalue()
+
+
+def procesar_foto(datos):
+    """Genera las variantes y devuelve {variante: hash}."""
+    imagen = _abrir(datos)
+    return {
+        variante: guardar_media(_codificar(imagen, lado, calidad))
+        for variante, (lado, calidad) in VARIANTES.items()
+    }
+
+
+def asignar_variantes(mascota, hashes):
+    mascota.foto_miniatura = hashes["miniatura"]
+    mascota.foto_mediana = hashes["mediana"]
+    mascota.foto_original = hashes["original"]
+
+
+def asignar_foto_archivo(mascota, archivo):
+    """Foto subida por formulario (werkzeug FileStorage)."""
+    asignar_variantes(mascota, procesar_foto(archivo.read()))
+
+
+def variantes_api(valor):
+    """La API recibe base64/data URL; el texto vacío quita la foto (todas las variantes en None)."""
+    if not valor:
+        return {v: None for v in VARIANTES}
+    return procesar_foto(decodificar_base64(valor))
+
+
+def asignar_foto_api(mascota, valor):
+    asignar_variantes(mascota, variantes_api(valor))
+    mascota.foto = ""
+
+
+# ============================================================
+# MIGRACIÓN DE FOTOS HEREDADAS (ARCHIVOS EN uploads/)
+# ============================================================
+def _es_base64(valor):
+    return valor.startswith("data:") or len(valor) > 200
+
+
+def _buscar_archivo_heredado(nombre):
+    nombre = secure_filename(nombre)
+    candidatas = [
+        os.path.join(current_app.config['UPLOAD_FOLDER'], nombre),
+        os.path.join(current_app.static_folder, 'uploads', nombre),
+    ]
+    for ruta in candidatas:
+        if os.path.isfile(ruta):
+            return ruta
+    return None
+
+
+def procesar_fotos_heredadas(lote=50):
+    from models import db, Mascota
+
+    procesadas, sin_archivo, ultimo_id = 0, 0, 0
+    while True:
+        mascotas = (
+            Mascota.query
+            .filter(Mascota.id > ultimo_id, Mascota.foto_miniatura.is_(None),
+                    Mascota.foto.isnot(None), Mascota.foto != "")
+            .order_by(Mascota.id)
+            .limit(lote)
+            .all()
+        )
+        if not mascotas:
+            break
+
+        for mascota in mascotas:
+            try:
+                if _es_base64(mascota.foto):
+                    asignar_foto_api(mascota, mascota.foto)
+                else:
+                    ruta = _buscar_archivo_heredado(mascota.foto)
+                    if not ruta:
+                        sin_archivo += 1
+                        continue
+                    with open(ruta, 'rb') as f:
+                        asignar_variantes(mascota, procesar_foto(f.read()))
+                procesadas += 1
+            except MediaInvalida:
+                current_app.logger.warning("Foto inválida de la mascota %s", mascota.id)
+
+        ultimo_id = mascotas[-1].id
+        db.session.commit()
+
+    return procesadas, sin_archivo
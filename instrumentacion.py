@@ -0,0 +1,272 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+
+# ============================================================
+# INSTRUMENTACIÓN POR PETICIÓN
+# ============================================================
+# - Cuenta las consultas SQL de cada petición y su tiempo (eventos del
+#   engine) y lo publica en la cabecera Server-Timing.
+# - Detecta N+1: la misma forma de consulta repetida N_MAS_1_UMBRAL
+#   veces o más en una petición (típico de relaciones perezosas dentro
+#   de un bucle o de una plantilla).
+# - /metrics en formato de texto de Prometheus. Las métricas son por
+#   proceso: con varios workers de gunicorn cada scrape ve uno solo.
+# - Perfilador por muestreo opcional (PERFILADOR_UMBRAL_MS > 0): un hilo
+#   toma la pila de cada petición en curso cada PERFILADOR_INTERVALO_MS
+#   y, si la petición supera el umbral, guarda las pilas en formato
+#   "folded" (flamegraph.pl, speedscope) en PERFILADOR_CARPETA.
+#
+# Configuración (app.config):
+#   N_MAS_1_UMBRAL          repeticiones para marcar N+1 (5)
+#   METRICAS_TOKEN          si se define, /metrics exige "Authorization: Bearer <token>"
+#   PERFILADOR_UMBRAL_MS    0 = perfilador apagado
+#   PERFILADOR_INTERVALO_MS intervalo de muestreo (5)
+#   PERFILADOR_CARPETA      destino de los .folded
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_RE_ESPACIOS = re.compile(r"\s+")
+_RE_LISTA_PARAMETROS = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+
+
+def forma_consulta(sql):
+    """Normaliza una sentencia para comparar: IN (?, ?, ?) cuenta igual que IN (?)."""
+    return _RE_LISTA_PARAMETROS.sub("(?)", _RE_ESPACIOS.sub(" ", sql).strip())
+
+
+# ------------------ MÉTRICAS (PROCESO) ------------------
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.peticiones = Counter()      # (endpoint, método, estado) -> n
+        self.consultas = Counter()       # endpoint -> consultas SQL
+        self.segundos_db = Counter()     # endpoint -> segundos en la base
+        self.n_mas_1 = Counter()         # endpoint -> peticiones con N+1
+        self.histograma = {}             # endpoint -> [conteos por bucket..., suma, total]
+
+    def registrar(self, endpoint, metodo, estado, segundos, consultas, segundos_db, n_mas_1):
+        with self._lock:
+            self.peticiones[(endpoint, metodo, estado)] += 1
+            self.consultas[endpoint] += consultas
+            self.segundos_db[endpoint] += segundos_db
+            if n_mas_1:
+                self.n_mas_1[endpoint] += 1
+            fila = self.histograma.setdefault(endpoint, [0] * len(BUCKETS) + [0.0, 0])
+            for i, limite in enumerate(BUCKETS):
+                if segundos <= limite:
+                    fila[i] += 1
+            fila[-2] += segundos
+            fila[-1] += 1
+
+    def texto(self, extra=()):
+        lineas = []
+
+        def bloque(nombre, tipo, ayuda, muestras):
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for etiquetas, valor in muestras:
+                lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+
+        with self._lock:
+            bloque("vacunapet_peticiones_total", "counter", "Peticiones atendidas.",
+                   [({"endpoint": e, "metodo": m, "estado": s}, n) for (e, m, s), n in sorted(self.peticiones.items())])
+            histograma = []
+            for endpoint, fila in sorted(self.histograma.items()):
+                for limite, n in zip(BUCKETS, fila):
+                    histograma.append(({"endpoint": endpoint, "le": limite}, n))
+                histograma.append(({"endpoint": endpoint, "le": "+Inf"}, fila[-1]))
+            lineas.append("# HELP vacunapet_peticion_segundos Duración de las peticiones.")
+            lineas.append("# TYPE vacunapet_peticion_segundos histogram")
+            for etiquetas, n in histograma:
+                lineas.append(f"vacunapet_peticion_segundos_bucket{_etiquetas(etiquetas)} {n}")
+            for endpoint, fila in sorted(self.histograma.items()):
+                lineas.append(f'vacunapet_peticion_segundos_sum{_etiquetas({"endpoint": endpoint})} {fila[-2]:.6f}')
+                lineas.append(f'vacunapet_peticion_segundos_count{_etiquetas({"endpoint": endpoint})} {fila[-1]}')
+            bloque("vacunapet_consultas_sql_total", "counter", "Consultas SQL ejecutadas.",
+                   [({"endpoint": e}, n) for e, n in sorted(self.consultas.items())])
+            bloque("vacunapet_db_segundos_total", "counter", "Tiempo total en la base de datos.",
+                   [({"endpoint": e}, f"{s:.6f}") for e, s in sorted(self.segundos_db.items())])
+            bloque("vacunapet_n_mas_1_total", "counter", "Peticiones con consultas N+1 detectadas.",
+                   [({"endpoint": e}, n) for e, n in sorted(self.n_mas_1.items())])
+
+        for nombre, tipo, ayuda, valor in extra:
+            bloque(nombre, tipo, ayuda, [({}, valor)])
+        return "\n".join(lineas) + "\n"
+
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    partes = []
+    for clave, valor in etiquetas.items():
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"')
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+metricas = Metricas()
+
+
+# ------------------ PERFILADOR POR MUESTREO ------------------
+
+class Muestreador:
+    """Un hilo por proceso que muestrea las pilas de los hilos registrados."""
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self._pilas = {}  # thread id -> Counter de pilas
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _arrancar(self):
+        # Tras el fork de gunicorn el hilo del padre no existe en el hijo
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            threading.Thread(target=self._bucle, name="muestreador", daemon=True).start()
+
+    def _bucle(self):
+        while True:
+            time.sleep(self.intervalo)
+            marcos = sys._current_frames()
+            with self._lock:
+                for hilo, pilas in self._pilas.items():
+                    marco = marcos.get(hilo)
+                    if marco is not None:
+                        pilas[_pila(marco)] += 1
+
+    def empezar(self):
+        with self._lock:
+            self._arrancar()
+            self._pilas[threading.get_ident()] = Counter()
+
+    def terminar(self):
+        with self._lock:
+            return self._pilas.pop(threading.get_ident(), Counter())
+
+
+def _pila(marco):
+    nombres = []
+    while marco is not None:
+        codigo = marco.f_code
+        nombres.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+        marco = marco.f_back
+    return ";".join(reversed(nombres))
+
+
+def _guardar_perfil(pilas, segundos):
+    carpeta = current_app.config.get("PERFILADOR_CARPETA") or os.path.join(current_app.instance_path, "perfiles")
+    os.makedirs(carpeta, exist_ok=True)
+    nombre = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'desconocido'}-{int(segundos * 1000)}ms.folded"
+    with open(os.path.join(carpeta, nombre), "w", encoding="utf-8") as f:
+        for pila, n in pilas.most_common():
+            f.write(f"{pila} {n}\n")
+
+
+# ------------------ ENGANCHES ------------------
+
+def instrumentar_motor(engine):
+    """Cuenta el tiempo y las consultas de `engine` en la petición en curso."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, sql, parametros, contexto, executemany):
+        conn.info.setdefault("instr_inicio", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, sql, parametros, contexto, executemany):
+        inicio = conn.info["instr_inicio"].pop()
+        if has_request_context() and "instr" in g:
+            g.instr["segundos_db"] += time.perf_counter() - inicio
+            g.instr["formas"][forma_consulta(sql)] += 1
+
+    @event.listens_for(engine, "handle_error")
+    def _error(contexto):
+        if contexto.connection is not None:
+            pendientes = contexto.connection.info.get("instr_inicio")
+            if pendientes:
+                pendientes.pop()
+
+
+def instalar(app, *engines):
+    """Engancha los eventos de los engines (primaria y réplicas) y de Flask. Llamar dentro del app context."""
+    umbral_perfil = app.config.get("PERFILADOR_UMBRAL_MS", 0)
+    muestreador = Muestreador(app.config.get("PERFILADOR_INTERVALO_MS", 5) / 1000) if umbral_perfil else None
+
+    for engine in engines:
+        instrumentar_motor(engine)
+
+    @app.before_request
+    def _empezar():
+        g.instr = {"inicio": time.perf_counter(), "segundos_db": 0.0, "formas": Counter()}
+        if muestreador:
+            muestreador.empezar()
+
+    @app.after_request
+    def _terminar(respuesta):
+        datos = g.pop("instr", None)
+        if datos is None:
+            return respuesta
+        segundos = time.perf_counter() - datos["inicio"]
+        formas = datos["formas"]
+        consultas = sum(formas.values())
+
+        umbral = app.config.get("N_MAS_1_UMBRAL", 5)
+        repetidas = [(forma, n) for forma, n in formas.most_common() if n >= umbral]
+        if repetidas:
+            forma, n = repetidas[0]
+            app.logger.warning("Posible N+1 en %s: %d veces %s", request.endpoint, n, forma[:300])
+
+        endpoint = request.endpoint or "desconocido"
+        metricas.registrar(endpoint, request.method, respuesta.status_code, segundos,
+                           consultas, datos["segundos_db"], bool(repetidas))
+
+        tiempos = [
+            f'db;dur={datos["segundos_db"] * 1000:.2f};desc="{consultas} consultas"',
+            f"app;dur={segundos * 1000:.2f}",
+        ]
+        if repetidas:
+            tiempos.append(f'n1;desc="{repetidas[0][1]}x misma consulta"')
+        respuesta.headers.add("Server-Timing", ", ".join(tiempos))
+
+        if muestreador:
+            pilas = muestreador.terminar()
+            if segundos * 1000 >= umbral_perfil and pilas:
+                _guardar_perfil(pilas, segundos)
+        return respuesta
+
+    @app.teardown_request
+    def _limpiar(_error=None):
+        # Si la vista lanzó una excepción after_request no corre
+        if muestreador:
+            muestreador.terminar()
+
+    app.add_url_rule("/metrics", "metricas_prometheus", _vista_metricas)
+
+
+def _vista_metricas():
+    token = current_app.config.get("METRICAS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return Response("No autorizado\n", status=401, mimetype="text/plain")
+
+    import cache
+    import seguridad
+
+    hashing = seguridad.metricas()
+    extra = [
+        ("vacunapet_hashing_en_cola", "gauge", "Hashes de contraseña en curso o esperando.", hashing["en_cola"]),
+        ("vacunapet_hashing_rechazados_total", "counter", "Hashes rechazados por saturación.", hashing["rechazados"]),
+    ]
+    estado_cache = cache.metricas()
+    if "hits" in estado_cache:
+        extra += [
+            ("vacunapet_cache_aciertos_total", "counter", "Aciertos de la caché de lecturas.", estado_cache["hits"]),
+            ("vacunapet_cache_fallos_total", "counter", "Fallos de la caché de lecturas.", estado_cache["misses"]),
+            ("vacunapet_cache_bytes", "gauge", "Bytes ocupados por la caché.", estado_cache["bytes"]),
+        ]
+    return Response(metricas.texto(extra), mimetype="text/plain; version=0.0.4")
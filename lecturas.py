@@ -0,0 +1,72 @@
+from sqlalchemy import func, select
+
+from models import db, Mascota, Vacuna, Diagnostico, Receta, Prevencion
+
+# ============================================================
+# MODELOS DE LECTURA PARA LAS PÁGINAS WEB
+# ============================================================
+# Las plantillas no deben disparar cargas perezosas: cada página sale de
+# un número fijo de consultas, tenga el dueño 2 mascotas o 200.
+#   dashboard: 1 consulta (mascotas + conteos + última vacuna/diagnóstico
+#              con subconsultas correlacionadas sobre los índices por
+#              mascota_id y fecha de la migración 3)
+
+CATEGORIAS = {
+    "vacunas": Vacuna,
+    "diagnosticos": Diagnostico,
+    "recetas": Receta,
+    "prevenciones": Prevencion,
+}
+
+
+class TarjetaMascota:
+    """Una fila del dashboard: la mascota y su resumen ya calculado."""
+
+    def __init__(self, mascota, conteos, ultima_vacuna, ultimo_diagnostico):
+        self.mascota = mascota
+        self.conteos = conteos
+        self.ultima_vacuna = ultima_vacuna            # (nombre, fecha) o None
+        self.ultimo_diagnostico = ultimo_diagnostico  # (titulo, fecha) o None
+        self.edad = mascota.calcular_edad()
+
+
+def _conteo(modelo):
+    return (
+        select(func.count()).select_from(modelo)
+        .where(modelo.mascota_id == Mascota.id)
+        .correlate(Mascota).scalar_subquery()
+    )
+
+
+def _ultimo(columna, fecha, modelo):
+    return (
+        select(columna).where(modelo.mascota_id == Mascota.id)
+        .order_by(fecha.desc(), modelo.id.desc()).limit(1)
+        .correlate(Mascota).scalar_subquery()
+    )
+
+
+def tarjetas_mascotas(user_id):
+    consulta = (
+        select(
+            Mascota,
+            *[_conteo(modelo).label(f"n_{clave}") for clave, modelo in CATEGORIAS.items()],
+            _ultimo(Vacuna.nombre, Vacuna.fecha_aplicacion, Vacuna).label("vacuna_nombre"),
+            _ultimo(Vacuna.fecha_aplicacion, Vacuna.fecha_aplicacion, Vacuna).label("vacuna_fecha"),
+            _ultimo(Diagnostico.titulo, Diagnostico.fecha, Diagnostico).label("diagnostico_titulo"),
+            _ultimo(Diagnostico.fecha, Diagnostico.fecha, Diagnostico).label("diagnostico_fecha"),
+        )
+        .where(Mascota.user_id == user_id)
+        .order_by(Mascota.id)
+    )
+
+    tarjetas = []
+    for fila in db.session.execute(consulta):
+        tarjetas.append(TarjetaMascota(
+            fila.Mascota,
+            {clave: getattr(fila, f"n_{clave}") for clave in CATEGORIAS},
+            (fila.vacuna_nombre, fila.vacuna_fecha) if fila.vacuna_fecha else None,
+            (fila.diagnostico_titulo, fila.diagnostico_fecha) if fila.diagnostico_fecha else None,
+        ))
+    return tarjetas
+
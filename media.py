@@ -0,0 +1,149 @@
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+
+from flask import current_app
+
+# ============================================================
+# ALMACÉN DE MEDIA DIRECCIONADO POR CONTENIDO
+# ============================================================
+# Cada archivo se guarda una sola vez bajo el SHA-256 de sus bytes:
+#   MEDIA_FOLDER/ab/cd/abcd...ef
+# Las filas solo guardan el hash; el contenido nunca cambia para un
+# mismo hash, así que se puede servir con caché inmutable.
+
+HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+FIRMAS = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+MAX_BYTES_POR_DEFECTO = 10 * 1024 * 1024
+
+
+class MediaInvalida(ValueError):
+    pass
+
+
+def es_hash_valido(valor):
+    return bool(valor) and bool(HASH_RE.match(valor))
+
+
+def detectar_mimetype(cabecera):
+    for firma, mimetype in FIRMAS:
+        if cabecera.startswith(firma):
+            return mimetype
+    if cabecera[:4] == b'RIFF' and cabecera[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def decodificar_base64(texto):
+    """Acepta base64 plano o un data URL ("data:image/jpeg;base64,...")."""
+    if not texto:
+        raise MediaInvalida("No se envió ninguna foto")
+
+    if texto.startswith('data:'):
+        _, _, texto = texto.partition(',')
+
+    try:
+        return base64.b64decode(''.join(texto.split()), validate=True)
+    except (binascii.Error, ValueError):
+        raise MediaInvalida("La foto no es base64 válido")
+
+
+def carpeta_media():
+    return current_app.config.get('MEDIA_FOLDER') or os.path.join(os.getcwd(), 'media')
+
+
+def ruta_media(hash_media):
+    return os.path.join(carpeta_media(), hash_media[:2], hash_media[2:4], hash_media)
+
+
+def url_media(hash_media):
+    return f"/api/media/{hash_media}" if hash_media else None
+
+
+def guardar_media(datos):
+    """Guarda los bytes (si no existen ya) y devuelve su hash."""
+    max_bytes = current_app.config.get('MEDIA_MAX_BYTES', MAX_BYTES_POR_DEFECTO)
+    if not datos:
+        raise MediaInvalida("La foto está vacía")
+    if len(datos) > max_bytes:
+        raise MediaInvalida("La foto supera el tamaño máximo permitido")
+    if detectar_mimetype(datos[:16]) is None:
+        raise MediaInvalida("Formato de imagen no soportado")
+
+    hash_media = hashlib.sha256(datos).hexdigest()
+    ruta = ruta_media(hash_media)
+
+    if not os.path.exists(ruta):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Escritura atómica: dos workers pueden subir la misma foto a la vez
+        fd, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(datos)
+            os.replace(temporal, ruta)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+    return hash_media
+
+
+def guardar_foto_base64(texto):
+    return guardar_media(decodificar_base64(texto))
+
+
+def mimetype_de_archivo(ruta):
+    with open(ruta, 'rb') as f:
+        return detectar_mimetype(f.read(16)) or 'application/octet-stream'
+
+
+# ============================================================
+# MIGRACIÓN DE FOTOS BASE64 HEREDADAS
+# ============================================================
+def migrar_foto_usuario(usuario):
+    """Mueve la foto base64 de la fila al almacén. Devuelve True si cambió algo."""
+    if not usuario.foto:
+        return False
+
+    try:
+        usuario.foto_hash = guardar_foto_base64(usuario.foto)
+    except MediaInvalida:
+        current_app.logger.warning("Foto inválida del usuario %s, se descarta", usuario.id)
+        usuario.foto_hash = None
+
+    usuario.foto = None
+    return True
+
+
+def migrar_fotos_usuarios(lote=100):
+    from models import db, Usuario
+
+    total = 0
+    while True:
+        usuarios = (
+            Usuario.query
+            .filter(Usuario.foto.isnot(None), Usuario.foto != "")
+            .order_by(Usuario.id)
+            .limit(lote)
+            .all()
+        )
+        if not usuarios:
+            break
+
+        for usuario in usuarios:
+            migrar_foto_usuario(usuario)
+        db.session.commit()
+        total += len(usuarios)
+
+    return total
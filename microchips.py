@@ -0,0 +1,156 @@
+import logging
+import re
+
+from flask import current_app
+from sqlalchemy import bindparam, select
+from sqlalchemy.exc import IntegrityError
+
+import cache
+from media import url_media
+from models import db, Usuario, Mascota
+from paginacion import ParametroInvalido
+
+# ============================================================
+# MICROCHIPS (ISO 11784/11785)
+# ============================================================
+# Se guardan normalizados y son únicos entre las mascotas que tienen
+# (índice único parcial, migración 10). Formatos aceptados:
+#   "985 112 000 123 456", "985-112000123456"  -> 985112000123456
+#   "3D9.1A2B3C4D5E" (hexadecimal de algunos lectores: país . id)
+#                                              -> 985 + id en 12 dígitos
+#   FDX-A / AVID heredados: 9-10 caracteres hexadecimales, en mayúsculas
+#
+# Los lectores repiten mucho los chips que no están registrados (animales
+# de otra red, lecturas dobles): las búsquedas sin resultado se recuerdan
+# MICROCHIP_TTL_NEGATIVO segundos en la caché, en el espacio
+# "chip:<codigo>", que se invalida al asignar ese chip a una mascota.
+
+_SEPARADORES = re.compile(r"[\s\-.:_/]")
+_ISO_HEX = re.compile(r"([0-9A-F]{3})\.([0-9A-F]{10})")
+_HEREDADO = re.compile(r"[0-9A-F]{9,10}")
+
+log = logging.getLogger(__name__)
+
+
+class MicrochipInvalido(ParametroInvalido):
+    pass
+
+
+class MicrochipRegistrado(ValueError):
+    def __init__(self, microchip):
+        super().__init__(f"El microchip {microchip} ya está registrado en otra mascota")
+        self.microchip = microchip
+
+
+def normalizar(codigo):
+    """Forma canónica del chip, None si viene vacío. Lanza MicrochipInvalido."""
+    crudo = str(codigo or "").strip().upper()
+    if not crudo:
+        return None
+
+    hexadecimal = _ISO_HEX.fullmatch(crudo)
+    if hexadecimal:
+        pais, numero = int(hexadecimal.group(1), 16), int(hexadecimal.group(2), 16)
+        if pais > 999 or numero > 999_999_999_999:
+            raise MicrochipInvalido("Microchip no válido")
+        return f"{pais:03d}{numero:012d}"
+
+    compacto = _SEPARADORES.sub("", crudo)
+    if compacto.isdigit() and len(compacto) == 15:
+        return compacto
+    if _HEREDADO.fullmatch(compacto):
+        return compacto
+    raise MicrochipInvalido("Microchip no válido")
+
+
+def asignable(codigo, mascota_id=None):
+    """Normaliza y comprueba que ninguna otra mascota lo tenga."""
+    microchip = normalizar(codigo)
+    if microchip is not None:
+        otra = db.session.execute(
+            select(Mascota.id).where(Mascota.microchip == microchip, Mascota.id != mascota_id)
+        ).first()
+        if otra:
+            raise MicrochipRegistrado(microchip)
+    return microchip
+
+
+def confirmar(microchip, mascota_id=None):
+    """Commit de la mascota con `microchip` ya pasado por asignable().
+
+    Entre la comprobación y el commit otra petición puede registrar el
+    mismo chip: el índice único lo rechaza y se informa como asignable().
+    """
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        if microchip is not None and db.session.execute(
+            select(Mascota.id).where(Mascota.microchip == microchip, Mascota.id != mascota_id)
+        ).first():
+            raise MicrochipRegistrado(microchip)
+        raise
+
+
+def olvidar_negativo(microchip):
+    """Llamar después del commit que asigna el chip a una mascota."""
+    if microchip:
+        cache.invalidar(f"chip:{microchip}")
+
+
+# ------------------ BÚSQUEDA ------------------
+
+# Sentencias construidas una vez: en el camino caliente solo cambia el parámetro
+_FICHAS = (
+    select(
+        Mascota.microchip, Mascota.id, Mascota.nombre, Mascota.especie, Mascota.raza,
+        Mascota.foto_miniatura, Usuario.id.label("user_id"), Usuario.nombre.label("duenio_nombre"),
+        Usuario.apellido, Usuario.email,
+    )
+    .join(Usuario, Usuario.id == Mascota.user_id)
+)
+_POR_CHIP = _FICHAS.where(Mascota.microchip == bindparam("microchip"))
+_POR_CHIPS = _FICHAS.where(Mascota.microchip.in_(bindparam("microchips", expanding=True)))
+
+
+def _ficha(fila):
+    return {
+        "mascota": {
+            "id": fila.id,
+            "nombre": fila.nombre,
+            "especie": fila.especie,
+            "raza": fila.raza,
+            "foto_miniatura": url_media(fila.foto_miniatura),
+        },
+        "duenio": {
+            "id": fila.user_id,
+            "nombre": fila.duenio_nombre,
+            "apellido": fila.apellido,
+            "email": fila.email,
+        },
+    }
+
+
+def buscar(microchip):
+    """Ficha de la mascota con ese chip (ya normalizado), o None."""
+    espacio = f"chip:{microchip}"
+    if cache.leer(espacio, "negativo"):
+        return None
+
+    fila = db.session.connection().execute(_POR_CHIP, {"microchip": microchip}).first()
+    if fila is None:
+        cache.guardar(espacio, "negativo", b"1", current_app.config.get("MICROCHIP_TTL_NEGATIVO", 60))
+        return None
+    return _ficha(fila)
+
+
+def buscar_lote(microchips):
+    """{chip: ficha} de los que estén registrados, en una sola consulta.
+
+    Sin caché negativa: una consulta IN sobre el índice único sale más
+    barata que consultar la caché chip por chip.
+    """
+    if not microchips:
+        return {}
+    filas = db.session.connection().execute(_POR_CHIPS, {"microchips": list(microchips)})
+    return {fila.microchip: _ficha(fila) for fila in filas}
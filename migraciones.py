@@ -0,0 +1,555 @@
+import logging
+import re
+from datetime import datetime
+
+from sqlalchemy import (
+    Boolean, Column, Date, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text, UniqueConstraint,
+    bindparam, column, inspect, table, text,
+)
+
+import calendario
+
+# ============================================================
+# MIGRACIONES DE ESQUEMA VERSIONADAS
+# ============================================================
+# Se aplican con `flask --app app migrar` (nunca al importar la app).
+# Cada migración corre en su propia transacción y registra su número en
+# la tabla schema_version. Deben ser idempotentes: las bases antiguas (de
+# antes de este sistema) pueden tener parte del esquema.
+#
+# Una migración publicada no se edita. Tampoco usa los modelos ni los
+# módulos de la app (busqueda, microchips, sincronizacion...): las tablas
+# que crea y el SQL que ejecuta quedan congelados aquí como eran en su
+# versión, así que cambiar models.py no cambia lo que hace una migración
+# vieja al aplicarse sobre una base vieja. Solo se toman de la app las
+# reglas de negocio puras (intervalos del calendario).
+
+MIGRACIONES = []
+
+log = logging.getLogger(__name__)
+
+
+def migracion(version, descripcion):
+    def registrar(funcion):
+        MIGRACIONES.append((version, descripcion, funcion))
+        MIGRACIONES.sort(key=lambda m: m[0])
+        return funcion
+    return registrar
+
+
+# ------------------ UTILIDADES ------------------
+
+def _columnas(conn, tabla):
+    return {c['name'] for c in inspect(conn).get_columns(tabla)}
+
+
+def agregar_columna(conn, tabla, columna, ddl):
+    if columna not in _columnas(conn, tabla):
+        conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {ddl}"))
+
+
+def crear_indice(conn, nombre, tabla, columnas, unico=False, donde=None):
+    sql = f"CREATE {'UNIQUE ' if unico else ''}INDEX IF NOT EXISTS {nombre} ON {tabla} ({', '.join(columnas)})"
+    if donde:
+        sql += f" WHERE {donde}"
+    conn.execute(text(sql))
+
+
+# ------------------ ESQUEMA CONGELADO ------------------
+# Las tablas como las creó cada versión (las columnas posteriores las
+# agregan las migraciones siguientes). No importar desde la app.
+
+_esquema = MetaData()
+
+# v1
+_USUARIO = Table(
+    "usuario", _esquema,
+    Column("id", Integer, primary_key=True),
+    Column("nombre", String(80), nullable=False),
+    Column("apellido", String(80), nullable=False),
+    Column("email", String(120), unique=True, nullable=False),
+    Column("password", String(200), nullable=False),
+    Column("foto", Text),
+)
+_MASCOTA = Table(
+    "mascota", _esquema,
+    Column("id", Integer, primary_key=True),
+    Column("nombre", String(100), nullable=False),
+    Column("especie", String(100), nullable=False),
+    Column("raza", String(100)),
+    Column("fecha_nacimiento", Date),
+    Column("peso", Float),
+    Column("microchip", String(100)),
+    Column("castrado", Boolean),
+    Column("foto", String(200)),
+    Column("user_id", Integer, ForeignKey("usuario.id"), nullable=False),
+)
+_VACUNA = Table(
+    "vacuna", _esquema,
+    Column("id", Integer, primary_key=True),
+    Column("nombre", String(100), nullable=False),
+    Column("fecha_aplicacion", Date, nullable=False),
+    Column("mascota_id", Integer, ForeignKey("mascota.id"), nullable=False),
+)
+_DIAGNOSTICO = Table(
+    "diagnostico", _esquema,
+    Column("id", Integer, primary_key=True),
+    Column("titulo", String(200), nullable=False),
+    Column("fecha", Date, nullable=False),
+    Column("descripcion", Text),
+    Column("mascota_id", Integer, ForeignKey("mascota.id"), nullable=False),
+)
+_RECETA = Table(
+    "receta", _esquema,
+    Column("id", Integer, primary_key=True),
+    Column("medicamento", String(200), nullable=False),
+    Column("dosis", String(200), nullable=False),
+    Column("fecha", Date, nullable=False),
+    Column("instrucciones", Text),
+    Column("mascota_id", Integer, ForeignKey("mascota.id"), nullable=False),
+)
+_PREVENCION = Table(
+    "prevencion", _esquema,
+    Column("id", Integer, primary_key=True),
+    Column("tipo", String(200), nullable=False),
+    Column("fecha", Date, nullable=False),
+    Column("descripcion", Text),
+    Column("mascota_id", Integer, ForeignKey("mascota.id"), nullable=False),
+)
+
+# v5
+_CONTADOR_REVISION = Table(
+    "contador_revision", _esquema,
+    Column("id", Integer, primary_key=True),
+    Column("valor", Integer, nullable=False),
+)
+_ELIMINACION = Table(
+    "eliminacion", _esquema,
+    Column("id", Integer, primary_key=True),
+    Column("tabla", String(30), nullable=False),
+    Column("registro_id", Integer, nullable=False),
+    Column("user_id", Integer, nullable=False),
+    Column("rev", Integer, nullable=False),
+    Column("eliminado_en", DateTime, nullable=False),
+)
+
+# v7
+_TRABAJO = Table(
+    "trabajo", _esquema,
+    Column("id", Integer, primary_key=True),
+    Column("tipo", String(30), nullable=False),
+    Column("clave", String(120), unique=True, nullable=False),
+    Column("datos", Text, nullable=False),
+    Column("estado", String(12), nullable=False),
+    Column("intentos", Integer, nullable=False),
+    Column("ejecutar_en", DateTime, nullable=False),
+    Column("bloqueado_hasta", DateTime),
+    Column("ultimo_error", Text),
+    Column("creado_en", DateTime, nullable=False),
+)
+_AVISO = Table(
+    "aviso", _esquema,
+    Column("id", Integer, primary_key=True),
+    Column("tabla", String(30), nullable=False),
+    Column("registro_id", Integer, nullable=False),
+    Column("vence", Date, nullable=False),
+    Column("user_id", Integer, nullable=False),
+    Column("creado_en", DateTime, nullable=False),
+    UniqueConstraint("tabla", "registro_id", "vence", name="uq_aviso_registro_vence"),
+)
+
+# v8
+_IMPORTACION = Table(
+    "importacion", _esquema,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer),
+    Column("formato", String(10), nullable=False),
+    Column("estado", String(12), nullable=False),
+    Column("registros", Integer, nullable=False),
+    Column("insertados", Integer, nullable=False),
+    Column("errores", Integer, nullable=False),
+    Column("ultimo_error", Text),
+    Column("creado_en", DateTime, nullable=False),
+    Column("actualizado_en", DateTime, nullable=False),
+)
+_IMPORTACION_MASCOTA = Table(
+    "importacion_mascota", _esquema,
+    Column("importacion_id", Integer, primary_key=True),
+    Column("origen_id", Integer, primary_key=True),
+    Column("mascota_id", Integer, nullable=False),
+)
+
+# v12
+_ESTADISTICA = Table(
+    "estadistica", _esquema,
+    Column("metrica", String(20), primary_key=True),
+    Column("periodo", String(7), primary_key=True),
+    Column("especie", String(100), primary_key=True),
+    Column("raza", String(100), primary_key=True),
+    Column("clave", String(200), primary_key=True),
+    Column("valor", Integer, nullable=False),
+)
+
+
+def _crear_tablas(conn, *tablas):
+    _esquema.create_all(conn, tables=list(tablas))
+
+
+# ------------------ VERSIONES ------------------
+
+@migracion(1, "Esquema inicial")
+def _esquema_inicial(conn):
+    _crear_tablas(conn, _USUARIO, _MASCOTA, _VACUNA, _DIAGNOSTICO, _RECETA, _PREVENCION)
+
+
+@migracion(2, "Foto de usuario en almacén de media")
+def _foto_hash_usuario(conn):
+    agregar_columna(conn, "usuario", "foto_hash", "VARCHAR(64)")
+
+
+@migracion(3, "Índices de claves foráneas e historial por fecha")
+def _indices_historial(conn):
+    crear_indice(conn, "ix_mascota_user_id_id", "mascota", ["user_id", "id"])
+    crear_indice(conn, "ix_vacuna_mascota_id_fecha", "vacuna", ["mascota_id", "fecha_aplicacion"])
+    crear_indice(conn, "ix_diagnostico_mascota_id_fecha", "diagnostico", ["mascota_id", "fecha"])
+    crear_indice(conn, "ix_receta_mascota_id_fecha", "receta", ["mascota_id", "fecha"])
+    crear_indice(conn, "ix_prevencion_mascota_id_fecha", "prevencion", ["mascota_id", "fecha"])
+
+
+def _recalcular_proximas(conn, tabla, col_nombre, col_fecha, col_destino, calcular, lote=1000):
+    """Deja `col_destino` = calcular(especie, nombre, fecha) en la fila más
+    reciente de cada (mascota, nombre normalizado) y NULL en las demás.
+    Recorre `lote` mascotas por vez."""
+    t = table(tabla, column("id", Integer), column(col_nombre, String), column(col_fecha, Date),
+              column("mascota_id", Integer))
+    m = table("mascota", column("id", Integer), column("especie", String))
+    sentencia = text(f"UPDATE {tabla} SET {col_destino} = :b_proxima WHERE id = :b_id")
+
+    ultima = 0
+    while True:
+        mascotas = conn.execute(
+            t.select().with_only_columns(t.c.mascota_id).distinct()
+            .where(t.c.mascota_id > ultima).order_by(t.c.mascota_id).limit(lote)
+        ).scalars().all()
+        if not mascotas:
+            break
+        ultima = mascotas[-1]
+
+        grupos = {}
+        for id_, nombre, fecha, mascota_id, especie in conn.execute(
+            t.select().with_only_columns(t.c.id, t.c[col_nombre], t.c[col_fecha], t.c.mascota_id, m.c.especie)
+            .select_from(t.join(m, m.c.id == t.c.mascota_id))
+            .where(t.c.mascota_id.between(mascotas[0], ultima))
+        ):
+            grupos.setdefault((mascota_id, calendario.normalizar(nombre)), []).append((fecha, id_, nombre, especie))
+
+        cambios = []
+        for filas in grupos.values():
+            fecha, id_, nombre, especie = max(filas)
+            cambios.append({"b_id": id_, "b_proxima": calcular(especie, nombre, fecha)})
+            cambios += [{"b_id": f[1], "b_proxima": None} for f in filas if f[1] != id_]
+        if cambios:
+            conn.execute(sentencia, cambios)
+
+
+@migracion(4, "Próxima dosis de vacunas")
+def _proxima_dosis(conn):
+    agregar_columna(conn, "vacuna", "proxima_dosis", "DATE")
+    crear_indice(conn, "ix_vacuna_proxima_dosis", "vacuna", ["proxima_dosis"],
+                 donde="proxima_dosis IS NOT NULL")
+    crear_indice(conn, "ix_vacuna_mascota_id_proxima_dosis", "vacuna", ["mascota_id", "proxima_dosis"],
+                 donde="proxima_dosis IS NOT NULL")
+    configuracion = calendario._configuracion()
+    _recalcular_proximas(
+        conn, "vacuna", "nombre", "fecha_aplicacion", "proxima_dosis",
+        lambda especie, nombre, fecha: calendario.calcular_proxima_dosis(especie, nombre, fecha, configuracion),
+    )
+
+
+def _siguiente_revision(conn):
+    if conn.execute(text("UPDATE contador_revision SET valor = valor + 1 WHERE id = 1")).rowcount == 0:
+        conn.execute(text("INSERT INTO contador_revision (id, valor) VALUES (1, 1)"))
+    return conn.execute(text("SELECT valor FROM contador_revision WHERE id = 1")).scalar()
+
+
+@migracion(5, "Revisiones y lápidas para sincronización incremental")
+def _sincronizacion(conn):
+    _crear_tablas(conn, _CONTADOR_REVISION, _ELIMINACION)
+
+    ahora = datetime.utcnow()
+    for tabla in ("mascota", "vacuna", "diagnostico", "receta", "prevencion"):
+        agregar_columna(conn, tabla, "rev", "INTEGER")
+        agregar_columna(conn, tabla, "actualizado_en", "TIMESTAMP")
+        # Lo existente entra como revisión 1
+        conn.execute(text(f"UPDATE {tabla} SET rev = 1, actualizado_en = :ahora WHERE rev IS NULL"),
+                     {"ahora": ahora})
+
+    if conn.execute(text("SELECT COUNT(*) FROM contador_revision")).scalar() == 0:
+        conn.execute(text("INSERT INTO contador_revision (id, valor) VALUES (1, 1)"))
+
+    crear_indice(conn, "ix_mascota_user_id_rev", "mascota", ["user_id", "rev"])
+    for tabla in ("vacuna", "diagnostico", "receta", "prevencion"):
+        crear_indice(conn, f"ix_{tabla}_mascota_id_rev", tabla, ["mascota_id", "rev"])
+    crear_indice(conn, "ix_eliminacion_user_id_rev", "eliminacion", ["user_id", "rev"])
+
+
+@migracion(6, "Variantes de foto de mascota")
+def _variantes_foto_mascota(conn):
+    for columna in ("foto_miniatura", "foto_mediana", "foto_original"):
+        agregar_columna(conn, "mascota", columna, "VARCHAR(64)")
+
+
+@migracion(7, "Recordatorios: próxima prevención, cola de trabajos y avisos")
+def _recordatorios(conn):
+    agregar_columna(conn, "prevencion", "proxima_fecha", "DATE")
+    crear_indice(conn, "ix_prevencion_proxima_fecha", "prevencion", ["proxima_fecha"],
+                 donde="proxima_fecha IS NOT NULL")
+    intervalos = calendario._intervalos_prevencion()
+    _recalcular_proximas(
+        conn, "prevencion", "tipo", "fecha", "proxima_fecha",
+        lambda especie, tipo, fecha: calendario.calcular_proxima_prevencion(tipo, fecha, intervalos),
+    )
+
+    _crear_tablas(conn, _TRABAJO, _AVISO)
+    crear_indice(conn, "ix_trabajo_estado_ejecutar_en", "trabajo", ["estado", "ejecutar_en"])
+
+
+@migracion(8, "Progreso de importaciones")
+def _importaciones(conn):
+    _crear_tablas(conn, _IMPORTACION, _IMPORTACION_MASCOTA)
+
+
+# Documentos del índice de búsqueda en la versión 9:
+# tabla -> (código de la clave, título, columnas del cuerpo, mascota)
+_DOCUMENTOS_V9 = {
+    "mascota": (1, "nombre", ("especie", "raza", "microchip"), "t.id"),
+    "diagnostico": (2, "titulo", ("descripcion",), "t.mascota_id"),
+    "receta": (3, "medicamento", ("dosis", "instrucciones"), "t.mascota_id"),
+}
+
+
+def _indexar_v9(conn, tabla, ids=None):
+    """(Re)indexa las filas `ids` de `tabla` (todas si ids es None)."""
+    codigo, titulo, cuerpo, mascota_id = _DOCUMENTOS_V9[tabla]
+    if conn.dialect.name == "sqlite":
+        destino, duenio, clave = "busqueda (rowid, duenio", "'u' || CAST(m.user_id AS VARCHAR)", "rowid"
+    else:
+        destino, duenio, clave = "busqueda (clave, user_id", "m.user_id", "clave"
+    texto = " || ' ' || ".join(f"coalesce(t.{c}, '')" for c in cuerpo)
+    sql = (
+        f"INSERT INTO {destino}, titulo, cuerpo, tabla, registro_id, mascota_id) "
+        f"SELECT t.id * 4 + {codigo}, {duenio}, t.{titulo}, {texto}, '{tabla}', t.id, {mascota_id} "
+        f"FROM {tabla} t JOIN mascota m ON m.id = {mascota_id}"
+    )
+    if ids is None:
+        conn.execute(text(sql))
+        return
+
+    ids = sorted(ids)
+    for inicio in range(0, len(ids), 500):
+        tramo = ids[inicio:inicio + 500]
+        conn.execute(text(f"DELETE FROM busqueda WHERE {clave} IN :claves")
+                     .bindparams(bindparam("claves", expanding=True)), {"claves": [i * 4 + codigo for i in tramo]})
+        conn.execute(text(sql + " WHERE t.id IN :ids").bindparams(bindparam("ids", expanding=True)), {"ids": tramo})
+
+
+@migracion(9, "Índice de búsqueda de texto completo")
+def _busqueda(conn):
+    if conn.dialect.name == "sqlite":
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS busqueda USING fts5("
+            "duenio, titulo, cuerpo, tabla UNINDEXED, registro_id UNINDEXED, mascota_id UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+    else:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+        # unaccent() no es IMMUTABLE y una columna generada lo exige
+        conn.execute(text(
+            "CREATE OR REPLACE FUNCTION vacunapet_sin_tildes(texto text) RETURNS text "
+            "LANGUAGE sql IMMUTABLE PARALLEL SAFE AS "
+            "$$ SELECT public.unaccent('public.unaccent'::regdictionary, texto) $$"
+        ))
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS busqueda ("
+            "clave BIGINT PRIMARY KEY, user_id INTEGER NOT NULL, titulo TEXT, cuerpo TEXT, "
+            "tabla VARCHAR(20) NOT NULL, registro_id INTEGER NOT NULL, mascota_id INTEGER NOT NULL, "
+            "documento tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', vacunapet_sin_tildes(coalesce(titulo, ''))), 'A') || "
+            "setweight(to_tsvector('simple', vacunapet_sin_tildes(coalesce(cuerpo, ''))), 'B')) STORED)"
+        ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_busqueda_documento ON busqueda USING GIN (documento)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_busqueda_user_id ON busqueda (user_id)"))
+
+    conn.execute(text("DELETE FROM busqueda"))
+    for tabla in _DOCUMENTOS_V9:
+        _indexar_v9(conn, tabla)
+
+
+# Formatos de microchip de la versión 10 (ISO 11784/11785 y FDX-A/AVID heredados)
+_CHIP_SEPARADORES = re.compile(r"[\s\-.:_/]")
+_CHIP_ISO_HEX = re.compile(r"([0-9A-F]{3})\.([0-9A-F]{10})")
+_CHIP_HEREDADO = re.compile(r"[0-9A-F]{9,10}")
+
+
+def _normalizar_chip(codigo):
+    """Forma canónica, o None si no se puede normalizar (queda como estaba)."""
+    crudo = str(codigo or "").strip().upper()
+    hexadecimal = _CHIP_ISO_HEX.fullmatch(crudo)
+    if hexadecimal:
+        pais, numero = int(hexadecimal.group(1), 16), int(hexadecimal.group(2), 16)
+        return f"{pais:03d}{numero:012d}" if pais <= 999 and numero <= 999_999_999_999 else None
+    compacto = _CHIP_SEPARADORES.sub("", crudo)
+    if (compacto.isdigit() and len(compacto) == 15) or _CHIP_HEREDADO.fullmatch(compacto):
+        return compacto
+    return None
+
+
+@migracion(10, "Microchips normalizados y únicos")
+def _microchips(conn, lote=5000):
+    # Normaliza los chips guardados; si dos mascotas comparten uno, lo
+    # conserva la más antigua y a las demás se les quita (queda en el log)
+    cambiadas = []
+    ultimo = 0
+    while True:
+        filas = conn.execute(text(
+            "SELECT id, microchip FROM mascota WHERE id > :ultimo AND microchip IS NOT NULL ORDER BY id LIMIT :lote"
+        ), {"ultimo": ultimo, "lote": lote}).all()
+        if not filas:
+            break
+        ultimo = filas[-1].id
+
+        cambios = []
+        for id_, microchip in filas:
+            nuevo = _normalizar_chip(microchip)
+            if nuevo is not None and nuevo != microchip:
+                cambios.append({"b_id": id_, "b_chip": nuevo})
+        if cambios:
+            conn.execute(text("UPDATE mascota SET microchip = :b_chip WHERE id = :b_id"), cambios)
+            cambiadas += [c["b_id"] for c in cambios]
+
+    repetidos = conn.execute(text(
+        "SELECT microchip, MIN(id) FROM mascota WHERE microchip IS NOT NULL GROUP BY microchip HAVING COUNT(*) > 1"
+    )).all()
+    for microchip, conserva in repetidos:
+        ids = conn.execute(text("SELECT id FROM mascota WHERE microchip = :chip AND id != :id"),
+                           {"chip": microchip, "id": conserva}).scalars().all()
+        log.warning("Microchip %s repetido: se conserva en la mascota %s y se quita de %s", microchip, conserva, ids)
+        conn.execute(text("UPDATE mascota SET microchip = NULL WHERE microchip = :chip AND id != :id"),
+                     {"chip": microchip, "id": conserva})
+        cambiadas += ids
+
+    if cambiadas:
+        # Que los clientes offline reciban el chip corregido
+        rev = _siguiente_revision(conn)
+        for inicio in range(0, len(cambiadas), 500):
+            conn.execute(
+                text("UPDATE mascota SET rev = :rev, actualizado_en = :ahora WHERE id IN :ids")
+                .bindparams(bindparam("ids", expanding=True)),
+                {"rev": rev, "ahora": datetime.utcnow(), "ids": cambiadas[inicio:inicio + 500]},
+            )
+        _indexar_v9(conn, "mascota", cambiadas)
+    crear_indice(conn, "ix_mascota_microchip", "mascota", ["microchip"], unico=True, donde="microchip IS NOT NULL")
+
+
+@migracion(11, "Borrado del historial en cascada y borrado diferido de mascotas")
+def _borrado_mascotas(conn):
+    agregar_columna(conn, "mascota", "eliminada_en", "TIMESTAMP")
+    crear_indice(conn, "ix_mascota_eliminada_en", "mascota", ["eliminada_en"], donde="eliminada_en IS NOT NULL")
+
+    historial = ("vacuna", "diagnostico", "receta", "prevencion")
+    if conn.dialect.name == "sqlite":
+        # Las FK no se aplican sin PRAGMA foreign_keys: un trigger hace la cascada
+        borrados = " ".join(f"DELETE FROM {tabla} WHERE mascota_id = OLD.id;" for tabla in historial)
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS tr_mascota_borrar_historial AFTER DELETE ON mascota "
+            f"BEGIN {borrados} END"
+        ))
+        return
+
+    for tabla in historial:
+        fks = [fk for fk in inspect(conn).get_foreign_keys(tabla) if fk["referred_table"] == "mascota"]
+        if any((fk["options"].get("ondelete") or "").upper() == "CASCADE" for fk in fks):
+            continue
+        for fk in fks:
+            conn.execute(text(f'ALTER TABLE {tabla} DROP CONSTRAINT "{fk["name"]}"'))
+        conn.execute(text(
+            f"ALTER TABLE {tabla} ADD CONSTRAINT {tabla}_mascota_id_fkey FOREIGN KEY (mascota_id) "
+            f"REFERENCES mascota (id) ON DELETE CASCADE"
+        ))
+
+
+@migracion(12, "Agregados de estadísticas de la clínica")
+def _estadisticas(conn):
+    _crear_tablas(conn, _ESTADISTICA)
+    conn.execute(text("DELETE FROM estadistica"))
+
+    def normalizada(columna):
+        return f"lower(trim(coalesce({columna}, '')))"
+
+    def mes(columna):
+        return f"strftime('%Y-%m', {columna})" if conn.dialect.name == "sqlite" else f"to_char({columna}, 'YYYY-MM')"
+
+    grupo = f"{normalizada('m.especie')}, {normalizada('m.raza')}"
+    insertar = "INSERT INTO estadistica (metrica, periodo, especie, raza, clave, valor) "
+    conn.execute(text(
+        insertar + f"SELECT 'mascotas', '', {grupo}, '', COUNT(*) FROM mascota m "
+        f"WHERE m.eliminada_en IS NULL GROUP BY {grupo}"
+    ))
+    conn.execute(text(
+        insertar + f"SELECT 'vacunadas', '', {grupo}, '', COUNT(*) FROM mascota m "
+        f"WHERE m.eliminada_en IS NULL AND EXISTS (SELECT 1 FROM vacuna v WHERE v.mascota_id = m.id) "
+        f"GROUP BY {grupo}"
+    ))
+    for metrica, tabla, fecha, clave in (
+        ("vacunas", "vacuna", "fecha_aplicacion", "nombre"),
+        ("recetas", "receta", "fecha", "medicamento"),
+        ("vencimientos", "prevencion", "proxima_fecha", "tipo"),
+    ):
+        columnas = f"{mes('t.' + fecha)}, {grupo}, {normalizada('t.' + clave)}"
+        conn.execute(text(
+            insertar + f"SELECT '{metrica}', {columnas}, COUNT(*) FROM {tabla} t JOIN mascota m ON m.id = t.mascota_id "
+            f"WHERE m.eliminada_en IS NULL AND t.{fecha} IS NOT NULL GROUP BY {columnas}"
+        ))
+
+
+# ------------------ EJECUCIÓN ------------------
+
+def _asegurar_tabla_version(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, "
+            "descripcion VARCHAR(200) NOT NULL, "
+            "aplicada_en TIMESTAMP NOT NULL)"
+        ))
+
+
+def version_actual(engine):
+    _asegurar_tabla_version(engine)
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def pendientes(engine):
+    actual = version_actual(engine)
+    return [m for m in MIGRACIONES if m[0] > actual]
+
+
+def aplicar(engine, hasta=None, log=print):
+    """Aplica en orden las migraciones pendientes. Devuelve las versiones aplicadas."""
+    aplicadas = []
+    for version, descripcion, funcion in pendientes(engine):
+        if hasta is not None and version > hasta:
+            break
+
+        with engine.begin() as conn:
+            funcion(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, descripcion, aplicada_en) VALUES (:v, :d, :f)"),
+                {"v": version, "d": descripcion, "f": datetime.utcnow()},
+            )
+
+        log(f"  ✔ {version:03d} {descripcion}")
+        aplicadas.append(version)
+
+    return aplicadas
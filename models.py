@@ -2,10 +2,14 @@ print("✅ models.py correcto cargado")
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from datetime import date
+from datetime import date, datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+from media import url_media
+from replicas import SesionEnrutada
+
+# Los SELECT de las peticiones de solo lectura pueden ir a una réplica (ver replicas.py)
+db = SQLAlchemy(session_options={"class_": SesionEnrutada})
 
 # ------------------ USUARIO ------------------
 
@@ -17,7 +21,10 @@ class Usuario(db.Model, UserMixin):
     password = db.Column(db.String(200), nullable=False)
 
     # ✔ AGREGADO: foto del usuario en base64
+    # (heredado: las fotos nuevas van al almacén de media y aquí solo queda NULL)
     foto = db.Column(db.Text)
+    # Hash SHA-256 de la foto en el almacén de media
+    foto_hash = db.Column(db.String(64))
 
     mascotas = db.relationship('Mascota', backref='duenio', lazy=True)
 
@@ -27,26 +34,54 @@ class Usuario(db.Model, UserMixin):
     def check_password(self, password):
         return check_password_hash(self.password, password)
 
+    def foto_url(self):
+        return f"/api/media/{self.foto_hash}" if self.foto_hash else ""
+
 
 # ------------------ MASCOTA ------------------
 
 class Mascota(db.Model):
+    campos_api = ("id", "nombre", "especie", "raza", "fecha_nacimiento", "peso",
+                  "microchip", "castrado", "foto", "foto_miniatura", "foto_mediana",
+                  "foto_original", "user_id")
+    # Las variantes se guardan como hash y se publican como URL
+    formatos_api = {
+        "foto_miniatura": url_media,
+        "foto_mediana": url_media,
+        "foto_original": url_media,
+    }
+
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), nullable=False)
     especie = db.Column(db.String(100), nullable=False)
     raza = db.Column(db.String(100))
     fecha_nacimiento = db.Column(db.Date)
     peso = db.Column(db.Float)
+    # Normalizado y único entre las mascotas que lo tienen (ver microchips.py)
     microchip = db.Column(db.String(100))
     castrado = db.Column(db.Boolean, default=False)
+    # Heredado: nombre de archivo en uploads/. Las fotos nuevas van en las variantes.
     foto = db.Column(db.String(200))
+    # Hashes (almacén de media) de las variantes WebP generadas en imagenes.py
+    foto_miniatura = db.Column(db.String(64))
+    foto_mediana = db.Column(db.String(64))
+    foto_original = db.Column(db.String(64))
 
     user_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
 
-    vacunas = db.relationship('Vacuna', backref='mascota', cascade="all, delete-orphan")
-    diagnosticos = db.relationship('Diagnostico', backref='mascota', cascade="all, delete-orphan")
-    recetas = db.relationship('Receta', backref='mascota', cascade="all, delete-orphan")
-    prevenciones = db.relationship('Prevencion', backref='mascota', cascade="all, delete-orphan")
+    # Sincronización incremental (ver sincronizacion.py)
+    rev = db.Column(db.Integer)
+    actualizado_en = db.Column(db.DateTime)
+    # Borrado diferido: oculta hasta que el purgador la borre (ver borrado.py)
+    eliminada_en = db.Column(db.DateTime)
+
+    # El historial lo borra la base (ON DELETE CASCADE / trigger): no se carga para borrarlo
+    vacunas = db.relationship('Vacuna', backref='mascota', cascade="all, delete-orphan", passive_deletes=True)
+    diagnosticos = db.relationship('Diagnostico', backref='mascota', cascade="all, delete-orphan",
+                                   passive_deletes=True)
+    recetas = db.relationship('Receta', backref='mascota', cascade="all, delete-orphan", passive_deletes=True)
+    prevenciones = db.relationship('Prevencion', backref='mascota', cascade="all, delete-orphan",
+                                   passive_deletes=True)
 
     def calcular_edad(self):
         if not self.fecha_nacimiento:
@@ -57,56 +92,159 @@ class Mascota(db.Model):
             años -= 1
         return años
 
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "nombre": self.nombre,
-            "especie": self.especie,
-            "raza": self.raza,
-            "fecha_nacimiento": self.fecha_nacimiento.isoformat() if self.fecha_nacimiento else None,
-            "peso": self.peso,
-            "microchip": self.microchip,
-            "castrado": self.castrado,
-            "foto": self.foto,
-            "user_id": self.user_id
-        }
+    def foto_url(self, variante="miniatura"):
+        hash_media = getattr(self, "foto_" + variante)
+        if hash_media:
+            return url_media(hash_media)
+        if self.foto and len(self.foto) <= 200:
+            return f"/static/uploads/{self.foto}"
+        return None
 
 
 # ------------------ VACUNA ------------------
 
 class Vacuna(db.Model):
+    campos_api = ("id", "nombre", "fecha_aplicacion", "proxima_dosis")
+
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), nullable=False)
     fecha_aplicacion = db.Column(db.Date, nullable=False)
-    mascota_id = db.Column(db.Integer, db.ForeignKey('mascota.id'), nullable=False)
+    # Solo en la aplicación más reciente de cada vacuna (ver calendario.py)
+    proxima_dosis = db.Column(db.Date)
+    mascota_id = db.Column(db.Integer, db.ForeignKey('mascota.id', ondelete='CASCADE'), nullable=False)
+    rev = db.Column(db.Integer)
+    actualizado_en = db.Column(db.DateTime)
 
 
 # ------------------ DIAGNOSTICO ------------------
 
 class Diagnostico(db.Model):
+    campos_api = ("id", "titulo", "fecha", "descripcion")
+
     id = db.Column(db.Integer, primary_key=True)
     titulo = db.Column(db.String(200), nullable=False)
     fecha = db.Column(db.Date, nullable=False)
     descripcion = db.Column(db.Text)
-    mascota_id = db.Column(db.Integer, db.ForeignKey('mascota.id'), nullable=False)
+    mascota_id = db.Column(db.Integer, db.ForeignKey('mascota.id', ondelete='CASCADE'), nullable=False)
+    rev = db.Column(db.Integer)
+    actualizado_en = db.Column(db.DateTime)
 
 
 # ------------------ RECETA ------------------
 
 class Receta(db.Model):
+    campos_api = ("id", "medicamento", "dosis", "fecha", "instrucciones")
+
     id = db.Column(db.Integer, primary_key=True)
     medicamento = db.Column(db.String(200), nullable=False)
     dosis = db.Column(db.String(200), nullable=False)
     fecha = db.Column(db.Date, nullable=False)
     instrucciones = db.Column(db.Text)
-    mascota_id = db.Column(db.Integer, db.ForeignKey('mascota.id'), nullable=False)
+    mascota_id = db.Column(db.Integer, db.ForeignKey('mascota.id', ondelete='CASCADE'), nullable=False)
+    rev = db.Column(db.Integer)
+    actualizado_en = db.Column(db.DateTime)
 
 
 # ------------------ PREVENCION ------------------
 
 class Prevencion(db.Model):
+    campos_api = ("id", "tipo", "fecha", "descripcion", "proxima_fecha")
+
     id = db.Column(db.Integer, primary_key=True)
     tipo = db.Column(db.String(200), nullable=False)
     fecha = db.Column(db.Date, nullable=False)
     descripcion = db.Column(db.Text)
-    mascota_id = db.Column(db.Integer, db.ForeignKey('mascota.id'), nullable=False)
+    # Solo en la más reciente de cada tipo (ver calendario.py)
+    proxima_fecha = db.Column(db.Date)
+    mascota_id = db.Column(db.Integer, db.ForeignKey('mascota.id', ondelete='CASCADE'), nullable=False)
+    rev = db.Column(db.Integer)
+    actualizado_en = db.Column(db.DateTime)
+
+
+# ------------------ SINCRONIZACIÓN ------------------
+
+class ContadorRevision(db.Model):
+    __tablename__ = 'contador_revision'
+
+    id = db.Column(db.Integer, primary_key=True)
+    valor = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Eliminacion(db.Model):
+    """Lápida de un registro borrado, para que los clientes offline lo quiten."""
+    id = db.Column(db.Integer, primary_key=True)
+    tabla = db.Column(db.String(30), nullable=False)
+    registro_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    rev = db.Column(db.Integer, nullable=False)
+    eliminado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# ------------------ RECORDATORIOS ------------------
+
+class Trabajo(db.Model):
+    """Cola persistente del worker de recordatorios (ver recordatorios.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(30), nullable=False)
+    # Idempotencia: el mismo trabajo no se encola dos veces
+    clave = db.Column(db.String(120), unique=True, nullable=False)
+    datos = db.Column(db.Text, nullable=False)
+    estado = db.Column(db.String(12), nullable=False, default="pendiente")
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    ejecutar_en = db.Column(db.DateTime, nullable=False)
+    bloqueado_hasta = db.Column(db.DateTime)
+    ultimo_error = db.Column(db.Text)
+    creado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class Aviso(db.Model):
+    """Vencimiento ya notificado: un registro y una fecha se avisan una sola vez."""
+    __table_args__ = (db.UniqueConstraint("tabla", "registro_id", "vence", name="uq_aviso_registro_vence"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    tabla = db.Column(db.String(30), nullable=False)
+    registro_id = db.Column(db.Integer, nullable=False)
+    vence = db.Column(db.Date, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    creado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# ------------------ IMPORTACIONES ------------------
+
+class Importacion(db.Model):
+    """Progreso de una importación en streaming, para poder reanudarla (ver exportacion.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    # None = importación de clínica (cada mascota trae su user_id)
+    user_id = db.Column(db.Integer)
+    formato = db.Column(db.String(10), nullable=False)
+    estado = db.Column(db.String(12), nullable=False, default="en_curso")
+    # Registros de la entrada ya confirmados (válidos o no): al reanudar se saltan
+    registros = db.Column(db.Integer, nullable=False, default=0)
+    insertados = db.Column(db.Integer, nullable=False, default=0)
+    errores = db.Column(db.Integer, nullable=False, default=0)
+    ultimo_error = db.Column(db.Text)
+    creado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    actualizado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ImportacionMascota(db.Model):
+    """Traducción id de origen -> id nuevo de las mascotas importadas."""
+    __tablename__ = 'importacion_mascota'
+
+    importacion_id = db.Column(db.Integer, primary_key=True)
+    origen_id = db.Column(db.Integer, primary_key=True)
+    mascota_id = db.Column(db.Integer, nullable=False)
+
+
+# ------------------ ESTADÍSTICAS ------------------
+
+class Estadistica(db.Model):
+    """Contador agregado que mantiene estadisticas.py (nunca se escribe a mano)."""
+    metrica = db.Column(db.String(20), primary_key=True)
+    # 'AAAA-MM', o '' en las métricas sin fecha
+    periodo = db.Column(db.String(7), primary_key=True)
+    especie = db.Column(db.String(100), primary_key=True)
+    raza = db.Column(db.String(100), primary_key=True)
+    # Vacuna, medicamento o tipo de prevención, normalizado; '' si no aplica
+    clave = db.Column(db.String(200), primary_key=True)
+    valor = db.Column(db.Integer, nullable=False, default=0)
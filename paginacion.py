@@ -0,0 +1,129 @@
+import base64
+import binascii
+import json
+from datetime import date
+
+from flask import request
+from sqlalchemy import and_, or_, select
+
+from models import db
+from serializacion import a_dicts, valor_json
+
+# ============================================================
+# PAGINACIÓN POR CURSOR (KEYSET), ORDEN Y PROYECCIÓN
+# ============================================================
+# ?limite=50&orden=-fecha&campos=id,nombre&cursor=<next_cursor>
+#
+# El cursor guarda el último (valor_orden, id) entregado, así que la
+# página siguiente es un rango sobre el índice y no un OFFSET: el costo
+# no crece con la profundidad y la memoria queda acotada por `limite`.
+
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 500
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+def _codificar_cursor(orden, valor, id_):
+    crudo = json.dumps([orden, valor_json(valor), id_], separators=(',', ':'))
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip('=')
+
+
+def _decodificar_cursor(cursor, orden, columna):
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        orden_cursor, valor, id_ = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (binascii.Error, ValueError, TypeError):
+        raise ParametroInvalido("Cursor no válido")
+
+    if orden_cursor != orden or not isinstance(id_, int):
+        raise ParametroInvalido("El cursor no corresponde al orden pedido")
+
+    if valor is not None and columna.type.python_type is date:
+        try:
+            valor = date.fromisoformat(valor)
+        except (TypeError, ValueError):
+            raise ParametroInvalido("Cursor no válido")
+
+    return valor, id_
+
+
+def _limite():
+    valor = request.args.get('limite')
+    if not valor:
+        return LIMITE_POR_DEFECTO
+    try:
+        limite = int(valor)
+    except ValueError:
+        raise ParametroInvalido("El límite debe ser un número")
+    return max(1, min(limite, LIMITE_MAXIMO))
+
+
+def _campos(modelo):
+    if not request.args.get('campos'):
+        return list(modelo.campos_api)
+
+    campos = [c.strip() for c in request.args['campos'].split(',') if c.strip()]
+    invalidos = [c for c in campos if c not in modelo.campos_api]
+    if invalidos:
+        raise ParametroInvalido(f"Campo no válido: {', '.join(invalidos)}")
+
+    # El id siempre viaja: el cliente lo necesita para editar/borrar
+    if 'id' not in campos:
+        campos.insert(0, 'id')
+    return campos
+
+
+def paginar(modelo, filtros, ordenables, extra=None, uniones=(), orden_por_defecto='id'):
+    """Devuelve (filas, next_cursor) leyendo solo las columnas pedidas.
+
+    `ordenables` mapea el nombre público del orden a su columna, por
+    ejemplo {"id": Vacuna.id, "fecha": Vacuna.fecha_aplicacion}.
+    `extra` agrega columnas fijas (de `uniones`) a cada fila.
+    """
+    orden = request.args.get('orden') or orden_por_defecto
+    descendente = orden.startswith('-')
+    nombre_orden = orden.lstrip('-')
+    if nombre_orden not in ordenables:
+        raise ParametroInvalido(f"Orden no válido: {nombre_orden}")
+
+    limite = _limite()
+    campos = _campos(modelo)
+
+    col_orden = ordenables[nombre_orden]
+    col_id = modelo.id
+    extra = extra or {}
+    columnas = [getattr(modelo, c) for c in campos] + [col.label(n) for n, col in extra.items()]
+    nombres = campos + list(extra)
+
+    consulta = select(*columnas, col_orden.label('_orden'))
+    for union in uniones:
+        consulta = consulta.join(union)
+    consulta = consulta.where(*filtros)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        valor, ultimo_id = _decodificar_cursor(cursor, orden, col_orden)
+        if col_orden is col_id:
+            consulta = consulta.where(col_id < ultimo_id if descendente else col_id > ultimo_id)
+        elif descendente:
+            consulta = consulta.where(or_(col_orden < valor, and_(col_orden == valor, col_id < ultimo_id)))
+        else:
+            consulta = consulta.where(or_(col_orden > valor, and_(col_orden == valor, col_id > ultimo_id)))
+
+    if descendente:
+        consulta = consulta.order_by(col_orden.desc(), col_id.desc())
+    else:
+        consulta = consulta.order_by(col_orden.asc(), col_id.asc())
+
+    filas = db.session.execute(consulta.limit(limite + 1)).all()
+
+    next_cursor = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultima = filas[-1]
+        next_cursor = _codificar_cursor(orden, ultima._orden, ultima.id)
+
+    return a_dicts(modelo, nombres, filas), next_cursor
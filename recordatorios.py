@@ -0,0 +1,300 @@
+import hashlib
+import json
+import random
+import signal
+import smtplib
+import time
+import urllib.request
+from datetime import date, datetime, timedelta
+from email.message import EmailMessage
+
+from flask import current_app
+from sqlalchemy import and_, delete, exists, insert, literal, or_, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Usuario, Mascota, Vacuna, Prevencion, Trabajo, Aviso
+
+# ============================================================
+# RECORDATORIOS DE VACUNAS Y PREVENCIONES (WORKER)
+# ============================================================
+# Corre en su propio proceso (`flask --app app recordatorios`), nunca en
+# los workers web.
+#
+# 1) Planificar: recorre con un cursor en streaming lo que vence en la
+#    ventana [hoy - ATRASO, hoy + ANTICIPACION] (rangos sobre los índices
+#    parciales de proxima_dosis / proxima_fecha), ordenado por dueño.
+#    Descarta lo ya avisado (tabla `aviso`) y encola un trabajo por dueño
+#    y destino. La memoria queda acotada por `lote`, no por el catálogo.
+# 2) Entregar: reclama trabajos vencidos con un UPDATE condicional (varios
+#    workers no toman el mismo), los envía por su destino y, si falla,
+#    reintenta con backoff exponencial hasta RECORDATORIOS_MAX_INTENTOS.
+#    Un trabajo "en_curso" cuyo bloqueo expiró (worker caído) se retoma.
+#
+# Configuración (app.config):
+#   RECORDATORIOS_DESTINOS          lista: "log", "smtp", "webhook"
+#   RECORDATORIOS_ANTICIPACION_DIAS avisar lo que vence en los próximos N días (7)
+#   RECORDATORIOS_ATRASO_DIAS       y lo vencido hace como mucho N días (30)
+#   RECORDATORIOS_MAX_INTENTOS      (6)
+#   RECORDATORIOS_BACKOFF_SEGUNDOS  primer reintento; se duplica en cada fallo (60)
+#   RECORDATORIOS_SMTP_HOST/PORT    ("localhost", 1025: p. ej. `python -m aiosmtpd -n`)
+#   RECORDATORIOS_REMITENTE
+#   RECORDATORIOS_WEBHOOK_URL
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+HECHO = "hecho"
+FALLIDO = "fallido"
+
+TIPO = "recordatorio"
+BLOQUEO = timedelta(minutes=5)
+BACKOFF_MAXIMO = 6 * 3600
+
+
+def _config(clave, por_defecto):
+    return current_app.config.get(clave, por_defecto)
+
+
+# ------------------ DESTINOS ------------------
+
+class DestinoLog:
+    def enviar(self, datos):
+        current_app.logger.info(
+            "Recordatorio para %s: %s", datos["email"],
+            "; ".join(f'{i["mascota"]}: {i["nombre"]} ({i["vence"]})' for i in datos["items"]),
+        )
+
+
+class DestinoSmtp:
+    def enviar(self, datos):
+        mensaje = EmailMessage()
+        mensaje["Subject"] = "VacunaPet: próximas vacunas y prevenciones"
+        mensaje["From"] = _config("RECORDATORIOS_REMITENTE", "recordatorios@vacunapet.local")
+        mensaje["To"] = datos["email"]
+        lineas = [f"Hola {datos['nombre']},", "", "Tienes pendiente:"]
+        lineas += [f"  - {i['mascota']}: {i['nombre']} ({i['vence']})" for i in datos["items"]]
+        mensaje.set_content("\n".join(lineas))
+
+        with smtplib.SMTP(_config("RECORDATORIOS_SMTP_HOST", "localhost"),
+                          _config("RECORDATORIOS_SMTP_PORT", 1025), timeout=10) as smtp:
+            smtp.send_message(mensaje)
+
+
+class DestinoWebhook:
+    def enviar(self, datos):
+        solicitud = urllib.request.Request(
+            _config("RECORDATORIOS_WEBHOOK_URL", None),
+            data=json.dumps(datos).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        # urlopen lanza HTTPError con 4xx/5xx: cuenta como fallo y se reintenta
+        with urllib.request.urlopen(solicitud, timeout=10):
+            pass
+
+
+DESTINOS = {
+    "log": DestinoLog,
+    "smtp": DestinoSmtp,
+    "webhook": DestinoWebhook,
+}
+
+
+def registrar_destino(nombre, clase):
+    """Añade un destino: `clase().enviar(datos)` debe lanzar excepción si falla."""
+    DESTINOS[nombre] = clase
+
+
+# ------------------ PLANIFICACIÓN ------------------
+
+def _vencimientos(desde, hasta):
+    """Vacunas y prevenciones que vencen en [desde, hasta] y aún no se avisaron."""
+    def parte(tabla, modelo, nombre, vence):
+        return (
+            select(
+                literal(tabla).label("tabla"), modelo.id.label("registro_id"), nombre.label("nombre"),
+                vence.label("vence"), Mascota.nombre.label("mascota"),
+                Usuario.id.label("user_id"), Usuario.email, Usuario.nombre.label("duenio"),
+            )
+            .join(Mascota, Mascota.id == modelo.mascota_id)
+            .join(Usuario, Usuario.id == Mascota.user_id)
+            .where(vence.between(desde, hasta), Mascota.eliminada_en.is_(None))
+            .where(~exists().where(
+                Aviso.tabla == tabla, Aviso.registro_id == modelo.id, Aviso.vence == vence,
+            ))
+        )
+
+    todas = union_all(
+        parte("vacuna", Vacuna, Vacuna.nombre, Vacuna.proxima_dosis),
+        parte("prevencion", Prevencion, Prevencion.tipo, Prevencion.proxima_fecha),
+    ).subquery()
+    return select(todas).order_by(todas.c.user_id, todas.c.tabla, todas.c.registro_id)
+
+
+def _clave(destino, user_id, items):
+    huella = hashlib.sha1("|".join(f'{i["tabla"]}:{i["id"]}:{i["vence"]}' for i in items).encode())
+    return f"{TIPO}:{destino}:{user_id}:{huella.hexdigest()[:16]}"
+
+
+def planificar(hoy=None, lote=1000):
+    """Encola los recordatorios pendientes. Devuelve (dueños, trabajos)."""
+    hoy = hoy or date.today()
+    desde = hoy - timedelta(days=_config("RECORDATORIOS_ATRASO_DIAS", 30))
+    hasta = hoy + timedelta(days=_config("RECORDATORIOS_ANTICIPACION_DIAS", 7))
+    destinos = _config("RECORDATORIOS_DESTINOS", ["log"])
+
+    avisos, trabajos = [], []
+    totales = {"duenios": 0, "trabajos": 0}
+    ahora = datetime.utcnow()
+
+    def cerrar_duenio(duenio, items):
+        for item in items:
+            avisos.append({"tabla": item["tabla"], "registro_id": item["id"], "vence": item["vence_fecha"],
+                           "user_id": duenio["user_id"], "creado_en": ahora})
+            del item["vence_fecha"]
+        for destino in destinos:
+            datos = dict(duenio, destino=destino, items=items)
+            trabajos.append({"tipo": TIPO, "clave": _clave(destino, duenio["user_id"], items),
+                             "datos": json.dumps(datos, ensure_ascii=False), "estado": PENDIENTE,
+                             "intentos": 0, "ejecutar_en": ahora, "creado_en": ahora})
+        totales["duenios"] += 1
+
+    def volcar():
+        if not avisos:
+            return
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(insert(Aviso), avisos)
+                conn.execute(insert(Trabajo), trabajos)
+            totales["trabajos"] += len(trabajos)
+        except IntegrityError:
+            # Otro planificador encoló lo mismo a la vez: ya está avisado
+            current_app.logger.warning("Recordatorios duplicados descartados (%d avisos)", len(avisos))
+        avisos.clear()
+        trabajos.clear()
+
+    # Lectura en streaming en su propia conexión; las escrituras van en
+    # transacciones cortas aparte para no retener locks durante el recorrido.
+    duenio, items = None, []
+    with db.engine.connect() as lectura:
+        filas = lectura.execution_options(stream_results=True, yield_per=lote).execute(_vencimientos(desde, hasta))
+        for fila in filas:
+            if duenio is None or fila.user_id != duenio["user_id"]:
+                if duenio is not None:
+                    cerrar_duenio(duenio, items)
+                    if len(avisos) >= lote:
+                        volcar()
+                duenio = {"user_id": fila.user_id, "email": fila.email, "nombre": fila.duenio}
+                items = []
+            items.append({"tabla": fila.tabla, "id": fila.registro_id, "mascota": fila.mascota,
+                          "nombre": fila.nombre, "vence": fila.vence.isoformat(), "vence_fecha": fila.vence})
+    if duenio is not None:
+        cerrar_duenio(duenio, items)
+    volcar()
+    return totales["duenios"], totales["trabajos"]
+
+
+def purgar(dias=30):
+    """Borra los trabajos terminados hace más de `dias` (los avisos se conservan para deduplicar)."""
+    limite = datetime.utcnow() - timedelta(days=dias)
+    resultado = db.session.execute(
+        delete(Trabajo).where(Trabajo.estado == HECHO, Trabajo.ejecutar_en < limite)
+    )
+    db.session.commit()
+    return resultado.rowcount
+
+
+# ------------------ ENTREGA ------------------
+
+def _disponibles(ahora):
+    return or_(
+        and_(Trabajo.estado == PENDIENTE, Trabajo.ejecutar_en <= ahora),
+        and_(Trabajo.estado == EN_CURSO, Trabajo.bloqueado_hasta < ahora),
+    )
+
+
+def reclamar():
+    """Toma el siguiente trabajo vencido, o None. Seguro con varios workers."""
+    for _ in range(5):
+        ahora = datetime.utcnow()
+        trabajo_id = db.session.execute(
+            select(Trabajo.id).where(_disponibles(ahora)).order_by(Trabajo.ejecutar_en).limit(1)
+        ).scalar()
+        if trabajo_id is None:
+            db.session.commit()
+            return None
+
+        resultado = db.session.execute(
+            update(Trabajo)
+            .where(Trabajo.id == trabajo_id, _disponibles(ahora))
+            .values(estado=EN_CURSO, bloqueado_hasta=ahora + BLOQUEO, intentos=Trabajo.intentos + 1)
+        )
+        db.session.commit()
+        if resultado.rowcount == 1:
+            return db.session.get(Trabajo, trabajo_id, populate_existing=True)
+    return None
+
+
+def _espera(intentos):
+    base = _config("RECORDATORIOS_BACKOFF_SEGUNDOS", 60)
+    # Jitter: los reintentos de muchos trabajos no llegan todos a la vez
+    return min(BACKOFF_MAXIMO, base * 2 ** (intentos - 1)) * random.uniform(0.5, 1.0)
+
+
+def entregar(trabajo):
+    datos = json.loads(trabajo.datos)
+    try:
+        clase = DESTINOS[datos["destino"]]
+        clase().enviar(datos)
+    except Exception as e:  # cualquier fallo del destino se reintenta
+        trabajo.ultimo_error = f"{type(e).__name__}: {e}"[:500]
+        if trabajo.intentos >= _config("RECORDATORIOS_MAX_INTENTOS", 6):
+            trabajo.estado = FALLIDO
+            current_app.logger.error("Recordatorio %s fallido: %s", trabajo.id, trabajo.ultimo_error)
+        else:
+            trabajo.estado = PENDIENTE
+            trabajo.ejecutar_en = datetime.utcnow() + timedelta(seconds=_espera(trabajo.intentos))
+    else:
+        trabajo.estado = HECHO
+        trabajo.ultimo_error = None
+    trabajo.bloqueado_hasta = None
+    db.session.commit()
+    return trabajo.estado == HECHO
+
+
+def procesar(maximo=500):
+    """Entrega hasta `maximo` trabajos vencidos. Devuelve (entregados, fallidos)."""
+    entregados = fallidos = 0
+    for _ in range(maximo):
+        trabajo = reclamar()
+        if trabajo is None:
+            break
+        if entregar(trabajo):
+            entregados += 1
+        else:
+            fallidos += 1
+    return entregados, fallidos
+
+
+def ejecutar_worker(intervalo=30, planificar_cada=3600, una_vez=False, log=print):
+    """Bucle del worker: planifica cada `planificar_cada` segundos y entrega lo vencido."""
+    detener = []
+    signal.signal(signal.SIGTERM, lambda *_: detener.append(True))
+
+    ultima_planificacion = None
+    while not detener:
+        if ultima_planificacion is None or time.monotonic() - ultima_planificacion >= planificar_cada:
+            duenios, trabajos = planificar()
+            purgados = purgar()
+            log(f"Planificados {trabajos} trabajos para {duenios} dueños (purgados {purgados})")
+            ultima_planificacion = time.monotonic()
+
+        entregados, fallidos = procesar()
+        if entregados or fallidos:
+            log(f"Entregados {entregados}, con error {fallidos}")
+
+        if una_vez:
+            break
+        # Duerme en pasos cortos para atender SIGTERM a tiempo
+        fin = time.monotonic() + intervalo
+        while not detener and time.monotonic() < fin:
+            time.sleep(min(1, intervalo))
@@ -0,0 +1,259 @@
+import itertools
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session as SesionFlask
+from sqlalchemy import event, text
+
+import cache
+from basedatos import METODOS_ESCRITURA
+
+# ============================================================
+# RÉPLICAS DE LECTURA
+# ============================================================
+# Con DATABASE_REPLICA_URLS (ver basedatos.py) los SELECT de las
+# peticiones que solo leen van a una réplica; todo lo demás sigue en la
+# primaria:
+#   - peticiones POST/PUT/PATCH/DELETE y endpoints de SOLO_PRIMARIA,
+#   - flush, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE y
+#     session.connection() (lo usan los hooks que escriben),
+#   - lo que corre fuera de una petición (CLI, workers, migraciones).
+# Una petición que escribe algo pasa a leer de la primaria desde ahí.
+#
+# Leer lo propio: tras una escritura, el mismo cliente lee de la primaria
+# durante REPLICA_VENTANA_PRIMARIA_S segundos, mientras la réplica se
+# pone al día. Se recuerda en una cookie (navegador) y, con token, por
+# usuario en el proceso y en la caché (compartida entre workers con
+# CACHE_BACKEND=sqlite).
+# Las respuestas cacheadas de un espacio invalidado hace menos que la
+# ventana también se leen de la primaria, para no cachear datos viejos.
+#
+# Salud: cada réplica se verifica como mucho cada REPLICA_VERIFICAR_CADA_S
+# segundos, al elegirla. Se descarta si no responde, si no tiene la
+# última migración o si (PostgreSQL) va más de REPLICA_RETRASO_MAX_S
+# segundos atrás; un error de conexión en plena consulta también la
+# descarta. Al elegirla se toma una conexión de su pool: si falla, la
+# petición pasa a la siguiente réplica sana o a la primaria. Sin réplicas
+# sanas se lee de la primaria.
+# REPLICA_RETRASO_MAX_S no debe superar la ventana de leer lo propio.
+
+COOKIE = "vp_primaria"
+
+# Lecturas que deben ver lo último escrito por cualquier cliente
+SOLO_PRIMARIA = {
+    'api.obtener_importacion',
+    'api.metricas_hashing',
+    'api.metricas_cache',
+    'api.metricas_replicas',
+}
+
+_SIN_ELEGIR = object()
+
+# user_id -> hasta cuándo lee de la primaria (este proceso; la caché lo comparte con los demás)
+_fijados = {}
+
+_VERSION_ESQUEMA = text("SELECT MAX(version) FROM schema_version")
+_RETRASO_POSTGRES = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class Replica:
+    def __init__(self, clave, engine):
+        self.clave = clave
+        self.engine = engine
+        self.sana = True
+        self.motivo = None
+        self.verificar_en = 0.0
+        self.lock = threading.Lock()
+
+
+class Replicas:
+    """Las réplicas de la app, su estado de salud y el reparto entre ellas."""
+
+    def __init__(self, primaria, replicas, verificar_cada=10, retraso_max=5):
+        self.primaria = primaria
+        self.replicas = replicas
+        self.verificar_cada = verificar_cada
+        self.retraso_max = retraso_max
+        self._turno = itertools.count()
+
+    def elegir(self):
+        """Engine de una réplica sana (por turnos), o None."""
+        inicio = next(self._turno)
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(inicio + i) % len(self.replicas)]
+            if time.monotonic() >= replica.verificar_en:
+                self.verificar(replica)
+            if replica.sana and self._conecta(replica):
+                return replica.engine
+        return None
+
+    def _conecta(self, replica):
+        # Tomar y devolver una conexión del pool: si la réplica acaba de caer
+        # se pasa a la siguiente sin que la petición falle
+        try:
+            replica.engine.connect().close()
+            return True
+        except Exception as e:
+            self.caida(replica.engine, e)
+            return False
+
+    def verificar(self, replica):
+        # Un solo hilo verifica; los demás usan el último estado
+        if not replica.lock.acquire(blocking=False):
+            return
+        try:
+            replica.verificar_en = time.monotonic() + self.verificar_cada
+            try:
+                self._marcar(replica, self._problema(replica))
+            except Exception as e:
+                self._marcar(replica, f"sin conexión: {e.__class__.__name__}")
+        finally:
+            replica.lock.release()
+
+    def _problema(self, replica):
+        with self.primaria.connect() as conn:
+            version = conn.execute(_VERSION_ESQUEMA).scalar()
+        with replica.engine.connect() as conn:
+            version_replica = conn.execute(_VERSION_ESQUEMA).scalar()
+            retraso = conn.execute(_RETRASO_POSTGRES).scalar() if conn.dialect.name == "postgresql" else 0
+        if version_replica != version:
+            return f"esquema en la versión {version_replica}, la primaria en {version}"
+        if retraso is not None and retraso > self.retraso_max:
+            return f"{retraso:.1f} s de retraso"
+        return None
+
+    def _marcar(self, replica, motivo):
+        if motivo and replica.sana:
+            current_app.logger.warning("Réplica %s fuera de servicio: %s", replica.clave, motivo)
+        elif not motivo and not replica.sana:
+            current_app.logger.info("Réplica %s de nuevo en servicio", replica.clave)
+        replica.sana, replica.motivo = motivo is None, motivo
+
+    def caida(self, engine, error):
+        for replica in self.replicas:
+            if replica.engine is engine:
+                replica.verificar_en = time.monotonic() + self.verificar_cada
+                self._marcar(replica, f"error de conexión: {error.__class__.__name__}")
+
+    def estado(self):
+        return [{"replica": r.clave, "sana": r.sana, "motivo": r.motivo} for r in self.replicas]
+
+
+def instalar(app, db):
+    """Registra las réplicas de SQLALCHEMY_BINDS. Llamar dentro del app context, después de db.init_app."""
+    claves = app.config.get('REPLICAS') or []
+    replicas = [Replica(clave, db.engines[clave]) for clave in claves]
+    app.extensions["vacunapet_replicas"] = Replicas(
+        db.engine, replicas,
+        verificar_cada=app.config.get('REPLICA_VERIFICAR_CADA_S', 10),
+        retraso_max=app.config.get('REPLICA_RETRASO_MAX_S', 5),
+    )
+    if not replicas:
+        return
+
+    for replica in replicas:
+        @event.listens_for(replica.engine, "handle_error")
+        def _error(contexto, engine=replica.engine):
+            if contexto.is_disconnect or contexto.connection is None:
+                app.extensions["vacunapet_replicas"].caida(engine, contexto.original_exception)
+
+    @app.after_request
+    def _fijar_tras_escritura(respuesta):
+        if request.method in METODOS_ESCRITURA and respuesta.status_code < 400:
+            ventana = app.config.get('REPLICA_VENTANA_PRIMARIA_S', 5)
+            hasta = time.time() + ventana
+            respuesta.set_cookie(COOKIE, f"{hasta:.3f}", max_age=int(ventana) + 1, httponly=True, samesite="Lax")
+            if g.get("user_id") is not None:
+                if len(_fijados) > 10000:
+                    for user_id, fin in list(_fijados.items()):
+                        if fin < time.time():
+                            _fijados.pop(user_id, None)
+                _fijados[g.user_id] = hasta
+                cache.marcar(f"primaria:u:{g.user_id}", ventana)
+        return respuesta
+
+
+def motores():
+    """Engines de las réplicas configuradas (para instrumentarlos)."""
+    return [r.engine for r in current_app.extensions["vacunapet_replicas"].replicas]
+
+
+def estado():
+    return current_app.extensions["vacunapet_replicas"].estado()
+
+
+# ------------------ ELECCIÓN POR PETICIÓN ------------------
+
+def _fijada():
+    try:
+        if float(request.cookies.get(COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    user_id = g.get("user_id")
+    if user_id is None:
+        return False
+    return _fijados.get(user_id, 0) > time.time() or cache.marcado(f"primaria:u:{user_id}")
+
+
+def _elegir():
+    replicas = current_app.extensions.get("vacunapet_replicas")
+    if (not replicas or not replicas.replicas or request.method in METODOS_ESCRITURA
+            or request.endpoint in SOLO_PRIMARIA or _fijada()):
+        return None
+    return replicas.elegir()
+
+
+def replica_de_la_peticion():
+    """Engine de réplica para los SELECT de esta petición, o None (primaria)."""
+    if not has_request_context():
+        return None
+    eleccion = g.get("_replica", _SIN_ELEGIR)
+    if eleccion is _SIN_ELEGIR:
+        eleccion = g._replica = _elegir()
+    return eleccion
+
+
+def usar_primaria():
+    """El resto de la petición lee de la primaria."""
+    if has_request_context():
+        g._replica = None
+
+
+def motor_de_lectura(engine):
+    """Para lecturas con Core fuera de la Session (exportación): la réplica o `engine`."""
+    return replica_de_la_peticion() or engine
+
+
+def _con_sentencia(statement, bind_arguments):
+    # Con sentencias de Core (sin entidades del ORM) la Session no le pasa la cláusula a get_bind
+    return {"clause": statement, **(bind_arguments or {})}
+
+
+class SesionEnrutada(SesionFlask):
+    """Session de Flask-SQLAlchemy que manda los SELECT de las peticiones de lectura a una réplica."""
+
+    def execute(self, statement, params=None, *, bind_arguments=None, **kwargs):
+        return super().execute(statement, params, bind_arguments=_con_sentencia(statement, bind_arguments), **kwargs)
+
+    def scalar(self, statement, params=None, *, bind_arguments=None, **kwargs):
+        return super().scalar(statement, params, bind_arguments=_con_sentencia(statement, bind_arguments), **kwargs)
+
+    def scalars(self, statement, params=None, *, bind_arguments=None, **kwargs):
+        return super().scalars(statement, params, bind_arguments=_con_sentencia(statement, bind_arguments), **kwargs)
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and clause is not None and not self._flushing:
+            if getattr(clause, "is_select", False) and getattr(clause, "_for_update_arg", None) is None:
+                replica = replica_de_la_peticion()
+                if replica is not None:
+                    return replica
+            elif getattr(clause, "is_dml", False):
+                usar_primaria()
+        elif self._flushing:
+            usar_primaria()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,222 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# ============================================================
+# HASH DE CONTRASEÑAS FUERA DEL WORKER WEB
+# ============================================================
+# scrypt/pbkdf2 ocupan la CPU decenas o cientos de ms. Se ejecutan en
+# un pool de procesos acotado; si ya hay HASH_MAX_EN_COLA trabajos
+# pendientes la petición se rechaza al instante (503) en lugar de
+# encolarse y arrastrar al resto de endpoints.
+#
+# Configuración (app.config):
+#   HASH_METODO        método de werkzeug ("scrypt", "pbkdf2:sha256:600000", ...)
+#   HASH_WORKERS       procesos del pool (0 = en el propio hilo, para desarrollo)
+#   HASH_MAX_EN_COLA   trabajos admitidos a la vez (en ejecución + esperando)
+#   HASH_TIMEOUT       segundos máximos de espera por un hash
+#
+# La cola solo tiene sentido con un worker que atiende varias peticiones
+# a la vez (gunicorn -k gthread --threads N, o asgi.py con ASGI_HILOS):
+# con workers sync cada proceso espera su propio hash y nunca hay más de
+# uno pendiente. HASH_MAX_EN_COLA se dimensiona contra esos hilos (igual
+# o menor) y HASH_WORKERS contra los núcleos que quedan libres, teniendo
+# en cuenta que cada worker web tiene su propio pool.
+#
+# Si un proceso del pool muere (OOM, kill) ProcessPoolExecutor queda
+# roto para siempre: se reemplaza por uno nuevo en el siguiente envío.
+
+
+class HashingSaturado(Exception):
+    pass
+
+
+class DemasiadosIntentos(Exception):
+    def __init__(self, reintentar_en):
+        super().__init__("Demasiados intentos, espera un momento")
+        self.reintentar_en = reintentar_en
+
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_semaforo = None
+_prefijos = {}
+
+_metricas = {
+    "en_cola": 0,
+    "completados": 0,
+    "rechazados": 0,
+    "segundos_totales": 0.0,
+}
+
+
+def _config(clave, por_defecto):
+    return current_app.config.get(clave, por_defecto)
+
+
+def _obtener_pool():
+    """Pool perezoso por proceso: gunicorn hace fork después de importar la app."""
+    global _pool, _pool_pid, _semaforo
+    workers = _config('HASH_WORKERS', 2)
+
+    with _lock:
+        if _semaforo is None or _pool_pid != os.getpid():
+            _semaforo = threading.BoundedSemaphore(_config('HASH_MAX_EN_COLA', 8))
+            _pool = ProcessPoolExecutor(max_workers=workers) if workers else None
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def _reemplazar_pool(roto):
+    global _pool
+    with _lock:
+        if _pool is roto:
+            _pool = ProcessPoolExecutor(max_workers=_config('HASH_WORKERS', 2))
+            roto.shutdown(wait=False)
+        return _pool
+
+
+def _ejecutar(funcion, *args):
+    pool = _obtener_pool()
+
+    if not _semaforo.acquire(blocking=False):
+        with _lock:
+            _metricas["rechazados"] += 1
+        raise HashingSaturado("El servidor está ocupado, intenta de nuevo")
+
+    with _lock:
+        _metricas["en_cola"] += 1
+    inicio = time.perf_counter()
+
+    def terminar(_=None):
+        with _lock:
+            _metricas["en_cola"] -= 1
+            _metricas["completados"] += 1
+            _metricas["segundos_totales"] += time.perf_counter() - inicio
+        _semaforo.release()
+
+    if pool is None:
+        try:
+            return funcion(*args)
+        finally:
+            terminar()
+
+    try:
+        try:
+            futuro = pool.submit(funcion, *args)
+        except BrokenProcessPool:
+            pool = _reemplazar_pool(pool)
+            futuro = pool.submit(funcion, *args)
+    except BaseException:
+        terminar()
+        raise
+
+    # El cupo se libera cuando termina el proceso, no cuando nos cansamos de esperar
+    futuro.add_done_callback(terminar)
+    try:
+        return futuro.result(timeout=_config('HASH_TIMEOUT', 5))
+    except TimeoutError:
+        raise HashingSaturado("El servidor está ocupado, intenta de nuevo")
+    except BrokenProcessPool:
+        _reemplazar_pool(pool)
+        raise HashingSaturado("El servidor está ocupado, intenta de nuevo")
+
+
+def _metodo():
+    return _config('HASH_METODO', 'scrypt')
+
+
+def generar_hash(password):
+    return _ejecutar(generate_password_hash, password, _metodo())
+
+
+def verificar_password(password_hash, password):
+    return _ejecutar(check_password_hash, password_hash, password)
+
+
+def necesita_rehash(password_hash):
+    """True si el hash se generó con otro método o parámetros que los actuales."""
+    metodo = _metodo()
+    if metodo not in _prefijos:
+        # "scrypt" -> "scrypt:32768:8:1": werkzeug completa los parámetros por defecto
+        _prefijos[metodo] = generate_password_hash("x", metodo).split("$", 1)[0]
+    return password_hash.split("$", 1)[0] != _prefijos[metodo]
+
+
+def metricas():
+    with _lock:
+        datos = dict(_metricas)
+    datos["capacidad"] = _config('HASH_MAX_EN_COLA', 8)
+    datos["workers"] = _config('HASH_WORKERS', 2)
+    return datos
+
+
+# ============================================================
+# LIMITADOR DE INTENTOS (EN MEMORIA DEL PROCESO)
+# ============================================================
+class LimitadorIntentos:
+    """Ventana deslizante: como mucho `maximo` eventos por clave en `ventana` segundos."""
+
+    def __init__(self, maximo, ventana):
+        self.maximo = maximo
+        self.ventana = ventana
+        self._eventos = {}
+        self._lock = threading.Lock()
+        self._ultima_limpieza = time.monotonic()
+
+    def _purgar(self, ahora):
+        limite = ahora - self.ventana
+        for clave in [c for c, ev in self._eventos.items() if not ev or ev[-1] <= limite]:
+            del self._eventos[clave]
+        self._ultima_limpieza = ahora
+
+    def comprobar(self, clave):
+        """Lanza DemasiadosIntentos si la clave agotó su cupo."""
+        ahora = time.monotonic()
+        with self._lock:
+            eventos = self._eventos.get(clave)
+            if not eventos:
+                return
+            while eventos and eventos[0] <= ahora - self.ventana:
+                eventos.popleft()
+            if len(eventos) >= self.maximo:
+                raise DemasiadosIntentos(int(eventos[0] + self.ventana - ahora) + 1)
+
+    def registrar(self, clave):
+        ahora = time.monotonic()
+        with self._lock:
+            if ahora - self._ultima_limpieza > self.ventana:
+                self._purgar(ahora)
+            self._eventos.setdefault(clave, deque()).append(ahora)
+
+    def reiniciar(self, clave):
+        with self._lock:
+            self._eventos.pop(clave, None)
+
+
+# Todas las peticiones de auth por IP y los fallos por email
+limitador_ip = LimitadorIntentos(maximo=int(os.environ.get('AUTH_MAX_POR_IP', 30)), ventana=60)
+limitador_email = LimitadorIntentos(maximo=5, ventana=300)
+
+
+def admitir_intento(email, ip):
+    """Control previo al hash: no se gasta CPU en peticiones que se van a rechazar."""
+    limitador_ip.comprobar(ip)
+    limitador_ip.registrar(ip)
+    if email:
+        limitador_email.comprobar(email.strip().lower())
+
+
+def registrar_fallo(email):
+    limitador_email.registrar(email.strip().lower())
+
+
+def registrar_exito(email):
+    limitador_email.reiniciar(email.strip().lower())
@@ -0,0 +1,133 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+try:
+    import orjson
+except ImportError:  # opcional, ver requirements-opcional.txt
+    orjson = None
+
+# ============================================================
+# SERIALIZACIÓN DE LA API
+# ============================================================
+# Cada modelo declara su esquema público:
+#   campos_api   -> qué columnas se publican y en qué orden
+#   formatos_api -> conversión de las que no salen tal cual
+#                   (p. ej. hashes de media -> URL)
+#
+# Con eso se piden tuplas de columnas (sin hidratar objetos del ORM ni
+# pasar por el identity map) y los dicts se arman con un conversor por
+# columna calculado una sola vez. Las fechas no se convierten aquí: el
+# proveedor JSON de la app las escribe en ISO 8601.
+#
+# JSON_BACKEND: "auto" (orjson si está instalado), "orjson" o "stdlib".
+
+
+def valor_json(valor):
+    """Para JSON que no pasa por el proveedor de la app (cursores, exportación)."""
+    return valor.isoformat() if isinstance(valor, date) else valor
+
+
+def _tal_cual(valor):
+    return valor
+
+
+def conversores(modelo, nombres):
+    formatos = getattr(modelo, 'formatos_api', {})
+    return [formatos.get(nombre, _tal_cual) for nombre in nombres]
+
+
+def a_dicts(modelo, nombres, filas):
+    """Filas (tuplas en el orden de `nombres`) -> lista de dicts de la API.
+
+    Las columnas que sobren al final de cada fila se ignoran.
+    """
+    nombres = tuple(nombres)
+    convertir = conversores(modelo, nombres)
+    if all(c is _tal_cual for c in convertir):
+        return [dict(zip(nombres, fila)) for fila in filas]
+    return [
+        {nombre: conversor(valor) for nombre, conversor, valor in zip(nombres, convertir, fila)}
+        for fila in filas
+    ]
+
+
+def consulta(modelo, nombres=None):
+    """SELECT de las columnas públicas del modelo (o de `nombres`)."""
+    return select(*[getattr(modelo, nombre) for nombre in (nombres or modelo.campos_api)])
+
+
+def listar(session, modelo, *filtros, orden=(), nombres=None):
+    """Lista de dicts de la API con las filas de `modelo` que cumplen `filtros`."""
+    nombres = tuple(nombres or modelo.campos_api)
+    filas = session.execute(consulta(modelo, nombres).where(*filtros).order_by(*orden))
+    return a_dicts(modelo, nombres, filas)
+
+
+def uno(session, modelo, *filtros, nombres=None):
+    nombres = tuple(nombres or modelo.campos_api)
+    fila = session.execute(consulta(modelo, nombres).where(*filtros)).first()
+    return a_dicts(modelo, nombres, [fila])[0] if fila else None
+
+
+# ------------------ PROVEEDOR JSON ------------------
+
+def _por_defecto(valor):
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return DefaultJSONProvider.default(valor)
+
+
+class ProveedorJSON(DefaultJSONProvider):
+    """jsonify/request.get_json con orjson si está disponible.
+
+    Misma salida que el proveedor de Flask (claves ordenadas, compacta
+    salvo en debug) excepto fechas, que salen en ISO 8601 y no en formato
+    HTTP, y los caracteres no ASCII, que van en UTF-8 y no como \\uXXXX.
+    """
+
+    default = staticmethod(_por_defecto)
+
+    def __init__(self, app, backend="auto"):
+        super().__init__(app)
+        if backend not in ("auto", "orjson", "stdlib"):
+            raise ValueError(f"JSON_BACKEND desconocido: {backend}")
+        if backend == "orjson" and orjson is None:
+            raise RuntimeError("JSON_BACKEND=orjson pero orjson no está instalado")
+        self.backend = "orjson" if orjson is not None and backend != "stdlib" else "stdlib"
+
+    def _opciones(self, indentar=False):
+        opciones = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            opciones |= orjson.OPT_SORT_KEYS
+        if indentar:
+            opciones |= orjson.OPT_INDENT_2
+        return opciones
+
+    def dumps(self, obj, **kwargs):
+        # Con argumentos propios de json.dumps (indent, cls...) se usa la stdlib
+        if self.backend == "stdlib" or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._opciones()).decode()
+
+    def loads(self, s, **kwargs):
+        if self.backend == "stdlib" or kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if self.backend == "stdlib":
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indentar = (self.compact is None and self._app.debug) or self.compact is False
+        cuerpo = orjson.dumps(obj, default=self.default, option=self._opciones(indentar))
+        return self._app.response_class(cuerpo + b"\n", mimetype=self.mimetype)
+
+
+def instalar(app):
+    app.json = ProveedorJSON(app, app.config.get('JSON_BACKEND', 'auto'))
@@ -0,0 +1,210 @@
+from datetime import datetime
+
+from sqlalchemy import event, insert, literal, select, text
+from sqlalchemy.orm import Session
+
+from models import db, Mascota, Vacuna, Diagnostico, Receta, Prevencion, ContadorRevision, Eliminacion
+from paginacion import ParametroInvalido
+from serializacion import a_dicts
+
+# ============================================================
+# SINCRONIZACIÓN INCREMENTAL (OFFLINE-FIRST)
+# ============================================================
+# Cada transacción que toca mascotas o historial toma un número de
+# revisión global (contador_revision) y lo graba en las filas que
+# cambia. Los borrados dejan una lápida en `eliminacion` con la misma
+# revisión. El cliente guarda la última `rev` recibida y pide solo lo
+# posterior: GET /api/sync?user_id=&desde_rev= (más &cursor= si la
+# respuesta anterior lo trajo: una revisión con más de LIMITE_CAMBIOS
+# cambios se entrega por partes, en orden (tabla, id)).
+#
+# El UPDATE del contador bloquea su fila hasta el commit, así que las
+# revisiones se confirman en orden y ningún cliente se salta cambios.
+#
+# Al borrar una mascota su historial lo borra la base (ver borrado.py):
+# las lápidas de esas filas se insertan con INSERT ... SELECT, sin
+# cargarlas. Una mascota marcada como eliminada (modo diferido) deja su
+# lápida al marcarse y las de su historial a medida que se purga.
+
+SINCRONIZABLES = {
+    "mascotas": Mascota,
+    "vacunas": Vacuna,
+    "diagnosticos": Diagnostico,
+    "recetas": Receta,
+    "prevenciones": Prevencion,
+}
+
+LIMITE_CAMBIOS = 1000
+
+# Orden de las tablas dentro de una revisión entregada por partes
+ORDEN = list(SINCRONIZABLES) + ["eliminados"]
+
+
+def siguiente_revision(conn):
+    tabla = ContadorRevision.__table__
+    resultado = conn.execute(text(f"UPDATE {tabla.name} SET valor = valor + 1 WHERE id = 1"))
+    if resultado.rowcount == 0:
+        conn.execute(tabla.insert().values(id=1, valor=1))
+    return conn.execute(text(f"SELECT valor FROM {tabla.name} WHERE id = 1")).scalar()
+
+
+def revision_actual():
+    return db.session.execute(select(ContadorRevision.valor).where(ContadorRevision.id == 1)).scalar() or 0
+
+
+def _duenio(objeto):
+    if isinstance(objeto, Mascota):
+        return objeto.user_id
+    return objeto.mascota.user_id if objeto.mascota else None
+
+
+@event.listens_for(Session, "before_flush")
+def _marcar_revision(session, flush_context, instances):
+    modelos = tuple(SINCRONIZABLES.values())
+
+    cambiados = [o for o in session.new if isinstance(o, modelos)]
+    cambiados += [o for o in session.dirty if isinstance(o, modelos) and session.is_modified(o)]
+    eliminados = [o for o in session.deleted if isinstance(o, modelos)]
+    eliminados += [o for o in cambiados if isinstance(o, Mascota) and o.eliminada_en is not None]
+
+    if not cambiados and not eliminados:
+        return
+
+    rev = siguiente_revision(session.connection())
+    ahora = datetime.utcnow()
+
+    for objeto in cambiados:
+        objeto.rev = rev
+        objeto.actualizado_en = ahora
+
+    # El historial de las mascotas borradas va entero por lapidas_historial
+    mascotas = {o.id: o.user_id for o in session.deleted if isinstance(o, Mascota)}
+    for objeto in eliminados:
+        if getattr(objeto, "mascota_id", None) in mascotas:
+            continue
+        session.add(Eliminacion(
+            tabla=objeto.__tablename__,
+            registro_id=objeto.id,
+            user_id=_duenio(objeto),
+            rev=rev,
+            eliminado_en=ahora,
+        ))
+    for mascota_id, user_id in mascotas.items():
+        lapidas_historial(session.connection(), mascota_id, user_id, rev, ahora)
+
+
+def lapidas_historial(conn, mascota_id, user_id, rev, ahora, tramos=None):
+    """Lápidas del historial de la mascota, sin cargarlo. `tramos` limita a {modelo: ids}."""
+    for modelo in tramos or [m for m in SINCRONIZABLES.values() if m is not Mascota]:
+        filas = select(
+            literal(modelo.__tablename__), modelo.id, literal(user_id), literal(rev), literal(ahora),
+        ).where(modelo.mascota_id == mascota_id)
+        if tramos:
+            filas = filas.where(modelo.id.in_(tramos[modelo]))
+        conn.execute(insert(Eliminacion).from_select(
+            ["tabla", "registro_id", "user_id", "rev", "eliminado_en"], filas,
+        ))
+
+
+# ------------------ CONSULTA DE CAMBIOS ------------------
+
+def _columnas(modelo):
+    nombres = list(modelo.campos_api)
+    if modelo is not Mascota:
+        nombres.append("mascota_id")
+    nombres.append("rev")
+    return nombres
+
+
+def _consultas(user_id, desde_rev):
+    """(clave, columnas, select) por cada tabla, filtrado por dueño y revisión."""
+    consultas = []
+    for clave, modelo in SINCRONIZABLES.items():
+        columnas = _columnas(modelo)
+        consulta = select(*[getattr(modelo, c) for c in columnas]).where(modelo.rev > desde_rev)
+        if modelo is Mascota:
+            consulta = consulta.where(Mascota.user_id == user_id)
+        else:
+            consulta = consulta.join(Mascota, Mascota.id == modelo.mascota_id).where(Mascota.user_id == user_id)
+        consultas.append((clave, modelo, columnas, consulta))
+
+    consultas.append((
+        "eliminados",
+        Eliminacion,
+        ["tabla", "registro_id", "rev"],
+        select(Eliminacion.tabla, Eliminacion.registro_id, Eliminacion.rev)
+        .where(Eliminacion.user_id == user_id, Eliminacion.rev > desde_rev),
+    ))
+    return consultas
+
+
+def cambios_desde(user_id, desde_rev, limite=LIMITE_CAMBIOS, cursor=None):
+    """Devuelve (cambios, hasta_rev, hay_mas, cursor).
+
+    Si alguna tabla tiene más de `limite` cambios se corta en la última
+    revisión completa; el cliente repite con desde_rev=hasta_rev. Si la
+    revisión siguiente sola ya supera el límite (la 1 de la migración 5
+    trae todo lo anterior) se entrega por partes: hasta_rev queda en
+    desde_rev y `cursor` dice por dónde seguir dentro de esa revisión.
+    """
+    cursor = _leer_cursor(cursor) if cursor else None
+    rev_actual = revision_actual()
+    if desde_rev >= rev_actual:
+        return {}, rev_actual, False, None
+
+    consultas = _consultas(user_id, desde_rev)
+
+    # 1) Revisión de corte: la de la fila `limite`+1 de cada tabla
+    hasta_rev = rev_actual
+    if cursor is None:
+        for _, modelo, _, consulta in consultas:
+            corte = db.session.execute(
+                consulta.with_only_columns(modelo.rev).order_by(modelo.rev).offset(limite).limit(1)
+            ).scalar()
+            if corte is not None:
+                hasta_rev = min(hasta_rev, corte - 1)
+    if cursor is not None or hasta_rev <= desde_rev:
+        return _partes_de_revision(consultas, desde_rev, limite, cursor, rev_actual)
+
+    # 2) Todo lo comprendido en (desde_rev, hasta_rev]
+    cambios = {}
+    for clave, modelo, columnas, consulta in consultas:
+        filas = db.session.execute(consulta.where(modelo.rev <= hasta_rev).order_by(modelo.rev)).all()
+        if filas:
+            cambios[clave] = a_dicts(modelo, columnas, filas)
+
+    return cambios, hasta_rev, hasta_rev < rev_actual, None
+
+
+def _leer_cursor(texto):
+    """"tabla:id" -> (tabla, id). Lanza ParametroInvalido."""
+    tabla, _, id_ = texto.partition(":")
+    if tabla not in ORDEN or not id_.isdigit():
+        raise ParametroInvalido("cursor no válido")
+    return tabla, int(id_)
+
+
+def _partes_de_revision(consultas, desde_rev, limite, cursor, rev_actual):
+    """Hasta `limite` cambios de la revisión desde_rev+1, en orden (tabla, id)."""
+    rev = desde_rev + 1
+    ultimo = cursor or (ORDEN[0], 0)  # (tabla, id) del último cambio entregado
+    cambios = {}
+    restantes = limite
+    for clave, modelo, columnas, consulta in consultas:
+        if ORDEN.index(clave) < ORDEN.index(ultimo[0]):
+            continue
+        # El id va al final de cada fila: a_dicts lo ignora
+        consulta = consulta.add_columns(modelo.id).where(modelo.rev == rev)
+        if clave == ultimo[0]:
+            consulta = consulta.where(modelo.id > ultimo[1])
+        filas = db.session.execute(consulta.order_by(modelo.id).limit(restantes + 1)).all()
+        lleno = len(filas) > restantes
+        filas = filas[:restantes]
+        if filas:
+            cambios[clave] = a_dicts(modelo, columnas, filas)
+            ultimo = (clave, filas[-1][-1])
+        if lleno:
+            return cambios, desde_rev, True, f"{ultimo[0]}:{ultimo[1]}"
+        restantes -= len(filas)
+
+    return cambios, rev, rev < rev_actual, None
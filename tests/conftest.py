@@ -0,0 +1,142 @@
+"""Fixtures comunes: la app sobre una base SQLite temporal, migrada una vez.
+
+Uso (desde la raíz del repo):
+    python -m pytest -q
+
+La app lee la configuración al importarse, así que el entorno se fija
+aquí antes de importarla. Cada prueba empieza con una copia de la base
+recién migrada. La caché de respuestas queda apagada: los ids se repiten
+de una prueba a otra. La réplica de lectura está configurada pero su
+archivo solo existe mientras una prueba lo crea (fixture `replica`); sin
+él las lecturas van a la primaria.
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+_CARPETA = tempfile.mkdtemp(prefix="vacunapet-pruebas-")
+PRIMARIA = os.path.join(_CARPETA, "primaria.db")
+PLANTILLA = os.path.join(_CARPETA, "plantilla.db")
+REPLICA = os.path.join(_CARPETA, "replica.db")
+
+os.environ['DATABASE_URL'] = "sqlite:///" + PRIMARIA
+os.environ['DATABASE_REPLICA_URLS'] = f"sqlite:///file:{REPLICA}?mode=ro&uri=true"
+os.environ['REPLICA_VERIFICAR_CADA_S'] = "0"
+os.environ['MEDIA_FOLDER'] = os.path.join(_CARPETA, "media")
+os.environ['CACHE_BACKEND'] = "ninguno"
+os.environ['TOKEN_SECRET'] = "secreto-de-pruebas"
+os.environ['HASH_WORKERS'] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as _app  # noqa: E402
+from models import db  # noqa: E402
+import migraciones  # noqa: E402
+import replicas  # noqa: E402
+import seguridad  # noqa: E402
+
+# Hashes baratos: cada prueba registra usuarios
+_app.config['HASH_METODO'] = "pbkdf2:sha256:1000"
+
+
+def copiar(origen, destino):
+    fuente, copia = sqlite3.connect(origen), sqlite3.connect(destino)
+    fuente.backup(copia)
+    copia.close()
+    fuente.close()
+
+
+def _quitar(ruta):
+    for sufijo in ("", "-wal", "-shm"):
+        try:
+            os.remove(ruta + sufijo)
+        except FileNotFoundError:
+            pass
+
+
+def _cerrar_conexiones():
+    with _app.app_context():
+        for motor in [db.engine, *replicas.motores()]:
+            motor.dispose()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _plantilla():
+    with _app.app_context():
+        migraciones.aplicar(db.engine, log=lambda _: None)
+    _cerrar_conexiones()
+    copiar(PRIMARIA, PLANTILLA)
+    yield
+    _cerrar_conexiones()
+    shutil.rmtree(_CARPETA, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def _base_limpia(_plantilla):
+    _cerrar_conexiones()
+    _quitar(PRIMARIA)
+    _quitar(REPLICA)
+    shutil.copy(PLANTILLA, PRIMARIA)
+    replicas._fijados.clear()
+    # Los limitadores de intentos viven en memoria del proceso
+    for limitador in (seguridad.limitador_ip, seguridad.limitador_email):
+        limitador._eventos.clear()
+    yield
+    _cerrar_conexiones()
+
+
+@pytest.fixture
+def app():
+    return _app
+
+
+@pytest.fixture
+def contexto(app):
+    with app.app_context():
+        yield
+
+
+@pytest.fixture
+def cliente(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def clinica(app, monkeypatch):
+    """Emails con scope "clinica" en los tokens que se emitan desde ahora."""
+    emails = []
+    monkeypatch.setitem(app.config, "CLINICA_EMAILS", emails)
+    return emails
+
+
+@pytest.fixture
+def registrar(cliente):
+    """registrar(email) -> (user_id, cabeceras con su token de acceso)."""
+    def registrar(email="duenio@example.com"):
+        r = cliente.post('/api/register', json={"nombre": "Ana", "email": email, "password": "clave-segura-1"})
+        assert r.status_code == 201, r.json
+        return r.json["user_id"], {"Authorization": f"Bearer {r.json['access_token']}"}
+    return registrar
+
+
+@pytest.fixture
+def nueva_mascota(cliente):
+    def nueva_mascota(cabeceras, nombre="Firulais", especie="perro", raza="mestiza", **extra):
+        r = cliente.post('/api/mascotas', headers=cabeceras,
+                         json={"nombre": nombre, "especie": especie, "raza": raza, **extra})
+        assert r.status_code == 201, r.json
+        return r.json["id"]
+    return nueva_mascota
+
+
+@pytest.fixture
+def replica():
+    """Copia la primaria a la réplica; llamar de nuevo para "replicar" más tarde."""
+    def replicar():
+        _cerrar_conexiones()
+        copiar(PRIMARIA, REPLICA)
+    replicar()
+    return replicar
@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+import pytest
+
+from asgi import PuenteASGI
+
+
+def _pedir(puente, metodo, ruta, cuerpo=b"", cabeceras=(), trozo=7, cortar=False):
+    """Hace una petición ASGI partiendo el cuerpo en trozos; devuelve (estado, cabeceras, [bloques]).
+
+    Con `cortar` el cliente se desconecta tras el primer trozo.
+    """
+    trozos = [cuerpo[i:i + trozo] for i in range(0, len(cuerpo), trozo)] or [b""]
+    mensajes = [{"type": "http.request", "body": t, "more_body": i < len(trozos) - 1} for i, t in enumerate(trozos)]
+    if cortar:
+        mensajes = [dict(mensajes[0], more_body=True)]
+    enviados = []
+
+    async def receive():
+        return mensajes.pop(0) if mensajes else {"type": "http.disconnect"}
+
+    async def send(mensaje):
+        enviados.append(mensaje)
+
+    scope = {
+        "type": "http", "http_version": "1.1", "method": metodo, "path": ruta, "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in cabeceras],
+        "client": ("127.0.0.1", 5000), "server": ("localhost", 8000),
+    }
+    asyncio.run(puente(scope, receive, send))
+    if not enviados:
+        return None, {}, []
+    inicio, cuerpos = enviados[0], enviados[1:]
+    assert cuerpos[-1].get("more_body", False) is False
+    return inicio["status"], dict(inicio["headers"]), [m["body"] for m in cuerpos]
+
+
+@pytest.fixture
+def puente(app):
+    puente = PuenteASGI(app, hilos=2, cuerpo_en_memoria=16, respuesta_en_memoria=64, max_cuerpo=4096)
+    yield puente
+    puente.hilos.shutdown(wait=True)
+
+
+def test_sirve_la_app_con_el_cuerpo_por_partes(puente):
+    cuerpo = json.dumps({"nombre": "Ana", "email": "a@example.com", "password": "clave-segura-1"}).encode()
+    estado, cabeceras, bloques = _pedir(puente, "POST", "/api/register", cuerpo,
+                                        [("Content-Type", "application/json")])
+    assert estado == 201
+    assert cabeceras[b"content-type"] == b"application/json"
+    assert json.loads(b"".join(bloques))["success"] is True
+
+
+def test_cuerpo_demasiado_grande_da_413_sin_llamar_a_la_app():
+    llamadas = []
+    puente = PuenteASGI(lambda *a: llamadas.append(a), hilos=1, max_cuerpo=10)
+    try:
+        assert _pedir(puente, "POST", "/api/import", b"x" * 11)[0] == 413
+        assert _pedir(puente, "POST", "/api/import", b"x", [("Content-Length", "11")])[0] == 413
+    finally:
+        puente.hilos.shutdown(wait=True)
+    assert llamadas == []
+
+
+def test_cliente_que_se_va_durante_la_subida_no_llega_a_la_app():
+    llamadas = []
+    puente = PuenteASGI(lambda *a: llamadas.append(a), hilos=1)
+    try:
+        assert _pedir(puente, "POST", "/api/import", b"x" * 20, cortar=True) == (None, {}, [])
+    finally:
+        puente.hilos.shutdown(wait=True)
+    assert llamadas == []
+
+
+def test_la_exportacion_llega_en_streaming(app, cliente, registrar, nueva_mascota, puente):
+    user_id, cabeceras = registrar()
+    for i in range(3):
+        nueva_mascota(cabeceras, nombre=f"M{i}")
+    ruta = f'/api/usuarios/{user_id}/export'
+    esperado = cliente.get(ruta, headers=cabeceras).get_data()
+
+    estado, _, bloques = _pedir(puente, "GET", ruta, cabeceras=list(cabeceras.items()))
+    assert estado == 200
+    assert b"".join(bloques) == esperado
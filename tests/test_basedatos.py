@@ -0,0 +1,82 @@
+import base64
+import io
+
+import pytest
+from flask import Flask
+from PIL import Image
+from sqlalchemy import event, text
+
+import basedatos
+import imagenes
+from models import db
+
+
+def _png():
+    salida = io.BytesIO()
+    Image.new("RGB", (40, 30), "orange").save(salida, format="PNG")
+    return salida.getvalue()
+
+
+def test_sqlite_en_wal_con_espera_por_el_lock(app, contexto):
+    with db.engine.connect() as conn:
+        pragmas = [conn.execute(text(f"PRAGMA {p}")).scalar() for p in ("journal_mode", "synchronous", "busy_timeout")]
+    assert pragmas == ["wal", 1, app.config["SQLITE_BUSY_TIMEOUT_MS"]]
+
+
+@pytest.mark.parametrize("metodo,ruta,inmediato", [
+    ("POST", "/api/mascotas", True),
+    ("DELETE", "/api/vacunas/1", True),
+    ("GET", "/api/mascotas", False),
+    ("POST", "/api/login", False),
+    ("POST", "/api/register", False),
+])
+def test_begin_immediate_solo_en_escrituras_rapidas(app, metodo, ruta, inmediato):
+    with app.test_request_context(ruta, method=metodo):
+        assert basedatos._escribe() is inmediato
+
+
+@pytest.mark.parametrize("url,esperada", [
+    (None, "sqlite:///vacunapet.db"),
+    ("postgres://u:c@host/base", "postgresql+psycopg://u:c@host/base"),
+    ("postgresql://u:c@host/base", "postgresql+psycopg://u:c@host/base"),
+])
+def test_url_desde_entorno(monkeypatch, url, esperada):
+    if url is None:
+        monkeypatch.delenv("DATABASE_URL", raising=False)
+    else:
+        monkeypatch.setenv("DATABASE_URL", url)
+    assert basedatos.url_desde_entorno() == esperada
+
+
+def test_postgres_usa_pool_con_pre_ping(monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgres://u:c@host/base")
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    otra = Flask(__name__)
+    basedatos.configurar(otra)
+    opciones = otra.config["SQLALCHEMY_ENGINE_OPTIONS"]
+    assert (opciones["pool_size"], opciones["pool_pre_ping"]) == (3, True)
+    assert "statement_timeout=30000" in opciones["connect_args"]["options"]
+
+
+def test_la_foto_se_procesa_antes_de_abrir_la_transaccion(app, cliente, registrar, nueva_mascota, monkeypatch):
+    _, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras)
+    eventos = []
+    procesar = imagenes.procesar_foto
+    monkeypatch.setattr(imagenes, "procesar_foto", lambda datos: eventos.append("foto") or procesar(datos))
+    foto = "data:image/png;base64," + base64.b64encode(_png()).decode()
+
+    def escuchar(*_):
+        eventos.append("sql")
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", escuchar)
+        try:
+            for metodo, ruta in (("POST", '/api/mascotas'), ("PUT", f'/api/mascotas/{mascota_id}')):
+                eventos.clear()
+                r = cliente.open(ruta, method=metodo, headers=cabeceras,
+                                 json={"nombre": "Rex", "especie": "perro", "raza": "x", "foto": foto})
+                assert r.status_code in (200, 201), r.json
+                assert eventos[0] == "foto"
+        finally:
+            event.remove(db.engine, "before_cursor_execute", escuchar)
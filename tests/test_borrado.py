@@ -0,0 +1,92 @@
+import pytest
+from sqlalchemy import func, select
+
+import borrado
+from models import db, Mascota, Vacuna, Diagnostico, Eliminacion
+
+CHIP = "985112000123456"
+
+
+@pytest.fixture
+def diferido(app, monkeypatch):
+    monkeypatch.setitem(app.config, "MASCOTAS_BORRADO_DIFERIDO", True)
+
+
+@pytest.fixture
+def con_historial(cliente, registrar, nueva_mascota):
+    """Dueño con una mascota (con microchip) que tiene 2 vacunas y 5 diagnósticos."""
+    user_id, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras, microchip=CHIP)
+    for nombre in ("rabia", "moquillo"):
+        cliente.post('/api/vacunas', headers=cabeceras,
+                     json={"mascota_id": mascota_id, "nombre": nombre, "fecha_aplicacion": "2024-01-10"})
+    items = [{"titulo": f"control {i}", "fecha": "2024-03-01"} for i in range(5)]
+    cliente.post(f'/api/mascotas/{mascota_id}/diagnosticos:batch', headers=cabeceras, json={"items": items})
+    return user_id, cabeceras, mascota_id
+
+
+def _filas(modelo, mascota_id):
+    columna = modelo.id if modelo is Mascota else modelo.mascota_id
+    return db.session.execute(
+        select(func.count()).select_from(modelo).where(columna == mascota_id)
+        .execution_options(incluir_eliminadas=True)
+    ).scalar()
+
+
+def test_borrado_inmediato_se_lleva_el_historial(app, cliente, con_historial):
+    _, cabeceras, mascota_id = con_historial
+    assert cliente.delete(f'/api/mascotas/{mascota_id}', headers=cabeceras).status_code == 200
+
+    with app.app_context():
+        assert [_filas(m, mascota_id) for m in (Mascota, Vacuna, Diagnostico)] == [0, 0, 0]
+    assert cliente.get(f'/api/mascotas/{mascota_id}/historial', headers=cabeceras).status_code == 404
+
+
+def test_marcada_no_aparece_en_ninguna_consulta(app, cliente, nueva_mascota, con_historial, diferido):
+    _, cabeceras, mascota_id = con_historial
+    assert cliente.delete(f'/api/mascotas/{mascota_id}', headers=cabeceras).status_code == 200
+
+    # Sigue en la base hasta que pase el purgador...
+    with app.app_context():
+        assert [_filas(m, mascota_id) for m in (Mascota, Vacuna, Diagnostico)] == [1, 2, 5]
+    # ...pero no en la API
+    assert cliente.get('/api/mascotas', headers=cabeceras).json["mascotas"] == []
+    assert cliente.get(f'/api/mascotas/{mascota_id}/historial', headers=cabeceras).status_code == 404
+    assert cliente.get(f'/api/mascotas/{mascota_id}/vacunas', headers=cabeceras).json["vacunas"] == []
+    assert cliente.put(f'/api/mascotas/{mascota_id}', headers=cabeceras, json={"nombre": "x"}).status_code == 404
+    assert cliente.delete(f'/api/mascotas/{mascota_id}', headers=cabeceras).status_code == 404
+    r = cliente.post('/api/vacunas', headers=cabeceras,
+                     json={"mascota_id": mascota_id, "nombre": "rabia", "fecha_aplicacion": "2024-05-01"})
+    assert r.status_code == 404
+    # El microchip queda libre al marcarla
+    nueva_mascota(cabeceras, nombre="Otra", microchip=CHIP)
+
+
+def test_marcada_deja_su_lapida_al_instante(cliente, con_historial, diferido):
+    _, cabeceras, mascota_id = con_historial
+    rev = cliente.get('/api/sync', headers=cabeceras).json["rev"]
+    cliente.delete(f'/api/mascotas/{mascota_id}', headers=cabeceras)
+    eliminados = cliente.get('/api/sync', headers=cabeceras, query_string={"desde_rev": rev}).json["cambios"]["eliminados"]
+    assert [(e["tabla"], e["registro_id"]) for e in eliminados] == [("mascota", mascota_id)]
+
+
+def test_purgador_borra_por_tramos(app, cliente, nueva_mascota, con_historial, diferido):
+    _, cabeceras, mascota_id = con_historial
+    otra = nueva_mascota(cabeceras, nombre="Se queda")
+    cliente.delete(f'/api/mascotas/{mascota_id}', headers=cabeceras)
+
+    with app.app_context():
+        # Con `maximo` corta a mitad y la siguiente llamada sigue donde quedó
+        assert borrado.purgar(lote=2, maximo=3) == (0, 4)
+        assert _filas(Vacuna, mascota_id) + _filas(Diagnostico, mascota_id) == 3
+        assert borrado.purgar(lote=2) == (1, 3)
+        assert [_filas(m, mascota_id) for m in (Mascota, Vacuna, Diagnostico)] == [0, 0, 0]
+        assert _filas(Mascota, otra) == 1
+        assert borrado.purgar() == (0, 0)
+
+        lapidas = db.session.execute(
+            select(Eliminacion.tabla, func.count()).where(Eliminacion.user_id.isnot(None))
+            .group_by(Eliminacion.tabla).order_by(Eliminacion.tabla)
+        ).all()
+    assert lapidas == [("diagnostico", 5), ("mascota", 1), ("vacuna", 2)]
+    assert [m["id"] for m in cliente.get('/api/mascotas', headers=cabeceras).json["mascotas"]] == [otra]
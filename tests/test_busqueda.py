@@ -0,0 +1,83 @@
+def _buscar(cliente, cabeceras, q, estado=200, **params):
+    r = cliente.get('/api/buscar', headers=cabeceras, query_string={"q": q, **params})
+    assert r.status_code == estado, r.json
+    return r.json
+
+
+def _encontrados(cliente, cabeceras, q, **params):
+    return [(x["tabla"], x["id"]) for x in _buscar(cliente, cabeceras, q, **params)["resultados"]]
+
+
+def _diagnostico(cliente, cabeceras, mascota_id, titulo, descripcion=""):
+    r = cliente.post('/api/diagnosticos', headers=cabeceras, json={
+        "mascota_id": mascota_id, "titulo": titulo, "descripcion": descripcion, "fecha": "2024-03-01"})
+    assert r.status_code == 201, r.json
+    return r.json["id"]
+
+
+def test_prefijos_sin_tildes_ni_mayusculas(cliente, registrar, nueva_mascota):
+    _, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras, nombre="Ñandú")
+    diagnostico_id = _diagnostico(cliente, cabeceras, mascota_id, "Dermatitis atópica", "Picazón en el lomo")
+
+    assert _encontrados(cliente, cabeceras, "derma") == [("diagnostico", diagnostico_id)]
+    assert _encontrados(cliente, cabeceras, "ATOPI picazon") == [("diagnostico", diagnostico_id)]
+    assert _encontrados(cliente, cabeceras, "nandu") == [("mascota", mascota_id)]
+    assert _encontrados(cliente, cabeceras, "derma otitis") == []
+
+    resultado = _buscar(cliente, cabeceras, "derma")["resultados"][0]
+    assert resultado["titulo"] == "«Dermatitis» atópica"
+    assert resultado["mascota"] == "Ñandú"
+
+
+def test_solo_busca_en_lo_del_duenio(cliente, registrar, nueva_mascota, clinica):
+    clinica.append("vet@example.com")
+    _, cabeceras = registrar()
+    _, otro = registrar("otro@example.com")
+    _, vet = registrar("vet@example.com")
+    mia = nueva_mascota(cabeceras, nombre="Firulais")
+    ajena = nueva_mascota(otro, nombre="Firulete")
+
+    assert _encontrados(cliente, cabeceras, "firul") == [("mascota", mia)]
+    assert sorted(_encontrados(cliente, vet, "firul")) == [("mascota", mia), ("mascota", ajena)]
+
+
+def test_el_indice_sigue_a_las_escrituras(cliente, registrar, nueva_mascota):
+    _, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras)
+    diagnostico_id = _diagnostico(cliente, cabeceras, mascota_id, "Otitis")
+
+    cliente.put(f'/api/diagnosticos/{diagnostico_id}', headers=cabeceras, json={"titulo": "Gastritis"})
+    assert _encontrados(cliente, cabeceras, "otitis") == []
+    assert _encontrados(cliente, cabeceras, "gastr") == [("diagnostico", diagnostico_id)]
+
+    # Altas masivas por Core
+    r = cliente.post(f'/api/mascotas/{mascota_id}/recetas:batch', headers=cabeceras, json={"items": [
+        {"medicamento": "Amoxicilina", "dosis": "250 mg", "fecha": "2024-03-01"}]})
+    receta_id = r.json["resultados"][0]["id"]
+    assert _encontrados(cliente, cabeceras, "amoxi") == [("receta", receta_id)]
+
+    cliente.delete(f'/api/diagnosticos/{diagnostico_id}', headers=cabeceras)
+    assert _encontrados(cliente, cabeceras, "gastr") == []
+
+
+def test_filtro_por_tabla_y_cursor(cliente, registrar, nueva_mascota):
+    _, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras, nombre="Control")
+    ids = {_diagnostico(cliente, cabeceras, mascota_id, f"Control {i}") for i in range(5)}
+
+    vistos, cursor = [], "0"
+    while cursor:
+        pagina = _buscar(cliente, cabeceras, "control", en="diagnosticos", limite=2, cursor=cursor)
+        vistos += [x["id"] for x in pagina["resultados"]]
+        cursor = pagina["next_cursor"]
+    assert sorted(vistos) == sorted(ids)
+
+
+def test_parametros_invalidos_dan_400(cliente, registrar):
+    _, cabeceras = registrar()
+    _buscar(cliente, cabeceras, "  ", 400)
+    _buscar(cliente, cabeceras, "x", 400, en="vacunas")
+    _buscar(cliente, cabeceras, "x", 400, cursor="-1")
+    # La sintaxis de FTS5 en la consulta se toma como texto
+    assert _buscar(cliente, cabeceras, 'a" OR duenio:u1 NEAR(')["resultados"] == []
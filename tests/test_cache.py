@@ -0,0 +1,78 @@
+import pytest
+
+import cache
+
+
+@pytest.fixture
+def con_cache(app, monkeypatch, tmp_path):
+    """usar(tipo) enciende la caché con un backend nuevo (lo crea el primer pedido)."""
+    def usar(tipo="memoria"):
+        monkeypatch.setitem(app.config, "CACHE_BACKEND", tipo)
+        monkeypatch.setitem(app.config, "CACHE_SQLITE_RUTA", str(tmp_path / "cache.db"))
+        monkeypatch.setitem(app.extensions, "vacunapet_cache", None)
+    return usar
+
+
+def _mascotas(cliente, cabeceras):
+    r = cliente.get('/api/mascotas', headers=cabeceras)
+    assert r.status_code == 200
+    return r.headers.get("X-Cache"), [m["nombre"] for m in r.json["mascotas"]]
+
+
+@pytest.mark.parametrize("tipo", ["memoria", "sqlite"])
+def test_una_escritura_invalida_las_lecturas_del_duenio(cliente, registrar, nueva_mascota, con_cache, tipo):
+    con_cache(tipo)
+    _, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras, nombre="Rex")
+
+    assert _mascotas(cliente, cabeceras) == ("MISS", ["Rex"])
+    assert _mascotas(cliente, cabeceras) == ("HIT", ["Rex"])
+
+    nueva_mascota(cabeceras, nombre="Toby")
+    assert _mascotas(cliente, cabeceras) == ("MISS", ["Rex", "Toby"])
+
+    cliente.put(f'/api/mascotas/{mascota_id}', headers=cabeceras, json={"nombre": "Rey"})
+    assert _mascotas(cliente, cabeceras) == ("MISS", ["Rey", "Toby"])
+
+
+def test_el_historial_se_invalida_por_mascota(cliente, registrar, nueva_mascota, con_cache):
+    con_cache()
+    _, cabeceras = registrar()
+    mascota_id, otra = nueva_mascota(cabeceras), nueva_mascota(cabeceras, nombre="Toby")
+    urls = [f'/api/mascotas/{m}/vacunas' for m in (mascota_id, otra)]
+    for url in urls:
+        cliente.get(url, headers=cabeceras)
+
+    r = cliente.post('/api/vacunas', headers=cabeceras,
+                     json={"mascota_id": mascota_id, "nombre": "rabia", "fecha_aplicacion": "2024-01-10"})
+    vacuna_id = r.json["id"]
+    r = cliente.get(urls[0], headers=cabeceras)
+    assert (r.headers["X-Cache"], len(r.json["vacunas"])) == ("MISS", 1)
+    assert cliente.get(urls[1], headers=cabeceras).headers["X-Cache"] == "HIT"
+
+    cliente.delete(f'/api/vacunas/{vacuna_id}', headers=cabeceras)
+    assert cliente.get(urls[0], headers=cabeceras).json["vacunas"] == []
+
+
+def test_no_comparte_respuestas_entre_usuarios(cliente, registrar, nueva_mascota, con_cache):
+    con_cache()
+    _, cabeceras = registrar()
+    _, otro = registrar("otro@example.com")
+    nueva_mascota(cabeceras)
+    _mascotas(cliente, cabeceras)
+    assert _mascotas(cliente, otro) == ("MISS", [])
+
+
+def test_sqlite_ve_las_invalidaciones_de_otro_worker(app, cliente, registrar, nueva_mascota, con_cache):
+    con_cache("sqlite")
+    _, cabeceras = registrar()
+    nueva_mascota(cabeceras, nombre="Rex")
+    _mascotas(cliente, cabeceras)
+    este = app.extensions["vacunapet_cache"]
+
+    # Otro proceso con su propia conexión al mismo archivo escribe e invalida
+    app.extensions["vacunapet_cache"] = cache.CacheSqlite(app.config["CACHE_SQLITE_RUTA"])
+    nueva_mascota(cabeceras, nombre="Toby")
+
+    app.extensions["vacunapet_cache"] = este
+    assert _mascotas(cliente, cabeceras) == ("MISS", ["Rex", "Toby"])
@@ -0,0 +1,89 @@
+from datetime import date, timedelta
+
+import pytest
+
+import calendario
+from models import db, Vacuna
+
+HOY = date.today()
+
+
+def _dias(n):
+    return (HOY + timedelta(days=n)).isoformat()
+
+
+@pytest.fixture
+def perro(cliente, registrar, nueva_mascota):
+    user_id, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras, user_id=user_id)
+
+    def vacunar(nombre, fecha, mascota=mascota_id):
+        r = cliente.post('/api/vacunas', headers=cabeceras,
+                         json={"mascota_id": mascota, "nombre": nombre, "fecha_aplicacion": fecha})
+        assert r.status_code == 201, r.json
+        return r.json["id"]
+
+    return user_id, cabeceras, mascota_id, vacunar
+
+
+def _proximas(app, mascota_id):
+    with app.app_context():
+        return {v.id: v.proxima_dosis for v in Vacuna.query.filter_by(mascota_id=mascota_id)}
+
+
+def test_solo_la_ultima_aplicacion_tiene_proxima_dosis(app, cliente, perro):
+    _, cabeceras, mascota_id, vacunar = perro
+    vieja = vacunar("Antirrábica", "2023-01-10")
+    nueva = vacunar("antirrabica ", "2024-01-10")
+    otra = vacunar("Moquillo", "2023-06-01")
+    assert _proximas(app, mascota_id) == {vieja: None, nueva: date(2025, 1, 9), otra: date(2024, 5, 31)}
+
+    # Borrar la última le devuelve la próxima dosis a la anterior
+    assert cliente.delete(f'/api/vacunas/{nueva}', headers=cabeceras).status_code == 200
+    assert _proximas(app, mascota_id) == {vieja: date(2024, 1, 10), otra: date(2024, 5, 31)}
+
+
+def test_intervalos_por_especie_y_configuracion(app, cliente, perro, monkeypatch):
+    _, cabeceras, mascota_id, vacunar = perro
+    monkeypatch.setitem(app.config, "INTERVALOS_REFUERZO", {"perro": {"Rabia": 180}})
+    monkeypatch.setitem(app.config, "INTERVALO_REFUERZO_POR_DEFECTO", None)
+    rabia = vacunar("rabia", "2024-01-01")
+    moquillo = vacunar("moquillo", "2024-01-01")
+    desconocida = vacunar("inventada", "2024-01-01")
+    assert _proximas(app, mascota_id) == {rabia: date(2024, 6, 29), moquillo: date(2024, 12, 31), desconocida: None}
+
+    # Moquillo no tiene intervalo para gatos: cambiar la especie recalcula
+    cliente.put(f'/api/mascotas/{mascota_id}', headers=cabeceras, json={"especie": "Gato"})
+    assert _proximas(app, mascota_id)[moquillo] is None
+
+
+def test_recalcular_todo_por_lotes(app, perro, nueva_mascota):
+    user_id, cabeceras, mascota_id, vacunar = perro
+    otra = nueva_mascota(cabeceras, nombre="Toby", user_id=user_id)
+    for fecha in ("2022-01-01", "2023-01-01", "2024-01-01"):
+        vacunar("rabia", fecha)
+        vacunar("rabia", fecha, mascota=otra)
+    esperado = {m: _proximas(app, m) for m in (mascota_id, otra)}
+
+    with app.app_context():
+        db.session.execute(db.update(Vacuna).values(proxima_dosis=date(2000, 1, 1)))
+        calendario.recalcular_todo(db.session.connection(), lote=2)
+        db.session.commit()
+    assert {m: _proximas(app, m) for m in (mascota_id, otra)} == esperado
+
+
+def test_pendientes_del_usuario_incluye_las_vencidas(cliente, perro):
+    user_id, cabeceras, _, vacunar = perro
+    vacunar("rabia", _dias(-360))     # vence en 5 días
+    vacunar("moquillo", _dias(-400))  # vencida
+    vacunar("parvovirus", _dias(-10))  # falta casi un año
+
+    r = cliente.get(f'/api/usuarios/{user_id}/pendientes', headers=cabeceras, query_string={"dias": 30})
+    assert r.status_code == 200
+    assert [(p["nombre"], p["proxima_dosis"], p["vencida"]) for p in r.json["pendientes"]] == [
+        ("moquillo", _dias(-35), True),
+        ("rabia", _dias(5), False),
+    ]
+    assert r.json["pendientes"][0]["mascota"] == "Firulais"
+    assert cliente.get(f'/api/usuarios/{user_id}/pendientes', headers=cabeceras,
+                       query_string={"dias": "x"}).status_code == 400
@@ -0,0 +1,76 @@
+import pytest
+
+
+@pytest.fixture
+def ficha(cliente, registrar, nueva_mascota):
+    _, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras)
+    cliente.post('/api/vacunas', headers=cabeceras,
+                 json={"mascota_id": mascota_id, "nombre": "rabia", "fecha_aplicacion": "2024-01-10"})
+    return mascota_id, cabeceras
+
+
+def _get(cliente, url, cabeceras, etag=None, **params):
+    extra = {"If-None-Match": etag} if etag else {}
+    return cliente.get(url, headers={**cabeceras, **extra}, query_string=params)
+
+
+def test_sin_cambios_responde_304_sin_cuerpo(cliente, ficha):
+    mascota_id, cabeceras = ficha
+    for url in ('/api/mascotas', f'/api/mascotas/{mascota_id}/historial', f'/api/mascotas/{mascota_id}/vacunas'):
+        r = _get(cliente, url, cabeceras)
+        assert r.status_code == 200
+        assert r.headers["ETag"].startswith('W/"')
+        assert {"private", "no-cache"} <= {p.strip() for p in r.headers["Cache-Control"].split(",")}
+
+        r = _get(cliente, url, cabeceras, r.headers["ETag"])
+        assert r.status_code == 304
+        assert r.data == b""
+
+
+@pytest.mark.parametrize("escribir", [
+    lambda c, m, h: c.post('/api/vacunas', headers=h, json={"mascota_id": m, "nombre": "moquillo", "fecha_aplicacion": "2024-02-01"}),
+    lambda c, m, h: c.put(f'/api/mascotas/{m}', headers=h, json={"peso": 12.5}),
+    lambda c, m, h: c.delete('/api/vacunas/1', headers=h),
+])
+def test_cualquier_escritura_cambia_el_etag(cliente, ficha, escribir):
+    mascota_id, cabeceras = ficha
+    url = f'/api/mascotas/{mascota_id}/historial'
+    etag = _get(cliente, url, cabeceras).headers["ETag"]
+
+    assert escribir(cliente, mascota_id, cabeceras).status_code in (200, 201)
+    r = _get(cliente, url, cabeceras, etag)
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+
+
+def test_la_lista_cambia_al_borrar_una_mascota(cliente, ficha, nueva_mascota):
+    mascota_id, cabeceras = ficha
+    nueva_mascota(cabeceras, nombre="Toby")
+    etag = _get(cliente, '/api/mascotas', cabeceras).headers["ETag"]
+    cliente.delete(f'/api/mascotas/{mascota_id}', headers=cabeceras)
+    assert _get(cliente, '/api/mascotas', cabeceras, etag).status_code == 200
+
+
+def test_el_etag_depende_de_la_pagina_y_del_usuario(cliente, ficha, registrar):
+    _, cabeceras = ficha
+    etag = _get(cliente, '/api/mascotas', cabeceras).headers["ETag"]
+    assert _get(cliente, '/api/mascotas', cabeceras, etag, campos="nombre").status_code == 200
+    _, otro = registrar("otro@example.com")
+    assert _get(cliente, '/api/mascotas', otro, etag).status_code == 200
+
+
+def test_if_modified_since(cliente, ficha):
+    mascota_id, cabeceras = ficha
+    url = f'/api/mascotas/{mascota_id}/vacunas'
+    ultima = _get(cliente, url, cabeceras).headers["Last-Modified"]
+    r = cliente.get(url, headers={**cabeceras, "If-Modified-Since": ultima})
+    assert r.status_code == 304
+
+
+def test_mascota_ajena_o_inexistente_no_lleva_validadores(cliente, ficha, registrar):
+    mascota_id, _ = ficha
+    _, otro = registrar("otro@example.com")
+    r = _get(cliente, f'/api/mascotas/{mascota_id}/historial', otro)
+    assert r.status_code == 404
+    assert "ETag" not in r.headers
@@ -0,0 +1,149 @@
+import io
+import json
+from datetime import date
+
+import pytest
+from sqlalchemy import event, select
+
+import borrado
+import estadisticas
+import exportacion
+from models import db, Estadistica
+
+
+def _agregados():
+    return sorted(tuple(f) for f in db.session.execute(
+        select(Estadistica.metrica, Estadistica.periodo, Estadistica.especie, Estadistica.raza,
+               Estadistica.clave, Estadistica.valor).where(Estadistica.valor != 0)
+    ))
+
+
+@pytest.fixture
+def consistente(app):
+    """consistente() compara la tabla mantenida con una reconstruida desde cero."""
+    def consistente():
+        with app.app_context():
+            mantenida = _agregados()
+            estadisticas.reconstruir(db.session.connection())
+            desde_cero = _agregados()
+            db.session.rollback()
+        assert mantenida == desde_cero
+        return mantenida
+    return consistente
+
+
+@pytest.fixture
+def ficha(cliente, registrar, nueva_mascota):
+    """Un perro con vacunas, recetas y prevenciones, cargadas de a una y en lote."""
+    _, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras, raza="Labrador ")
+    ids = {"mascota": mascota_id}
+
+    def post(url, **datos):
+        r = cliente.post(url, headers=cabeceras, json={"mascota_id": mascota_id, **datos})
+        assert r.status_code == 201, r.json
+        return r.json["id"]
+
+    ids["vacuna"] = post('/api/vacunas', nombre="Rabia", fecha_aplicacion="2024-01-10")
+    ids["receta"] = post('/api/recetas', medicamento="Amoxicilina", dosis="1", fecha="2024-02-01")
+    ids["prevencion"] = post('/api/prevenciones', tipo="pipeta", fecha="2024-03-01")
+    for categoria, items in {
+        "vacunas": [{"nombre": "moquillo", "fecha_aplicacion": "2024-04-0%d" % d} for d in (1, 2)],
+        "recetas": [{"medicamento": "amoxicilina", "dosis": "2", "fecha": "2024-02-15"}],
+        "prevenciones": [{"tipo": "Desparasitación", "fecha": "2024-05-01"}],
+    }.items():
+        r = cliente.post(f'/api/mascotas/{mascota_id}/{categoria}:batch', headers=cabeceras, json={"items": items})
+        assert r.status_code == 201, r.json
+    return cabeceras, ids
+
+
+def test_altas(consistente, ficha, cliente, registrar, nueva_mascota):
+    _, cabeceras = registrar("otro@example.com")
+    nueva_mascota(cabeceras, especie="Gato", raza="siamés")
+
+    filas = consistente()
+    metricas = {f[0] for f in filas}
+    assert metricas == {"mascotas", "vacunadas", "vacunas", "recetas", "vencimientos"}
+    assert ("recetas", "2024-02", "perro", "labrador", "amoxicilina", 2) in filas
+
+
+def test_altas_por_importacion(app, consistente, registrar):
+    user_id, _ = registrar()
+    lineas = [
+        {"tabla": "mascota", "id": 1, "nombre": "Rex", "especie": "perro", "raza": "x"},
+        {"tabla": "vacuna", "mascota_id": 1, "nombre": "rabia", "fecha_aplicacion": "2024-01-01"},
+        {"tabla": "prevencion", "mascota_id": 1, "tipo": "pipeta", "fecha": "2024-01-01"},
+        {"tabla": "receta", "mascota_id": 1, "medicamento": "m", "dosis": "1", "fecha": "2024-01-01"},
+    ]
+    with app.app_context():
+        importacion = exportacion.crear_importacion("ndjson", user_id)
+        exportacion.importar(io.StringIO("".join(json.dumps(l) + "\n" for l in lineas)), importacion, lote=2)
+    assert any(f[0] == "vencimientos" for f in consistente())
+
+
+def test_cambios(consistente, ficha, cliente):
+    cabeceras, ids = ficha
+    cambios = [
+        ('/api/vacunas/%d' % ids["vacuna"], {"nombre": "Parvovirus", "fecha_aplicacion": "2023-12-01"}),
+        ('/api/recetas/%d' % ids["receta"], {"medicamento": "Meloxicam"}),
+        ('/api/prevenciones/%d' % ids["prevencion"], {"fecha": "2024-06-15"}),
+        ('/api/mascotas/%d' % ids["mascota"], {"raza": "  LABRADOR"}),
+        ('/api/mascotas/%d' % ids["mascota"], {"especie": "gato"}),
+    ]
+    for url, datos in cambios:
+        assert cliente.put(url, headers=cabeceras, json=datos).status_code == 200
+        consistente()
+
+
+def test_bajas(app, consistente, ficha, cliente, nueva_mascota, monkeypatch):
+    cabeceras, ids = ficha
+    for url in ('/api/vacunas/%d' % ids["vacuna"], '/api/recetas/%d' % ids["receta"],
+                '/api/prevenciones/%d' % ids["prevencion"]):
+        assert cliente.delete(url, headers=cabeceras).status_code == 200
+        consistente()
+
+    assert cliente.delete('/api/mascotas/%d' % ids["mascota"], headers=cabeceras).status_code == 200
+    assert consistente() == []
+
+    # Modo diferido: el aporte se va al marcarla y el purgador no lo vuelve a restar
+    monkeypatch.setitem(app.config, "MASCOTAS_BORRADO_DIFERIDO", True)
+    otra = nueva_mascota(cabeceras)
+    cliente.post('/api/vacunas', headers=cabeceras, json={"mascota_id": otra, "nombre": "rabia", "fecha_aplicacion": "2024-01-10"})
+    assert consistente()
+    assert cliente.delete(f'/api/mascotas/{otra}', headers=cabeceras).status_code == 200
+    assert consistente() == []
+    with app.app_context():
+        borrado.purgar()
+    assert consistente() == []
+
+
+def test_series_de_medicamentos_en_una_consulta(app, cliente, ficha, registrar, clinica):
+    cabeceras, ids = ficha
+    for medicamento in ("Meloxicam", "Prednisona"):
+        cliente.post('/api/recetas', headers=cabeceras, json={
+            "mascota_id": ids["mascota"], "medicamento": medicamento, "dosis": "1", "fecha": "2024-03-05"})
+    clinica.append("vet@example.com")
+    _, vet = registrar("vet@example.com")
+    rango = {"desde": "2024-01-01", "hasta": "2024-12-31"}
+
+    sentencias = []
+
+    def escuchar(conn, cursor, sql, *args):
+        sentencias.append(sql)
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", escuchar)
+        try:
+            r = cliente.get('/api/estadisticas/medicamentos', headers=vet, query_string=rango)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", escuchar)
+        esperado = {
+            m["medicamento"]: estadisticas.serie("recetas", date(2024, 1, 1), date(2024, 12, 31), clave=m["medicamento"])
+            for m in r.json["medicamentos"]
+        }
+
+    assert r.status_code == 200
+    assert [m["medicamento"] for m in r.json["medicamentos"]][0] == "amoxicilina"
+    assert {m["medicamento"]: m["por_periodo"] for m in r.json["medicamentos"]} == json.loads(json.dumps(esperado))
+    # Ranking y series: lo mismo con 3 medicamentos que con 100
+    assert len([s for s in sentencias if "estadistica" in s]) == 2
@@ -0,0 +1,159 @@
+import csv
+import io
+import json
+
+import pytest
+
+import exportacion
+from models import db, Mascota, Vacuna
+
+
+class _Cortada:
+    """Entrada que se corta (como una subida interrumpida) tras `n` líneas."""
+
+    def __init__(self, texto, n):
+        self.lineas = texto.splitlines(keepends=True)[:n]
+
+    def __iter__(self):
+        yield from self.lineas
+        raise ConnectionError("subida interrumpida")
+
+
+def _cuenta(cliente, cabeceras, user_id):
+    for nombre in ("Firulais", "Michi"):
+        mascota_id = cliente.post('/api/mascotas', headers=cabeceras, json={
+            "user_id": user_id, "nombre": nombre, "especie": "perro", "raza": "mestiza"}).json["id"]
+        for fecha in ("2024-01-10", "2024-06-10"):
+            r = cliente.post('/api/vacunas', headers=cabeceras,
+                             json={"mascota_id": mascota_id, "nombre": "rabia", "fecha_aplicacion": fecha})
+            assert r.status_code == 201, r.json
+        cliente.post('/api/diagnosticos', headers=cabeceras,
+                     json={"mascota_id": mascota_id, "titulo": "control", "fecha": "2024-02-01"})
+
+
+def _exportar(cliente, cabeceras, user_id, formato="ndjson"):
+    r = cliente.get(f'/api/usuarios/{user_id}/export', headers=cabeceras, query_string={"formato": formato})
+    assert r.status_code == 200
+    return r.get_data(as_text=True)
+
+
+def _resumen(app, user_id):
+    """(nombre, vacunas con su próxima dosis) de cada mascota del usuario."""
+    with app.app_context():
+        mascotas = db.session.scalars(
+            db.select(Mascota).where(Mascota.user_id == user_id).order_by(Mascota.nombre)).all()
+        return [
+            (m.nombre, sorted((str(v.fecha_aplicacion), str(v.proxima_dosis))
+                              for v in db.session.scalars(db.select(Vacuna).where(Vacuna.mascota_id == m.id))))
+            for m in mascotas
+        ]
+
+
+def test_exporta_solo_lo_del_usuario_mascotas_primero(cliente, registrar):
+    user_id, cabeceras = registrar()
+    otro_id, otro = registrar("otro@example.com")
+    _cuenta(cliente, cabeceras, user_id)
+    _cuenta(cliente, otro, otro_id)
+
+    registros = [json.loads(linea) for linea in _exportar(cliente, cabeceras, user_id).splitlines()]
+    tablas = [r["tabla"] for r in registros]
+    assert tablas == ["mascota"] * 2 + ["vacuna"] * 4 + ["diagnostico"] * 2
+    assert {r["user_id"] for r in registros if r["tabla"] == "mascota"} == {user_id}
+
+    filas = list(csv.DictReader(io.StringIO(_exportar(cliente, cabeceras, user_id, "csv"))))
+    assert [f["tabla"] for f in filas] == tablas
+
+
+@pytest.mark.parametrize("formato", ["ndjson", "csv"])
+def test_ida_y_vuelta_recalcula_proximas(app, cliente, registrar, formato):
+    user_id, cabeceras = registrar()
+    destino_id, destino = registrar("destino@example.com")
+    _cuenta(cliente, cabeceras, user_id)
+
+    r = cliente.post(f'/api/usuarios/{destino_id}/import', headers=destino, query_string={"formato": formato},
+                     data=_exportar(cliente, cabeceras, user_id, formato))
+    assert r.status_code == 200, r.json
+    assert (r.json["estado"], r.json["registros"], r.json["insertados"], r.json["errores"]) == ("completa", 8, 8, 0)
+    resumen = _resumen(app, destino_id)
+    assert resumen == _resumen(app, user_id)
+    # La próxima dosis no se importa: se recalcula y solo la lleva la última
+    assert [[p for _, p in vacunas] for _, vacunas in resumen] == [["None", "2025-06-10"]] * 2
+
+
+def test_importacion_cortada_se_reanuda_sin_duplicar(app, cliente, registrar):
+    user_id, cabeceras = registrar()
+    destino_id, destino = registrar("destino@example.com")
+    _cuenta(cliente, cabeceras, user_id)
+    texto = _exportar(cliente, cabeceras, user_id)
+
+    with app.app_context():
+        importacion = exportacion.crear_importacion("ndjson", destino_id)
+        importacion_id = importacion.id
+        with pytest.raises(ConnectionError):
+            exportacion.importar(_Cortada(texto, 5), importacion, lote=2)
+        db.session.rollback()
+
+    r = cliente.get(f'/api/importaciones/{importacion_id}', headers=destino)
+    assert (r.json["estado"], r.json["registros"]) == ("en_curso", 4)
+    # Cada bloque confirmado ya trae sus próximas fechas recalculadas
+    assert _resumen(app, destino_id) == [
+        ("Firulais", [("2024-01-10", "None"), ("2024-06-10", "2025-06-10")]), ("Michi", [])]
+
+    # Se reenvía la entrada completa: lo ya confirmado se salta
+    r = cliente.post(f'/api/usuarios/{destino_id}/import', headers=destino,
+                     query_string={"importacion": importacion_id}, data=texto)
+    assert r.status_code == 200, r.json
+    assert (r.json["estado"], r.json["registros"], r.json["insertados"]) == ("completa", 8, 8)
+    assert _resumen(app, destino_id) == _resumen(app, user_id)
+
+    r = cliente.post(f'/api/usuarios/{destino_id}/import', headers=destino,
+                     query_string={"importacion": importacion_id}, data=texto)
+    assert r.status_code == 400
+
+
+def test_errores_por_registro_no_cortan_la_importacion(cliente, registrar):
+    user_id, cabeceras = registrar()
+    entrada = "\n".join([
+        json.dumps({"tabla": "mascota", "id": 7, "nombre": "Firulais", "especie": "perro", "raza": "x"}),
+        "no es json",
+        json.dumps({"tabla": "vacuna", "id": 1, "mascota_id": 7, "nombre": "rabia", "fecha_aplicacion": "ayer"}),
+        json.dumps({"tabla": "vacuna", "id": 2, "mascota_id": 99, "nombre": "rabia", "fecha_aplicacion": "2024-01-10"}),
+        json.dumps({"tabla": "vacuna", "id": 3, "mascota_id": 7, "nombre": "rabia", "fecha_aplicacion": "2024-01-10"}),
+    ])
+    r = cliente.post(f'/api/usuarios/{user_id}/import', headers=cabeceras, data=entrada)
+    assert r.status_code == 200
+    assert r.json["success"] is False
+    assert (r.json["insertados"], r.json["errores"]) == (2, 3)
+    assert [e["registro"] for e in r.json["detalle_errores"]] == [2, 3, 4]
+
+
+def test_formato_desconocido_da_400(cliente, registrar):
+    user_id, cabeceras = registrar()
+    assert cliente.get(f'/api/usuarios/{user_id}/export?formato=xml', headers=cabeceras).status_code == 400
+
+
+def test_reanudar_invalida_el_historial_en_cache(app, cliente, registrar, monkeypatch):
+    monkeypatch.setitem(app.config, "CACHE_BACKEND", "memoria")
+    monkeypatch.setitem(app.extensions, "vacunapet_cache", None)
+    user_id, cabeceras = registrar()
+    texto = "".join(json.dumps(r) + "\n" for r in [
+        {"tabla": "mascota", "id": 7, "nombre": "Rex", "especie": "perro", "raza": "x"},
+        {"tabla": "diagnostico", "id": 1, "mascota_id": 7, "titulo": "control", "fecha": "2024-02-01"},
+    ])
+
+    with app.app_context():
+        importacion = exportacion.crear_importacion("ndjson", user_id)
+        importacion_id = importacion.id
+        with pytest.raises(ConnectionError):
+            exportacion.importar(_Cortada(texto, 1), importacion, lote=1)
+        db.session.rollback()
+
+    mascota_id, = [m["id"] for m in cliente.get('/api/mascotas', headers=cabeceras).json["mascotas"]]
+    url = f'/api/mascotas/{mascota_id}/historial'
+    assert cliente.get(url, headers=cabeceras).json["diagnosticos"] == []
+    assert cliente.get(url, headers=cabeceras).headers["X-Cache"] == "HIT"
+
+    cliente.post(f'/api/usuarios/{user_id}/import', headers=cabeceras,
+                 query_string={"importacion": importacion_id}, data=texto)
+    r = cliente.get(url, headers=cabeceras)
+    assert [d["titulo"] for d in r.json["diagnosticos"]] == ["control"]
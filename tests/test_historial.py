@@ -0,0 +1,51 @@
+import pytest
+
+
+@pytest.fixture
+def ficha(cliente, registrar, nueva_mascota):
+    """Una mascota con un registro de cada categoría en enero y otro en marzo."""
+    user_id, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras, user_id=user_id)
+    for fecha in ("2024-01-10", "2024-03-10"):
+        for url, datos in (
+            ('/api/vacunas', {"nombre": "rabia", "fecha_aplicacion": fecha}),
+            ('/api/diagnosticos', {"titulo": "control", "fecha": fecha}),
+            ('/api/recetas', {"medicamento": "amoxicilina", "dosis": "1", "fecha": fecha}),
+            ('/api/prevenciones', {"tipo": "pipeta", "fecha": fecha}),
+        ):
+            r = cliente.post(url, headers=cabeceras, json={"mascota_id": mascota_id, **datos})
+            assert r.status_code == 201, r.json
+    return mascota_id, cabeceras
+
+
+def _historial(cliente, mascota_id, cabeceras, **params):
+    return cliente.get(f'/api/mascotas/{mascota_id}/historial', headers=cabeceras, query_string=params)
+
+
+def test_trae_la_mascota_y_todo_su_historial(cliente, ficha):
+    mascota_id, cabeceras = ficha
+    r = _historial(cliente, mascota_id, cabeceras)
+    assert r.status_code == 200
+    assert r.json["mascota"]["id"] == mascota_id
+    for categoria in ("vacunas", "diagnosticos", "recetas", "prevenciones"):
+        assert len(r.json[categoria]) == 2
+    assert r.json["vacunas"][0]["fecha_aplicacion"] == "2024-01-10"
+
+
+def test_incluir_y_desde_filtran(cliente, ficha):
+    mascota_id, cabeceras = ficha
+    r = _historial(cliente, mascota_id, cabeceras, incluir="vacunas,recetas", desde="2024-02-01")
+    assert r.status_code == 200
+    assert "diagnosticos" not in r.json and "prevenciones" not in r.json
+    assert [v["fecha_aplicacion"] for v in r.json["vacunas"]] == ["2024-03-10"]
+    assert [v["fecha"] for v in r.json["recetas"]] == ["2024-03-10"]
+
+    # El filtro no queda pegado a la colección en la siguiente lectura
+    assert len(_historial(cliente, mascota_id, cabeceras).json["vacunas"]) == 2
+
+
+def test_parametros_invalidos_y_mascota_inexistente(cliente, ficha):
+    mascota_id, cabeceras = ficha
+    assert _historial(cliente, mascota_id, cabeceras, incluir="vacunas,fotos").status_code == 400
+    assert _historial(cliente, mascota_id, cabeceras, desde="ayer").status_code == 400
+    assert _historial(cliente, mascota_id + 1, cabeceras).status_code == 404
@@ -0,0 +1,93 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+import imagenes
+
+
+def _data_url(imagen, formato="JPEG", **opciones):
+    salida = io.BytesIO()
+    imagen.save(salida, format=formato, **opciones)
+    return f"data:image/{formato.lower()};base64," + base64.b64encode(salida.getvalue()).decode()
+
+
+def _foto_rotada():
+    """JPEG apaisado de 3000x2000 con EXIF "rotar 90°" y datos de cámara."""
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    exif[0x010F] = "Camara de prueba"
+    return _data_url(Image.new("RGB", (3000, 2000), "orange"), exif=exif)
+
+
+@pytest.fixture
+def cuenta(registrar):
+    return registrar()
+
+
+def _mascota(cliente, cuenta):
+    user_id, cabeceras = cuenta
+    r = cliente.get('/api/mascotas', headers=cabeceras, query_string={"user_id": user_id})
+    return r.json["mascotas"][0]
+
+
+def _abrir(cliente, url):
+    r = cliente.get(url)
+    assert r.status_code == 200
+    return Image.open(io.BytesIO(r.data))
+
+
+def test_genera_tres_variantes_webp_rotadas_y_sin_exif(cliente, cuenta, nueva_mascota):
+    nueva_mascota(cuenta[1], user_id=cuenta[0], foto=_foto_rotada())
+    mascota = _mascota(cliente, cuenta)
+    assert mascota["foto"] == ""
+
+    tamanios = {}
+    for variante in ("miniatura", "mediana", "original"):
+        imagen = _abrir(cliente, mascota["foto_" + variante])
+        assert imagen.format == "WEBP"
+        assert not imagen.getexif()
+        tamanios[variante] = imagen.size
+    # Vertical después de aplicar la orientación, con el lado mayor acotado
+    assert tamanios == {"miniatura": (267, 400), "mediana": (533, 800), "original": (1067, 1600)}
+
+
+def test_foto_chica_no_se_agranda_y_conserva_la_transparencia(cliente, cuenta, nueva_mascota):
+    nueva_mascota(cuenta[1], user_id=cuenta[0], foto=_data_url(Image.new("RGBA", (300, 200)), "PNG"))
+    mascota = _mascota(cliente, cuenta)
+    for variante in ("miniatura", "mediana", "original"):
+        imagen = _abrir(cliente, mascota["foto_" + variante])
+        assert (imagen.size, imagen.mode) == ((300, 200), "RGBA")
+
+
+def test_borrar_la_foto_por_la_api(cliente, cuenta, nueva_mascota):
+    mascota_id = nueva_mascota(cuenta[1], user_id=cuenta[0], foto=_foto_rotada())
+    r = cliente.put(f'/api/mascotas/{mascota_id}', headers=cuenta[1], json={"foto": ""})
+    assert r.status_code == 200
+    mascota = _mascota(cliente, cuenta)
+    assert [mascota["foto_" + v] for v in ("miniatura", "mediana", "original")] == [None] * 3
+
+
+@pytest.mark.parametrize("foto", [
+    "data:image/png;base64," + base64.b64encode(b"no es una imagen" * 20).decode(),
+    # 1-bit de 9000x9000: unos KB comprimida, 81 Mpx al decodificarla
+    _data_url(Image.new("1", (9000, 9000)), "PNG"),
+    # 42 Mpx: sobre el límite pero por debajo del doble, donde Pillow ya no avisa
+    _data_url(Image.new("1", (7000, 6000)), "PNG"),
+])
+def test_foto_invalida_o_enorme_da_400(cliente, cuenta, foto):
+    assert Image.MAX_IMAGE_PIXELS != imagenes.MAX_PIXELES
+    user_id, cabeceras = cuenta
+    r = cliente.post('/api/mascotas', headers=cabeceras,
+                     json={"user_id": user_id, "nombre": "Rex", "especie": "perro", "raza": "x", "foto": foto})
+    assert r.status_code == 400
+    assert cliente.get('/api/mascotas', headers=cabeceras, query_string={"user_id": user_id}).json["mascotas"] == []
+
+
+@pytest.mark.parametrize("foto", ["perro.jpg", "https://example.com/rex.png", "aG9sYQ=="])
+def test_texto_corto_que_no_es_una_foto_da_400(cliente, cuenta, nueva_mascota, foto):
+    mascota_id = nueva_mascota(cuenta[1], user_id=cuenta[0], foto=_foto_rotada())
+    r = cliente.put(f'/api/mascotas/{mascota_id}', headers=cuenta[1], json={"foto": foto})
+    assert r.status_code == 400
+    assert _mascota(cliente, cuenta)["foto_miniatura"] is not None
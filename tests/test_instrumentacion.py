@@ -0,0 +1,41 @@
+import instrumentacion
+
+
+def _tiempos(respuesta):
+    return dict(
+        (parte.split(";", 1) + [""])[:2]
+        for parte in respuesta.headers["Server-Timing"].split(", ")
+    )
+
+
+def test_server_timing_cuenta_las_consultas(cliente, registrar, nueva_mascota):
+    _, cabeceras = registrar()
+    nueva_mascota(cabeceras)
+    tiempos = _tiempos(cliente.get('/api/mascotas', headers=cabeceras))
+    assert set(tiempos) == {"db", "app"}
+    consultas = int(tiempos["db"].split('desc="')[1].split()[0])
+    assert consultas >= 1
+    assert "n1" not in tiempos
+
+
+def test_marca_consultas_repetidas_y_las_publica(app, cliente, registrar, monkeypatch):
+    _, cabeceras = registrar()
+    monkeypatch.setitem(app.config, "N_MAS_1_UMBRAL", 1)
+    assert "n1" in _tiempos(cliente.get('/api/mascotas', headers=cabeceras))
+
+    metricas = cliente.get('/metrics').get_data(as_text=True)
+    assert 'vacunapet_n_mas_1_total{endpoint="api.obtener_mascotas"}' in metricas
+    assert 'vacunapet_peticiones_total{endpoint="api.obtener_mascotas",metodo="GET",estado="200"}' in metricas
+
+
+def test_metrics_con_token(app, cliente, monkeypatch):
+    monkeypatch.setitem(app.config, "METRICAS_TOKEN", "s3creto")
+    assert cliente.get('/metrics').status_code == 401
+    r = cliente.get('/metrics', headers={"Authorization": "Bearer s3creto"})
+    assert r.status_code == 200
+    assert "# TYPE vacunapet_peticion_segundos histogram" in r.get_data(as_text=True)
+
+
+def test_forma_consulta_unifica_listas_in():
+    assert instrumentacion.forma_consulta("SELECT *\n  FROM x WHERE id IN (?, ?,?)") == \
+        instrumentacion.forma_consulta("SELECT * FROM x WHERE id IN (?)")
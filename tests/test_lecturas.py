@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+import lecturas
+from models import db
+
+
+@contextmanager
+def contar_consultas():
+    sentencias = []
+
+    def escuchar(conn, cursor, sql, *args):
+        if sql != "BEGIN":
+            sentencias.append(sql)
+    event.listen(db.engine, "before_cursor_execute", escuchar)
+    try:
+        yield sentencias
+    finally:
+        event.remove(db.engine, "before_cursor_execute", escuchar)
+
+
+@pytest.fixture
+def duenio(cliente, registrar, nueva_mascota):
+    """Dueño con `n` mascotas, cada una con dos vacunas y un diagnóstico."""
+    user_id, cabeceras = registrar()
+
+    def con_mascotas(n):
+        for i in range(n):
+            mascota_id = nueva_mascota(cabeceras, nombre=f"M{i}")
+            for nombre, fecha in (("rabia", "2024-01-10"), ("moquillo", "2024-03-01")):
+                cliente.post('/api/vacunas', headers=cabeceras,
+                             json={"mascota_id": mascota_id, "nombre": nombre, "fecha_aplicacion": fecha})
+            cliente.post('/api/diagnosticos', headers=cabeceras,
+                         json={"mascota_id": mascota_id, "titulo": "control", "fecha": "2024-02-01"})
+        return user_id
+    return con_mascotas
+
+
+def test_tarjetas_en_una_consulta(app, duenio):
+    user_id = duenio(3)
+    with app.app_context():
+        with contar_consultas() as sentencias:
+            tarjetas = lecturas.tarjetas_mascotas(user_id)
+            resumen = [(t.mascota.nombre, t.conteos, t.ultima_vacuna[0], t.ultimo_diagnostico[0]) for t in tarjetas]
+        assert len(sentencias) == 1
+    conteos = {"vacunas": 2, "diagnosticos": 1, "recetas": 0, "prevenciones": 0}
+    assert resumen == [(f"M{i}", conteos, "moquillo", "control") for i in range(3)]
+
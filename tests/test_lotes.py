@@ -0,0 +1,106 @@
+import pytest
+
+import api
+
+
+@pytest.fixture
+def mascota(registrar, nueva_mascota):
+    user_id, cabeceras = registrar()
+    return nueva_mascota(cabeceras, user_id=user_id), cabeceras
+
+
+def _lote(cliente, mascota, categoria, items, **extra):
+    mascota_id, cabeceras = mascota
+    return cliente.post(f'/api/mascotas/{mascota_id}/{categoria}:batch', headers=cabeceras,
+                        json={"items": items, **extra})
+
+
+def _listar(cliente, mascota, categoria):
+    mascota_id, cabeceras = mascota
+    return cliente.get(f'/api/mascotas/{mascota_id}/{categoria}', headers=cabeceras).json[categoria]
+
+
+def test_todo_valido_inserta_en_orden(cliente, mascota):
+    items = [{"nombre": "rabia", "fecha_aplicacion": f"202{i}-01-01"} for i in range(3)]
+    r = _lote(cliente, mascota, "vacunas", items)
+    assert r.status_code == 201
+    assert r.json["insertados"] == 3
+
+    vacunas = _listar(cliente, mascota, "vacunas")
+    assert [v["id"] for v in vacunas] == [x["id"] for x in r.json["resultados"]]
+    # El calendario se recalcula una vez para todo el lote
+    assert [v["proxima_dosis"] for v in vacunas] == [None, None, "2023-01-01"]
+
+
+def test_errores_parciales_dan_207_con_el_indice(cliente, mascota):
+    items = [
+        {"titulo": "control", "fecha": "2024-01-01"},
+        {"titulo": "", "fecha": "2024-01-01"},
+        {"titulo": "otro", "fecha": "ayer"},
+        "no es un objeto",
+        {"titulo": "último", "fecha": "2024-01-02", "descripcion": "ok"},
+    ]
+    r = _lote(cliente, mascota, "diagnosticos", items)
+    assert r.status_code == 207
+    assert [x["success"] for x in r.json["resultados"]] == [True, False, False, False, True]
+    assert [x["indice"] for x in r.json["resultados"]] == list(range(5))
+    assert [d["titulo"] for d in _listar(cliente, mascota, "diagnosticos")] == ["control", "último"]
+
+
+def test_atomico_no_inserta_nada_si_hay_errores(cliente, mascota):
+    items = [{"medicamento": "m", "dosis": "1", "fecha": "2024-01-01"}, {"medicamento": "m", "fecha": "2024-01-01"}]
+    r = _lote(cliente, mascota, "recetas", items, atomico=True)
+    assert r.status_code == 400
+    assert r.json["insertados"] == 0
+    assert r.json["resultados"][1]["message"] == "Falta 'dosis'"
+    assert _listar(cliente, mascota, "recetas") == []
+
+
+def test_limites_del_pedido(cliente, mascota, monkeypatch):
+    monkeypatch.setattr(api, "MAX_LOTE", 2)
+    item = {"tipo": "pipeta", "fecha": "2024-01-01"}
+    assert _lote(cliente, mascota, "prevenciones", [item] * 3).status_code == 413
+    assert _lote(cliente, mascota, "prevenciones", []).status_code == 400
+    assert _lote(cliente, (mascota[0] + 1, mascota[1]), "prevenciones", [item]).status_code == 404
+    assert _listar(cliente, mascota, "prevenciones") == []
+
+
+def test_texto_demasiado_largo_se_rechaza_con_su_indice(cliente, mascota):
+    items = [{"titulo": "control", "fecha": "2024-01-01"}, {"titulo": "x" * 201, "fecha": "2024-01-01"}]
+    r = _lote(cliente, mascota, "diagnosticos", items)
+    assert r.status_code == 207
+    assert r.json["resultados"][1] == {"indice": 1, "success": False, "message": "'titulo' supera los 200 caracteres"}
+
+
+@pytest.fixture
+def titulo_que_choca(monkeypatch):
+    """Simula una restricción de la base que la validación no cubre."""
+    validar = api._validar_item_lote
+
+    def validar_con_hueco(modelo, item, *args):
+        fila, error = validar(modelo, item, *args)
+        if fila and item.get("titulo") == "choca":
+            fila["titulo"] = None
+        return fila, error
+    monkeypatch.setattr(api, "_validar_item_lote", validar_con_hueco)
+
+
+def test_restriccion_de_la_base_solo_tumba_su_elemento(cliente, mascota, titulo_que_choca):
+    items = [{"titulo": t, "fecha": "2024-01-01"} for t in ("control", "choca", "otro")]
+    r = _lote(cliente, mascota, "diagnosticos", items)
+    assert r.status_code == 207
+    assert [x["success"] for x in r.json["resultados"]] == [True, False, True]
+    assert r.json["resultados"][1]["message"] == "Rechazado por la base de datos"
+    assert [d["titulo"] for d in _listar(cliente, mascota, "diagnosticos")] == ["control", "otro"]
+
+    r = _lote(cliente, mascota, "diagnosticos", [{"titulo": "choca", "fecha": "2024-01-01"}])
+    assert r.status_code == 409
+
+
+def test_restriccion_de_la_base_en_lote_atomico_da_409(cliente, mascota, titulo_que_choca):
+    items = [{"titulo": t, "fecha": "2024-01-01"} for t in ("control", "choca")]
+    r = _lote(cliente, mascota, "diagnosticos", items, atomico=True)
+    assert r.status_code == 409
+    assert [x.get("message") for x in r.json["resultados"]] == [
+        "No insertado: el lote tiene errores", "Rechazado por la base de datos"]
+    assert _listar(cliente, mascota, "diagnosticos") == []
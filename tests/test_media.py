@@ -0,0 +1,85 @@
+import base64
+import os
+
+import media
+from models import db, Usuario
+
+# PNG de 1x1
+PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg=="
+)
+
+
+def _subir(cliente, cuenta, foto):
+    user_id, cabeceras = cuenta
+    return cliente.put(f'/api/usuario/{user_id}/foto', headers=cabeceras, json={"foto": foto})
+
+
+def test_foto_se_sirve_por_hash_con_cache_inmutable(cliente, registrar):
+    user_id, cabeceras = cuenta = registrar()
+    r = _subir(cliente, cuenta, "data:image/png;base64," + base64.b64encode(PNG).decode())
+    assert r.status_code == 200, r.json
+    url = r.json["foto_url"]
+    assert cliente.get(f'/api/usuario/{user_id}', headers=cabeceras).json["usuario"]["foto_url"] == url
+
+    r = cliente.get(url)
+    assert r.status_code == 200
+    assert r.data == PNG
+    assert r.mimetype == "image/png"
+    assert r.headers["ETag"] == '"%s"' % url.rsplit("/", 1)[1]
+    assert "immutable" in r.headers["Cache-Control"]
+
+    assert cliente.get(url, headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+    r = cliente.get(url, headers={"Range": "bytes=0-3"})
+    assert r.status_code == 206
+    assert r.data == PNG[:4]
+
+
+def test_misma_foto_se_guarda_una_vez(app, cliente, registrar):
+    foto = base64.b64encode(PNG).decode()
+    urls = {_subir(cliente, registrar(email), foto).json["foto_url"] for email in ("a@example.com", "b@example.com")}
+    assert len(urls) == 1
+
+    hash_media = urls.pop().rsplit("/", 1)[1]
+    with app.app_context():
+        assert os.listdir(os.path.dirname(media.ruta_media(hash_media))) == [hash_media]
+
+
+def test_foto_invalida_da_400(cliente, registrar):
+    cuenta = registrar()
+    assert _subir(cliente, cuenta, "esto no es base64!").status_code == 400
+    assert _subir(cliente, cuenta, base64.b64encode(b"texto plano").decode()).status_code == 400
+    assert cliente.get('/api/media/' + "0" * 64).status_code == 404
+    assert cliente.get('/api/media/no-es-un-hash').status_code == 404
+
+
+def test_migrar_fotos_pasa_el_base64_heredado_al_almacen(app, registrar):
+    ids = [registrar(email)[0] for email in ("a@example.com", "b@example.com")]
+    with app.app_context():
+        db.session.get(Usuario, ids[0]).foto = base64.b64encode(PNG).decode()
+        db.session.get(Usuario, ids[1]).foto = "basura"
+        db.session.commit()
+
+    resultado = app.test_cli_runner().invoke(args=["migrar-fotos"])
+    assert "Fotos migradas: 2" in resultado.output
+
+    with app.app_context():
+        buena, mala = (db.session.get(Usuario, i) for i in ids)
+        assert (buena.foto, mala.foto, mala.foto_hash) == (None, None, None)
+        with open(media.ruta_media(buena.foto_hash), "rb") as f:
+            assert f.read() == PNG
+
+
+def test_leer_no_migra_y_la_escritura_si(app, cliente, registrar):
+    user_id, cabeceras = registrar()
+    with app.app_context():
+        db.session.get(Usuario, user_id).foto = base64.b64encode(PNG).decode()
+        db.session.commit()
+
+    assert cliente.get(f'/api/usuario/{user_id}', headers=cabeceras).json["usuario"]["foto_url"] == ""
+    with app.app_context():
+        assert db.session.get(Usuario, user_id).foto_hash is None
+
+    assert cliente.put(f'/api/usuario/{user_id}', headers=cabeceras, json={"nombre": "Eva"}).status_code == 200
+    url = cliente.get(f'/api/usuario/{user_id}', headers=cabeceras).json["usuario"]["foto_url"]
+    assert cliente.get(url).data == PNG
@@ -0,0 +1,86 @@
+import pytest
+
+import microchips
+
+CHIP = "985112000123456"
+
+
+@pytest.mark.parametrize("codigo, esperado", [
+    ("985 112 000 123 456", CHIP),
+    ("985-112000123456", CHIP),
+    ("3d9.1A2B3C4D5E", "985112394521950"),
+    ("0a1b2c3d4e", "0A1B2C3D4E"),
+    ("   ", None),
+])
+def test_normaliza_los_formatos_de_los_lectores(codigo, esperado):
+    assert microchips.normalizar(codigo) == esperado
+
+
+@pytest.mark.parametrize("codigo", ["98511200012345", "12345678901234567", "FFF.1A2B3C4D5E", "chip"])
+def test_rechaza_los_codigos_invalidos(codigo):
+    with pytest.raises(microchips.MicrochipInvalido):
+        microchips.normalizar(codigo)
+
+
+def test_un_chip_solo_en_una_mascota(cliente, registrar, nueva_mascota):
+    _, cabeceras = registrar()
+    _, otro = registrar("otro@example.com")
+    mascota_id = nueva_mascota(cabeceras, microchip="985 112 000 123 456")
+
+    r = cliente.post('/api/mascotas', headers=otro,
+                     json={"nombre": "Rex", "especie": "perro", "raza": "x", "microchip": "985-112000123456"})
+    assert r.status_code == 409
+    otra_id = nueva_mascota(otro)
+    assert cliente.put(f'/api/mascotas/{otra_id}', headers=otro, json={"microchip": CHIP}).status_code == 409
+
+    # Volver a guardar el propio no choca consigo mismo
+    assert cliente.put(f'/api/mascotas/{mascota_id}', headers=cabeceras, json={"microchip": CHIP}).status_code == 200
+    assert cliente.put(f'/api/mascotas/{mascota_id}', headers=cabeceras, json={"microchip": "x"}).status_code == 400
+
+
+def test_busqueda_por_chip_de_clinica(cliente, registrar, nueva_mascota, clinica):
+    clinica.append("vet@example.com")
+    user_id, cabeceras = registrar()
+    _, vet = registrar("vet@example.com")
+    mascota_id = nueva_mascota(cabeceras, nombre="Rex", microchip=CHIP)
+
+    assert cliente.get(f'/api/microchip/{CHIP}', headers=cabeceras).status_code == 403
+    # Devuelve datos del dueño: sin token no alcanza con el modo heredado
+    assert cliente.get(f'/api/microchip/{CHIP}').status_code == 401
+    assert cliente.post('/api/microchip:batch', json={"codigos": [CHIP]}).status_code == 401
+    r = cliente.get('/api/microchip/985-112-000-123-456', headers=vet)
+    assert r.status_code == 200
+    assert (r.json["mascota"]["id"], r.json["duenio"]["id"]) == (mascota_id, user_id)
+    assert cliente.get('/api/microchip/985112000000001', headers=vet).status_code == 404
+    assert cliente.get('/api/microchip/chip', headers=vet).status_code == 400
+
+    r = cliente.post('/api/microchip:batch', headers=vet, json={"codigos": [CHIP, "985112000000001", "chip"]})
+    assert r.json["encontrados"] == 1
+    assert [x["success"] for x in r.json["resultados"]] == [True, False, False]
+
+
+def test_asignar_el_chip_olvida_la_busqueda_negativa(app, cliente, registrar, nueva_mascota, clinica, monkeypatch):
+    monkeypatch.setitem(app.config, "CACHE_BACKEND", "memoria")
+    monkeypatch.setitem(app.extensions, "vacunapet_cache", None)
+    clinica.append("vet@example.com")
+    _, cabeceras = registrar()
+    _, vet = registrar("vet@example.com")
+
+    assert cliente.get(f'/api/microchip/{CHIP}', headers=vet).status_code == 404
+    nueva_mascota(cabeceras, microchip=CHIP)
+    assert cliente.get(f'/api/microchip/{CHIP}', headers=vet).status_code == 200
+
+
+def test_chip_registrado_a_la_vez_da_409(cliente, registrar, nueva_mascota, monkeypatch):
+    _, cabeceras = registrar()
+    nueva_mascota(cabeceras, microchip=CHIP)
+    otra_id = nueva_mascota(cabeceras)
+    # Otra petición asigna el chip entre la comprobación y el commit: solo queda el índice único
+    monkeypatch.setattr(microchips, "asignable", lambda codigo, mascota_id=None: microchips.normalizar(codigo))
+
+    r = cliente.post('/api/mascotas', headers=cabeceras,
+                     json={"nombre": "Rex", "especie": "perro", "raza": "x", "microchip": CHIP})
+    assert (r.status_code, r.json["message"]) == (409, str(microchips.MicrochipRegistrado(CHIP)))
+    r = cliente.put(f'/api/mascotas/{otra_id}', headers=cabeceras, json={"microchip": CHIP})
+    assert r.status_code == 409
+    assert len(cliente.get('/api/mascotas', headers=cabeceras).json["mascotas"]) == 2
@@ -0,0 +1,105 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import migraciones
+from models import db
+
+# Esquema que create_all() dejaba antes de las migraciones (models.py original)
+ESQUEMA_BASE = [
+    "CREATE TABLE usuario (id INTEGER NOT NULL, nombre VARCHAR(80) NOT NULL, apellido VARCHAR(80) NOT NULL, "
+    "email VARCHAR(120) NOT NULL, password VARCHAR(200) NOT NULL, foto TEXT, PRIMARY KEY (id), UNIQUE (email))",
+    "CREATE TABLE mascota (id INTEGER NOT NULL, nombre VARCHAR(100) NOT NULL, especie VARCHAR(100) NOT NULL, "
+    "raza VARCHAR(100), fecha_nacimiento DATE, peso FLOAT, microchip VARCHAR(100), castrado BOOLEAN, "
+    "foto VARCHAR(200), user_id INTEGER NOT NULL, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES usuario (id))",
+    "CREATE TABLE diagnostico (id INTEGER NOT NULL, titulo VARCHAR(200) NOT NULL, fecha DATE NOT NULL, "
+    "descripcion TEXT, mascota_id INTEGER NOT NULL, PRIMARY KEY (id), FOREIGN KEY(mascota_id) REFERENCES mascota (id))",
+    "CREATE TABLE prevencion (id INTEGER NOT NULL, tipo VARCHAR(200) NOT NULL, fecha DATE NOT NULL, "
+    "descripcion TEXT, mascota_id INTEGER NOT NULL, PRIMARY KEY (id), FOREIGN KEY(mascota_id) REFERENCES mascota (id))",
+    "CREATE TABLE receta (id INTEGER NOT NULL, medicamento VARCHAR(200) NOT NULL, dosis VARCHAR(200) NOT NULL, "
+    "fecha DATE NOT NULL, instrucciones TEXT, mascota_id INTEGER NOT NULL, PRIMARY KEY (id), "
+    "FOREIGN KEY(mascota_id) REFERENCES mascota (id))",
+    "CREATE TABLE vacuna (id INTEGER NOT NULL, nombre VARCHAR(100) NOT NULL, fecha_aplicacion DATE NOT NULL, "
+    "mascota_id INTEGER NOT NULL, PRIMARY KEY (id), FOREIGN KEY(mascota_id) REFERENCES mascota (id))",
+]
+
+DATOS_BASE = [
+    "INSERT INTO usuario VALUES (1, 'Ana', 'Paz', 'ana@example.com', 'x', '')",
+    "INSERT INTO mascota VALUES (1, 'Rex', 'perro', 'mestiza', NULL, 12.5, NULL, 0, '', 1)",
+    "INSERT INTO vacuna VALUES (1, 'rabia', '2024-01-10', 1)",
+    "INSERT INTO diagnostico VALUES (1, 'control', '2024-02-01', NULL, 1)",
+]
+
+ULTIMA = migraciones.MIGRACIONES[-1][0]
+
+
+@pytest.fixture
+def motor(tmp_path):
+    motor = create_engine(f"sqlite:///{tmp_path / 'migrar.db'}")
+    yield motor
+    motor.dispose()
+
+
+def _indices(motor, tabla):
+    return {i["name"] for i in inspect(motor).get_indexes(tabla)}
+
+
+def _verificar_esquema(motor):
+    assert migraciones.version_actual(motor) == ULTIMA
+    assert migraciones.pendientes(motor) == []
+    assert "foto_hash" in {c["name"] for c in inspect(motor).get_columns("usuario")}
+    assert "ix_mascota_user_id_id" in _indices(motor, "mascota")
+    assert "ix_vacuna_mascota_id_fecha" in _indices(motor, "vacuna")
+
+
+def test_desde_base_vacia(motor):
+    aplicadas = migraciones.aplicar(motor, log=lambda _: None)
+    assert aplicadas == [m[0] for m in migraciones.MIGRACIONES]
+    _verificar_esquema(motor)
+    # Volver a correrlo no hace nada
+    assert migraciones.aplicar(motor, log=lambda _: None) == []
+
+
+def test_desde_el_esquema_original_conserva_los_datos(motor):
+    with motor.begin() as conn:
+        for sql in ESQUEMA_BASE + DATOS_BASE:
+            conn.execute(text(sql))
+
+    migraciones.aplicar(motor, log=lambda _: None)
+    _verificar_esquema(motor)
+    with motor.connect() as conn:
+        assert conn.execute(text("SELECT nombre, peso, user_id FROM mascota")).all() == [("Rex", 12.5, 1)]
+        assert conn.execute(text("SELECT nombre, fecha_aplicacion FROM vacuna")).all() == [("rabia", "2024-01-10")]
+        assert conn.execute(text("SELECT email, foto_hash FROM usuario")).all() == [("ana@example.com", None)]
+        # El índice de búsqueda se llena con lo que ya había
+        assert conn.execute(text("SELECT tabla, registro_id FROM busqueda WHERE busqueda MATCH 'rex'")).all() == [
+            ("mascota", 1)]
+
+
+@pytest.mark.parametrize("desde_base", [False, True])
+def test_el_esquema_migrado_tiene_las_columnas_de_los_modelos(motor, desde_base):
+    if desde_base:
+        with motor.begin() as conn:
+            for sql in ESQUEMA_BASE:
+                conn.execute(text(sql))
+    migraciones.aplicar(motor, log=lambda _: None)
+    for tabla in db.metadata.sorted_tables:
+        assert {c["name"] for c in inspect(motor).get_columns(tabla.name)} == set(tabla.c.keys()), tabla.name
+
+
+def test_la_version_1_es_el_esquema_original(motor):
+    migraciones.aplicar(motor, hasta=1, log=lambda _: None)
+    original = create_engine("sqlite://")
+    with original.begin() as conn:
+        for sql in ESQUEMA_BASE:
+            conn.execute(text(sql))
+    for tabla in ("usuario", "mascota", "vacuna", "diagnostico", "receta", "prevencion"):
+        assert [c["name"] for c in inspect(motor).get_columns(tabla)] == [
+            c["name"] for c in inspect(original).get_columns(tabla)], tabla
+    original.dispose()
+
+
+def test_hasta_se_detiene_en_la_version_pedida(motor):
+    assert migraciones.aplicar(motor, hasta=2, log=lambda _: None) == [1, 2]
+    assert migraciones.version_actual(motor) == 2
+    assert "ix_vacuna_mascota_id_fecha" not in _indices(motor, "vacuna")
+    assert [m[0] for m in migraciones.pendientes(motor)][0] == 3
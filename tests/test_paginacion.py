@@ -0,0 +1,88 @@
+import base64
+import json
+
+import pytest
+
+# Tres vacunas el mismo día en medio: el orden por fecha empata y decide el id
+FECHAS = ["2024-01-05", "2024-02-01", "2024-02-01", "2024-02-01", "2024-03-01", "2024-01-20", "2024-02-01"]
+
+
+@pytest.fixture
+def vacunas(cliente, registrar, nueva_mascota):
+    user_id, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras, user_id=user_id)
+    ids = []
+    for fecha in FECHAS:
+        r = cliente.post('/api/vacunas', headers=cabeceras,
+                         json={"mascota_id": mascota_id, "nombre": "rabia", "fecha_aplicacion": fecha})
+        ids.append(r.json["id"])
+    return f'/api/mascotas/{mascota_id}/vacunas', cabeceras, ids
+
+
+def _paginas(cliente, url, cabeceras, **params):
+    """Sigue next_cursor hasta el final; devuelve la lista de páginas."""
+    paginas, cursor = [], None
+    while True:
+        r = cliente.get(url, headers=cabeceras, query_string={**params, **({"cursor": cursor} if cursor else {})})
+        assert r.status_code == 200, r.json
+        paginas.append(r.json["vacunas"])
+        cursor = r.json["next_cursor"]
+        if cursor is None:
+            return paginas
+
+
+def _cursor(*partes):
+    return base64.urlsafe_b64encode(json.dumps(list(partes)).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("orden,descendente", [("fecha", False), ("-fecha", True)])
+def test_recorre_todo_una_vez_en_orden_aun_con_empates(cliente, vacunas, orden, descendente):
+    url, cabeceras, ids = vacunas
+    paginas = _paginas(cliente, url, cabeceras, orden=orden, limite=2)
+
+    assert [len(p) for p in paginas] == [2, 2, 2, 1]
+    esperado = sorted(zip(FECHAS, ids), reverse=descendente)
+    assert [(v["fecha_aplicacion"], v["id"]) for p in paginas for v in p] == esperado
+
+
+def test_ultima_pagina_completa_no_trae_cursor(cliente, vacunas):
+    url, cabeceras, ids = vacunas
+    paginas = _paginas(cliente, url, cabeceras, limite=len(ids))
+    assert [[v["id"] for v in p] for p in paginas] == [ids]
+
+    paginas = _paginas(cliente, url, cabeceras, orden="-id", limite=4)
+    assert [v["id"] for p in paginas for v in p] == ids[::-1]
+
+
+def test_campos_proyecta_y_siempre_incluye_el_id(cliente, registrar, nueva_mascota):
+    user_id, cabeceras = registrar()
+    for nombre in ("Toby", "Bruno", "Toby"):
+        nueva_mascota(cabeceras, nombre=nombre, user_id=user_id)
+
+    r = cliente.get('/api/mascotas', headers=cabeceras,
+                    query_string={"user_id": user_id, "orden": "nombre", "campos": "nombre", "limite": 2})
+    assert r.status_code == 200
+    assert [set(m) for m in r.json["mascotas"]] == [{"id", "nombre"}] * 2
+    assert [m["nombre"] for m in r.json["mascotas"]] == ["Bruno", "Toby"]
+
+    r = cliente.get('/api/mascotas', headers=cabeceras, query_string={
+        "user_id": user_id, "orden": "nombre", "campos": "nombre", "cursor": r.json["next_cursor"]})
+    assert [m["nombre"] for m in r.json["mascotas"]] == ["Toby"]
+    assert r.json["next_cursor"] is None
+
+
+@pytest.mark.parametrize("params", [
+    {"orden": "peso"},
+    {"limite": "muchos"},
+    {"campos": "nombre,password"},
+    {"cursor": "no es un cursor"},
+    {"cursor": _cursor("fecha", "2024-02-01", 3), "orden": "-fecha"},  # de otro orden
+    {"cursor": _cursor("fecha", "2024-02-01", "3"), "orden": "fecha"},  # id alterado
+    {"cursor": _cursor("fecha", "febrero", 3), "orden": "fecha"},       # valor alterado
+    {"cursor": _cursor("fecha", "2024-02-01"), "orden": "fecha"},       # incompleto
+])
+def test_parametros_o_cursor_invalidos_dan_400(cliente, vacunas, params):
+    url, cabeceras, _ = vacunas
+    r = cliente.get(url, headers=cabeceras, query_string=params)
+    assert r.status_code == 400
+    assert r.json["success"] is False
@@ -0,0 +1,110 @@
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import recordatorios
+from models import db, Trabajo
+
+HOY = date.today()
+
+
+class Capturar:
+    enviados = []
+
+    def enviar(self, datos):
+        Capturar.enviados.append(datos)
+
+
+class Fallar:
+    def enviar(self, datos):
+        raise ConnectionError("sin red")
+
+
+@pytest.fixture
+def destinos(app, monkeypatch):
+    Capturar.enviados = []
+    monkeypatch.setitem(recordatorios.DESTINOS, "capturar", Capturar)
+    monkeypatch.setitem(recordatorios.DESTINOS, "fallar", Fallar)
+
+    def usar(*nombres):
+        monkeypatch.setitem(app.config, "RECORDATORIOS_DESTINOS", list(nombres))
+    usar("capturar")
+    return usar
+
+
+@pytest.fixture
+def vencimientos(cliente, registrar, nueva_mascota):
+    """Una vacuna que vence en 3 días, una pipeta en 5 y una vacuna lejana."""
+    def para(email):
+        _, cabeceras = registrar(email)
+        mascota_id = nueva_mascota(cabeceras, nombre="Rex")
+        for url, datos in (
+            ('/api/vacunas', {"nombre": "rabia", "fecha_aplicacion": (HOY - timedelta(days=362)).isoformat()}),
+            ('/api/vacunas', {"nombre": "moquillo", "fecha_aplicacion": HOY.isoformat()}),
+            ('/api/prevenciones', {"tipo": "Pipeta", "fecha": (HOY - timedelta(days=25)).isoformat()}),
+        ):
+            assert cliente.post(url, headers=cabeceras, json={"mascota_id": mascota_id, **datos}).status_code == 201
+    return para
+
+
+def _trabajos():
+    return db.session.execute(db.select(Trabajo).order_by(Trabajo.id)).scalars().all()
+
+
+def test_planifica_un_trabajo_por_duenio_y_destino_una_sola_vez(app, destinos, vencimientos):
+    vencimientos("a@example.com")
+    vencimientos("b@example.com")
+    destinos("capturar", "log")
+    with app.app_context():
+        assert recordatorios.planificar() == (2, 4)
+        assert recordatorios.planificar() == (0, 0)
+
+        datos = json.loads(_trabajos()[0].datos)
+    assert datos["email"] == "a@example.com"
+    assert [(i["tabla"], i["nombre"], i["vence"]) for i in datos["items"]] == [
+        ("prevencion", "Pipeta", (HOY + timedelta(days=5)).isoformat()),
+        ("vacuna", "rabia", (HOY + timedelta(days=3)).isoformat()),
+    ]
+
+
+def test_entrega_y_marca_hecho(app, destinos, vencimientos):
+    vencimientos("a@example.com")
+    with app.app_context():
+        recordatorios.planificar()
+        assert recordatorios.procesar() == (1, 0)
+        assert recordatorios.procesar() == (0, 0)
+        assert [t.estado for t in _trabajos()] == [recordatorios.HECHO]
+    assert [d["email"] for d in Capturar.enviados] == ["a@example.com"]
+
+
+def test_fallos_se_reintentan_con_espera_hasta_el_maximo(app, destinos, vencimientos, monkeypatch):
+    vencimientos("a@example.com")
+    destinos("fallar")
+    monkeypatch.setitem(app.config, "RECORDATORIOS_MAX_INTENTOS", 2)
+    with app.app_context():
+        recordatorios.planificar()
+        assert recordatorios.procesar() == (0, 1)
+        trabajo = _trabajos()[0]
+        assert (trabajo.estado, trabajo.intentos, trabajo.ultimo_error) == ("pendiente", 1, "ConnectionError: sin red")
+        assert trabajo.ejecutar_en > datetime.utcnow()
+        # Todavía no le toca
+        assert recordatorios.procesar() == (0, 0)
+
+        trabajo.ejecutar_en = datetime.utcnow()
+        db.session.commit()
+        assert recordatorios.procesar() == (0, 1)
+        assert _trabajos()[0].estado == recordatorios.FALLIDO
+
+
+def test_retoma_trabajos_de_un_worker_caido(app, destinos, vencimientos):
+    vencimientos("a@example.com")
+    with app.app_context():
+        recordatorios.planificar()
+        trabajo = recordatorios.reclamar()
+        assert recordatorios.reclamar() is None
+
+        # El worker murió sin entregar: al vencer el bloqueo otro lo toma
+        trabajo.bloqueado_hasta = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        assert recordatorios.procesar() == (1, 0)
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+import replicas
+
+
+def _nombres(cliente, cabeceras):
+    r = cliente.get('/api/mascotas', headers=cabeceras)
+    assert r.status_code == 200, r.json
+    return [m["nombre"] for m in r.json["mascotas"]]
+
+
+@pytest.fixture
+def escena(app, registrar, nueva_mascota, replica):
+    """Dos clientes del mismo dueño con token; la réplica tiene "Rex" y no "Nuevo"."""
+    _, cabeceras = registrar()
+    nueva_mascota(cabeceras, nombre="Rex")
+    replica()
+    escritor = app.test_client()
+    lector = app.test_client(use_cookies=False)
+    return escritor, lector, cabeceras
+
+
+def test_lectura_sin_escritura_va_a_la_replica(escena):
+    escritor, lector, cabeceras = escena
+    escritor.post('/api/mascotas', headers=cabeceras, json={"nombre": "Nuevo", "especie": "gato", "raza": "x"})
+    replicas._fijados.clear()  # otro worker: no conoce la escritura
+    assert _nombres(lector, cabeceras) == ["Rex"]
+
+
+def test_quien_escribe_lee_lo_suyo_por_la_cookie(escena):
+    escritor, lector, cabeceras = escena
+    escritor.post('/api/mascotas', headers=cabeceras, json={"nombre": "Nuevo", "especie": "gato", "raza": "x"})
+    replicas._fijados.clear()
+    assert _nombres(escritor, cabeceras) == ["Rex", "Nuevo"]
+
+
+def test_token_fija_al_usuario_aunque_no_haya_cookie(app, escena):
+    _, lector, cabeceras = escena
+    sin_cookies = app.test_client(use_cookies=False)
+    sin_cookies.post('/api/mascotas', headers=cabeceras, json={"nombre": "Nuevo", "especie": "gato", "raza": "x"})
+    assert _nombres(lector, cabeceras) == ["Rex", "Nuevo"]
+
+
+def test_pasada_la_ventana_vuelve_a_la_replica(app, escena, replica, monkeypatch):
+    escritor, lector, cabeceras = escena
+    monkeypatch.setitem(app.config, "REPLICA_VENTANA_PRIMARIA_S", 0.3)
+    escritor.post('/api/mascotas', headers=cabeceras, json={"nombre": "Nuevo", "especie": "gato", "raza": "x"})
+    assert _nombres(escritor, cabeceras) == ["Rex", "Nuevo"]
+
+    time.sleep(0.4)
+    assert _nombres(escritor, cabeceras) == ["Rex"]
+    replica()
+    assert _nombres(lector, cabeceras) == ["Rex", "Nuevo"]
+
+
+def test_solo_primaria_ignora_la_replica(escena):
+    escritor, lector, cabeceras = escena
+    user_id = lector.get('/api/mascotas', headers=cabeceras).json["mascotas"][0]["user_id"]
+    importacion = escritor.post(f'/api/usuarios/{user_id}/import', headers=cabeceras, data="").json["importacion"]
+    replicas._fijados.clear()
+    assert _nombres(lector, cabeceras) == ["Rex"]
+    assert lector.get(f'/api/importaciones/{importacion}', headers=cabeceras).status_code == 200
+
+
+def test_replica_caida_lee_de_la_primaria(app, registrar, nueva_mascota):
+    # Sin el archivo de la réplica (así empiezan todas las pruebas)
+    _, cabeceras = registrar()
+    nueva_mascota(cabeceras, nombre="Rex")
+    replicas._fijados.clear()
+    lector = app.test_client(use_cookies=False)
+    assert _nombres(lector, cabeceras) == ["Rex"]
+    estado = lector.get('/api/metricas/replicas', headers=cabeceras).json
+    assert [r["sana"] for r in estado["replicas"]] == [False]
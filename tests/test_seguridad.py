@@ -0,0 +1,125 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import seguridad
+from models import db, Usuario
+
+
+def _login(cliente, password, email="duenio@example.com"):
+    return cliente.post('/api/login', json={"email": email, "password": password})
+
+
+@pytest.fixture
+def semaforo_nuevo():
+    """El semáforo se crea con la capacidad vigente en el primer uso."""
+    seguridad._semaforo = None
+    yield
+    seguridad._semaforo = None
+
+
+def test_cinco_fallos_bloquean_el_email_aun_con_la_clave_correcta(cliente, registrar):
+    registrar()
+    for _ in range(5):
+        assert _login(cliente, "incorrecta").status_code == 401
+
+    r = _login(cliente, "clave-segura-1")
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) > 0
+    # Otro email desde la misma IP sigue pudiendo entrar
+    registrar("otro@example.com")
+    assert _login(cliente, "clave-segura-1", "otro@example.com").status_code == 200
+
+
+def test_un_login_correcto_reinicia_los_fallos(cliente, registrar):
+    registrar()
+    for _ in range(4):
+        _login(cliente, "incorrecta")
+    assert _login(cliente, "clave-segura-1").status_code == 200
+    for _ in range(4):
+        assert _login(cliente, "incorrecta").status_code == 401
+
+
+def test_limite_por_ip(cliente, monkeypatch):
+    monkeypatch.setattr(seguridad.limitador_ip, "maximo", 3)
+    for i in range(3):
+        r = cliente.post('/api/register', json={"nombre": "Ana", "email": f"{i}@example.com", "password": "x"})
+        assert r.status_code == 201
+    assert cliente.post('/api/login', json={"email": "0@example.com", "password": "x"}).status_code == 429
+
+
+def test_sin_cupo_de_hash_responde_503(app, cliente, monkeypatch, semaforo_nuevo):
+    monkeypatch.setitem(app.config, "HASH_MAX_EN_COLA", 0)
+    r = cliente.post('/api/register', json={"nombre": "Ana", "email": "a@example.com", "password": "x"})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+    with app.app_context():
+        assert seguridad.metricas()["rechazados"] >= 1
+
+
+class _PoolDePrueba:
+    """Corre en el propio hilo; los primeros submit() lanzan las excepciones de `fallas`."""
+
+    fallas = []
+    creados = []
+
+    def __init__(self, max_workers):
+        self.cerrado = False
+        _PoolDePrueba.creados.append(self)
+
+    def submit(self, funcion, *args):
+        if _PoolDePrueba.fallas:
+            raise _PoolDePrueba.fallas.pop(0)
+        futuro = Future()
+        futuro.set_result(funcion(*args))
+        return futuro
+
+    def shutdown(self, wait=True):
+        self.cerrado = True
+
+
+@pytest.fixture
+def pool_de_prueba(app, monkeypatch, semaforo_nuevo):
+    _PoolDePrueba.fallas, _PoolDePrueba.creados = [], []
+    monkeypatch.setattr(seguridad, "ProcessPoolExecutor", _PoolDePrueba)
+    monkeypatch.setitem(app.config, "HASH_WORKERS", 1)
+    monkeypatch.setitem(app.config, "HASH_MAX_EN_COLA", 1)
+    yield _PoolDePrueba.fallas
+    seguridad._pool = None
+
+
+def test_un_pool_roto_se_reemplaza(app, pool_de_prueba):
+    pool_de_prueba.append(BrokenProcessPool("murió un proceso"))
+    with app.app_context():
+        assert seguridad.verificar_password(seguridad.generar_hash("x"), "x")
+    roto, nuevo = _PoolDePrueba.creados
+    assert roto.cerrado and seguridad._pool is nuevo
+
+
+def test_si_submit_falla_el_cupo_se_libera(app, pool_de_prueba):
+    pool_de_prueba.extend([RuntimeError("cannot schedule new futures after shutdown")] * 2)
+    with app.app_context():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                seguridad.generar_hash("x")
+        # Con HASH_MAX_EN_COLA = 1 esto daría 503 si el cupo se hubiera perdido
+        assert seguridad.generar_hash("x")
+
+
+@pytest.mark.parametrize("datos", [{"email": ["a@example.com"], "password": "x"},
+                                   {"email": "a@example.com", "password": {"x": 1}}])
+def test_login_con_tipos_no_texto_da_400(cliente, datos):
+    assert cliente.post('/api/login', json=datos).status_code == 400
+
+
+def test_login_rehashea_si_cambio_el_metodo(app, cliente, registrar, monkeypatch):
+    monkeypatch.setitem(app.config, "HASH_METODO", "pbkdf2:sha256:1000")
+    user_id, _ = registrar()
+    monkeypatch.setitem(app.config, "HASH_METODO", "scrypt")
+    assert _login(cliente, "clave-segura-1").status_code == 200
+
+    with app.app_context():
+        password = db.session.get(Usuario, user_id).password
+        assert password.startswith("scrypt:")
+        assert not seguridad.necesita_rehash(password)
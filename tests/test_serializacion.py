@@ -0,0 +1,75 @@
+import gzip
+import json
+from datetime import date
+
+import pytest
+
+import compresion
+import serializacion
+
+
+@pytest.mark.parametrize("backend", ["stdlib", "orjson"])
+def test_proveedor_json_escribe_fechas_iso(app, backend):
+    if backend == "orjson" and serializacion.orjson is None:
+        pytest.skip("orjson no está instalado")
+    proveedor = serializacion.ProveedorJSON(app, backend)
+    texto = proveedor.dumps({"b": date(2024, 3, 1), "a": "Ñandú"})
+    assert json.loads(texto) == {"a": "Ñandú", "b": "2024-03-01"}
+    assert ("Ñandú" in texto) == (backend == "orjson")
+    assert proveedor.loads(texto) == json.loads(texto)
+
+
+def test_listados_con_el_esquema_del_modelo(cliente, registrar, nueva_mascota):
+    _, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras)
+    cliente.post('/api/vacunas', headers=cabeceras,
+                 json={"mascota_id": mascota_id, "nombre": "rabia", "fecha_aplicacion": "2024-01-10"})
+
+    r = cliente.get(f'/api/mascotas/{mascota_id}/historial', headers=cabeceras)
+    vacuna, = r.json["vacunas"]
+    assert set(vacuna) == {"id", "nombre", "fecha_aplicacion", "proxima_dosis"}
+    assert vacuna["fecha_aplicacion"] == "2024-01-10"
+
+
+def _muchas_mascotas(cliente, cabeceras, nueva_mascota, n=20):
+    for i in range(n):
+        nueva_mascota(cabeceras, nombre=f"Mascota {i}", raza="una raza bastante larga para repetir")
+
+
+def test_comprime_segun_accept_encoding(cliente, registrar, nueva_mascota):
+    _, cabeceras = registrar()
+    _muchas_mascotas(cliente, cabeceras, nueva_mascota)
+
+    plano = cliente.get('/api/mascotas', headers=cabeceras)
+    assert "Content-Encoding" not in plano.headers
+
+    r = cliente.get('/api/mascotas', headers={**cabeceras, "Accept-Encoding": "br;q=1, gzip;q=0.5"})
+    assert r.headers["Content-Encoding"] == compresion.elegir(r.request.accept_encodings)
+    assert "Accept-Encoding" in r.headers["Vary"]
+    if r.headers["Content-Encoding"] == "gzip":
+        assert json.loads(gzip.decompress(r.get_data())) == plano.json
+
+    assert "Content-Encoding" not in cliente.get(
+        '/api/mascotas', headers={**cabeceras, "Accept-Encoding": "gzip;q=0"}).headers
+
+
+def test_no_comprime_lo_pequenio_ni_con_la_opcion_apagada(app, cliente, registrar, nueva_mascota, monkeypatch):
+    _, cabeceras = registrar()
+    cabeceras = {**cabeceras, "Accept-Encoding": "gzip"}
+    assert "Content-Encoding" not in cliente.get('/api/mascotas', headers=cabeceras).headers
+
+    _muchas_mascotas(cliente, cabeceras, nueva_mascota)
+    monkeypatch.setitem(app.config, "COMPRESION", False)
+    assert "Content-Encoding" not in cliente.get('/api/mascotas', headers=cabeceras).headers
+
+
+def test_la_exportacion_se_comprime_en_streaming(cliente, registrar, nueva_mascota):
+    user_id, cabeceras = registrar()
+    _muchas_mascotas(cliente, cabeceras, nueva_mascota, 3)
+    url = f'/api/usuarios/{user_id}/export'
+
+    plano = cliente.get(url, headers=cabeceras).get_data()
+    r = cliente.get(url, headers={**cabeceras, "Accept-Encoding": "gzip"})
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in r.headers
+    assert gzip.decompress(r.get_data()) == plano
@@ -0,0 +1,126 @@
+import sincronizacion
+
+
+def _sync(cliente, cabeceras, desde_rev=0, **params):
+    r = cliente.get('/api/sync', headers=cabeceras, query_string={"desde_rev": desde_rev, **params})
+    assert r.status_code == 200, r.json
+    return r.json
+
+
+def _ids(cambios, clave):
+    return [c["id"] for c in cambios.get(clave, [])]
+
+
+def _lapidas(cambios):
+    return {(e["tabla"], e["registro_id"]) for e in cambios.get("eliminados", [])}
+
+
+def _lote(cliente, cabeceras, mascota_id, cantidad, categoria="diagnosticos"):
+    items = [{"titulo": f"control {i}", "medicamento": f"m{i}", "dosis": "1", "fecha": "2024-03-01"}
+             for i in range(cantidad)]
+    r = cliente.post(f'/api/mascotas/{mascota_id}/{categoria}:batch', headers=cabeceras, json={"items": items})
+    assert r.status_code == 201, r.json
+    return [x["id"] for x in r.json["resultados"]]
+
+
+def _todas_las_paginas(user_id, desde_rev, limite):
+    """Sigue rev y cursor como un cliente; devuelve (páginas, rev final)."""
+    paginas, rev, cursor = [], desde_rev, None
+    while True:
+        cambios, rev, hay_mas, cursor = sincronizacion.cambios_desde(user_id, rev, limite=limite, cursor=cursor)
+        paginas.append(cambios)
+        if not hay_mas:
+            return paginas, rev
+
+
+def test_solo_entrega_lo_posterior_a_la_revision(cliente, registrar, nueva_mascota):
+    _, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras)
+    vacuna_id = cliente.post('/api/vacunas', headers=cabeceras,
+                             json={"mascota_id": mascota_id, "nombre": "rabia", "fecha_aplicacion": "2024-01-10"}).json["id"]
+
+    primera = _sync(cliente, cabeceras)
+    assert _ids(primera["cambios"], "mascotas") == [mascota_id]
+    assert _ids(primera["cambios"], "vacunas") == [vacuna_id]
+    assert primera["hay_mas"] is False
+
+    assert _sync(cliente, cabeceras, primera["rev"])["cambios"] == {}
+
+    cliente.put(f'/api/vacunas/{vacuna_id}', headers=cabeceras, json={"fecha_aplicacion": "2024-02-10"})
+    segunda = _sync(cliente, cabeceras, primera["rev"])
+    assert list(segunda["cambios"]) == ["vacunas"]
+    assert segunda["cambios"]["vacunas"][0]["fecha_aplicacion"] == "2024-02-10"
+    assert segunda["rev"] > primera["rev"]
+
+
+def test_solo_entrega_lo_del_duenio(cliente, registrar, nueva_mascota):
+    _, cabeceras = registrar()
+    _, otro = registrar("otro@example.com")
+    nueva_mascota(otro)
+    mia = nueva_mascota(cabeceras)
+    assert _ids(_sync(cliente, cabeceras)["cambios"], "mascotas") == [mia]
+
+
+def test_borrados_dejan_lapidas(cliente, registrar, nueva_mascota):
+    _, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras)
+    vacuna_id = cliente.post('/api/vacunas', headers=cabeceras,
+                             json={"mascota_id": mascota_id, "nombre": "rabia", "fecha_aplicacion": "2024-01-10"}).json["id"]
+    diagnosticos = _lote(cliente, cabeceras, mascota_id, 3)
+    rev = _sync(cliente, cabeceras)["rev"]
+
+    assert cliente.delete(f'/api/vacunas/{vacuna_id}', headers=cabeceras).status_code == 200
+    cambios = _sync(cliente, cabeceras, rev)
+    assert _lapidas(cambios["cambios"]) == {("vacuna", vacuna_id)}
+
+    # Borrar la mascota deja su lápida y la de cada fila de su historial
+    assert cliente.delete(f'/api/mascotas/{mascota_id}', headers=cabeceras).status_code == 200
+    lapidas = _lapidas(_sync(cliente, cabeceras, cambios["rev"])["cambios"])
+    assert lapidas == {("mascota", mascota_id)} | {("diagnostico", d) for d in diagnosticos}
+
+
+def test_corta_en_revisiones_completas(app, cliente, registrar, nueva_mascota):
+    user_id, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras)
+    lotes = [_lote(cliente, cabeceras, mascota_id, n) for n in (3, 4, 2)]
+
+    with app.app_context():
+        paginas, rev = _todas_las_paginas(user_id, 0, limite=5)
+        assert rev == sincronizacion.revision_actual()
+
+    # Con límite 5 no entran dos lotes juntos: una revisión completa por página
+    assert [_ids(p, "diagnosticos") for p in paginas] == lotes
+
+
+def test_revision_grande_se_entrega_por_partes(app, cliente, registrar, nueva_mascota):
+    user_id, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras)
+    # Una revisión con 12 diagnósticos y 7 recetas, más otras dos pequeñas después
+    diagnosticos = _lote(cliente, cabeceras, mascota_id, 12)
+    recetas = _lote(cliente, cabeceras, mascota_id, 7, "recetas")
+    otra = nueva_mascota(cabeceras, nombre="Michi", especie="gato")
+
+    with app.app_context():
+        paginas, rev = _todas_las_paginas(user_id, 0, limite=5)
+        assert rev == sincronizacion.revision_actual()
+
+    assert all(sum(len(filas) for filas in p.values()) <= 5 for p in paginas)
+    entregados = {clave: [id_ for p in paginas for id_ in _ids(p, clave)] for clave in ("mascotas", "diagnosticos", "recetas")}
+    assert sorted(entregados["diagnosticos"]) == diagnosticos
+    assert sorted(entregados["recetas"]) == recetas
+    assert sorted(entregados["mascotas"]) == [mascota_id, otra]
+
+
+def test_cursor_por_la_api(cliente, registrar, nueva_mascota):
+    _, cabeceras = registrar()
+    mascota_id = nueva_mascota(cabeceras)
+    rev = _sync(cliente, cabeceras)["rev"]
+    diagnosticos = _lote(cliente, cabeceras, mascota_id, 4)
+
+    # Seguir dentro de la revisión rev+1 después del segundo diagnóstico
+    r = _sync(cliente, cabeceras, rev, cursor=f"diagnosticos:{diagnosticos[1]}")
+    assert _ids(r["cambios"], "diagnosticos") == diagnosticos[2:]
+    assert r["cursor"] is None
+
+    r = cliente.get('/api/sync', headers=cabeceras, query_string={"desde_rev": rev, "cursor": "vacunas:x"})
+    assert r.status_code == 400
@@ -0,0 +1,163 @@
+import time
+
+import pytest
+
+import tokens
+from models import db, Usuario
+
+ENDPOINTS_CLINICA = [
+    ("get", "/api/pendientes"),
+    ("get", "/api/export"),
+    ("get", "/api/microchip/985112000123456"),
+    ("post", "/api/microchip:batch"),
+    ("get", "/api/estadisticas/vacunacion"),
+]
+
+
+def _refrescar(cliente, refresh_token):
+    return cliente.post('/api/token/refresh', json={"refresh_token": refresh_token})
+
+
+@pytest.mark.parametrize("metodo,url", ENDPOINTS_CLINICA)
+def test_clinica_sin_token_da_401(cliente, registrar, metodo, url):
+    registrar()
+    r = getattr(cliente, metodo)(url, json={"codigos": ["985112000123456"]})
+    assert r.status_code == 401
+    assert r.json["success"] is False
+
+
+@pytest.mark.parametrize("metodo,url", ENDPOINTS_CLINICA)
+def test_clinica_sin_scope_da_403(cliente, registrar, metodo, url):
+    _, cabeceras = registrar()
+    r = getattr(cliente, metodo)(url, headers=cabeceras, json={"codigos": ["985112000123456"]})
+    assert r.status_code == 403
+
+
+def test_clinica_con_scope_accede(cliente, registrar, clinica):
+    clinica.append("vet@example.com")
+    _, cabeceras = registrar("vet@example.com")
+    assert cliente.get('/api/pendientes', headers=cabeceras).status_code == 200
+
+
+def test_token_no_alcanza_lo_de_otro_usuario(cliente, registrar, nueva_mascota):
+    _, ajeno = registrar("ajeno@example.com")
+    otro_id, otro = registrar("otro@example.com")
+    mascota_id = nueva_mascota(otro)
+
+    assert cliente.get(f'/api/usuarios/{otro_id}/pendientes', headers=ajeno).status_code == 403
+    assert cliente.get(f'/api/mascotas/{mascota_id}/historial', headers=ajeno).status_code == 404
+    assert cliente.delete(f'/api/mascotas/{mascota_id}', headers=ajeno).status_code == 404
+    # Con token, pedir por el user_id de otro es un error, no un atajo
+    assert cliente.get(f'/api/mascotas?user_id={otro_id}', headers=ajeno).status_code == 403
+
+
+def test_token_alterado_da_401(app, cliente, registrar):
+    _, cabeceras = registrar()
+    version, payload, firma = cabeceras["Authorization"][7:].split(".")
+    with app.app_context():
+        falso = tokens._b64(b'{"sub":1,"scp":["api","clinica"],"typ":"a","exp":9999999999}')
+    r = cliente.get('/api/pendientes', headers={"Authorization": f"Bearer {version}.{falso}.{firma}"})
+    assert r.status_code == 401
+
+
+def test_token_de_refresco_no_sirve_de_acceso(cliente):
+    r = cliente.post('/api/register', json={"nombre": "Ana", "email": "a@example.com", "password": "clave-segura-1"})
+    r = cliente.get('/api/mascotas', headers={"Authorization": f"Bearer {r.json['refresh_token']}"})
+    assert r.status_code == 401
+
+
+def test_token_vencido_da_401(app, cliente, registrar):
+    user_id, _ = registrar()
+    with app.app_context():
+        vencido = tokens.crear_token(user_id, ["api"], tokens.ACCESO, -1)
+    assert cliente.get('/api/mascotas', headers={"Authorization": f"Bearer {vencido}"}).status_code == 401
+
+
+def test_refresco_emite_un_acceso_valido(cliente, nueva_mascota):
+    r = cliente.post('/api/register', json={"nombre": "Ana", "email": "a@example.com", "password": "clave-segura-1"})
+    assert _refrescar(cliente, r.json["access_token"]).status_code == 401
+
+    r = _refrescar(cliente, r.json["refresh_token"])
+    assert r.status_code == 200
+    cabeceras = {"Authorization": f"Bearer {r.json['access_token']}"}
+    mascota_id = nueva_mascota(cabeceras)
+    assert [m["id"] for m in cliente.get('/api/mascotas', headers=cabeceras).json["mascotas"]] == [mascota_id]
+
+
+def test_refresco_recalcula_scopes_y_conserva_el_vencimiento(app, cliente, clinica):
+    r = cliente.post('/api/register', json={"nombre": "Ana", "email": "vet@example.com", "password": "clave-segura-1"})
+    refresco = r.json["refresh_token"]
+    with app.app_context():
+        vence = tokens.verificar_token(refresco, tokens.REFRESCO)["exp"]
+
+    clinica.append("vet@example.com")
+    time.sleep(1.1)
+    r = _refrescar(cliente, refresco)
+    assert r.status_code == 200
+    with app.app_context():
+        acceso = tokens.verificar_token(r.json["access_token"])
+        nuevo = tokens.verificar_token(r.json["refresh_token"], tokens.REFRESCO)
+    assert "clinica" in acceso["scp"]
+    assert nuevo["exp"] == vence
+
+    clinica.clear()
+    r = _refrescar(cliente, r.json["refresh_token"])
+    with app.app_context():
+        assert "clinica" not in tokens.verificar_token(r.json["access_token"])["scp"]
+
+
+def test_refresco_de_usuario_borrado_da_401(app, cliente):
+    r = cliente.post('/api/register', json={"nombre": "Ana", "email": "a@example.com", "password": "clave-segura-1"})
+    with app.app_context():
+        db.session.delete(db.session.get(Usuario, r.json["user_id"]))
+        db.session.commit()
+    assert _refrescar(cliente, r.json["refresh_token"]).status_code == 401
+
+
+def test_sin_secreto_no_hay_tokens(app, cliente, monkeypatch):
+    monkeypatch.setitem(app.config, "TOKEN_SECRET", None)
+    monkeypatch.setitem(app.config, "SECRET_KEY", "clave_secreta")
+    r = cliente.post('/api/register', json={"nombre": "Ana", "email": "a@example.com", "password": "clave-segura-1"})
+    assert r.status_code == 201
+    assert "access_token" not in r.json
+
+    with app.app_context():
+        monkeypatch.setitem(app.config, "SECRET_KEY", "otra-clave-cualquiera")
+        firmado = tokens.crear_token(r.json["user_id"], ["api", "clinica"], tokens.ACCESO, 60)
+    # Firmado con otra clave: con el valor por defecto no se acepta ninguno
+    monkeypatch.setitem(app.config, "SECRET_KEY", "clave_secreta")
+    r = cliente.get('/api/estadisticas/vacunacion', headers={"Authorization": f"Bearer {firmado}"})
+    assert r.status_code == 401
+
+
+def test_sin_secreto_solo_arranca_con_el_modo_heredado(app, monkeypatch):
+    monkeypatch.setitem(app.config, "TOKEN_SECRET", None)
+    monkeypatch.setitem(app.config, "SECRET_KEY", "clave_secreta")
+    with pytest.raises(RuntimeError):
+        tokens.validar_configuracion(app)
+    monkeypatch.setitem(app.config, "API_MODO_HEREDADO", True)
+    tokens.validar_configuracion(app)
+
+
+def test_sin_token_da_401_por_defecto(app, cliente, registrar):
+    user_id, _ = registrar()
+    assert not app.config["API_MODO_HEREDADO"]
+    assert cliente.get(f'/api/mascotas?user_id={user_id}').status_code == 401
+    assert cliente.post('/api/mascotas', json={"user_id": user_id, "nombre": "Rex", "especie": "perro",
+                                               "raza": "x"}).status_code == 401
+    assert cliente.get('/api/ping').status_code == 200
+    assert cliente.post('/api/login', json={"email": "duenio@example.com", "password": "clave-segura-1"}).status_code == 200
+
+
+def test_modo_heredado_avisa_en_cada_uso(app, cliente, registrar, nueva_mascota, monkeypatch, caplog):
+    user_id, cabeceras = registrar()
+    nueva_mascota(cabeceras, nombre="Rex")
+    monkeypatch.setitem(app.config, "API_MODO_HEREDADO", True)
+
+    for _ in range(2):
+        r = cliente.get(f'/api/mascotas?user_id={user_id}')
+        assert [m["nombre"] for m in r.json["mascotas"]] == ["Rex"]
+    assert sum("Modo heredado" in m for m in caplog.messages) == 2
+    # Con token no hay aviso
+    cliente.get('/api/mascotas', headers=cabeceras)
+    assert sum("Modo heredado" in m for m in caplog.messages) == 2
@@ -0,0 +1,137 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+
+from flask import current_app
+
+# ============================================================
+# TOKENS FIRMADOS (HMAC-SHA256) PARA LA API
+# ============================================================
+# Formato: v1.<payload base64url>.<firma base64url>
+# payload = {"sub": user_id, "scp": [...], "typ": "a"|"r", "exp": epoch}
+#
+# La clave sale de TOKEN_SECRET, o de SECRET_KEY si no es el valor público
+# por defecto. Sin ninguna de las dos no se emiten ni aceptan tokens.
+#
+# Verificar un token es un HMAC y una comparación en tiempo constante:
+# no hace falta ir a la base para saber quién llama ni qué puede hacer.
+# Los de acceso duran poco (TOKEN_ACCESO_SEGUNDOS); el de refresco
+# (TOKEN_REFRESCO_SEGUNDOS) solo sirve en POST /api/token/refresh. Ahí sí
+# se lee el usuario: un usuario borrado no recibe tokens, los scopes se
+# recalculan (quitar un email de CLINICA_EMAILS quita "clinica" en el
+# siguiente refresco) y el nuevo token de refresco vence cuando vencía el
+# original, así que hay que volver a hacer login cada TOKEN_REFRESCO_SEGUNDOS.
+
+VERSION = "v1"
+ACCESO = "a"
+REFRESCO = "r"
+
+# Valores públicos (el de app.py por defecto): con ellos cualquiera firmaría tokens
+SECRETOS_INSEGUROS = {"clave_secreta"}
+
+
+class TokenInvalido(Exception):
+    pass
+
+
+class AccesoDenegado(Exception):
+    pass
+
+
+def _b64(datos):
+    return base64.urlsafe_b64encode(datos).decode().rstrip("=")
+
+
+def _desb64(texto):
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def secreto(config):
+    """TOKEN_SECRET, o SECRET_KEY si no es el valor por defecto; si no, None."""
+    valor = config.get("TOKEN_SECRET") or config.get("SECRET_KEY")
+    if not valor or valor in SECRETOS_INSEGUROS:
+        return None
+    return valor
+
+
+def validar_configuracion(app):
+    """Al arrancar: sin secreto no se emiten tokens, y sin API_MODO_HEREDADO no se arranca."""
+    if secreto(app.config):
+        return
+    if not app.config.get("API_MODO_HEREDADO"):
+        raise RuntimeError("La API exige TOKEN_SECRET (o un SECRET_KEY propio), salvo con API_MODO_HEREDADO")
+    app.logger.warning("Tokens de la API desactivados: falta TOKEN_SECRET (o un SECRET_KEY propio)")
+
+
+def _clave():
+    # Clave derivada: el SECRET_KEY de las cookies no se usa directamente
+    valor = secreto(current_app.config)
+    if valor is None:
+        raise TokenInvalido("Tokens de la API desactivados en este servidor")
+    return hmac.new(valor.encode(), b"vacunapet-api-tokens", hashlib.sha256).digest()
+
+
+def _firmar(cuerpo):
+    return _b64(hmac.new(_clave(), cuerpo.encode(), hashlib.sha256).digest())
+
+
+def crear_token(user_id, scopes, tipo, duracion, ahora=None):
+    ahora = int(time.time()) if ahora is None else ahora
+    payload = {"sub": user_id, "scp": list(scopes), "typ": tipo, "exp": ahora + duracion}
+    cuerpo = f"{VERSION}.{_b64(json.dumps(payload, separators=(',', ':')).encode())}"
+    return f"{cuerpo}.{_firmar(cuerpo)}"
+
+
+def verificar_token(token, tipo=ACCESO):
+    """Devuelve el payload o lanza TokenInvalido."""
+    try:
+        version, payload_b64, firma = token.split(".")
+    except (AttributeError, ValueError):
+        raise TokenInvalido("Token mal formado")
+
+    if version != VERSION:
+        raise TokenInvalido("Versión de token no soportada")
+    if not hmac.compare_digest(firma, _firmar(f"{version}.{payload_b64}")):
+        raise TokenInvalido("Firma no válida")
+
+    try:
+        payload = json.loads(_desb64(payload_b64))
+    except (binascii.Error, ValueError):
+        raise TokenInvalido("Token mal formado")
+
+    if payload.get("typ") != tipo:
+        raise TokenInvalido("Tipo de token incorrecto")
+    if payload.get("exp", 0) < time.time():
+        raise TokenInvalido("Token vencido")
+    return payload
+
+
+def scopes_de(usuario):
+    scopes = ["api"]
+    if usuario.email in current_app.config.get("CLINICA_EMAILS", ()):
+        scopes.append("clinica")
+    return scopes
+
+
+def emitir_tokens(user_id, scopes, refresco_vence=None):
+    """Par de tokens. Al refrescar, `refresco_vence` (el exp del token usado)
+    mantiene el vencimiento original: la cadena de refrescos no se alarga.
+    Sin secreto configurado no emite nada (solo queda el modo heredado)."""
+    if secreto(current_app.config) is None:
+        return {}
+    acceso = current_app.config.get("TOKEN_ACCESO_SEGUNDOS", 15 * 60)
+    refresco = current_app.config.get("TOKEN_REFRESCO_SEGUNDOS", 30 * 24 * 3600)
+    # El mismo instante para los dos: el nuevo exp de refresco es exactamente refresco_vence
+    ahora = int(time.time())
+    if refresco_vence is not None:
+        refresco = max(0, refresco_vence - ahora)
+        acceso = min(acceso, refresco)
+    return {
+        "access_token": crear_token(user_id, scopes, ACCESO, acceso, ahora),
+        "refresh_token": crear_token(user_id, scopes, REFRESCO, refresco, ahora),
+        "token_type": "Bearer",
+        "expires_in": acceso,
+    }